@@ -0,0 +1,106 @@
+# LabConriquezConfig/basedatos.py
+#
+# Configuración de DATABASES a partir de variables de entorno, con dos perfiles:
+#
+#   LAB_DB_PERFIL=sqlite     (por defecto) archivo SQLite afinado para varios
+#                            usuarios: WAL, synchronous=NORMAL, espera ante
+#                            bloqueos y transacciones IMMEDIATE.
+#   LAB_DB_PERFIL=postgres   PostgreSQL con conexiones persistentes y
+#                            comprobación de salud, o con el pool de psycopg 3.
+#
+# Variables comunes:
+#   LAB_DB_NOMBRE            archivo SQLite (por defecto BASE_DIR/db.sqlite3)
+#                            o nombre de la base en PostgreSQL
+#   LAB_DB_CONN_MAX_AGE      segundos que se reutiliza una conexión (por
+#                            defecto 600; 0 = una conexión por petición)
+#
+# SQLite:
+#   LAB_DB_ESPERA            segundos esperando un bloqueo antes de fallar con
+#                            "database is locked" (por defecto 20)
+#   LAB_DB_CACHE_MB          caché de páginas por conexión (por defecto 64)
+#   LAB_DB_MMAP_MB           lectura por mmap (por defecto 256)
+#
+# PostgreSQL:
+#   LAB_DB_USUARIO, LAB_DB_CLAVE, LAB_DB_HOST (localhost), LAB_DB_PUERTO (5432)
+#   LAB_DB_POOL              "min,max" para usar el pool de psycopg 3
+#                            (p. ej. "2,20"); con pool no se usa CONN_MAX_AGE
+#   LAB_DB_SSLMODE           sslmode de libpq (por defecto prefer)
+
+import os
+
+PERFILES = ('sqlite', 'postgres')
+
+
+def _entero(entorno, nombre, defecto):
+    try:
+        return int(entorno.get(nombre, defecto))
+    except ValueError:
+        raise ValueError(f'{nombre} debe ser un número entero')
+
+
+def pragmas_sqlite(cache_mb=64, mmap_mb=256):
+    """PRAGMAs que se ejecutan en cada conexión nueva (OPTIONS["init_command"])"""
+    return ';'.join([
+        # Lectores y un escritor a la vez; los lectores no bloquean al que guarda
+        'PRAGMA journal_mode=WAL',
+        # En WAL solo se sincroniza en los checkpoints: seguro ante caídas del proceso
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA cache_size=-{cache_mb * 1024}',
+        f'PRAGMA mmap_size={mmap_mb * 1024 * 1024}',
+        'PRAGMA temp_store=MEMORY',
+        'PRAGMA foreign_keys=ON',
+    ])
+
+
+def sqlite(entorno, base_dir):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': entorno.get('LAB_DB_NOMBRE') or base_dir / 'db.sqlite3',
+        'CONN_MAX_AGE': _entero(entorno, 'LAB_DB_CONN_MAX_AGE', 600),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # busy_timeout: cuánto espera una escritura a que termine otra
+            'timeout': _entero(entorno, 'LAB_DB_ESPERA', 20),
+            # Toma el bloqueo de escritura al abrir la transacción; con DEFERRED dos
+            # transacciones que leen y luego escriben fallan con "database is locked"
+            # sin esperar el timeout
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': pragmas_sqlite(
+                _entero(entorno, 'LAB_DB_CACHE_MB', 64), _entero(entorno, 'LAB_DB_MMAP_MB', 256),
+            ),
+        },
+    }
+
+
+def postgres(entorno, base_dir):
+    configuracion = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': entorno.get('LAB_DB_NOMBRE', 'labconriquez'),
+        'USER': entorno.get('LAB_DB_USUARIO', ''),
+        'PASSWORD': entorno.get('LAB_DB_CLAVE', ''),
+        'HOST': entorno.get('LAB_DB_HOST', 'localhost'),
+        'PORT': entorno.get('LAB_DB_PUERTO', '5432'),
+        'CONN_MAX_AGE': _entero(entorno, 'LAB_DB_CONN_MAX_AGE', 600),
+        # Antes de reutilizar una conexión persistente se comprueba que siga viva
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'sslmode': entorno.get('LAB_DB_SSLMODE', 'prefer')},
+    }
+    pool = entorno.get('LAB_DB_POOL')
+    if pool:
+        try:
+            minimo, maximo = (int(n) for n in pool.split(','))
+        except ValueError:
+            raise ValueError('LAB_DB_POOL debe tener la forma "min,max", p. ej. "2,20"')
+        # El pool (psycopg_pool) ya reutiliza las conexiones: Django exige CONN_MAX_AGE=0
+        configuracion['CONN_MAX_AGE'] = 0
+        configuracion['OPTIONS']['pool'] = {'min_size': minimo, 'max_size': maximo, 'timeout': 10}
+    return configuracion
+
+
+def base_de_datos(base_dir, entorno=None):
+    """Diccionario para DATABASES['default'] según LAB_DB_PERFIL"""
+    entorno = os.environ if entorno is None else entorno
+    perfil = entorno.get('LAB_DB_PERFIL', 'sqlite').lower()
+    if perfil not in PERFILES:
+        raise ValueError(f"LAB_DB_PERFIL={perfil!r}; los perfiles válidos son {', '.join(PERFILES)}")
+    return sqlite(entorno, base_dir) if perfil == 'sqlite' else postgres(entorno, base_dir)
@@ -0,0 +1,308 @@
+# LabConriquezConfig/metricas.py
+#
+# Métricas del proceso en formato de texto de Prometheus. MetricasMiddleware
+# mide cada petición y acumula en memoria, por vista (nombre de la URL):
+#
+#   lab_peticion_segundos         histograma de latencia (vista, método)
+#   lab_peticiones_total          peticiones por código de estado
+#   lab_sql_consultas_total       consultas SQL y su tiempo (lab_sql_segundos_total)
+#   lab_plantilla_segundos_total  tiempo renderizando la TemplateResponse de la
+#                                 vista (admin, vistas genéricas); las vistas
+#                                 que usan render() quedan dentro de la latencia
+#   lab_cache_aciertos_total /    aciertos y fallos de las cachés de labApp
+#   lab_cache_fallos_total        (señal labApp.senales.cache_consultada)
+#
+# y la vista ``exponer`` las publica en /metrics. Los datos son de cada proceso:
+# con varios workers de gunicorn cada uno tiene los suyos (la etiqueta "proceso"
+# los distingue), así que conviene raspar cada worker o usar workers con hilos.
+#
+# Con LAB_METRICAS_PERFIL_UMBRAL_MS, una fracción de las peticiones corre bajo
+# cProfile y se guarda el perfil (.prof, para snakeviz o pstats) de las que
+# tardan más que el umbral.
+#
+# Configuración (settings.py, opcional):
+#   LAB_METRICAS                     activa el registro (por defecto True)
+#   LAB_METRICAS_CUBETAS             límites del histograma en segundos
+#   LAB_METRICAS_IPS                 IPs que pueden leer /metrics (por defecto
+#                                    solo localhost)
+#   LAB_METRICAS_TOKEN               alternativa a las IPs: "Authorization: Bearer <token>"
+#   LAB_METRICAS_PERFIL_UMBRAL_MS    guarda perfiles de peticiones más lentas que
+#                                    esto (por defecto None, sin perfiles)
+#   LAB_METRICAS_PERFIL_MUESTREO     fracción de peticiones perfiladas (0.01)
+#   LAB_METRICAS_PERFIL_DIRECTORIO   dónde se guardan (BASE_DIR/perfiles)
+#   LAB_METRICAS_PERFIL_MAXIMO       perfiles guardados como máximo (100)
+
+import cProfile
+import hmac
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_safe
+
+from labApp.senales import cache_consultada
+
+CUBETAS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIN_RUTA = '<sin ruta>'
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+_peticion = ContextVar('lab_metricas_peticion', default=None)
+
+
+class Peticion:
+    """Lo que se acumula durante una petición"""
+    __slots__ = ('consultas', 'sql_segundos', 'plantilla_segundos')
+
+    def __init__(self):
+        self.consultas = 0
+        self.sql_segundos = 0.0
+        self.plantilla_segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_segundos += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+class Registro:
+    """Contadores e histogramas del proceso, protegidos por un lock"""
+
+    def __init__(self, cubetas=CUBETAS):
+        self._lock = threading.Lock()
+        self.cubetas = tuple(cubetas)
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            # (vista, método) -> [conteos por cubeta..., +Inf], suma
+            self.histogramas = {}
+            self.peticiones = defaultdict(int)
+            self.sql = defaultdict(lambda: [0, 0.0])
+            self.plantillas = defaultdict(float)
+            self.caches = defaultdict(lambda: [0, 0])
+
+    def observar(self, vista, metodo, estado, segundos, peticion=None):
+        posicion = bisect_left(self.cubetas, segundos)
+        with self._lock:
+            histograma = self.histogramas.get((vista, metodo))
+            if histograma is None:
+                histograma = self.histogramas[(vista, metodo)] = [[0] * (len(self.cubetas) + 1), 0.0]
+            histograma[0][posicion] += 1
+            histograma[1] += segundos
+            self.peticiones[(vista, metodo, str(estado))] += 1
+            if peticion is not None:
+                sql = self.sql[vista]
+                sql[0] += peticion.consultas
+                sql[1] += peticion.sql_segundos
+                self.plantillas[vista] += peticion.plantilla_segundos
+
+    def contar_cache(self, nombre, acierto):
+        with self._lock:
+            self.caches[nombre][0 if acierto else 1] += 1
+
+    def texto(self):
+        """Todas las métricas en el formato de exposición de Prometheus"""
+        proceso = {'proceso': str(os.getpid())}
+        with self._lock:
+            histogramas = {clave: (list(conteos), suma) for clave, (conteos, suma) in self.histogramas.items()}
+            peticiones = dict(self.peticiones)
+            sql = {vista: tuple(valores) for vista, valores in self.sql.items()}
+            plantillas = dict(self.plantillas)
+            caches = {nombre: tuple(valores) for nombre, valores in self.caches.items()}
+
+        lineas = [
+            '# HELP lab_peticion_segundos Latencia de las peticiones por vista.',
+            '# TYPE lab_peticion_segundos histogram',
+        ]
+        limites = [_numero(limite) for limite in self.cubetas] + ['+Inf']
+        for (vista, metodo), (conteos, suma) in sorted(histogramas.items()):
+            etiquetas = {**proceso, 'vista': vista, 'metodo': metodo}
+            acumulado = 0
+            for limite, conteo in zip(limites, conteos):
+                acumulado += conteo
+                lineas.append(f"lab_peticion_segundos_bucket{_etiquetas({**etiquetas, 'le': limite})} {acumulado}")
+            lineas.append(f'lab_peticion_segundos_sum{_etiquetas(etiquetas)} {_numero(suma)}')
+            lineas.append(f'lab_peticion_segundos_count{_etiquetas(etiquetas)} {acumulado}')
+
+        def contador(nombre, ayuda, valores):
+            lineas.extend([f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} counter'])
+            for etiquetas, valor in sorted(valores, key=lambda par: sorted(par[0].items())):
+                lineas.append(f'{nombre}{_etiquetas({**proceso, **etiquetas})} {_numero(valor)}')
+
+        contador('lab_peticiones_total', 'Peticiones atendidas por código de estado.', [
+            ({'vista': vista, 'metodo': metodo, 'estado': estado}, total)
+            for (vista, metodo, estado), total in peticiones.items()
+        ])
+        contador('lab_sql_consultas_total', 'Consultas SQL ejecutadas por vista.', [
+            ({'vista': vista}, total) for vista, (total, _) in sql.items()
+        ])
+        contador('lab_sql_segundos_total', 'Tiempo en consultas SQL por vista.', [
+            ({'vista': vista}, segundos) for vista, (_, segundos) in sql.items()
+        ])
+        contador('lab_plantilla_segundos_total', 'Tiempo renderizando plantillas por vista.', [
+            ({'vista': vista}, segundos) for vista, segundos in plantillas.items()
+        ])
+        contador('lab_cache_aciertos_total', 'Lecturas de caché que encontraron el dato.', [
+            ({'cache': nombre}, aciertos) for nombre, (aciertos, _) in caches.items()
+        ])
+        contador('lab_cache_fallos_total', 'Lecturas de caché que tuvieron que recalcular.', [
+            ({'cache': nombre}, fallos) for nombre, (_, fallos) in caches.items()
+        ])
+        return '\n'.join(lineas) + '\n'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _etiquetas(etiquetas):
+    def escapar(valor):
+        return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{clave}="{escapar(valor)}"' for clave, valor in etiquetas.items()) + '}'
+
+
+registro = Registro(getattr(settings, 'LAB_METRICAS_CUBETAS', CUBETAS))
+
+
+def contar_cache(nombre, acierto):
+    """Para las cachés propias: cuenta una lectura como acierto o fallo"""
+    if getattr(settings, 'LAB_METRICAS', True):
+        registro.contar_cache(nombre, acierto)
+
+
+@receiver(cache_consultada)
+def _cache_consultada(sender, nombre, acierto, **kwargs):
+    contar_cache(nombre, acierto)
+
+
+def nombre_vista(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    if coincidencia is None:
+        return SIN_RUTA
+    return coincidencia.view_name or coincidencia.route or SIN_RUTA
+
+
+class Perfilador:
+    """Decide qué peticiones perfilar y guarda las que superan el umbral"""
+
+    def __init__(self):
+        self.umbral_ms = getattr(settings, 'LAB_METRICAS_PERFIL_UMBRAL_MS', None)
+        self.muestreo = getattr(settings, 'LAB_METRICAS_PERFIL_MUESTREO', 0.01)
+        self.directorio = str(getattr(settings, 'LAB_METRICAS_PERFIL_DIRECTORIO', settings.BASE_DIR / 'perfiles'))
+        self.maximo = getattr(settings, 'LAB_METRICAS_PERFIL_MAXIMO', 100)
+        self.guardados = None
+
+    def iniciar(self):
+        if self.umbral_ms is None or random.random() >= self.muestreo:
+            return None
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            # Ya hay otro perfilador activo en este hilo
+            return None
+        return perfil
+
+    def terminar(self, perfil, request, segundos):
+        perfil.disable()
+        if segundos * 1000 < self.umbral_ms:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        if self.guardados is None:
+            self.guardados = sum(1 for nombre in os.listdir(self.directorio) if nombre.endswith('.prof'))
+        if self.guardados >= self.maximo:
+            return
+        vista = re.sub(r'[^\w.-]+', '_', nombre_vista(request))
+        nombre = f"{timezone.now():%Y%m%d-%H%M%S}_{vista}_{segundos * 1000:.0f}ms_{os.getpid()}.prof"
+        perfil.dump_stats(os.path.join(self.directorio, nombre))
+        self.guardados += 1
+
+
+class MetricasMiddleware:
+    # Conviene ponerlo primero en MIDDLEWARE para que la latencia incluya a los
+    # demás. En ASGI (vistas async) solo mide latencia y estado: las consultas
+    # corren en los hilos de sync_to_async.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.activo = getattr(settings, 'LAB_METRICAS', True)
+        self.perfilador = Perfilador()
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self._llamar_async(request)
+        if not self.activo:
+            return self.get_response(request)
+        peticion = Peticion()
+        token = _peticion.set(peticion)
+        perfil = self.perfilador.iniciar()
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pila:
+                for alias in connections:
+                    pila.enter_context(connections[alias].execute_wrapper(peticion))
+                response = self.get_response(request)
+        finally:
+            segundos = time.perf_counter() - inicio
+            if perfil is not None:
+                self.perfilador.terminar(perfil, request, segundos)
+            _peticion.reset(token)
+        registro.observar(nombre_vista(request), request.method, response.status_code, segundos, peticion)
+        return response
+
+    def process_template_response(self, request, response):
+        # Al ser el primer middleware, este gancho corre justo antes de render()
+        peticion = _peticion.get()
+        if peticion is None:
+            return response
+        inicio = time.perf_counter()
+
+        def medir(respuesta):
+            peticion.plantilla_segundos += time.perf_counter() - inicio
+
+        response.add_post_render_callback(medir)
+        return response
+
+    async def _llamar_async(self, request):
+        if not self.activo:
+            return await self.get_response(request)
+        inicio = time.perf_counter()
+        response = await self.get_response(request)
+        registro.observar(nombre_vista(request), request.method, response.status_code, time.perf_counter() - inicio)
+        return response
+
+
+def autorizado(request):
+    token = getattr(settings, 'LAB_METRICAS_TOKEN', None)
+    if token:
+        cabecera = request.headers.get('Authorization', '')
+        return hmac.compare_digest(cabecera.encode(), f'Bearer {token}'.encode())
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'LAB_METRICAS_IPS', ('127.0.0.1', '::1'))
+
+
+@require_safe
+def exponer(request):
+    # 404 y no 403: a quien no puede leerlas no se le confirma que existen
+    if not autorizado(request):
+        raise Http404
+    return HttpResponse(registro.texto(), content_type=TIPO_CONTENIDO)
@@ -1,6 +1,8 @@
 
 from pathlib import Path
 
+from .basedatos import base_de_datos
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -38,7 +40,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero, para que la latencia medida incluya al resto (ver metricas.py)
+    'LabConriquezConfig.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'labApp.instrumentacion.ConsultasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -72,11 +77,9 @@ WSGI_APPLICATION = 'LabConriquezConfig.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Perfil según LAB_DB_PERFIL (sqlite por defecto, o postgres); ver basedatos.py
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': base_de_datos(BASE_DIR),
 }
 
 
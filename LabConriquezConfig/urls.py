@@ -19,6 +19,7 @@ from django.urls import path
 from labApp import views
 from django.conf import settings
 from django.conf.urls.static import static
+from . import metricas
 
 # Configuración del panel de administración
 admin.site.site_header = "Administración del Laboratorio Conriquez"
@@ -29,6 +30,9 @@ admin.site.index_title = "Bienvenido al Administrador"
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("LabConriquezMex/", views.inicio, name="inicio"),
+    path("api/ingesta/resultados/", views.ingestar_resultados, name="ingesta_resultados"),
+    path("logos/<str:nombre>", views.logo_variante, name="logo_variante"),
+    path("metrics", metricas.exponer, name="metricas"),
     # aquí puedes agregar otras rutas
 ]
 
@@ -13,6 +13,6 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LabConriquez.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LabConriquezConfig.settings')
 
 application = get_wsgi_application()
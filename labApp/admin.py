@@ -1,97 +1,234 @@
-from django.contrib import admin
+import json
+
+from django.contrib import admin, messages
+from django.contrib.admin.widgets import AutocompleteSelect
 from django import forms
-from django.utils.html import format_html
-from django.db import transaction, models
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.http import (
+    FileResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.html import format_html, format_html_join
+from django.utils import timezone
+from django.utils.http import http_date
+from django.db import models
+from . import (
+    busqueda, exportacion, imagenes, ingesta_archivos, laboratorios, reportes, resultados, tareas, tendencias,
+)
+from .paginacion import PaginacionKeysetMixin
 from .models import (
     Usuario, Laboratorio, Paciente, Pago, LoincCode, Analisis,
-    ResultadoAnalisis, Plantilla, PropiedadPlantilla, IntervaloReferencia, Reporte
+    ResultadoAnalisis, Plantilla, PropiedadPlantilla, IntervaloReferencia, Reporte,
+    ArchivoIngesta, ResultadoCuarentena, Tarea, ResumenControlDiario,
 )
 
+COLORES_BANDERA = {'H': 'red', 'L': 'red', 'N': 'green'}
+
+
+def trazo_svg(valores, ancho=160, alto=32):
+    """Puntos de un <polyline> que dibuja ``valores`` escalados al recuadro"""
+    if len(valores) < 2:
+        return ''
+    minimo, maximo = min(valores), max(valores)
+    rango = (maximo - minimo) or 1
+    paso = ancho / (len(valores) - 1)
+    return ' '.join(
+        f'{i * paso:.1f},{alto - (v - minimo) * alto / rango:.1f}' for i, v in enumerate(valores)
+    )
+
+
+def valor_con_color(resultado):
+    """Valor en rojo/verde según la bandera calculada al guardar; sin color si no es numérico"""
+    color = COLORES_BANDERA.get(resultado.bandera)
+    if color:
+        return format_html('<span style="color:{};">{}</span>', color, resultado.valor)
+    return resultado.valor
+
+# -------------------------------
+# Separación por laboratorio
+# -------------------------------
+class PorLaboratorioAdminMixin:
+    """Limita el admin a los laboratorios del usuario (labApp/laboratorios.py); el superusuario ve todos"""
+    # Lookup con el id del laboratorio de cada fila; en las tablas grandes es la copia denormalizada
+    campo_laboratorio = 'laboratorio_id'
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        ids = laboratorios.laboratorios_de(request)
+        if ids is None:
+            return queryset
+        return queryset.filter(**{f'{self.campo_laboratorio}__in': ids})
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        """Solo se pueden elegir laboratorios (o pacientes) propios, también con raw_id_fields"""
+        ids = laboratorios.laboratorios_de(request)
+        if ids is not None and 'queryset' not in kwargs:
+            if db_field.related_model is Laboratorio:
+                kwargs['queryset'] = Laboratorio.objects.filter(pk__in=ids)
+            elif db_field.related_model is Paciente:
+                kwargs['queryset'] = Paciente.objects.de_laboratorios(ids)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class LaboratorioListFilter(admin.RelatedFieldListFilter):
+    """Filtro lateral de laboratorio con solo los del usuario"""
+
+    def field_choices(self, field, request, model_admin):
+        ids = laboratorios.laboratorios_de(request)
+        return field.get_choices(
+            include_blank=False, ordering=self.field_admin_ordering(field, request, model_admin),
+            limit_choices_to=None if ids is None else {'pk__in': ids},
+        )
+
 # -------------------------------
 # Inlines
 # -------------------------------
+class AutocompletePrecargado(AutocompleteSelect):
+    """AutocompleteSelect que usa el objeto ya cargado de la fila en lugar de consultarlo (una consulta por fila)"""
+    precargado = None
+
+    def optgroups(self, name, value, attr=None):
+        objeto = self.precargado
+        if objeto is None or [str(v) for v in value if v] != [str(objeto.pk)]:
+            return super().optgroups(name, value, attr)
+        opciones = []
+        if not self.is_required:
+            opciones.append(self.create_option(name, '', '', False, 0))
+        etiqueta = self.choices.field.label_from_instance(objeto)
+        opciones.append(self.create_option(name, objeto.pk, etiqueta, {str(objeto.pk)}, len(opciones)))
+        return [(None, opciones, 0)]
+
+
+class PkPrecargado(forms.ModelChoiceField):
+    """Campo oculto del id de cada fila que la busca en las filas ya cargadas del formset (no una consulta por fila)"""
+
+    def __init__(self, formset, *args, **kwargs):
+        self.formset = formset
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            pk = self.queryset.model._meta.pk.to_python(value)
+        except ValidationError:
+            pk = None
+        objeto = self.formset._existing_object(pk) if pk is not None else None
+        if objeto is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+        return objeto
+
+
+class FormSetPrecargado(forms.BaseInlineFormSet):
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        nombre = self._pk_field.name
+        campo = form.fields.get(nombre)
+        if type(campo) is forms.ModelChoiceField:
+            form.fields[nombre] = PkPrecargado(
+                self, campo.queryset, initial=campo.initial, required=False, widget=campo.widget,
+            )
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        for nombre, campo in form.fields.items():
+            widget = getattr(campo.widget, 'widget', campo.widget)
+            if isinstance(widget, AutocompletePrecargado):
+                relacion = form.instance._meta.get_field(nombre)
+                if relacion.is_cached(form.instance):
+                    widget.precargado = relacion.get_cached_value(form.instance)
+        return form
+
+
+class InlinePrecargadoMixin:
+    """Carga con select_related las relaciones que muestra el inline (autocomplete y __str__)"""
+    formset = FormSetPrecargado
+    relaciones_precargadas = ()
+
+    def get_queryset(self, request):
+        relaciones = set(self.relaciones_precargadas) | set(self.get_autocomplete_fields(request))
+        return super().get_queryset(request).select_related(*relaciones)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request) and 'widget' not in kwargs:
+            kwargs['widget'] = AutocompletePrecargado(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
 class IntervaloReferenciaInline(admin.TabularInline):
     model = IntervaloReferencia
+    fields = ('sexo', 'edad_min', 'edad_max', 'unidad_edad', 'valor_min', 'valor_max')
     extra = 1  # Siempre mostrar un registro vacío para llenar
 
-class PropiedadPlantillaInline(admin.TabularInline):
+class PropiedadPlantillaInline(InlinePrecargadoMixin, admin.TabularInline):
     model = PropiedadPlantilla
+    relaciones_precargadas = ('plantilla',)  # PropiedadPlantilla.__str__
     fields = ('nombre_propiedad', 'unidad', 'loinc_code')
     autocomplete_fields = ('loinc_code',)  # Busca LOINC por texto
     extra = 1
     verbose_name = "Propiedad"
     verbose_name_plural = "Añadir Propiedades a esta Plantilla"
 
-class ResultadoAnalisisInline(admin.TabularInline):
+MENSAJE_CONFLICTO = 'Otro usuario guardó este resultado mientras lo editabas. Recarga la página para ver su valor.'
+
+class ResultadoAnalisisForm(forms.ModelForm):
+    class Meta:
+        model = ResultadoAnalisis
+        fields = '__all__'
+        widgets = {'version': forms.HiddenInput}
+
+class ResultadosFormSet(FormSetPrecargado):
+    # Resultados que chocaron al guardar; los marca ResultadoAnalisisInline.get_formset
+    en_conflicto = frozenset()
+
+    def clean(self):
+        """Revisa las versiones con las filas bloqueadas: el bloqueo dura hasta que changeform_view confirma"""
+        super().clean()
+        editados = {
+            form.instance.pk: form for form in self.forms
+            if form.instance.pk and form.has_changed() and not self._should_delete_form(form)
+            and 'version' in getattr(form, 'cleaned_data', {})
+        }
+        if not editados:
+            return
+        actuales = dict(
+            ResultadoAnalisis.objects.select_for_update().filter(pk__in=editados).values_list('pk', 'version')
+        )
+        for pk, form in editados.items():
+            if pk in self.en_conflicto or form.cleaned_data['version'] != actuales.get(pk):
+                form.add_error(None, MENSAJE_CONFLICTO)
+
+class ResultadoAnalisisInline(InlinePrecargadoMixin, admin.TabularInline):
     model = ResultadoAnalisis
+    form = ResultadoAnalisisForm
+    formset = ResultadosFormSet
     extra = 0
     autocomplete_fields = ['loinc_code']
-    fields = ('loinc_code', 'nombre_propiedad', 'valor', 'unidad', 'intervalo_referencia', 'valor_coloreado')
+    fields = ('loinc_code', 'nombre_propiedad', 'valor', 'unidad', 'intervalo_referencia', 'valor_coloreado', 'version')
     readonly_fields = ('intervalo_referencia', 'valor_coloreado')
 
+    class Media:
+        js = ('labApp/js/autoguardado_resultados.js',)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.en_conflicto = getattr(request, 'resultados_en_conflicto', frozenset())
+        return formset
+
     def intervalo_referencia(self, obj):
-        """Muestra el rango de referencia según paciente"""
-        paciente = obj.analisis.paciente
-        edad = paciente.edad
-        sexo = paciente.sexo
-
-        if edad <= 18:
-            grupo_edad = "NINO"
-        elif edad <= 59:
-            grupo_edad = "ADULTO"
-        else:
-            grupo_edad = "ADULTO_MAYOR"
-
-        # Buscar el intervalo correspondiente
-        propiedad = obj.analisis.plantilla.propiedades.filter(nombre_propiedad=obj.nombre_propiedad).first()
-        if not propiedad:
-            return "-"
-        intervalo = propiedad.intervalos.filter(
-            grupo_edad=grupo_edad
-        ).filter(
-            models.Q(sexo=sexo) | models.Q(sexo="AMBOS")
-        ).first()
-
-        if intervalo:
-            return f"{intervalo.valor_min} - {intervalo.valor_max} {obj.unidad or ''}"
+        """Muestra el rango de referencia guardado en el resultado"""
+        if obj.ref_min is not None and obj.ref_max is not None:
+            return f"{obj.ref_min} - {obj.ref_max} {obj.unidad or ''}"
         return "-"
 
     intervalo_referencia.short_description = "Rango Ref."
 
     def valor_coloreado(self, obj):
         """Muestra el valor con color según esté dentro o fuera del rango"""
-        paciente = obj.analisis.paciente
-        edad = paciente.edad
-        sexo = paciente.sexo
-
-        if edad <= 18:
-            grupo_edad = "NINO"
-        elif edad <= 59:
-            grupo_edad = "ADULTO"
-        else:
-            grupo_edad = "ADULTO_MAYOR"
-
-        propiedad = obj.analisis.plantilla.propiedades.filter(nombre_propiedad=obj.nombre_propiedad).first()
-        if not propiedad:
-            return obj.valor
-
-        intervalo = propiedad.intervalos.filter(
-            grupo_edad=grupo_edad
-        ).filter(
-            models.Q(sexo=sexo) | models.Q(sexo="AMBOS")
-        ).first()
-
-        if intervalo:
-            try:
-                valor = float(obj.valor)
-                if valor < intervalo.valor_min or valor > intervalo.valor_max:
-                    color = "red"
-                else:
-                    color = "green"
-                return format_html('<span style="color:{};">{}</span>', color, obj.valor)
-            except ValueError:
-                return obj.valor  # Valor no numérico
-        return obj.valor
+        return valor_con_color(obj)
 
     valor_coloreado.short_description = "Valor Coloreado"
 
@@ -129,49 +266,127 @@ class PropiedadPlantillaAdmin(admin.ModelAdmin):
 # Admin de Analisis
 # -------------------------------
 @admin.register(Analisis)
-class AnalisisAdmin(admin.ModelAdmin):
+class AnalisisAdmin(PorLaboratorioAdminMixin, PaginacionKeysetMixin, admin.ModelAdmin):
     list_display = ('id', 'paciente', 'plantilla', 'fecha_analisis')
+    list_select_related = ('paciente__laboratorio', 'plantilla')
+    keyset_campos = ('fecha_analisis', 'id')
     search_fields = ('paciente__nombre', 'plantilla__titulo')
-    list_filter = ('plantilla', 'fecha_analisis')
+    list_filter = ('plantilla', 'fecha_analisis', 'es_control')
     inlines = [ResultadoAnalisisInline]
     raw_id_fields = ('paciente', 'plantilla')
-
-    def save_model(self, request, obj, form, change):
-        super().save_model(request, obj, form, change)
-
-        # Crear resultados solo para análisis nuevos y con plantilla
-        if not change and obj.plantilla and obj.plantilla.tipo_formato != 'RECETA_JUSTIFICADA':
-            paciente = obj.paciente
-            sexo_paciente = paciente.sexo
-            if paciente.edad <= 18:
-                grupo_edad = "NINO"
-            elif paciente.edad <= 59:
-                grupo_edad = "ADULTO"
-            else:
-                grupo_edad = "ADULTO_MAYOR"
-
-            resultados = []
-            for propiedad in obj.plantilla.propiedades.all():
-                intervalo = propiedad.intervalos.filter(
-                    grupo_edad=grupo_edad
-                ).filter(
-                    models.Q(sexo=sexo_paciente) | models.Q(sexo="AMBOS")
-                ).first()
-
-                if intervalo:
-                    if not ResultadoAnalisis.objects.filter(
-                        analisis=obj, nombre_propiedad=propiedad.nombre_propiedad
-                    ).exists():
-                        resultados.append(
-                            ResultadoAnalisis(
-                                analisis=obj,
-                                loinc_code=propiedad.loinc_code,
-                                nombre_propiedad=propiedad.nombre_propiedad,
-                                valor='',
-                                unidad=propiedad.unidad
-                            )
-                        )
-            ResultadoAnalisis.objects.bulk_create(resultados)
+    actions = ['descargar_reportes_zip', 'exportar_csv', 'exportar_jsonl', 'encolar_pdfs', 'encolar_recalculo']
+    # Los resultados de un análisis nuevo los crea la señal post_save (labApp/resultados.py)
+
+    def save_formset(self, request, form, formset, change):
+        """Los resultados editados se guardan con un solo bulk_update en lugar de un UPDATE por fila"""
+        if formset.model is not ResultadoAnalisis:
+            return super().save_formset(request, form, formset, change)
+        instancias = formset.save(commit=False)
+        for obj in formset.deleted_objects:
+            obj.delete()
+        for obj in instancias:
+            if obj.pk is None:
+                obj.save()
+        campos = {campo for _, cambiados in formset.changed_objects for campo in cambiados} - {'version'}
+        existentes = [obj for obj, _ in formset.changed_objects]
+        for obj in existentes:
+            obj.analisis = form.instance
+        # Las versiones ya se revisaron con las filas bloqueadas (ResultadosFormSet.clean); si aun así hay
+        # conflicto (SQLite no bloquea al leer) la excepción deshace todo en changeform_view
+        resultados.guardar_en_lote(existentes, campos=sorted(campos))
+        formset.save_m2m()
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except resultados.ConflictoVersion as exc:
+            # La transacción de super() ya se revirtió completa: se valida otra vez el mismo POST con esas
+            # filas marcadas, para devolver el formulario con lo capturado y el error en cada una
+            request.resultados_en_conflicto = frozenset(r.pk for r in exc.resultados)
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
+    def get_urls(self):
+        urls = [
+            path(
+                '<int:analisis_id>/resultados/<int:resultado_id>/valor/',
+                self.admin_site.admin_view(self.autoguardar_valor),
+                name='labApp_analisis_autoguardar_valor',
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def autoguardar_valor(self, request, analisis_id, resultado_id):
+        """Guarda el valor de un resultado desde el formulario (JSON {valor, version}) sin enviar la página"""
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        resultado = get_object_or_404(
+            ResultadoAnalisis.objects.de_laboratorios(laboratorios.laboratorios_de(request))
+            .select_related('analisis__paciente'), pk=resultado_id, analisis_id=analisis_id,
+        )
+        if not self.has_change_permission(request, resultado.analisis):
+            raise PermissionDenied
+        try:
+            datos = json.loads(request.body)
+            valor = str(datos['valor'])
+            version = int(datos['version'])
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'error': 'Se esperaba {"valor": ..., "version": ...}'}, status=400)
+        if len(valor) > ResultadoAnalisis._meta.get_field('valor').max_length:
+            return JsonResponse({'error': 'El valor es demasiado largo.'}, status=400)
+        resultado.valor = valor
+        resultado.version = version
+        try:
+            resultados.guardar_en_lote([resultado])
+        except resultados.ConflictoVersion:
+            actual = ResultadoAnalisis.objects.values('valor', 'version').get(pk=resultado_id)
+            return JsonResponse({'error': 'Otro usuario guardó este resultado.', **actual}, status=409)
+        return JsonResponse({
+            'version': resultado.version,
+            'valor_numerico': resultado.valor_numerico,
+            'ref_min': resultado.ref_min,
+            'ref_max': resultado.ref_max,
+            'bandera': resultado.bandera,
+        })
+
+    @admin.action(description='Descargar reportes PDF (ZIP)')
+    def descargar_reportes_zip(self, request, queryset):
+        """Genera los PDF seleccionados en paralelo y los envía en un ZIP conforme van quedando"""
+        usuario = Usuario.objects.filter(correo_electronico=request.user.email).first() if request.user.email else None
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+        respuesta = StreamingHttpResponse(
+            reportes.reportes_zip(ids, generado_por=usuario), content_type='application/zip',
+        )
+        respuesta.headers['Content-Disposition'] = f'attachment; filename="reportes_{timezone.localdate():%Y%m%d}.zip"'
+        return respuesta
+
+    def _exportar(self, queryset, formato, content_type):
+        respuesta = StreamingHttpResponse(
+            exportacion.exportar(formato, analisis=queryset.order_by().values('id')), content_type=content_type,
+        )
+        respuesta.headers['Content-Disposition'] = (
+            f'attachment; filename="resultados_{timezone.localdate():%Y%m%d}.{formato}"'
+        )
+        return respuesta
+
+    @admin.action(description='Generar reportes PDF en segundo plano')
+    def encolar_pdfs(self, request, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        tareas.encolar('reportes.pdf', analisis_ids=ids)
+        self.message_user(request, f'{len(ids)} reportes encolados; estarán listos en la caché al terminar.', messages.SUCCESS)
+
+    @admin.action(description='Recalcular banderas en segundo plano')
+    def encolar_recalculo(self, request, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        tareas.encolar('resultados.recalcular', analisis_ids=ids)
+        self.message_user(request, f'Recálculo de {len(ids)} análisis encolado.', messages.SUCCESS)
+
+    @admin.action(description='Exportar resultados (CSV)')
+    def exportar_csv(self, request, queryset):
+        return self._exportar(queryset, 'csv', 'text/csv; charset=utf-8')
+
+    @admin.action(description='Exportar resultados (JSON Lines)')
+    def exportar_jsonl(self, request, queryset):
+        return self._exportar(queryset, 'jsonl', 'application/x-ndjson; charset=utf-8')
 
 # -------------------------------
 # Admin de Usuario
@@ -198,13 +413,16 @@ class UsuarioAdmin(admin.ModelAdmin):
 # Admin de Laboratorio
 # -------------------------------
 @admin.register(Laboratorio)
-class LaboratorioAdmin(admin.ModelAdmin):
+class LaboratorioAdmin(PorLaboratorioAdminMixin, admin.ModelAdmin):
+    campo_laboratorio = 'pk'
     list_display = ('id', 'nombre_laboratorio', 'ciudad', 'estado', 'pais', 'codigo_postal', 'logo_thumbnail')
     search_fields = ('nombre_laboratorio', 'ciudad', 'estado', 'pais')
 
     def logo_thumbnail(self, obj):
         if obj.logo:
-            return format_html('<img src="{}" width="50" height="50" />', obj.logo.url)
+            # La miniatura pesa unos KB; el original solo mientras no se generan las variantes
+            url = imagenes.url_variante(obj, 'miniatura') or obj.logo.url
+            return format_html('<img src="{}" width="50" height="50" style="object-fit:contain;" loading="lazy" />', url)
         return "-"
     logo_thumbnail.short_description = 'Logo'
 
@@ -212,10 +430,87 @@ class LaboratorioAdmin(admin.ModelAdmin):
 # Admin de Paciente
 # -------------------------------
 @admin.register(Paciente)
-class PacienteAdmin(admin.ModelAdmin):
-    list_display = ('id', 'nombre', 'edad', 'sexo', 'laboratorio', 'telefono', 'correo_electronico')
-    search_fields = ('nombre', 'laboratorio__nombre_laboratorio')
-    list_filter = ('sexo', 'laboratorio')
+class PacienteAdmin(PorLaboratorioAdminMixin, admin.ModelAdmin):
+    list_display = ('id', 'nombre', 'edad', 'sexo', 'laboratorio', 'telefono', 'correo_electronico', 'ver_tendencias')
+    search_fields = ('nombre',)
+    search_help_text = 'Nombre y apellidos en cualquier orden, con o sin acentos, o nombre del laboratorio'
+    list_filter = ('sexo', ('laboratorio', LaboratorioListFilter))
+
+    def get_search_results(self, request, queryset, search_term):
+        """Claves normalizada y fonética del nombre (índice trigram) en lugar de icontains con join.
+
+        El nombre del laboratorio se busca aparte en su tabla (pocas filas) y se
+        filtra por el laboratorio_id indexado del paciente.
+        """
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        filtro = busqueda.filtro_pacientes(search_term)
+        laboratorio_ids = list(
+            Laboratorio.objects.filter(nombre_laboratorio__icontains=search_term.strip()).values_list('id', flat=True)
+        )
+        if laboratorio_ids:
+            filtro |= models.Q(laboratorio_id__in=laboratorio_ids)
+        return queryset.filter(filtro), False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not obj.nombre_fonetico or (change and 'nombre' not in form.changed_data):
+            return
+        # Mismo nombre fonético en el laboratorio: probablemente el paciente ya estaba registrado
+        parecidos = list(Paciente.objects.filter(
+            laboratorio_id=obj.laboratorio_id, nombre_fonetico=obj.nombre_fonetico,
+        ).exclude(pk=obj.pk).only('id', 'nombre', 'edad')[:5])
+        if parecidos:
+            self.message_user(request, format_html(
+                'Posible paciente duplicado: {}', format_html_join(', ', '<a href="{}">{} ({} años)</a>', (
+                    (reverse('admin:labApp_paciente_change', args=[p.pk]), p.nombre, p.edad) for p in parecidos
+                )),
+            ), messages.WARNING)
+
+    def get_urls(self):
+        urls = [
+            path(
+                '<int:paciente_id>/tendencias/',
+                self.admin_site.admin_view(self.tendencias_view),
+                name='labApp_paciente_tendencias',
+            ),
+            path(
+                '<int:paciente_id>/tendencias.json',
+                self.admin_site.admin_view(self.tendencias_json),
+                name='labApp_paciente_tendencias_json',
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def _paciente(self, request, paciente_id):
+        paciente = get_object_or_404(self.get_queryset(request).select_related('laboratorio'), pk=paciente_id)
+        if not self.has_view_permission(request, paciente):
+            raise PermissionDenied
+        return paciente
+
+    def tendencias_json(self, request, paciente_id):
+        """Series por LOINC del paciente (?loinc=2345-7 para una sola) con estadísticas y delta check"""
+        paciente = self._paciente(request, paciente_id)
+        series = tendencias.tendencias_paciente(paciente.pk, request.GET.get('loinc') or None)
+        return JsonResponse({'paciente': paciente.pk, 'series': [tendencias.a_json(s) for s in series.values()]})
+
+    def tendencias_view(self, request, paciente_id):
+        """Panel con la evolución de cada analito del paciente"""
+        paciente = self._paciente(request, paciente_id)
+        series = list(tendencias.tendencias_paciente(paciente.pk, request.GET.get('loinc') or None).values())
+        for serie in series:
+            serie['trazo'] = trazo_svg([p['valor_numerico'] for p in serie['puntos']])
+        return TemplateResponse(request, 'admin/labapp/paciente/tendencias.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'original': paciente,
+            'title': f'Tendencias de {paciente.nombre}',
+            'series': series,
+        })
+
+    @admin.display(description='Tendencias')
+    def ver_tendencias(self, obj):
+        return format_html('<a href="{}">Ver</a>', reverse('admin:labApp_paciente_tendencias', args=[obj.pk]))
 
 # -------------------------------
 # Admin de Pago
@@ -230,11 +525,19 @@ class PagoAdmin(admin.ModelAdmin):
 # Admin de ResultadoAnalisis
 # -------------------------------
 @admin.register(ResultadoAnalisis)
-class ResultadoAnalisisAdmin(admin.ModelAdmin):
-    list_display = ('analisis', 'nombre_propiedad', 'valor', 'unidad')
+class ResultadoAnalisisAdmin(PorLaboratorioAdminMixin, PaginacionKeysetMixin, admin.ModelAdmin):
+    list_display = ('analisis', 'nombre_propiedad', 'valor_coloreado', 'unidad', 'ref_min', 'ref_max', 'bandera')
+    list_select_related = ('analisis__paciente', 'analisis__plantilla')
+    exclude = ('version',)
+    raw_id_fields = ('analisis',)  # Un <select> con todos los análisis hacía una consulta por opción
     search_fields = ('nombre_propiedad', 'analisis__paciente__nombre')
+    list_filter = ('bandera',)
     autocomplete_fields = ['loinc_code']
 
+    @admin.display(description='Valor', ordering='valor_numerico')
+    def valor_coloreado(self, obj):
+        return valor_con_color(obj)
+
 # -------------------------------
 # Admin de LoincCode
 # -------------------------------
@@ -245,21 +548,36 @@ class LoincCodeAdmin(admin.ModelAdmin):
     list_filter = ('system', 'scale_typ')
     ordering = ('loinc_num',)
 
+    def get_search_results(self, request, queryset, search_term):
+        """Usa el índice FTS en lugar de icontains sobre cuatro columnas"""
+        if not busqueda.consulta_fts(search_term) or not busqueda.disponible():
+            return super().get_search_results(request, queryset, search_term)
+
+        resolver = getattr(request, 'resolver_match', None)
+        if resolver and resolver.url_name == 'autocomplete':
+            # El widget solo muestra las primeras páginas: se ordena por relevancia
+            ids = busqueda.buscar_loinc_ids(search_term, limite=busqueda.LIMITE_AUTOCOMPLETE)
+            return queryset.filter(pk__in=ids).order_by(busqueda.orden_por_ids(ids)), False
+
+        termino = search_term.strip()
+        return queryset.filter(
+            models.Q(pk__in=busqueda.subconsulta_fts(termino))
+            | models.Q(**busqueda.filtro_loinc_num(termino))
+        ), False
+
 # -------------------------------
 # Admin de Reporte
 # -------------------------------
-from django.contrib import admin
-from django.utils.html import format_html
-from .models import Reporte
-
 @admin.register(Reporte)
-class ReporteAdmin(admin.ModelAdmin):
+class ReporteAdmin(PorLaboratorioAdminMixin, PaginacionKeysetMixin, admin.ModelAdmin):
     list_display = ("id", "analisis_str", "paciente_str", "usuario_str", "fecha_generacion", "ver_pdf")
+    list_select_related = ("analisis__paciente__laboratorio", "analisis__plantilla", "generado_por")
+    keyset_campos = ("fecha_generacion", "id")
     
     # Filtros válidos: solo campos existentes en el modelo o relacionados
     list_filter = ("fecha_generacion", "analisis__plantilla")
     
-    search_fields = ("analisis__plantilla__titulo", "analisis__paciente__nombre", "usuario_generador__nombre")
+    search_fields = ("analisis__plantilla__titulo", "analisis__paciente__nombre", "generado_por__nombre")
     
     readonly_fields = ("analisis_str", "paciente_str", "usuario_str", "fecha_generacion")
 
@@ -276,7 +594,7 @@ class ReporteAdmin(admin.ModelAdmin):
     # Mostrar usuario generador
     @admin.display(description='Generado por')
     def usuario_str(self, obj):
-        return str(obj.usuario_generador)
+        return str(obj.generado_por) if obj.generado_por else "-"
 
     # No permitir agregar desde admin
     def has_add_permission(self, request):
@@ -290,12 +608,156 @@ class ReporteAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return True
 
+    def get_urls(self):
+        urls = [
+            path('<int:reporte_id>/pdf/', self.admin_site.admin_view(self.pdf_view), name='labApp_reporte_pdf'),
+        ]
+        return urls + super().get_urls()
+
+    def pdf_view(self, request, reporte_id):
+        """Envía el PDF del análisis del reporte; solo se renderiza si cambió su contenido"""
+        reporte = get_object_or_404(self.get_queryset(request).only('id', 'analisis_id'), pk=reporte_id)
+        if not self.has_view_permission(request, reporte):
+            raise PermissionDenied
+        analisis = reportes.analisis_para_reporte([reporte.analisis_id]).get()
+        ruta, clave = reportes.obtener_pdf(analisis)
+        etag = f'"{clave}"'
+        ultima_modificacion = ruta.stat().st_mtime
+        respuesta = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+        if respuesta is None:
+            respuesta = FileResponse(
+                open(ruta, 'rb'), content_type='application/pdf', filename=f'reporte_{reporte.id}.pdf',
+            )
+            respuesta.headers['Content-Disposition'] = f'inline; filename="reporte_{reporte.id}.pdf"'
+        respuesta.headers['ETag'] = etag
+        respuesta.headers['Last-Modified'] = http_date(ultima_modificacion)
+        patch_cache_control(respuesta, private=True, no_cache=True)
+        return respuesta
+
     # Botón para ver PDF
     @admin.display(description='Preview PDF')
     def ver_pdf(self, obj):
-        if obj.analisis:
+        if obj.analisis_id:
             return format_html(
                 '<a class="button" style="background-color:#2ecc71;color:white;padding:3px 8px;border-radius:4px;text-decoration:none;" '
-                'href="/admin/reporte/{}/pdf/" target="_blank">🖨️ Ver PDF</a>', obj.id
+                'href="{}" target="_blank">🖨️ Ver PDF</a>', reverse('admin:labApp_reporte_pdf', args=[obj.id])
             )
         return "-"
+
+# -------------------------------
+# Admin de ArchivoIngesta
+# -------------------------------
+@admin.register(ArchivoIngesta)
+class ArchivoIngestaAdmin(admin.ModelAdmin):
+    list_display = ('ruta', 'estado', 'mensajes', 'resultados', 'en_cuarentena', 'progreso', 'fecha_actualizacion')
+    list_filter = ('estado',)
+    search_fields = ('ruta',)
+    # Los escribe el comando ingestar_archivos; editarlos a mano rompería la reanudación
+    readonly_fields = [f.name for f in ArchivoIngesta._meta.fields]
+
+    @admin.display(description='Leído')
+    def progreso(self, obj):
+        return f'{obj.desplazamiento * 100 // obj.tamano}%' if obj.tamano else '-'
+
+    def has_add_permission(self, request):
+        return False
+
+# -------------------------------
+# Admin de ResultadoCuarentena
+# -------------------------------
+@admin.register(ResultadoCuarentena)
+class ResultadoCuarentenaAdmin(admin.ModelAdmin):
+    list_display = ('orden', 'codigo', 'valor', 'unidad', 'motivo', 'archivo', 'fecha_creacion')
+    list_select_related = ('archivo',)
+    list_filter = ('fecha_creacion',)
+    search_fields = ('orden', 'codigo', 'motivo')
+    raw_id_fields = ('archivo',)
+    actions = ['reintentar']
+
+    @admin.action(description='Reintentar (tras corregir el análisis o la plantilla)')
+    def reintentar(self, request, queryset):
+        total = queryset.count()
+        guardados = ingesta_archivos.reintentar_cuarentena(queryset)
+        self.message_user(request, f'{guardados} de {total} resultados guardados.', messages.SUCCESS)
+
+# -------------------------------
+# Admin de Tarea
+# -------------------------------
+@admin.register(Tarea)
+class TareaAdmin(PaginacionKeysetMixin, admin.ModelAdmin):
+    change_list_template = 'admin/labapp/tarea/change_list.html'
+    list_display = ('id', 'nombre', 'estado', 'prioridad', 'intentos', 'fecha_creacion', 'espera', 'duracion', 'trabajador')
+    list_filter = ('estado', 'nombre')
+    search_fields = ('nombre', 'trabajador')
+    keyset_campos = ('fecha_creacion', 'id')
+    readonly_fields = [f.name for f in Tarea._meta.fields]
+    actions = ['reintentar']
+
+    @admin.display(description='Espera')
+    def espera(self, obj):
+        return obj.fecha_inicio - obj.fecha_creacion if obj.fecha_inicio else '-'
+
+    @admin.display(description='Duración')
+    def duracion(self, obj):
+        return obj.fecha_fin - obj.fecha_inicio if obj.fecha_fin and obj.fecha_inicio else '-'
+
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        """Profundidad de la cola y latencias de la última hora encima de la lista"""
+        return super().changelist_view(request, {'resumen_tareas': tareas.resumen(), **(extra_context or {})})
+
+    @admin.action(description='Reintentar ahora')
+    def reintentar(self, request, queryset):
+        total = queryset.exclude(estado='EN_CURSO').update(
+            estado='PENDIENTE', intentos=0, disponible_desde=timezone.now(), fecha_fin=None,
+        )
+        self.message_user(request, f'{total} tareas devueltas a la cola.', messages.SUCCESS)
+
+# -------------------------------
+# Admin de ResumenControlDiario
+# -------------------------------
+@admin.register(ResumenControlDiario)
+class ResumenControlDiarioAdmin(PorLaboratorioAdminMixin, admin.ModelAdmin):
+    list_display = (
+        'fecha', 'laboratorio', 'propiedad', 'muestra', 'n', 'media_', 'de_', 'cv_', 'objetivo', 'reglas', 'rechazo',
+    )
+    list_select_related = ('laboratorio', 'propiedad__plantilla')
+    list_filter = ('rechazo', 'es_control', 'fecha', ('laboratorio', LaboratorioListFilter))
+    search_fields = ('propiedad__nombre_propiedad', 'nivel')
+    ordering = ('-fecha', 'laboratorio', 'propiedad', 'es_control', 'nivel')
+    # Los escribe el comando resumir_control_calidad a partir de los resultados
+    readonly_fields = [f.name for f in ResumenControlDiario._meta.fields]
+
+    @admin.display(description='Muestra', ordering='nivel')
+    def muestra(self, obj):
+        return f'Control {obj.nivel}'.strip() if obj.es_control else 'Pacientes'
+
+    @admin.display(description='Media', ordering='media')
+    def media_(self, obj):
+        return f'{obj.media:.4g}'
+
+    @admin.display(description='DE')
+    def de_(self, obj):
+        return f'{obj.de:.3g}' if obj.de is not None else '-'
+
+    @admin.display(description='CV %')
+    def cv_(self, obj):
+        return f'{obj.cv:.1f}' if obj.cv is not None else '-'
+
+    @admin.display(description='Objetivo')
+    def objetivo(self, obj):
+        if obj.media_objetivo is None:
+            return '-'
+        return f'{obj.media_objetivo:.4g} ± {obj.de_objetivo:.3g}' if obj.de_objetivo is not None else f'{obj.media_objetivo:.4g}'
+
+    @admin.display(description='Westgard')
+    def reglas(self, obj):
+        if not obj.violaciones:
+            return '-'
+        color = 'red' if obj.rechazo else 'orange'
+        return format_html('<b style="color:{};">{}</b>', color, ', '.join(obj.violaciones))
+
+    def has_add_permission(self, request):
+        return False
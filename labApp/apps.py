@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class LabappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'labApp'
+
+    def ready(self):
+        # Registra las señales que invalidan la caché de intervalos, suben la
+        # versión de las plantillas, mantienen el laboratorio copiado en análisis,
+        # resultados y reportes, y actualizan los rangos guardados en los resultados
+        from . import estructuras, intervalos, laboratorios, resultados  # noqa: F401
@@ -0,0 +1,135 @@
+# labApp/benchmarks
+#
+# Benchmarks de rendimiento. Se ejecutan con ``manage.py benchmark <nombre>``
+# sobre una base de datos de prueba desechable, nunca sobre la real.
+#
+# Un benchmark puede devolver {caso: métricas} (ver medir_caso); esas métricas
+# se comparan con la línea base guardada (linea_base.json) con --linea-base y
+# se reescriben con --guardar-linea-base.
+
+import json
+import time
+from importlib import import_module
+from pathlib import Path
+
+from labApp.instrumentacion import registrar_consultas
+
+# Módulos que registran benchmarks con @benchmark
+MODULOS = [
+    'labApp.benchmarks.busqueda_loinc',
+    'labApp.benchmarks.control_calidad',
+    'labApp.benchmarks.escritura_concurrente',
+    'labApp.benchmarks.ingesta',
+    'labApp.benchmarks.suite',
+    'labApp.benchmarks.tendencias',
+    'labApp.benchmarks.variantes_logo',
+]
+
+REGISTRO = {}
+
+
+def benchmark(nombre):
+    """Registra ``funcion(opciones, salida)`` bajo ``nombre``"""
+    def decorador(funcion):
+        REGISTRO[nombre] = funcion
+        return funcion
+    return decorador
+
+
+def cargar():
+    for modulo in MODULOS:
+        import_module(modulo)
+    return REGISTRO
+
+
+def medir(funcion, repeticiones):
+    """Ejecuta ``funcion`` ``repeticiones`` veces y devuelve los tiempos en ms"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def percentiles(tiempos):
+    ordenados = sorted(tiempos)
+
+    def p(q):
+        return ordenados[min(len(ordenados) - 1, int(round(q * (len(ordenados) - 1))))]
+
+    return {'p50': p(0.50), 'p95': p(0.95), 'p99': p(0.99), 'max': ordenados[-1]}
+
+
+def formato(nombre, tiempos):
+    stats = percentiles(tiempos)
+    return (
+        f"{nombre:<40} n={len(tiempos):<5} "
+        + ' '.join(f"{clave}={valor:8.2f}ms" for clave, valor in stats.items())
+    )
+
+
+LINEA_BASE = Path(__file__).with_name('linea_base.json')
+
+
+def medir_caso(funcion, repeticiones, calentamiento=1):
+    """Percentiles en ms y consultas SQL por llamada (la mayor observada) de ``funcion``"""
+    for _ in range(calentamiento):
+        funcion()
+    consultas = []
+
+    def contada():
+        with registrar_consultas() as registro:
+            funcion()
+        consultas.append(registro.total)
+
+    tiempos = medir(contada, repeticiones)
+    return {**{clave: round(valor, 3) for clave, valor in percentiles(tiempos).items()}, 'consultas': max(consultas)}
+
+
+def formato_caso(nombre, metricas):
+    return (
+        f"{nombre:<40} p50={metricas['p50']:8.2f}ms p95={metricas['p95']:8.2f}ms "
+        f"p99={metricas['p99']:8.2f}ms consultas={metricas['consultas']}"
+    )
+
+
+def leer_linea_base(ruta=LINEA_BASE):
+    try:
+        with open(ruta, encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return {}
+
+
+def guardar_linea_base(resultados, ruta=LINEA_BASE):
+    """Combina ``resultados`` ({benchmark: {caso: métricas}}) con lo que ya hay en el archivo"""
+    datos = leer_linea_base(ruta)
+    datos.update(resultados)
+    with open(ruta, 'w', encoding='utf-8') as archivo:
+        json.dump(datos, archivo, indent=2, sort_keys=True, ensure_ascii=False)
+        archivo.write('\n')
+
+
+def comparar(actual, base, tolerancia=0.5, minimo_ms=1.0):
+    """[(caso, detalle, es_regresion)] de un benchmark contra su línea base.
+
+    Es regresión un p50 que crece más de ``tolerancia`` (y más de ``minimo_ms``,
+    para no alarmarse por ruido en casos de microsegundos) o cualquier consulta
+    SQL de más.
+    """
+    filas = []
+    for caso, metricas in actual.items():
+        previo = base.get(caso)
+        if previo is None:
+            filas.append((caso, 'sin línea base', False))
+            continue
+        cambio = metricas['p50'] / previo['p50'] - 1 if previo['p50'] else 0.0
+        mas_lento = cambio > tolerancia and metricas['p50'] - previo['p50'] > minimo_ms
+        mas_consultas = metricas['consultas'] > previo['consultas']
+        detalle = (
+            f"p50 {previo['p50']:.2f} -> {metricas['p50']:.2f}ms ({cambio:+.0%}), "
+            f"consultas {previo['consultas']} -> {metricas['consultas']}"
+        )
+        filas.append((caso, detalle, mas_lento or mas_consultas))
+    return filas
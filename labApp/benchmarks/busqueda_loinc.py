@@ -0,0 +1,39 @@
+# Latencia del autocompletado de LoincCode (widget de PropiedadPlantilla) con
+# el índice FTS frente a la búsqueda icontains original.
+
+from django.contrib.auth import get_user_model
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from labApp.datos_sinteticos import crear_codigos_loinc
+from labApp.models import LoincCode
+from . import benchmark, formato, medir
+
+TERMINOS = ['2345', '2345-7', 'gluc', 'glucose ser', 'hemoglobin a1c', 'cholesterol ldl', 'potas', 'troponin']
+
+
+@benchmark('busqueda_loinc')
+def busqueda_loinc(opciones, salida):
+    escala = opciones['escala']
+    repeticiones = max(1, opciones['repeticiones'] // len(TERMINOS))
+    crear_codigos_loinc(escala)
+    salida.write(f'{LoincCode.objects.count()} códigos LOINC')
+
+    usuario = get_user_model().objects.create_superuser('bench', 'bench@example.com', 'bench')
+    cliente = Client()
+    cliente.force_login(usuario)
+    url = reverse('admin:autocomplete')
+
+    def consultar(termino):
+        respuesta = cliente.get(url, {
+            'term': termino, 'app_label': 'labApp',
+            'model_name': 'propiedadplantilla', 'field_name': 'loinc_code',
+        })
+        assert respuesta.status_code == 200, respuesta.status_code
+
+    for etiqueta, fts in (('fts', True), ('icontains', False)):
+        with override_settings(LAB_BUSQUEDA_LOINC_FTS=fts):
+            tiempos = []
+            for termino in TERMINOS:
+                tiempos += medir(lambda: consultar(termino), repeticiones)
+            salida.write(formato(f'autocomplete [{etiqueta}]', tiempos))
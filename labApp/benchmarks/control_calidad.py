@@ -0,0 +1,85 @@
+# Resumen diario de control de calidad (labApp/calidad.py): agregación de las
+# filas de una ventana con numpy frente al cálculo en Python, y una pasada
+# completa de resumir() (consulta + agregación + reemplazo) sobre la base.
+
+import datetime
+import random
+
+from labApp import calidad
+from labApp.models import (
+    Analisis, IntervaloReferencia, Laboratorio, Paciente, Plantilla, PropiedadPlantilla, ResultadoAnalisis,
+)
+from labApp.resultados import generar_resultados
+from . import benchmark, formato, medir
+
+PROPIEDADES = 20
+DIAS = 30
+NIVELES = ('1', '2')
+
+
+def filas_sinteticas(cantidad, azar):
+    """Filas con la forma de calidad.filas_resultados(), sin pasar por la base"""
+    inicio = datetime.date(2025, 1, 1)
+    filas = []
+    for k in range(cantidad):
+        control = k % 10 == 0
+        filas.append((
+            1 + k % 3, 1 + k % PROPIEDADES, control, NIVELES[k % 2] if control else '',
+            inicio + datetime.timedelta(days=k * DIAS // cantidad), azar.gauss(100, 5),
+        ))
+    return filas
+
+
+def crear_datos(analisis_por_dia, azar):
+    laboratorio = Laboratorio.objects.create(
+        nombre_laboratorio='Bench', ciudad='c', estado='e', codigo_postal='0', pais='MX',
+    )
+    plantilla = Plantilla.objects.create(titulo='Química (bench control)')
+    for i in range(PROPIEDADES):
+        propiedad = PropiedadPlantilla.objects.create(plantilla=plantilla, nombre_propiedad=f'Analito {i}', unidad='mg/dL')
+        IntervaloReferencia.objects.create(propiedad=propiedad, valor_min=70, valor_max=100)
+    paciente = Paciente.objects.create(laboratorio=laboratorio, nombre='Paciente', edad=40, sexo='FEMENINO', telefono='0')
+    control = Paciente.objects.create(laboratorio=laboratorio, nombre='Control', edad=40, sexo='FEMENINO', telefono='0')
+    inicio = datetime.datetime(2025, 1, 1, 7, tzinfo=datetime.timezone.utc)
+    for dia in range(DIAS):
+        analisis = Analisis.objects.bulk_create(
+            [Analisis(paciente=paciente, plantilla=plantilla) for _ in range(analisis_por_dia)]
+            + [Analisis(paciente=control, plantilla=plantilla, es_control=True, nivel_control=n) for n in NIVELES * 2]
+        )
+        for k, a in enumerate(analisis):
+            a.fecha_analisis = inicio + datetime.timedelta(days=dia, seconds=k)
+        Analisis.objects.bulk_update(analisis, ['fecha_analisis'], batch_size=1000)
+        generar_resultados(analisis)
+    resultados = list(ResultadoAnalisis.objects.all())
+    for resultado in resultados:
+        resultado.valor_numerico = azar.gauss(100, 5)
+        resultado.valor = f'{resultado.valor_numerico:.1f}'
+    ResultadoAnalisis.objects.bulk_update(resultados, ['valor', 'valor_numerico'], batch_size=2000)
+    return len(resultados)
+
+
+@benchmark('control_calidad')
+def control_calidad(opciones, salida):
+    azar = random.Random(1)
+    filas = filas_sinteticas(opciones['escala'], azar)
+    desde = datetime.date(2025, 1, 1)
+    salida.write(f'Agregación de {len(filas)} filas en memoria ({DIAS} días, {PROPIEDADES} propiedades)')
+    numpy = calidad.np
+    repeticiones = max(1, opciones['repeticiones'] // 10)
+    try:
+        for nombre, modulo in (('numpy', numpy), ('python', None)):
+            if nombre == 'numpy' and numpy is None:
+                continue
+            calidad.np = modulo
+            salida.write(formato(f'agregar ({nombre})', medir(lambda: calidad.agregar(filas, desde, {}), repeticiones)))
+    finally:
+        calidad.np = numpy
+
+    total = crear_datos(max(10, opciones['escala'] // (DIAS * PROPIEDADES * 10)), azar)
+    salida.write(f'resumir() sobre {total} resultados guardados, ventanas de 7 días')
+    hasta = desde + datetime.timedelta(days=DIAS)
+    salida.write(formato('resumir (completo)', medir(lambda: calidad.resumir(desde, hasta), repeticiones)))
+    # Ejecución incremental: solo el último día resumido
+    salida.write(formato(
+        'resumir (incremental)', medir(lambda: calidad.resumir(calidad.desde_pendiente(), hasta), opciones['repeticiones']),
+    ))
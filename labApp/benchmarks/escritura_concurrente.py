@@ -0,0 +1,121 @@
+# Guardados/seg de captura de resultados con varios técnicos a la vez: cada
+# hilo (su propia conexión) guarda una y otra vez los resultados de sus
+# análisis con resultados.guardar_en_lote(), como el admin.
+#
+# En SQLite se compara la configuración por defecto de Django (journal DELETE,
+# transacciones DEFERRED, 5 s de espera) con el perfil de basedatos.py. Para
+# que el resultado signifique algo la base de prueba debe estar en disco:
+#
+#   manage.py benchmark escritura_concurrente --en-disco
+#
+# En PostgreSQL se mide solo el perfil configurado.
+
+import threading
+import time
+
+from django.db import OperationalError, close_old_connections, connection, connections
+
+from labApp.models import (
+    Analisis, IntervaloReferencia, Laboratorio, Paciente, Plantilla, PropiedadPlantilla, ResultadoAnalisis,
+)
+from labApp.resultados import guardar_en_lote
+from . import benchmark, percentiles
+
+HILOS = (1, 4, 8)
+PROPIEDADES = 10
+SEGUNDOS_POR_RONDA = 3
+
+
+def crear_datos(cantidad_analisis):
+    laboratorio = Laboratorio.objects.create(
+        nombre_laboratorio='Bench', ciudad='c', estado='e', codigo_postal='0', pais='MX',
+    )
+    plantilla = Plantilla.objects.create(titulo='Química (bench escritura)')
+    for i in range(PROPIEDADES):
+        propiedad = PropiedadPlantilla.objects.create(plantilla=plantilla, nombre_propiedad=f'Analito {i}', unidad='mg/dL')
+        IntervaloReferencia.objects.create(propiedad=propiedad, valor_min=70, valor_max=100)
+    pacientes = Paciente.objects.bulk_create([
+        Paciente(laboratorio=laboratorio, nombre=f'Paciente {i}', edad=40, sexo='FEMENINO', telefono='0')
+        for i in range(cantidad_analisis)
+    ])
+    analisis = [Analisis.objects.create(paciente=p, plantilla=plantilla) for p in pacientes]
+    return [a.id for a in analisis]
+
+
+def tecnico(analisis_ids, fin, tiempos, errores):
+    """Abre el análisis, cambia todos sus valores y guarda, hasta ``fin``"""
+    n = 0
+    try:
+        while time.monotonic() < fin:
+            analisis_id = analisis_ids[n % len(analisis_ids)]
+            n += 1
+            close_old_connections()  # como al terminar cada petición
+            inicio = time.perf_counter()
+            try:
+                resultados = list(
+                    ResultadoAnalisis.objects.filter(analisis_id=analisis_id).select_related('analisis__paciente')
+                )
+                for resultado in resultados:
+                    resultado.valor = str(70 + n % 40)
+                guardar_en_lote(resultados)
+            except OperationalError:
+                errores.append(1)
+                continue
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+    finally:
+        connection.close()
+
+
+def ronda(hilos, analisis_ids):
+    tiempos, errores = [], []
+    fin = time.monotonic() + SEGUNDOS_POR_RONDA
+    # Cada técnico trabaja con sus propios análisis: los bloqueos son de la base, no conflictos de versión
+    trabajadores = [
+        threading.Thread(target=tecnico, args=(analisis_ids[n::hilos], fin, tiempos, errores))
+        for n in range(hilos)
+    ]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    return tiempos, len(errores)
+
+
+def perfiles(salida):
+    """(nombre, OPTIONS, journal_mode) a comparar según el motor"""
+    actual = connections.settings[connection.alias]
+    if connection.vendor != 'sqlite':
+        return [('perfil configurado', actual['OPTIONS'], None)]
+    if connection.is_in_memory_db():
+        salida.write('Aviso: base de prueba en memoria; use --en-disco para medir bloqueos reales.')
+    return [
+        ('sqlite por defecto', {}, 'DELETE'),
+        ('perfil sqlite (WAL)', actual['OPTIONS'], 'WAL'),
+    ]
+
+
+@benchmark('escritura_concurrente')
+def escritura_concurrente(opciones, salida):
+    analisis_ids = crear_datos(max(HILOS) * 4)
+    salida.write(f'{len(analisis_ids)} análisis x {PROPIEDADES} resultados, {SEGUNDOS_POR_RONDA}s por ronda')
+    configuracion = connections.settings[connection.alias]
+    original = configuracion['OPTIONS']
+    try:
+        for nombre, opciones_db, journal in perfiles(salida):
+            # Las conexiones de los hilos se abren con estas OPTIONS
+            configuracion['OPTIONS'] = opciones_db
+            if journal:
+                connection.close()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'PRAGMA journal_mode={journal}')
+            for hilos in HILOS:
+                tiempos, errores = ronda(hilos, analisis_ids)
+                stats = percentiles(tiempos) if tiempos else {'p50': 0, 'p95': 0}
+                salida.write(
+                    f'{nombre:<22} {hilos} hilos: {len(tiempos) / SEGUNDOS_POR_RONDA:7.0f} guardados/s '
+                    f'({len(tiempos) * PROPIEDADES / SEGUNDOS_POR_RONDA:7.0f} resultados/s)  '
+                    f'p50={stats["p50"]:.1f}ms p95={stats["p95"]:.1f}ms  bloqueos={errores}'
+                )
+    finally:
+        configuracion['OPTIONS'] = original
+        connection.close()
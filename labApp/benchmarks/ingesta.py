@@ -0,0 +1,100 @@
+# Resultados/seg sostenidos de la API de ingesta con varios analizadores
+# enviando lotes a la vez (AsyncClient sobre la vista async, como en ASGI).
+
+import asyncio
+import json
+import time
+
+from django.test import AsyncClient, override_settings
+
+from labApp.models import (
+    Analisis, IntervaloReferencia, Laboratorio, LoincCode, Paciente, Plantilla, PropiedadPlantilla,
+)
+from . import benchmark, percentiles
+
+TOKEN = 'benchmark'
+ANALIZADORES = (1, 4, 8)
+PROPIEDADES = 25
+TAMANO_LOTE = 250
+
+
+def crear_datos(cantidad_analisis):
+    laboratorio = Laboratorio.objects.create(
+        nombre_laboratorio='Bench', ciudad='c', estado='e', codigo_postal='0', pais='MX',
+    )
+    plantilla = Plantilla.objects.create(titulo='Biometría Hemática (bench)')
+    codigos = LoincCode.objects.bulk_create([
+        LoincCode(loinc_num=f'9{i:03d}-0', shortname=f'Analito {i}') for i in range(PROPIEDADES)
+    ])
+    for i, codigo in enumerate(codigos):
+        propiedad = PropiedadPlantilla.objects.create(
+            plantilla=plantilla, nombre_propiedad=f'Analito {i}', unidad='g/dL', loinc_code=codigo,
+        )
+        IntervaloReferencia.objects.create(propiedad=propiedad, valor_min=10, valor_max=20)
+    pacientes = Paciente.objects.bulk_create([
+        Paciente(laboratorio=laboratorio, nombre=f'Paciente {i}', edad=30 + i % 50, sexo='FEMENINO', telefono='0')
+        for i in range(cantidad_analisis)
+    ])
+    analisis = Analisis.objects.bulk_create([Analisis(paciente=p, plantilla=plantilla) for p in pacientes])
+    return [a.id for a in analisis], [c.loinc_num for c in codigos]
+
+
+def lotes(analisis_ids, loincs, inicio, cantidad):
+    """``cantidad`` lotes de TAMANO_LOTE resultados, cada uno con su clave de idempotencia"""
+    pares = [(a, l) for a in analisis_ids for l in loincs]
+    for n in range(cantidad):
+        desde = (inicio + n) * TAMANO_LOTE
+        tramo = [pares[(desde + k) % len(pares)] for k in range(TAMANO_LOTE)]
+        cuerpo = json.dumps({'resultados': [
+            {'analisis': a, 'loinc': l, 'valor': f'{10 + (a + n) % 12}.{n % 10}'} for a, l in tramo
+        ]})
+        yield f'bench-{inicio + n}', cuerpo
+
+
+async def analizador(cliente, cuerpos, tiempos, rechazos):
+    for clave, cuerpo in cuerpos:
+        while True:
+            inicio = time.perf_counter()
+            respuesta = await cliente.post(
+                '/api/ingesta/resultados/', cuerpo, content_type='application/json',
+                headers={'Authorization': f'Bearer {TOKEN}', 'Idempotency-Key': clave},
+            )
+            if respuesta.status_code == 429:
+                rechazos.append(1)
+                await asyncio.sleep(0.01)
+                continue
+            assert respuesta.status_code == 200, respuesta.content
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            break
+
+
+async def ronda(concurrentes, cuerpos_por_analizador):
+    tiempos, rechazos = [], []
+    inicio = time.perf_counter()
+    await asyncio.gather(*[
+        analizador(AsyncClient(), cuerpos, tiempos, rechazos) for cuerpos in cuerpos_por_analizador
+    ])
+    return time.perf_counter() - inicio, tiempos, len(rechazos)
+
+
+@benchmark('ingesta')
+def ingesta(opciones, salida):
+    cantidad_analisis = max(10, opciones['escala'] // PROPIEDADES // 10)
+    analisis_ids, loincs = crear_datos(cantidad_analisis)
+    lotes_por_analizador = max(1, opciones['repeticiones'] // 20)
+    salida.write(f'{len(analisis_ids)} análisis x {len(loincs)} propiedades, lotes de {TAMANO_LOTE}')
+
+    siguiente = 0
+    with override_settings(LAB_INGESTA_TOKENS=[TOKEN], LAB_INGESTA_CONCURRENCIA=4):
+        for concurrentes in ANALIZADORES:
+            cuerpos = []
+            for _ in range(concurrentes):
+                cuerpos.append(list(lotes(analisis_ids, loincs, siguiente, lotes_por_analizador)))
+                siguiente += lotes_por_analizador
+            segundos, tiempos, rechazos = asyncio.run(ronda(concurrentes, cuerpos))
+            total = concurrentes * lotes_por_analizador * TAMANO_LOTE
+            stats = percentiles(tiempos)
+            salida.write(
+                f'{concurrentes} analizadores: {total / segundos:8.0f} resultados/s  '
+                f'lote p50={stats["p50"]:.1f}ms p95={stats["p95"]:.1f}ms  429={rechazos}'
+            )
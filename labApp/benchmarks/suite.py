@@ -0,0 +1,113 @@
+# Suite de regresión: siembra un laboratorio sintético (labApp/datos_sinteticos.py)
+# proporcional a --escala y mide los caminos que más usa el día a día, con
+# percentiles y consultas SQL por caso. Devuelve las métricas para compararlas
+# con linea_base.json:
+#
+#   manage.py benchmark suite --escala 20000 --linea-base
+#   manage.py benchmark suite --escala 20000 --guardar-linea-base
+
+import csv
+import io
+import itertools
+import os
+import random
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client
+from django.urls import reverse
+
+from labApp import datos_sinteticos, duplicados
+from labApp.intervalos import intervalos
+from labApp.models import Analisis, Paciente, PropiedadPlantilla
+from . import benchmark, formato_caso, medir_caso
+
+LOOKUPS_POR_LLAMADA = 1000
+LOOKUPS_LOTE = 10000
+
+
+def escribir_csv_loinc(ruta, cantidad, azar):
+    with open(ruta, 'w', newline='', encoding='utf-8') as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow(['LOINC_NUM', 'COMPONENT', 'PROPERTY', 'SYSTEM', 'SCALE_TYP', 'SHORTNAME'])
+        for i in range(cantidad):
+            componente = azar.choice(datos_sinteticos.ANALITOS)
+            sistema = azar.choice(datos_sinteticos.SISTEMAS)
+            escritor.writerow([
+                f'{200_000 + i}-{i % 10}', componente, azar.choice(datos_sinteticos.PROPIEDADES_LOINC),
+                sistema, azar.choice(datos_sinteticos.ESCALAS), f'{componente} {sistema} {i}',
+            ])
+
+
+@benchmark('suite')
+def suite(opciones, salida):
+    escala = opciones['escala']
+    repeticiones = opciones['repeticiones']
+    repeticiones_paginas = max(5, repeticiones // 10)
+    totales = datos_sinteticos.sembrar(
+        laboratorios=max(1, escala // 20000), pacientes=max(10, escala // 100), analisis=max(10, escala // 20),
+    )
+    salida.write(', '.join(f'{cantidad} {modelo}' for modelo, cantidad in totales.items()))
+
+    usuario = get_user_model().objects.create_superuser('bench', 'bench@example.com', 'bench')
+    cliente = Client()
+    cliente.force_login(usuario)
+    azar = random.Random(1)
+    pacientes = list(Paciente.objects.values_list('id', flat=True)[:100])
+    plantilla_ids = list(PropiedadPlantilla.objects.values_list('plantilla_id', flat=True).distinct())
+    analisis_id = Analisis.objects.order_by('-id').values_list('id', flat=True)[0]
+    metricas = {}
+
+    def caso(nombre, funcion, repeticiones, calentamiento=1):
+        metricas[nombre] = medir_caso(funcion, repeticiones, calentamiento)
+        salida.write(formato_caso(nombre, metricas[nombre]))
+
+    def pagina(url, parametros=None):
+        def obtener():
+            respuesta = cliente.get(url, parametros)
+            assert respuesta.status_code == 200, respuesta.status_code
+        return obtener
+
+    # Captura: la señal post_save crea los resultados de la plantilla. Se alternan
+    # las plantillas y el calentamiento pasa por todas (caché de estructuras tibia)
+    siguiente = itertools.cycle(plantilla_ids)
+    caso('crear análisis (post_save)', lambda: Analisis.objects.create(
+        paciente_id=azar.choice(pacientes), plantilla_id=next(siguiente),
+    ), repeticiones, calentamiento=len(plantilla_ids))
+
+    for modelo in ('analisis', 'resultadoanalisis', 'paciente'):
+        caso(f'changelist {modelo}', pagina(reverse(f'admin:labApp_{modelo}_changelist')), repeticiones_paginas)
+    caso('buscar paciente "lopez maria"', pagina(
+        reverse('admin:labApp_paciente_changelist'), {'q': 'lopez maria'},
+    ), repeticiones_paginas)
+    caso('detectar duplicados', duplicados.detectar, 3)
+    caso('change form analisis', pagina(reverse('admin:labApp_analisis_change', args=[analisis_id])), repeticiones_paginas)
+
+    with tempfile.TemporaryDirectory(prefix='lab_suite_') as carpeta:
+        ruta = os.path.join(carpeta, 'LoincTableCore.csv')
+        escribir_csv_loinc(ruta, max(1000, escala // 10), azar)
+        importar = lambda: call_command('importar_loinc', ruta, stdout=io.StringIO())
+        caso('importar LOINC (nuevo)', importar, 1, calentamiento=0)
+        caso('importar LOINC (sin cambios)', importar, 3)
+
+    autocompletar = reverse('admin:autocomplete')
+    for termino in ('gluc', 'hemoglobin a1c'):
+        caso(f'autocomplete LOINC "{termino}"', pagina(autocompletar, {
+            'term': termino, 'app_label': 'labApp', 'model_name': 'propiedadplantilla', 'field_name': 'loinc_code',
+        }), repeticiones_paginas)
+
+    propiedad_ids = list(PropiedadPlantilla.objects.values_list('id', flat=True))
+    pares = [
+        (azar.choice(propiedad_ids), azar.randrange(0, 90 * 365), azar.choice(('MASCULINO', 'FEMENINO')))
+        for _ in range(LOOKUPS_LOTE)
+    ]
+
+    def resolver():
+        for propiedad_id, dias, sexo in pares[:LOOKUPS_POR_LLAMADA]:
+            intervalos.resolver(propiedad_id, dias, sexo)
+
+    caso(f'intervalos.resolver x{LOOKUPS_POR_LLAMADA}', resolver, repeticiones)
+    columnas = list(zip(*pares))
+    caso(f'intervalos.resolver_lote x{LOOKUPS_LOTE}', lambda: intervalos.resolver_lote(*columnas), repeticiones)
+    return metricas
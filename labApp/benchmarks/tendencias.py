@@ -0,0 +1,71 @@
+# Latencia del historial por LOINC de un paciente (labApp/tendencias.py) con
+# cientos de análisis, con numpy y con el cálculo en Python.
+
+import datetime
+import random
+
+from labApp import tendencias
+from labApp.models import (
+    Analisis, IntervaloReferencia, Laboratorio, LoincCode, Paciente, Plantilla, PropiedadPlantilla, ResultadoAnalisis,
+)
+from labApp.resultados import generar_resultados
+from . import benchmark, formato, medir
+
+PROPIEDADES = 20
+PACIENTES = 20
+
+
+def crear_datos(analisis_por_paciente):
+    laboratorio = Laboratorio.objects.create(
+        nombre_laboratorio='Bench', ciudad='c', estado='e', codigo_postal='0', pais='MX',
+    )
+    plantilla = Plantilla.objects.create(titulo='Química (bench tendencias)')
+    for i in range(PROPIEDADES):
+        codigo = LoincCode.objects.create(loinc_num=f'8{i:03d}-0', shortname=f'Analito {i}')
+        propiedad = PropiedadPlantilla.objects.create(
+            plantilla=plantilla, nombre_propiedad=f'Analito {i}', unidad='mg/dL', loinc_code=codigo,
+        )
+        IntervaloReferencia.objects.create(propiedad=propiedad, valor_min=70, valor_max=100)
+    inicio = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    azar = random.Random(1)
+    pacientes = Paciente.objects.bulk_create([
+        Paciente(laboratorio=laboratorio, nombre=f'Paciente {i}', edad=50, sexo='FEMENINO', telefono='0')
+        for i in range(PACIENTES)
+    ])
+    for paciente in pacientes:
+        analisis = Analisis.objects.bulk_create([
+            Analisis(paciente=paciente, plantilla=plantilla) for _ in range(analisis_por_paciente)
+        ])
+        for k, a in enumerate(analisis):
+            a.fecha_analisis = inicio + datetime.timedelta(days=3 * k)
+        Analisis.objects.bulk_update(analisis, ['fecha_analisis'], batch_size=1000)
+        generar_resultados(analisis)
+    resultados = list(ResultadoAnalisis.objects.all())
+    for resultado in resultados:
+        resultado.valor = f'{azar.uniform(60, 110):.1f}'
+        resultado.valor_numerico = float(resultado.valor)
+    ResultadoAnalisis.objects.bulk_update(resultados, ['valor', 'valor_numerico'], batch_size=2000)
+    return pacientes[0].pk
+
+
+@benchmark('tendencias')
+def tendencia(opciones, salida):
+    analisis_por_paciente = max(50, min(1000, opciones['escala'] // 200))
+    paciente_id = crear_datos(analisis_por_paciente)
+    salida.write(f'{PACIENTES} pacientes x {analisis_por_paciente} análisis x {PROPIEDADES} analitos')
+    numpy = tendencias.np
+    try:
+        for nombre, modulo in (('numpy', numpy), ('python', None)):
+            if nombre == 'numpy' and numpy is None:
+                continue
+            tendencias.np = modulo
+            salida.write(formato(
+                f'un analito ({nombre})',
+                medir(lambda: tendencias.tendencias_paciente(paciente_id, '8003-0'), opciones['repeticiones']),
+            ))
+            salida.write(formato(
+                f'todos los analitos ({nombre})',
+                medir(lambda: tendencias.tendencias_paciente(paciente_id), max(1, opciones['repeticiones'] // 10)),
+            ))
+    finally:
+        tendencias.np = numpy
@@ -0,0 +1,83 @@
+# Logo de laboratorio: bytes y latencia del original frente a sus variantes
+# (labApp/imagenes.py). Mide lo que descarga la lista del admin y cuánto tarda
+# y pesa un PDF con el logo original o con la variante "reporte".
+
+import io
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+
+from labApp import imagenes, reportes
+from labApp.models import Analisis, Laboratorio, Paciente, Plantilla
+from . import benchmark, formato, medir
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+
+
+def logo_de_prueba(lado):
+    """PNG de ``lado`` x ``lado`` con degradado, figuras y ruido de cámara (como una foto escaneada)"""
+    imagen = Image.merge('RGB', [
+        Image.radial_gradient('L').resize((lado, lado)),
+        Image.linear_gradient('L').resize((lado, lado)),
+        Image.effect_noise((lado, lado), 40),
+    ])
+    dibujo = ImageDraw.Draw(imagen)
+    for k in range(1, 8):
+        borde = k * lado // 18
+        dibujo.ellipse([borde, borde, lado - borde, lado - borde], outline=(30 * k, 80, 160), width=lado // 80)
+    buffer = io.BytesIO()
+    imagen.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@benchmark('variantes_logo')
+def variantes_logo(opciones, salida):
+    if Image is None:
+        salida.write('Se necesita Pillow')
+        return
+    directorio = tempfile.mkdtemp(prefix='bench-logo-')
+    try:
+        with override_settings(MEDIA_ROOT=directorio):
+            medir_logo(opciones, salida)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def medir_logo(opciones, salida):
+    contenido = logo_de_prueba(2400)
+    laboratorio = Laboratorio.objects.create(
+        nombre_laboratorio='Bench', ciudad='c', estado='e', codigo_postal='0', pais='MX',
+        logo=SimpleUploadedFile('logo.png', contenido),
+    )
+    repeticiones = max(1, opciones['repeticiones'] // 20)
+    salida.write(formato(
+        'generar variantes', medir(lambda: imagenes.actualizar_variantes(laboratorio, forzar=True), repeticiones),
+    ))
+    datos = laboratorio.logo_variantes
+    salida.write(f"original {datos['origen']['ancho']}x{datos['origen']['alto']}: {datos['origen']['bytes'] / 1024:,.0f} KB")
+    for nombre, variante in datos['variantes'].items():
+        salida.write(f"{nombre:<10} {variante['ancho']}x{variante['alto']}: {variante['bytes'] / 1024:,.1f} KB")
+    salida.write(
+        f"Lista del admin con 100 laboratorios: {100 * datos['origen']['bytes'] / 1024 ** 2:,.1f} MB con el original, "
+        f"{100 * datos['variantes']['miniatura']['bytes'] / 1024 ** 2:,.2f} MB con la miniatura"
+    )
+
+    try:
+        renderizador = reportes.ReportLabRenderizador()
+    except Exception as error:
+        salida.write(f'Sin PDF: {error}')
+        return
+    paciente = Paciente.objects.create(laboratorio=laboratorio, nombre='Paciente', edad=40, sexo='FEMENINO', telefono='0')
+    analisis = Analisis.objects.create(paciente=paciente, plantilla=Plantilla.objects.create(titulo='Bench logo'))
+    analisis = reportes.analisis_para_reporte([analisis.pk]).get()
+    con_variante = reportes.construir_contexto(analisis)
+    analisis.paciente.laboratorio.logo_variantes = {}
+    con_original = reportes.construir_contexto(analisis)
+    for nombre, contexto in (('original', con_original), ('variante reporte', con_variante)):
+        salida.write(formato(f'PDF con logo {nombre}', medir(lambda: renderizador.renderizar(contexto), repeticiones)))
+        salida.write(f'  {len(renderizador.renderizar(contexto)) / 1024:,.0f} KB por PDF')
@@ -0,0 +1,145 @@
+# labApp/busqueda.py
+#
+# Índice de texto completo para LoincCode (SQLite FTS5). La tabla virtual
+# labApp_loinccode_fts (migración 0004) usa labApp_loinccode como contenido
+# externo y se mantiene sincronizada con triggers, así que cualquier escritura
+# (admin, importar_loinc con bulk_create/upsert) la actualiza sin código extra.
+# El tokenizador unicode61 con remove_diacritics ignora mayúsculas y acentos.
+#
+# Pacientes: labApp_paciente_fts (migración 0018) indexa con el tokenizador
+# trigram las claves normalizada y fonética del nombre (labApp/nombres.py), así
+# que "jose lop" encuentra a "López, José" y "velasques" a "Velázquez" sin
+# recorrer la tabla. Los triggers la mantienen igual que la de LOINC.
+#
+# Configuración (settings.py, opcional):
+#   LAB_BUSQUEDA_LOINC_FTS       usar el índice de LOINC (por defecto True)
+#   LAB_BUSQUEDA_PACIENTES_FTS   usar el índice de pacientes (por defecto True)
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import LoincCode
+from .nombres import fonetica, tokens
+
+TABLA_FTS = 'labApp_loinccode_fts'
+TABLA_FTS_PACIENTES = 'labApp_paciente_fts'
+AJUSTES_FTS = {TABLA_FTS: 'LAB_BUSQUEDA_LOINC_FTS', TABLA_FTS_PACIENTES: 'LAB_BUSQUEDA_PACIENTES_FTS'}
+COLUMNAS_FTS = ('shortname', 'component', 'property', 'system')
+# Pesos bm25 por columna (mismo orden que COLUMNAS_FTS)
+PESOS_FTS = (10.0, 5.0, 1.0, 1.0)
+
+# Resultados máximos que se ordenan por relevancia en el autocompletado del admin
+LIMITE_AUTOCOMPLETE = 100
+
+PATRON_LOINC = re.compile(r'^\d+(-\d*)?$')
+
+_tablas_verificadas = {}
+
+
+def disponible(conexion=connection, tabla=TABLA_FTS):
+    """True si la búsqueda indexada está activa y la tabla FTS existe en esta base de datos"""
+    if not getattr(settings, AJUSTES_FTS[tabla], True) or conexion.vendor != 'sqlite':
+        return False
+    clave = (conexion.alias, str(conexion.settings_dict['NAME']), tabla)
+    if not _tablas_verificadas.get(clave):
+        _tablas_verificadas[clave] = tabla in conexion.introspection.table_names()
+    return _tablas_verificadas[clave]
+
+
+def consulta_fts(termino):
+    """Convierte el texto del usuario en una consulta FTS5 de prefijos: 'gluc ser' -> "gluc"* AND "ser"*"""
+    tokens = re.findall(r'\w+', termino.lower())
+    return ' AND '.join(f'"{token}"*' for token in tokens)
+
+
+def filtro_loinc_num(termino):
+    """Rango sobre el índice único de loinc_num equivalente a 'empieza con' (LIKE no usa el índice en SQLite)"""
+    return {'loinc_num__gte': termino, 'loinc_num__lt': termino + '\uffff'}
+
+
+def buscar_loinc_ids(termino, limite=20):
+    """Ids de LoincCode ordenados por relevancia.
+
+    Primero los códigos cuyo loinc_num empieza con el término (el exacto antes
+    que el resto), después las coincidencias de texto ordenadas por bm25.
+    """
+    termino = termino.strip()
+    ids = []
+    if PATRON_LOINC.match(termino):
+        codigos = LoincCode.objects.filter(**filtro_loinc_num(termino)).order_by('loinc_num').values_list('id', 'loinc_num')
+        codigos = sorted(codigos[:limite * 5], key=lambda c: (c[1] != termino, len(c[1]), c[1]))
+        ids = [pk for pk, _ in codigos[:limite]]
+
+    consulta = consulta_fts(termino)
+    if consulta and len(ids) < limite:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s "
+                f"ORDER BY bm25({TABLA_FTS}, {', '.join(map(str, PESOS_FTS))}) LIMIT %s",
+                [consulta, limite],
+            )
+            vistos = set(ids)
+            ids += [pk for (pk,) in cursor.fetchall() if pk not in vistos]
+    return ids[:limite]
+
+
+def subconsulta_fts(termino):
+    """Expresión para filtrar ``pk__in`` con todas las coincidencias FTS (sin límite ni orden)"""
+    return RawSQL(f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s', [consulta_fts(termino)])
+
+
+def orden_por_ids(ids):
+    """Expresión de orden que respeta la posición de cada id en ``ids``.
+
+    Un solo instr() en lugar de un CASE con una rama por id: compilar cien
+    WHEN cuesta más que la propia búsqueda.
+    """
+    return RawSQL(
+        "instr(%s, ',' || labApp_loinccode.id || ',')", [',' + ','.join(map(str, ids)) + ','],
+    ).asc()
+
+
+# Pacientes -----------------------------------------------------------------
+
+# Lo mínimo que indexa el tokenizador trigram
+MINIMO_TRIGRAMA = 3
+
+
+def consulta_fts_pacientes(termino):
+    """Cada palabra (normalizada) debe aparecer en la clave o, con su código fonético, en la fonética:
+    'José Lópes' -> (nombre_clave : "jose" OR nombre_fonetico : "jose") AND (... "lopes" ... "lopes")
+    Las palabras de menos de tres letras no entran (el trigram no las indexa).
+    """
+    partes = []
+    for token in tokens(termino):
+        if len(token) < MINIMO_TRIGRAMA:
+            continue
+        codigo = fonetica(token)
+        if len(codigo) >= MINIMO_TRIGRAMA:
+            partes.append(f'(nombre_clave : "{token}" OR nombre_fonetico : "{codigo}")')
+        else:
+            partes.append(f'nombre_clave : "{token}"')
+    return ' AND '.join(partes)
+
+
+def filtro_pacientes(termino):
+    """Q para buscar pacientes por nombre sin distinguir acentos, mayúsculas ni el orden de las palabras.
+
+    Con el índice trigram filtra ``pk__in`` sobre él; las palabras cortas (o
+    todas, sin índice) se comparan contra nombre_clave.
+    """
+    palabras = tokens(termino)
+    filtro = Q()
+    consulta = consulta_fts_pacientes(termino) if disponible(tabla=TABLA_FTS_PACIENTES) else ''
+    if consulta:
+        filtro &= Q(pk__in=RawSQL(
+            f'SELECT rowid FROM {TABLA_FTS_PACIENTES} WHERE {TABLA_FTS_PACIENTES} MATCH %s', [consulta],
+        ))
+        palabras = [p for p in palabras if len(p) < MINIMO_TRIGRAMA]
+    for palabra in palabras:
+        filtro &= Q(nombre_clave__contains=palabra)
+    return filtro
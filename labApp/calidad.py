@@ -0,0 +1,340 @@
+# labApp/calidad.py
+#
+# Control de calidad por laboratorio y propiedad: media, DE y CV diarios de los
+# resultados de pacientes y de cada nivel de control (Analisis.es_control), y
+# las reglas de Westgard sobre los controles (gráfica de Levey-Jennings).
+#
+# Los resultados se recorren por ventanas de días: una consulta por ventana en
+# orden de fecha_analisis, agrupada y agregada con numpy en unas cuantas
+# pasadas vectorizadas (con el mismo cálculo en Python si no está instalado).
+# Cada ventana reemplaza sus filas de ResumenControlDiario en una transacción:
+# volver a resumir un periodo es seguro y los tableros solo leen esas filas.
+#
+# La media y DE objetivo de cada control salen de los resúmenes de los días
+# anteriores a la ventana (sumas ya guardadas, sin volver a los resultados); si
+# no reúnen suficientes controles, de los controles de la propia ventana.
+#
+# Configuración (settings.py, opcional):
+#   LAB_QC_DIAS_REFERENCIA   días anteriores usados para la media/DE objetivo
+#                            (por defecto 30)
+#   LAB_QC_MIN_REFERENCIA    controles mínimos para usar esa referencia (por
+#                            defecto 20)
+#   LAB_QC_DIAS_CONTEXTO     días de controles previos que se leen para las reglas
+#                            que abarcan varias corridas, 4-1s y 10x (por defecto 10)
+
+import math
+import statistics
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Analisis, PropiedadPlantilla, ResultadoAnalisis, ResumenControlDiario
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# (regla, si obliga a rechazar la corrida); 1-2s es solo una advertencia
+REGLAS = [
+    ('1_2s', False),
+    ('1_3s', True),
+    ('2_2s', True),
+    ('R_4s', True),
+    ('4_1s', True),
+    ('10_x', True),
+]
+RECHAZO = {regla for regla, rechaza in REGLAS if rechaza}
+
+
+def _inicio_del_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def _finito(x):
+    if x is None:
+        return None
+    x = float(x)
+    return x if math.isfinite(x) else None
+
+
+def filas_resultados(desde, hasta, lote=5000):
+    """(laboratorio, propiedad, es_control, nivel, día, valor) de [desde, hasta) en orden cronológico
+
+    Incluye además los controles de los LAB_QC_DIAS_CONTEXTO días anteriores, que
+    solo sirven de contexto para las reglas de Westgard.
+    """
+    contexto = desde - timedelta(days=getattr(settings, 'LAB_QC_DIAS_CONTEXTO', 10))
+    propiedad = PropiedadPlantilla.objects.filter(
+        plantilla_id=OuterRef('analisis__plantilla_id'), nombre_propiedad=OuterRef('nombre_propiedad'),
+    ).values('id')[:1]
+    return (
+        ResultadoAnalisis.objects
+        .filter(
+            Q(analisis__fecha_analisis__gte=_inicio_del_dia(desde)) | Q(analisis__es_control=True),
+            # Rango completo de la ventana con su contexto en analisis_fecha_id_idx
+            analisis__fecha_analisis__gte=_inicio_del_dia(contexto),
+            analisis__fecha_analisis__lt=_inicio_del_dia(hasta),
+            valor_numerico__isnull=False,
+        )
+        .annotate(propiedad_id=Subquery(propiedad), dia=TruncDate('analisis__fecha_analisis'))
+        .filter(propiedad_id__isnull=False)
+        .order_by('analisis__fecha_analisis', 'analisis_id')
+        .values_list(
+            'laboratorio_id', 'propiedad_id', 'analisis__es_control',
+            'analisis__nivel_control', 'dia', 'valor_numerico',
+        )
+        .iterator(chunk_size=lote)
+    )
+
+
+def objetivos(desde):
+    """{(laboratorio, propiedad, nivel): (media, de)} de los controles resumidos antes de ``desde``"""
+    minimo = getattr(settings, 'LAB_QC_MIN_REFERENCIA', 20)
+    filas = (
+        ResumenControlDiario.objects
+        .filter(
+            es_control=True, fecha__lt=desde,
+            fecha__gte=desde - timedelta(days=getattr(settings, 'LAB_QC_DIAS_REFERENCIA', 30)),
+        )
+        .values('laboratorio_id', 'propiedad_id', 'nivel')
+        .annotate(total=Sum('n'), suma_total=Sum('suma'), cuadrados_total=Sum('suma_cuadrados'))
+        .order_by()
+    )
+    resultado = {}
+    for fila in filas:
+        n = fila['total']
+        if n < max(minimo, 2):
+            continue
+        media = fila['suma_total'] / n
+        varianza = max(fila['cuadrados_total'] - n * media * media, 0) / (n - 1)
+        resultado[fila['laboratorio_id'], fila['propiedad_id'], fila['nivel']] = (media, math.sqrt(varianza))
+    return resultado
+
+
+def _reglas_numpy(z, posicion):
+    """{regla: bandera por valor}; ``posicion`` es el índice del valor dentro de su serie"""
+    def seguidos(bandera, k):
+        acumulado = np.cumsum(bandera)
+        ventana = acumulado.copy()
+        ventana[k:] -= acumulado[:-k]
+        return (ventana == k) & (posicion >= k - 1)
+
+    alto2, bajo2 = z > 2, z < -2
+    anterior_alto2 = np.concatenate(([False], alto2[:-1])) & (posicion >= 1)
+    anterior_bajo2 = np.concatenate(([False], bajo2[:-1])) & (posicion >= 1)
+    return {
+        '1_2s': alto2 | bajo2,
+        '1_3s': np.abs(z) > 3,
+        '2_2s': (alto2 & anterior_alto2) | (bajo2 & anterior_bajo2),
+        'R_4s': (alto2 & anterior_bajo2) | (bajo2 & anterior_alto2),
+        '4_1s': seguidos(z > 1, 4) | seguidos(z < -1, 4),
+        '10_x': seguidos(z > 0, 10) | seguidos(z < 0, 10),
+    }
+
+
+def _agregar_numpy(filas, desde, referencia):
+    if not filas:
+        return []
+    laboratorio, propiedad, control, nivel, dia, valor = zip(*filas)
+    laboratorio = np.array(laboratorio, dtype=np.int64)
+    propiedad = np.array(propiedad, dtype=np.int64)
+    control = np.array(control, dtype=bool)
+    nombres_nivel, nivel = np.unique(np.array(nivel, dtype=str), return_inverse=True)
+    nivel = np.where(control, nivel, -1)
+    # Cada día como su índice en ``fechas``: convertir miles de date a datetime64 es lo más lento
+    fechas = sorted(set(dia))
+    indice = {fecha: i for i, fecha in enumerate(fechas)}
+    dia = np.fromiter(map(indice.__getitem__, dia), np.int64, len(dia))
+    v = np.array(valor, dtype=np.float64)
+
+    # Series (laboratorio, propiedad, control, nivel) contiguas; lexsort es estable y
+    # conserva el orden cronológico dentro de cada una
+    orden = np.lexsort((nivel, control, propiedad, laboratorio))
+    laboratorio, propiedad, control, nivel, dia, v = (
+        x[orden] for x in (laboratorio, propiedad, control, nivel, dia, v)
+    )
+    total = len(v)
+    nueva_serie = np.ones(total, dtype=bool)
+    nueva_serie[1:] = (
+        (laboratorio[1:] != laboratorio[:-1]) | (propiedad[1:] != propiedad[:-1])
+        | (control[1:] != control[:-1]) | (nivel[1:] != nivel[:-1])
+    )
+    serie = np.cumsum(nueva_serie) - 1
+    inicios_serie = np.flatnonzero(nueva_serie)
+    posicion = np.arange(total) - inicios_serie[serie]
+
+    # Media/DE objetivo de cada serie de controles (un ciclo por serie, no por valor)
+    media_obj = np.full(len(inicios_serie), np.nan)
+    de_obj = np.full(len(inicios_serie), np.nan)
+    for s, (i, j) in enumerate(zip(inicios_serie, np.append(inicios_serie[1:], total))):
+        if not control[i]:
+            continue
+        clave = (int(laboratorio[i]), int(propiedad[i]), str(nombres_nivel[nivel[i]]))
+        if clave in referencia:
+            media_obj[s], de_obj[s] = referencia[clave]
+        elif j - i > 1:
+            media_obj[s], de_obj[s] = v[i:j].mean(), v[i:j].std(ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(de_obj[serie] > 0, (v - media_obj[serie]) / de_obj[serie], np.nan)
+    reglas = _reglas_numpy(z, posicion)
+
+    # Agregados por (serie, día) con reduceat sobre los límites de cada grupo
+    nuevo_dia = nueva_serie.copy()
+    nuevo_dia[1:] |= dia[1:] != dia[:-1]
+    inicios = np.flatnonzero(nuevo_dia)
+    n = np.diff(np.append(inicios, total))
+    suma = np.add.reduceat(v, inicios)
+    media = suma / n
+    desviacion = v - np.repeat(media, n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        de = np.where(n > 1, np.sqrt(np.add.reduceat(desviacion * desviacion, inicios) / np.maximum(n - 1, 1)), np.nan)
+        cv = de * 100 / np.abs(media)
+    cuadrados = np.add.reduceat(v * v, inicios)
+    minimo = np.minimum.reduceat(v, inicios)
+    maximo = np.maximum.reduceat(v, inicios)
+    violadas = {regla: np.logical_or.reduceat(bandera, inicios) for regla, bandera in reglas.items()}
+
+    resumenes = []
+    for k, i in enumerate(inicios):
+        fecha = fechas[dia[i]]
+        if fecha < desde:
+            continue  # Controles de contexto: su día pertenece a la ventana anterior
+        s = serie[i]
+        violaciones = [regla for regla, _ in REGLAS if violadas[regla][k]]
+        resumenes.append({
+            'laboratorio_id': int(laboratorio[i]),
+            'propiedad_id': int(propiedad[i]),
+            'fecha': fecha,
+            'es_control': bool(control[i]),
+            'nivel': str(nombres_nivel[nivel[i]]) if control[i] else '',
+            'n': int(n[k]),
+            'suma': float(suma[k]),
+            'suma_cuadrados': float(cuadrados[k]),
+            'media': float(media[k]),
+            'de': _finito(de[k]),
+            'cv': _finito(cv[k]),
+            'minimo': float(minimo[k]),
+            'maximo': float(maximo[k]),
+            'media_objetivo': _finito(media_obj[s]),
+            'de_objetivo': _finito(de_obj[s]),
+            'violaciones': violaciones,
+            'rechazo': bool(RECHAZO.intersection(violaciones)),
+        })
+    return resumenes
+
+
+def _reglas_python(z):
+    """Conjunto de reglas violadas en cada valor de una serie de puntuaciones z"""
+    marcas = []
+    for i, x in enumerate(z):
+        violadas = set()
+        if abs(x) > 2:
+            violadas.add('1_2s')
+        if abs(x) > 3:
+            violadas.add('1_3s')
+        if i >= 1:
+            previo = z[i - 1]
+            if (x > 2 and previo > 2) or (x < -2 and previo < -2):
+                violadas.add('2_2s')
+            if (x > 2 and previo < -2) or (x < -2 and previo > 2):
+                violadas.add('R_4s')
+        if i >= 3 and (all(y > 1 for y in z[i - 3:i + 1]) or all(y < -1 for y in z[i - 3:i + 1])):
+            violadas.add('4_1s')
+        if i >= 9 and (all(y > 0 for y in z[i - 9:i + 1]) or all(y < 0 for y in z[i - 9:i + 1])):
+            violadas.add('10_x')
+        marcas.append(violadas)
+    return marcas
+
+
+def _agregar_python(filas, desde, referencia):
+    series = defaultdict(list)
+    for laboratorio, propiedad, control, nivel, dia, valor in filas:
+        series[laboratorio, propiedad, control, nivel if control else ''].append((dia, valor))
+    resumenes = []
+    for (laboratorio, propiedad, control, nivel), puntos in sorted(series.items()):
+        valores = [valor for _, valor in puntos]
+        media_obj = de_obj = None
+        marcas = [set()] * len(puntos)
+        if control:
+            if (laboratorio, propiedad, nivel) in referencia:
+                media_obj, de_obj = referencia[laboratorio, propiedad, nivel]
+            elif len(valores) > 1:
+                media_obj, de_obj = statistics.fmean(valores), statistics.stdev(valores)
+            if de_obj:
+                marcas = _reglas_python([(v - media_obj) / de_obj for v in valores])
+        for dia, indices in groupby(range(len(puntos)), key=lambda i: puntos[i][0]):
+            if dia < desde:
+                continue
+            indices = list(indices)
+            del_dia = [valores[i] for i in indices]
+            n = len(del_dia)
+            media = sum(del_dia) / n
+            de = statistics.stdev(del_dia) if n > 1 else None
+            violadas = set().union(*(marcas[i] for i in indices))
+            violaciones = [regla for regla, _ in REGLAS if regla in violadas]
+            resumenes.append({
+                'laboratorio_id': laboratorio,
+                'propiedad_id': propiedad,
+                'fecha': dia,
+                'es_control': control,
+                'nivel': nivel,
+                'n': n,
+                'suma': sum(del_dia),
+                'suma_cuadrados': sum(x * x for x in del_dia),
+                'media': media,
+                'de': de,
+                'cv': de * 100 / abs(media) if de is not None and media else None,
+                'minimo': min(del_dia),
+                'maximo': max(del_dia),
+                'media_objetivo': media_obj,
+                'de_objetivo': de_obj,
+                'violaciones': violaciones,
+                'rechazo': bool(RECHAZO.intersection(violaciones)),
+            })
+    return resumenes
+
+
+def agregar(filas, desde, referencia):
+    """Resúmenes diarios (diccionarios con los campos de ResumenControlDiario) desde ``desde``"""
+    calcular = _agregar_numpy if np is not None else _agregar_python
+    return calcular(filas, desde, referencia)
+
+
+def resumir_ventana(desde, hasta, lote=5000):
+    """Recalcula y reemplaza los resúmenes de los días [desde, hasta); devuelve cuántos escribió"""
+    resumenes = agregar(list(filas_resultados(desde, hasta, lote)), desde, objetivos(desde))
+    with transaction.atomic():
+        ResumenControlDiario.objects.filter(fecha__gte=desde, fecha__lt=hasta).delete()
+        ResumenControlDiario.objects.bulk_create(
+            [ResumenControlDiario(**resumen) for resumen in resumenes], batch_size=1000,
+        )
+    return len(resumenes)
+
+
+def ventanas(desde, hasta, dias=7):
+    inicio = desde
+    while inicio < hasta:
+        fin = min(inicio + timedelta(days=dias), hasta)
+        yield inicio, fin
+        inicio = fin
+
+
+def resumir(desde, hasta, dias=7, lote=5000):
+    """Resume [desde, hasta) ventana por ventana, en orden, para que cada una use las anteriores de referencia"""
+    return sum(resumir_ventana(inicio, fin, lote) for inicio, fin in ventanas(desde, hasta, dias))
+
+
+def desde_pendiente():
+    """Primer día por resumir: el último ya resumido (pudo quedar a medias) o el del primer análisis"""
+    ultimo = ResumenControlDiario.objects.order_by('-fecha').values_list('fecha', flat=True).first()
+    if ultimo is not None:
+        return ultimo
+    primero = Analisis.objects.order_by('fecha_analisis').values_list('fecha_analisis', flat=True).first()
+    return timezone.localdate(primero) if primero else None
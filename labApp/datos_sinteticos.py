@@ -0,0 +1,299 @@
+# labApp/datos_sinteticos.py
+#
+# Datos sintéticos con la forma de un laboratorio real para pruebas de carga y
+# benchmarks: laboratorios, pacientes, análisis y sus resultados sobre
+# plantillas reales (biometría hemática, química sanguínea de 24 elementos,
+# perfil tiroideo) con intervalos por sexo y edad y códigos LOINC.
+#
+# Todo sale de un random.Random con semilla: la misma semilla y los mismos
+# tamaños dan los mismos datos. Se escribe con bulk_create por lotes, sin pasar
+# por las señales; los rangos y banderas de los resultados se calculan con el
+# mismo índice de intervalos y las mismas reglas que al capturarlos.
+#
+#   manage.py seed_lab_data --perfil grande   # 50 laboratorios, 200k pacientes,
+#                                             # 1M análisis, ~20M resultados
+
+import datetime
+import math
+import random
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.utils import timezone
+
+from .intervalos import DIAS_POR_ANIO, intervalos
+from .models import (
+    Analisis, IntervaloReferencia, Laboratorio, LoincCode, Paciente, Plantilla, PropiedadPlantilla,
+    ResultadoAnalisis, Usuario,
+)
+from .resultados import calcular_campos
+
+PERFILES = {
+    'pequeno': {'laboratorios': 3, 'pacientes': 2_000, 'analisis': 10_000},
+    'mediano': {'laboratorios': 10, 'pacientes': 20_000, 'analisis': 100_000},
+    'grande': {'laboratorios': 50, 'pacientes': 200_000, 'analisis': 1_000_000},
+}
+
+# Bandas: (sexo, edad_min, edad_max en años o None, valor_min, valor_max); el valor
+# sintético se sortea alrededor de la última banda (adultos)
+PLANTILLAS = {
+    'Biometría Hemática': (40, [
+        ('Eritrocitos', '789-8', '10^6/µL', 2, [('AMBOS', 0, 11, 4.0, 5.2), ('MASCULINO', 12, None, 4.5, 5.9), ('FEMENINO', 12, None, 4.1, 5.1)]),
+        ('Hemoglobina', '718-7', 'g/dL', 1, [('AMBOS', 0, 11, 11.5, 15.5), ('MASCULINO', 12, None, 13.5, 17.5), ('FEMENINO', 12, None, 12.0, 15.5)]),
+        ('Hematocrito', '4544-3', '%', 1, [('AMBOS', 0, 11, 35, 45), ('MASCULINO', 12, None, 41, 53), ('FEMENINO', 12, None, 36, 46)]),
+        ('VCM', '787-2', 'fL', 1, [('AMBOS', 0, None, 80, 100)]),
+        ('HCM', '785-6', 'pg', 1, [('AMBOS', 0, None, 27, 33)]),
+        ('CHCM', '786-4', 'g/dL', 1, [('AMBOS', 0, None, 32, 36)]),
+        ('RDW', '788-0', '%', 1, [('AMBOS', 0, None, 11.5, 14.5)]),
+        ('Leucocitos', '6690-2', '10^3/µL', 2, [('AMBOS', 0, 11, 5.0, 14.5), ('AMBOS', 12, None, 4.5, 11.0)]),
+        ('Neutrófilos %', '770-8', '%', 1, [('AMBOS', 0, None, 40, 70)]),
+        ('Linfocitos %', '736-9', '%', 1, [('AMBOS', 0, None, 20, 45)]),
+        ('Monocitos %', '5905-5', '%', 1, [('AMBOS', 0, None, 2, 10)]),
+        ('Eosinófilos %', '713-8', '%', 1, [('AMBOS', 0, None, 1, 6)]),
+        ('Basófilos %', '706-2', '%', 1, [('AMBOS', 0, None, 0, 2)]),
+        ('Neutrófilos', '751-8', '10^3/µL', 2, [('AMBOS', 0, None, 1.8, 7.7)]),
+        ('Linfocitos', '731-0', '10^3/µL', 2, [('AMBOS', 0, None, 1.0, 4.8)]),
+        ('Monocitos', '742-7', '10^3/µL', 2, [('AMBOS', 0, None, 0.2, 0.9)]),
+        ('Eosinófilos', '711-2', '10^3/µL', 2, [('AMBOS', 0, None, 0.05, 0.5)]),
+        ('Basófilos', '704-7', '10^3/µL', 2, [('AMBOS', 0, None, 0.0, 0.2)]),
+        ('Plaquetas', '777-3', '10^3/µL', 0, [('AMBOS', 0, None, 150, 450)]),
+        ('VPM', '32623-1', 'fL', 1, [('AMBOS', 0, None, 7.5, 11.5)]),
+    ]),
+    'Química Sanguínea 24': (45, [
+        ('Glucosa', '2345-7', 'mg/dL', 0, [('AMBOS', 0, None, 70, 100)]),
+        ('Urea', '3091-6', 'mg/dL', 1, [('AMBOS', 0, None, 15, 45)]),
+        ('BUN', '3094-0', 'mg/dL', 1, [('AMBOS', 0, None, 7, 21)]),
+        ('Creatinina', '2160-0', 'mg/dL', 2, [('AMBOS', 0, 11, 0.3, 0.7), ('MASCULINO', 12, None, 0.7, 1.3), ('FEMENINO', 12, None, 0.6, 1.1)]),
+        ('Ácido úrico', '3084-1', 'mg/dL', 1, [('MASCULINO', 0, None, 3.4, 7.0), ('FEMENINO', 0, None, 2.4, 6.0)]),
+        ('Colesterol total', '2093-3', 'mg/dL', 0, [('AMBOS', 0, None, 120, 200)]),
+        ('Triglicéridos', '2571-8', 'mg/dL', 0, [('AMBOS', 0, None, 40, 150)]),
+        ('Colesterol HDL', '2085-9', 'mg/dL', 0, [('MASCULINO', 0, None, 40, 60), ('FEMENINO', 0, None, 50, 70)]),
+        ('Colesterol LDL', '13457-7', 'mg/dL', 0, [('AMBOS', 0, None, 50, 130)]),
+        ('Colesterol VLDL', '13458-5', 'mg/dL', 0, [('AMBOS', 0, None, 5, 40)]),
+        ('Proteínas totales', '2885-2', 'g/dL', 1, [('AMBOS', 0, None, 6.0, 8.3)]),
+        ('Albúmina', '1751-7', 'g/dL', 1, [('AMBOS', 0, None, 3.5, 5.0)]),
+        ('Globulinas', '10834-0', 'g/dL', 1, [('AMBOS', 0, None, 2.0, 3.5)]),
+        ('Bilirrubina total', '1975-2', 'mg/dL', 2, [('AMBOS', 0, None, 0.2, 1.2)]),
+        ('Bilirrubina directa', '1968-7', 'mg/dL', 2, [('AMBOS', 0, None, 0.0, 0.3)]),
+        ('Bilirrubina indirecta', '1971-1', 'mg/dL', 2, [('AMBOS', 0, None, 0.2, 0.9)]),
+        ('TGO (AST)', '1920-8', 'U/L', 0, [('AMBOS', 0, None, 10, 40)]),
+        ('TGP (ALT)', '1742-6', 'U/L', 0, [('AMBOS', 0, None, 7, 56)]),
+        ('Fosfatasa alcalina', '6768-6', 'U/L', 0, [('AMBOS', 0, 17, 100, 390), ('AMBOS', 18, None, 44, 147)]),
+        ('DHL', '2532-0', 'U/L', 0, [('AMBOS', 0, None, 140, 280)]),
+        ('GGT', '2324-2', 'U/L', 0, [('MASCULINO', 0, None, 8, 61), ('FEMENINO', 0, None, 5, 36)]),
+        ('Sodio', '2951-2', 'mmol/L', 0, [('AMBOS', 0, None, 135, 145)]),
+        ('Potasio', '2823-3', 'mmol/L', 1, [('AMBOS', 0, None, 3.5, 5.1)]),
+        ('Cloro', '2075-0', 'mmol/L', 0, [('AMBOS', 0, None, 98, 107)]),
+    ]),
+    'Perfil Tiroideo': (15, [
+        ('TSH', '3016-3', 'µUI/mL', 2, [('AMBOS', 0, None, 0.4, 4.0)]),
+        ('T3 total', '3053-6', 'ng/dL', 0, [('AMBOS', 0, None, 80, 200)]),
+        ('T4 total', '3026-2', 'µg/dL', 1, [('AMBOS', 0, None, 5.0, 12.0)]),
+        ('T4 libre', '3024-7', 'ng/dL', 2, [('AMBOS', 0, None, 0.8, 1.8)]),
+        ('T3 libre', '3051-0', 'pg/mL', 1, [('AMBOS', 0, None, 2.3, 4.2)]),
+    ]),
+}
+
+NOMBRES = [
+    'José', 'María', 'Juan', 'Guadalupe', 'Luis', 'Ana', 'Carlos', 'Rosa', 'Jorge', 'Laura', 'Miguel', 'Sofía',
+    'Francisco', 'Elena', 'Alejandro', 'Patricia', 'Fernando', 'Gabriela', 'Ricardo', 'Carmen',
+]
+APELLIDOS = [
+    'Hernández', 'García', 'Martínez', 'López', 'González', 'Pérez', 'Rodríguez', 'Sánchez', 'Ramírez', 'Cruz',
+    'Flores', 'Gómez', 'Morales', 'Vázquez', 'Reyes', 'Jiménez', 'Torres', 'Díaz', 'Gutiérrez', 'Conriquez',
+]
+CIUDADES = [
+    ('Culiacán', 'Sinaloa', '80000'), ('Mazatlán', 'Sinaloa', '82000'), ('Los Mochis', 'Sinaloa', '81200'),
+    ('Hermosillo', 'Sonora', '83000'), ('Guadalajara', 'Jalisco', '44100'), ('Monterrey', 'Nuevo León', '64000'),
+    ('Tijuana', 'Baja California', '22000'), ('Puebla', 'Puebla', '72000'), ('Mérida', 'Yucatán', '97000'),
+]
+
+ANALITOS = [
+    'Glucose', 'Hemoglobin', 'Cholesterol', 'Triglyceride', 'Creatinine', 'Urea nitrogen',
+    'Sodium', 'Potassium', 'Chloride', 'Calcium', 'Albumin', 'Bilirubin', 'Ferritin',
+    'Thyrotropin', 'Thyroxine', 'Leukocytes', 'Erythrocytes', 'Platelets', 'Hematocrit',
+    'Alanine aminotransferase', 'Aspartate aminotransferase', 'Alkaline phosphatase',
+    'Cholesterol.in HDL', 'Cholesterol.in LDL', 'Hemoglobin A1c', 'Troponin I', 'Lactate',
+]
+SISTEMAS = ['Ser/Plas', 'Bld', 'Urine', 'CSF', 'Ser', 'Plas', 'BldA', 'BldV']
+PROPIEDADES_LOINC = ['MCnc', 'SCnc', 'ACnc', 'NCnc', 'MFr', 'PrThr', 'Titr', 'Ratio']
+ESCALAS = ['Qn', 'Ord', 'Nom']
+
+
+def crear_codigos_loinc(cantidad, semilla=1, inicio=1000, lote=5000):
+    """``cantidad`` códigos LOINC sintéticos (los números que ya existan se ignoran)"""
+    azar = random.Random(semilla)
+    codigos = []
+    for i in range(cantidad):
+        analito = azar.choice(ANALITOS)
+        sistema = azar.choice(SISTEMAS)
+        propiedad = azar.choice(PROPIEDADES_LOINC)
+        codigos.append(LoincCode(
+            loinc_num=f'{inicio + i}-{i % 10}',
+            shortname=f'{analito} {sistema.replace("/", "")}-{propiedad} {i}',
+            component=analito,
+            property=propiedad,
+            system=sistema,
+            scale_typ=azar.choice(ESCALAS),
+        ))
+        if len(codigos) == lote:
+            LoincCode.objects.bulk_create(codigos, ignore_conflicts=True)
+            codigos = []
+    LoincCode.objects.bulk_create(codigos, ignore_conflicts=True)
+
+
+@contextmanager
+def fecha_analisis_manual():
+    """Permite fijar fecha_analisis en bulk_create (auto_now_add la pisaría con la hora actual)"""
+    campo = Analisis._meta.get_field('fecha_analisis')
+    campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        campo.auto_now_add = True
+
+
+def crear_plantillas():
+    """{titulo: (plantilla, peso, [(propiedad, decimales, media, de)])}, reutilizando las que ya existan"""
+    codigos = {
+        loinc: nombre for _, propiedades in PLANTILLAS.values() for nombre, loinc, *_ in propiedades
+    }
+    LoincCode.objects.bulk_create(
+        [LoincCode(loinc_num=loinc, shortname=nombre) for loinc, nombre in codigos.items()], ignore_conflicts=True,
+    )
+    loinc_ids = dict(LoincCode.objects.filter(loinc_num__in=codigos).values_list('loinc_num', 'id'))
+    resultado = {}
+    for titulo, (peso, propiedades) in PLANTILLAS.items():
+        plantilla, creada = Plantilla.objects.get_or_create(titulo=titulo)
+        if creada:
+            creadas = PropiedadPlantilla.objects.bulk_create([
+                PropiedadPlantilla(plantilla=plantilla, nombre_propiedad=nombre, loinc_code_id=loinc_ids[loinc], unidad=unidad)
+                for nombre, loinc, unidad, _, _ in propiedades
+            ])
+            IntervaloReferencia.objects.bulk_create([
+                IntervaloReferencia(
+                    propiedad=propiedad, sexo=sexo, edad_min=edad_min, edad_max=edad_max,
+                    unidad_edad='ANIOS', valor_min=valor_min, valor_max=valor_max,
+                )
+                for propiedad, (_, _, _, _, bandas) in zip(creadas, propiedades)
+                for sexo, edad_min, edad_max, valor_min, valor_max in bandas
+            ])
+        existentes = {p.nombre_propiedad: p for p in plantilla.propiedades.all()}
+        resultado[titulo] = (plantilla, peso, [
+            # Media en el centro del rango adulto y DE de un cuarto del rango: ~5 % fuera de rango
+            (existentes[nombre], decimales, (bandas[-1][3] + bandas[-1][4]) / 2, (bandas[-1][4] - bandas[-1][3]) / 4)
+            for nombre, _, _, decimales, bandas in propiedades
+        ])
+    # bulk_create no dispara las señales que invalidan el índice de intervalos
+    intervalos.invalidar()
+    return resultado
+
+
+def crear_laboratorios(cantidad, azar):
+    inicio = Laboratorio.objects.count()
+    laboratorios = Laboratorio.objects.bulk_create([
+        Laboratorio(
+            nombre_laboratorio=f'Laboratorio Sintético {inicio + i + 1}',
+            ciudad=ciudad, estado=estado, codigo_postal=codigo_postal, pais='México',
+        )
+        for i, (ciudad, estado, codigo_postal) in enumerate(azar.choice(CIUDADES) for _ in range(cantidad))
+    ])
+    usuarios = Usuario.objects.bulk_create([
+        Usuario(
+            nombre=f'Químico {laboratorio.nombre_laboratorio}',
+            correo_electronico=f'lab{laboratorio.pk}@sintetico.example', num_telefono='6670000000',
+        )
+        for laboratorio in laboratorios
+    ])
+    Usuario.laboratorios.through.objects.bulk_create([
+        Usuario.laboratorios.through(usuario_id=usuario.pk, laboratorio_id=laboratorio.pk)
+        for usuario, laboratorio in zip(usuarios, laboratorios)
+    ])
+    return laboratorios
+
+
+def crear_pacientes(laboratorios, cantidad, azar, hasta, lote):
+    """[(id, sexo, edad en días a ``hasta``)] de los pacientes creados"""
+    pacientes = []
+    for desde in range(0, cantidad, lote):
+        nuevos = []
+        for _ in range(min(lote, cantidad - desde)):
+            # Pirámide aproximada: más adultos que niños o ancianos
+            edad = min(int(abs(azar.gauss(38, 20))), 95)
+            nacimiento = hasta - datetime.timedelta(days=int(edad * DIAS_POR_ANIO) + azar.randrange(365))
+            sexo = azar.choice(('MASCULINO', 'FEMENINO'))
+            nuevos.append(Paciente(
+                laboratorio=azar.choice(laboratorios),
+                nombre=f'{azar.choice(NOMBRES)} {azar.choice(APELLIDOS)} {azar.choice(APELLIDOS)}',
+                edad=edad, fecha_nacimiento=nacimiento, sexo=sexo,
+                telefono=f'667{azar.randrange(10 ** 7):07d}',
+            ))
+        with transaction.atomic():
+            Paciente.objects.bulk_create(nuevos)
+        pacientes += [(p.pk, p.sexo, p.fecha_nacimiento) for p in nuevos]
+    return pacientes
+
+
+def crear_analisis(pacientes, plantillas, cantidad, azar, hasta, dias, lote, progreso=None):
+    """Análisis repartidos en los ``dias`` anteriores a ``hasta`` con sus resultados capturados"""
+    titulos = list(plantillas)
+    pesos = [plantillas[t][1] for t in titulos]
+    fin = timezone.make_aware(datetime.datetime.combine(hasta, datetime.time(20)))
+    total_resultados = 0
+    for desde in range(0, cantidad, lote):
+        nuevos = []
+        for _ in range(min(lote, cantidad - desde)):
+            paciente_id, sexo, nacimiento = azar.choice(pacientes)
+            fecha = fin - datetime.timedelta(seconds=azar.randrange(dias * 86400))
+            analisis = Analisis(
+                paciente_id=paciente_id, plantilla=plantillas[azar.choices(titulos, pesos)[0]][0],
+                fecha_analisis=fecha, fecha_muestra=fecha.date(),
+            )
+            analisis.datos_paciente = (sexo, nacimiento)
+            nuevos.append(analisis)
+        with transaction.atomic(), fecha_analisis_manual():
+            Analisis.objects.bulk_create(nuevos)
+            total_resultados += crear_resultados(nuevos, plantillas, azar)
+        if progreso:
+            progreso(desde + len(nuevos), total_resultados)
+    return total_resultados
+
+
+def crear_resultados(analisis, plantillas, azar):
+    por_plantilla = {plantilla.pk: propiedades for plantilla, _, propiedades in plantillas.values()}
+    pares = []
+    for a in analisis:
+        sexo, nacimiento = a.datos_paciente
+        dias = max((a.fecha_muestra - nacimiento).days, 0)
+        pares += [(a, propiedad, decimales, media, de, dias, sexo) for propiedad, decimales, media, de in por_plantilla[a.plantilla_id]]
+    minimos, maximos = intervalos.resolver_lote(
+        [par[1].pk for par in pares], [par[5] for par in pares], [par[6] for par in pares],
+    )
+    resultados = []
+    for (a, propiedad, decimales, media, de, _, _), ref_min, ref_max in zip(pares, minimos, maximos):
+        valor = f'{max(azar.gauss(media, de), 0):.{decimales}f}'
+        intervalo = None if math.isnan(ref_min) else (float(ref_min), float(ref_max))
+        numero, ref_min, ref_max, bandera = calcular_campos(valor, intervalo)
+        resultados.append(ResultadoAnalisis(
+            analisis=a, loinc_code_id=propiedad.loinc_code_id, nombre_propiedad=propiedad.nombre_propiedad,
+            valor=valor, unidad=propiedad.unidad,
+            valor_numerico=numero, ref_min=ref_min, ref_max=ref_max, bandera=bandera,
+        ))
+    ResultadoAnalisis.objects.bulk_create(resultados, batch_size=2000)
+    return len(resultados)
+
+
+def sembrar(laboratorios, pacientes, analisis, semilla=1, hasta=None, dias=365, lote=2000, progreso=None):
+    """Crea los datos y devuelve {modelo: filas creadas}"""
+    azar = random.Random(semilla)
+    hasta = hasta or datetime.date(2025, 12, 31)
+    plantillas = crear_plantillas()
+    creados_labs = crear_laboratorios(laboratorios, azar)
+    creados_pacientes = crear_pacientes(creados_labs, pacientes, azar, hasta, lote)
+    resultados = crear_analisis(creados_pacientes, plantillas, analisis, azar, hasta, dias, lote, progreso)
+    return {
+        'laboratorios': len(creados_labs),
+        'pacientes': len(creados_pacientes),
+        'analisis': analisis,
+        'resultados': resultados,
+    }
@@ -0,0 +1,79 @@
+# labApp/duplicados.py
+#
+# Detección de pacientes duplicados por bloques. En lugar de comparar cada par
+# de pacientes (n² comparaciones) se agrupan por claves que un duplicado real
+# comparte casi siempre, y solo se comparan los pacientes de un mismo bloque:
+#
+#   - laboratorio + nombre fonético ("José López" = "Jose Lopes" = "López José")
+#   - laboratorio + teléfono (nombres mal escritos; aquí se exige similitud
+#     del nombre, porque una familia suele compartir teléfono)
+#
+# Dentro de cada bloque los pacientes se ordenan por edad y cada uno se compara
+# solo con los siguientes mientras la edad quede dentro de la tolerancia (la
+# edad se captura al registrar, así que dos registros del mismo paciente con
+# años de diferencia no coinciden exactamente). Con 200 mil pacientes es una
+# sola lectura de la tabla y unos segundos de CPU.
+
+import re
+from collections import defaultdict
+
+from .models import Paciente
+from .nombres import similitud
+
+CAMPOS = (
+    'id', 'laboratorio_id', 'nombre', 'nombre_clave', 'nombre_fonetico', 'sexo', 'edad', 'fecha_nacimiento', 'telefono',
+)
+
+# Dígitos mínimos para que un teléfono sirva de bloque ("0", "N/A"... no)
+DIGITOS_TELEFONO = 7
+
+
+def bloques(pacientes, entre_laboratorios=False):
+    """{(motivo, laboratorio, clave): [paciente, ...]} con los bloques de dos o más pacientes"""
+    agrupados = defaultdict(list)
+    for paciente in pacientes:
+        laboratorio = None if entre_laboratorios else paciente.laboratorio_id
+        if paciente.nombre_fonetico:
+            agrupados['nombre', laboratorio, paciente.nombre_fonetico].append(paciente)
+        digitos = re.sub(r'\D', '', paciente.telefono or '')
+        if len(digitos) >= DIGITOS_TELEFONO:
+            agrupados['telefono', laboratorio, digitos[-10:]].append(paciente)
+    return {clave: grupo for clave, grupo in agrupados.items() if len(grupo) > 1}
+
+
+def compatibles(a, b, tolerancia_edad):
+    if a.sexo != b.sexo:
+        return False
+    if a.fecha_nacimiento and b.fecha_nacimiento:
+        return a.fecha_nacimiento == b.fecha_nacimiento
+    return abs(a.edad - b.edad) <= tolerancia_edad
+
+
+def detectar(queryset=None, umbral=0.85, tolerancia_edad=2, entre_laboratorios=False):
+    """Pares de posibles duplicados como dicts, del más parecido al menos parecido.
+
+    ``umbral`` es la similitud mínima del nombre para los pares que solo
+    comparten teléfono; los del bloque fonético ya suenan igual.
+    """
+    queryset = Paciente.objects.all() if queryset is None else queryset
+    pacientes = queryset.order_by().values_list(*CAMPOS, named=True).iterator(chunk_size=5000)
+    pares = {}
+    for (motivo, _, _), grupo in bloques(pacientes, entre_laboratorios).items():
+        grupo.sort(key=lambda p: p.edad)
+        for i, a in enumerate(grupo):
+            for b in grupo[i + 1:]:
+                if b.edad - a.edad > tolerancia_edad:
+                    break
+                clave = (min(a.id, b.id), max(a.id, b.id))
+                if clave in pares or not compatibles(a, b, tolerancia_edad):
+                    continue
+                parecido = similitud(a.nombre_clave, b.nombre_clave)
+                if motivo == 'nombre' or parecido >= umbral:
+                    primero, segundo = (a, b) if a.id < b.id else (b, a)
+                    pares[clave] = {
+                        'paciente_a': primero.id, 'paciente_b': segundo.id,
+                        'laboratorio_a': primero.laboratorio_id, 'laboratorio_b': segundo.laboratorio_id,
+                        'nombre_a': primero.nombre, 'nombre_b': segundo.nombre,
+                        'similitud': round(parecido, 3), 'motivo': motivo,
+                    }
+    return sorted(pares.values(), key=lambda par: (-par['similitud'], par['paciente_a'], par['paciente_b']))
@@ -0,0 +1,202 @@
+# labApp/estructuras.py
+#
+# Estructura resuelta de cada Plantilla: sus propiedades con nombre, unidad,
+# código LOINC e intervalos, como datos planos. Plantilla.version sube con
+# cualquier cambio a la plantilla, sus propiedades, sus intervalos o los LOINC
+# que usa (señales de este módulo), así que la estructura se guarda con clave
+# (plantilla_id, version) y nunca hay que invalidarla: una versión nueva es una
+# clave nueva. Se busca primero en un LRU del proceso, luego en la caché de
+# Django compartida y solo al final en la base (tres consultas para todas las
+# plantillas que falten).
+#
+# Las estructuras devueltas se comparten entre peticiones: no modificarlas.
+#
+# Configuración (settings.py, opcional):
+#   LAB_PLANTILLAS_CACHE   alias de CACHES compartido entre workers (por
+#                          defecto 'default'; None = solo el LRU del proceso)
+#   LAB_PLANTILLAS_LRU     estructuras guardadas por proceso (por defecto 256)
+
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.db.models.expressions import Combinable
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .senales import contar_cache, version_plantilla
+from .models import IntervaloReferencia, LoincCode, Plantilla, PropiedadPlantilla
+
+CLAVE = 'labApp:plantilla:{}:{}'
+
+
+class LRU:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()
+
+    def obtener(self, clave):
+        with self._lock:
+            valor = self._datos.get(clave)
+            if valor is not None:
+                self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor):
+        maximo = getattr(settings, 'LAB_PLANTILLAS_LRU', 256)
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > maximo:
+                self._datos.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+lru = LRU()
+
+
+def _cache_compartida():
+    alias = getattr(settings, 'LAB_PLANTILLAS_CACHE', 'default')
+    return caches[alias] if alias else None
+
+
+def _leer_bd(plantilla_ids):
+    """{id: estructura} de las plantillas indicadas, con la versión leída antes que los hijos"""
+    estructuras = {
+        plantilla_id: {
+            'id': plantilla_id, 'version': version, 'titulo': titulo, 'tipo_formato': tipo_formato,
+            'texto': texto or '', 'propiedades': [],
+        }
+        for plantilla_id, version, titulo, tipo_formato, texto in Plantilla.objects.filter(
+            pk__in=plantilla_ids,
+        ).values_list('id', 'version', 'titulo', 'tipo_formato', 'texto_justificado_default')
+    }
+    bandas = defaultdict(list)
+    for propiedad_id, *banda in IntervaloReferencia.objects.filter(
+        propiedad__plantilla_id__in=estructuras,
+    ).order_by('id').values_list('propiedad_id', 'sexo', 'edad_min', 'edad_max', 'unidad_edad', 'valor_min', 'valor_max'):
+        bandas[propiedad_id].append(tuple(banda))
+    for propiedad_id, plantilla_id, nombre, unidad, loinc_id, loinc_num in PropiedadPlantilla.objects.filter(
+        plantilla_id__in=estructuras,
+    ).order_by('id').values_list('id', 'plantilla_id', 'nombre_propiedad', 'unidad', 'loinc_code_id', 'loinc_code__loinc_num'):
+        estructuras[plantilla_id]['propiedades'].append({
+            'id': propiedad_id, 'nombre': nombre, 'unidad': unidad, 'loinc_id': loinc_id, 'loinc_num': loinc_num or '',
+            'intervalos': tuple(bandas[propiedad_id]),
+        })
+    for estructura in estructuras.values():
+        estructura['propiedades'] = tuple(estructura['propiedades'])
+    return estructuras
+
+
+def versiones(plantilla_ids=None):
+    """{id: version} de las plantillas indicadas o, sin ids, de todas"""
+    plantillas = Plantilla.objects.all() if plantilla_ids is None else Plantilla.objects.filter(pk__in=plantilla_ids)
+    return dict(plantillas.values_list('id', 'version'))
+
+
+def obtener_varias(plantilla_ids, versiones_conocidas=None):
+    """{id: estructura} de las plantillas; las que no existen no aparecen.
+
+    ``versiones_conocidas`` ({id: version}, p. ej. de plantillas ya cargadas)
+    evita la consulta de versiones para esas plantillas.
+    """
+    conocidas = dict(versiones_conocidas or {})
+    faltan_version = set(plantilla_ids) - set(conocidas)
+    if faltan_version:
+        conocidas.update(versiones(faltan_version))
+
+    resultado, faltantes = {}, {}
+    for plantilla_id, version in conocidas.items():
+        clave = CLAVE.format(plantilla_id, version)
+        estructura = lru.obtener(clave)
+        if estructura is None:
+            faltantes[clave] = plantilla_id
+        else:
+            resultado[plantilla_id] = estructura
+            contar_cache('plantillas', True)
+
+    compartida = _cache_compartida()
+    if faltantes and compartida is not None:
+        for clave, estructura in compartida.get_many(faltantes).items():
+            lru.guardar(clave, estructura)
+            resultado[faltantes.pop(clave)] = estructura
+            contar_cache('plantillas', True)
+
+    if faltantes:
+        leidas = _leer_bd(set(faltantes.values()))
+        # Con la versión leída junto con los hijos, que puede ser más nueva que la pedida
+        nuevas = {CLAVE.format(plantilla_id, e['version']): e for plantilla_id, e in leidas.items()}
+        for plantilla_id, estructura in leidas.items():
+            resultado[plantilla_id] = estructura
+            contar_cache('plantillas', False)
+        # Solo se guarda lo confirmado: dentro de una transacción que se revierta
+        # la plantilla podría no existir y su id (con la misma versión) reusarse
+        transaction.on_commit(lambda: _guardar(nuevas, compartida))
+    return resultado
+
+
+def _guardar(nuevas, compartida):
+    for clave, estructura in nuevas.items():
+        lru.guardar(clave, estructura)
+    if nuevas and compartida is not None:
+        compartida.set_many(nuevas, timeout=None)
+
+
+def obtener(plantilla):
+    """Estructura de una Plantilla (instancia, para usar su versión sin consultar) o de un id; None si no existe"""
+    if isinstance(plantilla, Plantilla):
+        return obtener_varias([plantilla.pk], {plantilla.pk: plantilla.version}).get(plantilla.pk)
+    return obtener_varias([plantilla]).get(plantilla)
+
+
+def tocar(**filtros):
+    """Sube la versión de las plantillas que cumplan ``filtros`` (una sola consulta UPDATE)"""
+    Plantilla.objects.filter(**filtros).update(version=F('version') + 1)
+    version_plantilla.send(sender=Plantilla)
+
+
+@receiver(pre_save, sender=Plantilla)
+def subir_version(sender, instance, raw=False, update_fields=None, **kwargs):
+    # El incremento va en el mismo UPDATE: dos ediciones simultáneas no comparten versión
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    if update_fields is None or 'version' in update_fields:
+        instance.version = F('version') + 1
+
+
+@receiver(post_save, sender=Plantilla)
+def leer_version(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or created:
+        return
+    if isinstance(instance.version, Combinable):
+        instance.refresh_from_db(fields=['version'])
+        version_plantilla.send(sender=Plantilla)
+    else:
+        tocar(pk=instance.pk)
+
+
+@receiver(post_save, sender=PropiedadPlantilla)
+@receiver(post_delete, sender=PropiedadPlantilla)
+def version_por_propiedad(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tocar(pk=instance.plantilla_id)
+
+
+@receiver(post_save, sender=IntervaloReferencia)
+@receiver(post_delete, sender=IntervaloReferencia)
+def version_por_intervalo(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tocar(propiedades__id=instance.propiedad_id)
+
+
+@receiver(post_save, sender=LoincCode)
+def version_por_loinc(sender, instance, created, raw=False, **kwargs):
+    # importar_loinc actualiza con bulk_update (sin señales), pero nunca cambia loinc_num
+    if not raw and not created:
+        tocar(propiedades__loinc_code_id=instance.pk)
@@ -0,0 +1,111 @@
+# labApp/exportacion.py
+#
+# Exportación en flujo de análisis + resultados (con paciente, plantilla y
+# LOINC) a CSV o JSON Lines. Se recorre con .iterator(chunk_size=...) sobre una
+# sola consulta con JOIN, así que la memoria no depende del número de filas.
+#
+# La exportación incremental usa una marca (fecha_analisis, analisis_id): se
+# exportan solo los análisis posteriores a la última marca guardada.
+#
+# Limitación: la marca solo avanza con análisis nuevos. Un resultado que se
+# captura o corrige después de que su análisis ya salió en una exportación no
+# vuelve a exportarse de forma incremental (ResultadoAnalisis no guarda fecha
+# de modificación); para recogerlo hay que exportar completo, sin marca, o
+# exportar esos análisis desde el admin.
+
+import csv
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import ResultadoAnalisis
+
+# (columna de salida, campo del ORM)
+COLUMNAS = [
+    ('analisis_id', 'analisis_id'),
+    ('fecha_analisis', 'analisis__fecha_analisis'),
+    ('fecha_muestra', 'analisis__fecha_muestra'),
+    ('laboratorio_id', 'laboratorio_id'),
+    ('paciente_id', 'analisis__paciente_id'),
+    ('paciente', 'analisis__paciente__nombre'),
+    ('edad', 'analisis__paciente__edad'),
+    ('sexo', 'analisis__paciente__sexo'),
+    ('plantilla', 'analisis__plantilla__titulo'),
+    ('resultado_id', 'id'),
+    ('propiedad', 'nombre_propiedad'),
+    ('loinc', 'loinc_code__loinc_num'),
+    ('loinc_nombre', 'loinc_code__shortname'),
+    ('valor', 'valor'),
+    ('valor_numerico', 'valor_numerico'),
+    ('unidad', 'unidad'),
+    ('ref_min', 'ref_min'),
+    ('ref_max', 'ref_max'),
+    ('bandera', 'bandera'),
+]
+ENCABEZADOS = [columna for columna, _ in COLUMNAS]
+FORMATOS = ('csv', 'jsonl')
+
+
+def marca_a_json(marca):
+    return {'fecha_analisis': marca[0].isoformat(), 'analisis_id': marca[1]} if marca else None
+
+
+def marca_desde_json(datos):
+    return (parse_datetime(datos['fecha_analisis']), datos['analisis_id']) if datos else None
+
+
+def filas(analisis=None, marca=None, chunk_size=2000):
+    """Tuplas en el orden de COLUMNAS, ordenadas por (fecha_analisis, analisis_id, id).
+
+    ``analisis`` limita la exportación a un queryset de Analisis; ``marca``
+    (fecha_analisis, analisis_id) exporta solo lo posterior a ella.
+    """
+    queryset = ResultadoAnalisis.objects.all()
+    if analisis is not None:
+        queryset = queryset.filter(analisis__in=analisis)
+    if marca is not None:
+        fecha, analisis_id = marca
+        queryset = queryset.filter(
+            Q(analisis__fecha_analisis__gt=fecha)
+            | Q(analisis__fecha_analisis=fecha, analisis_id__gt=analisis_id)
+        )
+    queryset = queryset.order_by('analisis__fecha_analisis', 'analisis_id', 'id')
+    return queryset.values_list(*[campo for _, campo in COLUMNAS]).iterator(chunk_size=chunk_size)
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea en vez de guardarla"""
+
+    def write(self, valor):
+        return valor
+
+
+def exportar(formato, analisis=None, marca=None, estado=None, filas_por_bloque=500):
+    """Genera bloques de texto CSV/JSONL.
+
+    Si se pasa ``estado`` (dict), al terminar contiene 'marca' (la nueva marca,
+    o la anterior si no hubo filas) y 'filas'.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato no soportado: {formato}')
+    i_fecha = ENCABEZADOS.index('fecha_analisis')
+    i_analisis = ENCABEZADOS.index('analisis_id')
+    escritor = csv.writer(_Eco())
+    ultima = marca
+    total = 0
+    bloque = [escritor.writerow(ENCABEZADOS)] if formato == 'csv' else []
+    for fila in filas(analisis=analisis, marca=marca):
+        if formato == 'csv':
+            bloque.append(escritor.writerow(fila))
+        else:
+            bloque.append(json.dumps(dict(zip(ENCABEZADOS, fila)), default=str, ensure_ascii=False) + '\n')
+        ultima = (fila[i_fecha], fila[i_analisis])
+        total += 1
+        if len(bloque) >= filas_por_bloque:
+            yield ''.join(bloque)
+            bloque = []
+    if bloque:
+        yield ''.join(bloque)
+    if estado is not None:
+        estado.update(marca=ultima, filas=total)
@@ -0,0 +1,133 @@
+# labApp/imagenes.py
+#
+# Variantes redimensionadas del logo de cada laboratorio (miniatura del admin,
+# encabezado de los PDF, página de inicio de sesión). Se generan al subir el
+# logo (señal post_save de Laboratorio) o con ``manage.py generar_variantes_logo``
+# y se guardan junto al original con el hash de su contenido en el nombre: si la
+# imagen cambia, cambia la URL, así que la vista logo_variante las sirve con
+# caché de un año. El original no se vuelve a enviar al navegador ni al PDF.
+#
+# Configuración (settings.py, opcional):
+#   LAB_LOGO_VARIANTES   {nombre: (ancho, alto, formato)} con otros tamaños o
+#                        formatos (por defecto VARIANTES)
+#   LAB_LOGO_CALIDAD     calidad de WebP, 1-100 (por defecto 85)
+
+import hashlib
+import io
+import json
+import logging
+import re
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.urls import reverse
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError, features
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+CARPETA = 'logos_laboratorios/variantes'
+VARIANTES = {
+    # Se muestra a 50x50 en la lista; el doble para pantallas de alta densidad
+    'miniatura': (100, 100, 'WEBP'),
+    # 3 cm del encabezado del PDF a unos 300 ppp; ReportLab incrusta PNG sin convertir
+    'reporte': (360, 360, 'PNG'),
+    'login': (480, 240, 'WEBP'),
+}
+EXTENSIONES = {'WEBP': 'webp', 'PNG': 'png'}
+TIPOS = {'webp': 'image/webp', 'png': 'image/png'}
+NOMBRE_VALIDO = re.compile(r'[a-z_]+-[0-9a-f]{16}\.(webp|png)')
+
+
+def variantes_configuradas():
+    return getattr(settings, 'LAB_LOGO_VARIANTES', VARIANTES)
+
+
+def _formato(formato):
+    """WebP solo si Pillow se compiló con soporte; si no, PNG"""
+    if formato == 'WEBP' and not features.check('webp'):
+        return 'PNG'
+    return formato
+
+
+def redimensionar(imagen, ancho, alto, formato):
+    """(bytes, (ancho, alto)) de ``imagen`` reducida para caber en ancho x alto; nunca la agranda"""
+    imagen = ImageOps.exif_transpose(imagen)
+    imagen = imagen.convert('RGBA' if imagen.mode in ('RGBA', 'LA', 'P', 'PA') else 'RGB')
+    imagen.thumbnail((ancho, alto), Image.LANCZOS)
+    buffer = io.BytesIO()
+    if formato == 'WEBP':
+        imagen.save(buffer, 'WEBP', quality=getattr(settings, 'LAB_LOGO_CALIDAD', 85), method=6)
+    else:
+        imagen.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue(), imagen.size
+
+
+def generar_variantes(laboratorio, forzar=False):
+    """Crea las variantes del logo y devuelve el valor para Laboratorio.logo_variantes
+
+    Si el logo y la configuración no cambiaron desde la última vez, devuelve lo
+    ya guardado sin abrir la imagen (salvo ``forzar``).
+    """
+    if not laboratorio.logo or Image is None:
+        return {}
+    configuracion = variantes_configuradas()
+    huella = hashlib.sha256(json.dumps(
+        [laboratorio.logo.name, configuracion, getattr(settings, 'LAB_LOGO_CALIDAD', 85)], sort_keys=True,
+    ).encode()).hexdigest()[:16]
+    actual = laboratorio.logo_variantes or {}
+    if not forzar and actual.get('huella') == huella:
+        return actual
+
+    almacen = laboratorio.logo.storage
+    try:
+        with laboratorio.logo.open('rb') as archivo:
+            original = archivo.read()
+        imagen = Image.open(io.BytesIO(original))
+        imagen.load()
+    except (OSError, UnidentifiedImageError) as error:
+        logger.warning('No se pudo leer el logo %s del laboratorio %s: %s', laboratorio.logo.name, laboratorio.pk, error)
+        return {}
+
+    variantes = {}
+    for nombre, (ancho, alto, formato) in configuracion.items():
+        formato = _formato(formato)
+        contenido, tamano = redimensionar(imagen, ancho, alto, formato)
+        ruta = f'{CARPETA}/{nombre}-{hashlib.sha256(contenido).hexdigest()[:16]}.{EXTENSIONES[formato]}'
+        # Mismo contenido, mismo nombre: otro laboratorio con el mismo logo ya lo escribió
+        if not almacen.exists(ruta):
+            ruta = almacen.save(ruta, ContentFile(contenido))
+        variantes[nombre] = {'ruta': ruta, 'ancho': tamano[0], 'alto': tamano[1], 'bytes': len(contenido)}
+    return {
+        'huella': huella,
+        'origen': {'ruta': laboratorio.logo.name, 'ancho': imagen.width, 'alto': imagen.height, 'bytes': len(original)},
+        'variantes': variantes,
+    }
+
+
+def actualizar_variantes(laboratorio, forzar=False):
+    """Genera las variantes y las guarda sin volver a disparar la señal de Laboratorio"""
+    from .models import Laboratorio
+    variantes = generar_variantes(laboratorio, forzar)
+    if variantes != (laboratorio.logo_variantes or {}):
+        Laboratorio.objects.filter(pk=laboratorio.pk).update(logo_variantes=variantes)
+        laboratorio.logo_variantes = variantes
+    return variantes
+
+
+def variante(laboratorio, nombre):
+    """{"ruta", "ancho", "alto", "bytes"} de la variante o None si no se ha generado para el logo actual"""
+    datos = laboratorio.logo_variantes or {}
+    if not laboratorio.logo or datos.get('origen', {}).get('ruta') != laboratorio.logo.name:
+        return None
+    return datos.get('variantes', {}).get(nombre)
+
+
+def url_variante(laboratorio, nombre):
+    datos = variante(laboratorio, nombre)
+    if datos is None:
+        return None
+    return reverse('logo_variante', args=[datos['ruta'].rsplit('/', 1)[-1]])
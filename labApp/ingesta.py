@@ -0,0 +1,188 @@
+# labApp/ingesta.py
+#
+# Ingesta de resultados enviados por los equipos analizadores. Cada lote es
+# una lista de {"analisis": <id>, "loinc": "<loinc_num>", "valor": "...",
+# "unidad": "..." (opcional)}; el código LOINC se traduce a la propiedad de la
+# plantilla del análisis y el resultado se escribe con un upsert en lote sobre
+# la restricción única (analisis, nombre_propiedad).
+#
+# La vista (views.ingestar_resultados) añade autenticación por token, límite
+# de peticiones simultáneas (429 cuando se rebasa) y claves de idempotencia:
+# reenviar un lote con la misma clave devuelve la respuesta original sin
+# volver a escribir. Las claves vencen a las LAB_INGESTA_IDEMPOTENCIA_HORAS:
+# después la misma clave cuenta como nueva, y ``manage.py purgar_idempotencia``
+# (p. ej. desde cron una vez al día) borra las vencidas.
+#
+# Configuración (settings.py, opcional):
+#   LAB_INGESTA_TOKENS         tokens aceptados en "Authorization: Bearer ..."
+#                              (sin tokens la API responde 403)
+#   LAB_INGESTA_CONCURRENCIA   lotes procesándose a la vez antes de responder
+#                              429 (por defecto 4)
+#   LAB_INGESTA_MAX_ITEMS      resultados por lote (por defecto 5000)
+#   LAB_INGESTA_IDEMPOTENCIA_HORAS  vigencia de una clave de idempotencia
+#                              (por defecto 24)
+
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import (
+    Analisis, ClaveIdempotencia, PropiedadPlantilla, ResultadoAnalisis, CAMPOS_CALCULADOS_RESULTADO,
+)
+from .resultados import asignar_campos, rangos_en_lote
+
+LONGITUD_VALOR = ResultadoAnalisis._meta.get_field('valor').max_length
+LONGITUD_UNIDAD = ResultadoAnalisis._meta.get_field('unidad').max_length
+
+
+class LoteInvalido(ValueError):
+    pass
+
+
+def huella_cuerpo(cuerpo):
+    return hashlib.sha256(cuerpo).hexdigest()
+
+
+def leer_lote(cuerpo, max_items):
+    """Lista de resultados del cuerpo JSON ({"resultados": [...]} o la lista directa)"""
+    try:
+        datos = json.loads(cuerpo)
+    except (ValueError, UnicodeDecodeError):
+        raise LoteInvalido('El cuerpo no es JSON válido.')
+    if isinstance(datos, dict):
+        datos = datos.get('resultados')
+    if not isinstance(datos, list):
+        raise LoteInvalido('Se esperaba una lista "resultados".')
+    if len(datos) > max_items:
+        raise LoteInvalido(f'El lote tiene {len(datos)} resultados; el máximo es {max_items}.')
+    return datos
+
+
+def _validar(items):
+    """Separa los items válidos, ya normalizados, de los errores por índice"""
+    validos, errores = [], []
+    for indice, item in enumerate(items):
+        if not isinstance(item, dict):
+            errores.append({'indice': indice, 'error': 'Cada resultado debe ser un objeto.'})
+            continue
+        try:
+            analisis_id = int(item['analisis'])
+            loinc = str(item['loinc']).strip()
+            valor = '' if item.get('valor') is None else str(item['valor']).strip()
+        except (KeyError, TypeError, ValueError):
+            errores.append({'indice': indice, 'error': 'Faltan "analisis", "loinc" o "valor".'})
+            continue
+        unidad = item.get('unidad')
+        if len(valor) > LONGITUD_VALOR or (unidad is not None and len(str(unidad)) > LONGITUD_UNIDAD):
+            errores.append({'indice': indice, 'error': 'Valor o unidad demasiado largos.'})
+            continue
+        validos.append((indice, analisis_id, loinc, valor, None if unidad is None else str(unidad)))
+    return validos, errores
+
+
+def ingestar(items):
+    """Valida y guarda un lote. Devuelve {"recibidos", "guardados", "errores"}.
+
+    Tres consultas de lectura (análisis con paciente, propiedades por LOINC y
+    versiones actuales) y un INSERT ... ON CONFLICT DO UPDATE por lote. Las
+    versiones se leen con las filas bloqueadas en la misma transacción que el
+    upsert, como en resultados.guardar_en_lote: un guardado del admin en medio
+    espera y después ve el conflicto de versión en lugar de perderse.
+    """
+    validos, errores = _validar(items)
+    analisis = Analisis.objects.select_related('paciente').only(
+        'plantilla_id', 'laboratorio_id', 'fecha_analisis', 'fecha_muestra',
+        'paciente__edad', 'paciente__fecha_nacimiento', 'paciente__sexo',
+    ).in_bulk({analisis_id for _, analisis_id, *_ in validos})
+    propiedades = {}
+    for plantilla_id, loinc_num, loinc_id, nombre, unidad in PropiedadPlantilla.objects.filter(
+        plantilla_id__in={a.plantilla_id for a in analisis.values()},
+        loinc_code__loinc_num__in={loinc for _, _, loinc, _, _ in validos},
+    ).order_by('id').values_list('plantilla_id', 'loinc_code__loinc_num', 'loinc_code_id', 'nombre_propiedad', 'unidad'):
+        propiedades.setdefault((plantilla_id, loinc_num), (loinc_id, nombre, unidad))
+
+    # Si un lote repite (análisis, propiedad) se queda el último, como haría un UPDATE tras otro
+    filas = {}
+    for indice, analisis_id, loinc, valor, unidad in validos:
+        a = analisis.get(analisis_id)
+        if a is None:
+            errores.append({'indice': indice, 'error': f'No existe el análisis {analisis_id}.'})
+            continue
+        propiedad = propiedades.get((a.plantilla_id, loinc))
+        if propiedad is None:
+            errores.append({'indice': indice, 'error': f'La plantilla del análisis {analisis_id} no tiene el LOINC {loinc}.'})
+            continue
+        loinc_id, nombre, unidad_plantilla = propiedad
+        filas[(analisis_id, nombre)] = ResultadoAnalisis(
+            analisis=a, loinc_code_id=loinc_id, nombre_propiedad=nombre, valor=valor,
+            unidad=unidad if unidad is not None else unidad_plantilla,
+        )
+
+    if filas:
+        resultados = list(filas.values())
+        rangos = rangos_en_lote(resultados)
+        with transaction.atomic():
+            versiones = {
+                (analisis_id, nombre): version
+                for analisis_id, nombre, version in ResultadoAnalisis.objects.select_for_update().filter(
+                    analisis_id__in={analisis_id for analisis_id, _ in filas},
+                    nombre_propiedad__in={nombre for _, nombre in filas},
+                ).values_list('analisis_id', 'nombre_propiedad', 'version')
+            }
+            for clave, resultado in filas.items():
+                asignar_campos(resultado, rangos.get(id(resultado)))
+                # Cambia la versión para que un técnico con el formulario abierto vea el conflicto
+                resultado.version = versiones[clave] + 1 if clave in versiones else 0
+            ResultadoAnalisis.objects.bulk_create(
+                resultados,
+                update_conflicts=True,
+                unique_fields=['analisis', 'nombre_propiedad'],
+                update_fields=['valor', 'unidad', 'loinc_code', *CAMPOS_CALCULADOS_RESULTADO, 'version'],
+            )
+    errores.sort(key=lambda error: error['indice'])
+    return {'recibidos': len(items), 'guardados': len(filas), 'errores': errores}
+
+
+def vencimiento_claves(horas=None):
+    """Fecha antes de la cual una clave de idempotencia ya no vale"""
+    if horas is None:
+        horas = getattr(settings, 'LAB_INGESTA_IDEMPOTENCIA_HORAS', 24)
+    return timezone.now() - timedelta(hours=horas)
+
+
+def purgar_claves(horas=None):
+    """Borra las claves de idempotencia vencidas; devuelve cuántas"""
+    borradas, _ = ClaveIdempotencia.objects.filter(fecha_creacion__lt=vencimiento_claves(horas)).delete()
+    return borradas
+
+
+def ingestar_idempotente(items, clave, huella):
+    """ingestar() con clave de idempotencia. Devuelve (estado_http, respuesta).
+
+    Lote y clave se guardan en la misma transacción: si otra petición con la
+    misma clave terminó antes, se deshace este lote y se devuelve la respuesta
+    guardada; si la clave se usó con otro cuerpo, 422. Una clave vencida se
+    reemplaza como si no existiera.
+    """
+    if not clave:
+        return 200, ingestar(items)
+    vigentes = ClaveIdempotencia.objects.filter(fecha_creacion__gte=vencimiento_claves())
+    previa = vigentes.filter(clave=clave).first()
+    if previa is None:
+        try:
+            with transaction.atomic():
+                ClaveIdempotencia.objects.filter(clave=clave).delete()
+                respuesta = ingestar(items)
+                ClaveIdempotencia.objects.create(clave=clave, huella=huella, respuesta=respuesta)
+            return 200, respuesta
+        except IntegrityError:
+            previa = vigentes.filter(clave=clave).first()
+            if previa is None:
+                raise
+    if previa.huella != huella:
+        return 422, {'error': 'La clave de idempotencia ya se usó con otro lote.'}
+    return 200, {**previa.respuesta, 'repetido': True}
@@ -0,0 +1,273 @@
+# labApp/ingesta_archivos.py
+#
+# Ingesta de archivos HL7 v2 (ORU^R01) y ASTM E1394 que los analizadores dejan
+# en un directorio. El archivo se lee como una cadena de generadores, sin
+# cargarlo entero en memoria:
+#
+#   segmentos(archivo, desde)  ->  (byte_final, texto) por segmento/registro
+#   mensajes(segmentos)        ->  (byte_final, [segmentos]) por mensaje MSH/H
+#   observaciones(mensaje)     ->  {"orden", "loinc", "valor", "unidad", ...}
+#
+# procesar_archivo() agrupa las observaciones en bloques y confirma cada bloque
+# en una transacción junto con el desplazamiento del archivo, así que una caída
+# repite como mucho el bloque en curso (y el upsert de ingesta.ingestar() lo
+# hace inofensivo). Lo que no se puede asignar va a ResultadoCuarentena.
+#
+# El número de análisis se toma de OBR-2 (placer order number) u OBR-3 en HL7
+# y del campo 3 (Specimen ID) del registro O en ASTM; el código LOINC de OBX-3
+# y del campo 3 del registro R.
+
+import os
+import re
+import time
+
+from django.db import transaction
+
+from .ingesta import ingestar
+from .models import ArchivoIngesta, ResultadoCuarentena
+
+TAMANO_LECTURA = 64 * 1024
+TAMANO_BLOQUE = 500
+
+_FIN_SEGMENTO = re.compile(rb'\r\n|\r|\n')
+# Caracteres de control de MLLP (HL7) y del protocolo de bajo nivel ASTM
+_CONTROL = str.maketrans('', '', '\x02\x03\x04\x05\x0b\x17\x1c')
+_MARCO_ASTM = re.compile(r'^\d(?=[A-Z]\|)')
+
+# Estados de OBX-11 / ASTM R-9 que no son un resultado: X = no se pudo obtener,
+# D = borrar, W = erróneo, I = pendiente
+ESTADOS_SIN_RESULTADO = {'X', 'D', 'W', 'I'}
+
+_CUARENTENA = {f.name: f.max_length for f in ResultadoCuarentena._meta.get_fields() if getattr(f, 'max_length', None)}
+
+
+def segmentos(archivo, desde=0, codificacion='latin-1'):
+    """(byte_final, texto) de cada segmento del archivo binario a partir del byte ``desde``"""
+    archivo.seek(desde)
+    posicion = desde
+    resto = b''
+    while True:
+        bloque = archivo.read(TAMANO_LECTURA)
+        if not bloque:
+            break
+        resto += bloque
+        inicio = 0
+        for fin in _FIN_SEGMENTO.finditer(resto):
+            texto = resto[inicio:fin.start()]
+            posicion += fin.end() - inicio
+            inicio = fin.end()
+            texto = texto.decode(codificacion).translate(_CONTROL).strip()
+            if texto:
+                yield posicion, texto
+        resto = resto[inicio:]
+    if resto:
+        texto = resto.decode(codificacion).translate(_CONTROL).strip()
+        if texto:
+            yield posicion + len(resto), texto
+
+
+def _es_inicio(texto):
+    return texto.startswith('MSH') or _MARCO_ASTM.sub('', texto).startswith('H|')
+
+
+def mensajes(segmentos):
+    """Agrupa los segmentos en mensajes; cada uno empieza en un MSH (HL7) o un H (ASTM)"""
+    actual, final = [], None
+    for fin, texto in segmentos:
+        if actual and _es_inicio(texto):
+            yield final, actual
+            actual = []
+        actual.append(texto)
+        final = fin
+    if actual:
+        yield final, actual
+
+
+def _campo(campos, n):
+    return campos[n] if n < len(campos) else ''
+
+
+def _componente(valor, separador, n=0):
+    partes = valor.split(separador)
+    return partes[n].strip() if n < len(partes) else ''
+
+
+def _observaciones_hl7(mensaje):
+    encabezado = mensaje[0]
+    # MSH-1 es el propio separador de campos; MSH-2, los de componente, repetición, escape...
+    separador = encabezado[3] if len(encabezado) > 3 else '|'
+    componente = encabezado[4] if len(encabezado) > 4 else '^'
+    orden = ''
+    for segmento in mensaje:
+        campos = segmento.split(separador)
+        tipo = campos[0]
+        if tipo == 'OBR':
+            orden = _componente(_campo(campos, 2), componente) or _componente(_campo(campos, 3), componente)
+        elif tipo == 'OBX':
+            if _campo(campos, 11).strip() in ESTADOS_SIN_RESULTADO:
+                continue
+            identificador = _campo(campos, 3)
+            codigo = _componente(identificador, componente)
+            # Si el código principal no es LOINC se prueba el alternativo (OBX-3.4, sistema en OBX-3.6)
+            if _componente(identificador, componente, 2) not in ('', 'LN') and _componente(identificador, componente, 5) == 'LN':
+                codigo = _componente(identificador, componente, 3)
+            yield {
+                'orden': orden,
+                'loinc': codigo,
+                'valor': _campo(campos, 5).replace(componente, ' ').strip(),
+                'unidad': _componente(_campo(campos, 6), componente) or None,
+                'segmento': segmento,
+            }
+
+
+def _observaciones_astm(mensaje):
+    encabezado = _MARCO_ASTM.sub('', mensaje[0])
+    # H|\^&: separador de campos, repetición, componente, escape
+    separador = encabezado[1] if len(encabezado) > 1 else '|'
+    componente = encabezado[3] if len(encabezado) > 3 else '^'
+    orden = ''
+    for registro in mensaje:
+        registro = _MARCO_ASTM.sub('', registro)
+        campos = registro.split(separador)
+        tipo = campos[0]
+        if tipo == 'O':
+            orden = _componente(_campo(campos, 2), componente)
+        elif tipo == 'R':
+            if _campo(campos, 8).strip() in ESTADOS_SIN_RESULTADO:
+                continue
+            # Universal Test ID: ^^^código
+            identificador = _campo(campos, 2)
+            codigo = _componente(identificador, componente, 3) or _componente(identificador, componente)
+            yield {
+                'orden': orden,
+                'loinc': codigo,
+                'valor': _campo(campos, 3).replace(componente, ' ').strip(),
+                'unidad': _componente(_campo(campos, 4), componente) or None,
+                'segmento': registro,
+            }
+
+
+def observaciones(mensaje):
+    """Resultados de un mensaje HL7 u ASTM, con el número de orden tal cual viene"""
+    if mensaje[0].startswith('MSH'):
+        yield from _observaciones_hl7(mensaje)
+    elif _es_inicio(mensaje[0]):
+        yield from _observaciones_astm(mensaje)
+
+
+def _a_cuarentena(archivo, observacion, motivo):
+    datos = {
+        'orden': observacion['orden'],
+        'codigo': observacion['loinc'],
+        'valor': observacion['valor'],
+        'unidad': observacion['unidad'] or '',
+        'motivo': motivo,
+    }
+    return ResultadoCuarentena(
+        archivo=archivo, segmento=observacion['segmento'],
+        **{campo: valor[:_CUARENTENA[campo]] for campo, valor in datos.items()},
+    )
+
+
+def _confirmar(archivo, pendientes, final, mensajes_leidos):
+    """Guarda un bloque de observaciones y avanza el desplazamiento en la misma transacción"""
+    items, origen, cuarentena = [], [], []
+    for observacion in pendientes:
+        if not observacion['orden'].isdigit():
+            cuarentena.append(_a_cuarentena(archivo, observacion, 'Sin número de análisis válido.'))
+            continue
+        items.append({
+            'analisis': int(observacion['orden']), 'loinc': observacion['loinc'],
+            'valor': observacion['valor'], 'unidad': observacion['unidad'],
+        })
+        origen.append(observacion)
+    with transaction.atomic():
+        respuesta = ingestar(items)
+        for error in respuesta['errores']:
+            cuarentena.append(_a_cuarentena(archivo, origen[error['indice']], error['error']))
+        ResultadoCuarentena.objects.bulk_create(cuarentena)
+        archivo.desplazamiento = final
+        archivo.mensajes += mensajes_leidos
+        archivo.resultados += respuesta['guardados']
+        archivo.en_cuarentena += len(cuarentena)
+        archivo.save(update_fields=[
+            'desplazamiento', 'mensajes', 'resultados', 'en_cuarentena', 'fecha_actualizacion',
+        ])
+
+
+def procesar_archivo(archivo, tamano_bloque=TAMANO_BLOQUE):
+    """Ingresa ``archivo`` (ArchivoIngesta) desde su desplazamiento hasta el final"""
+    tamano = os.path.getsize(archivo.ruta)
+    if tamano < archivo.desplazamiento:
+        # Otro archivo con el mismo nombre: se empieza de cero
+        archivo.desplazamiento = archivo.mensajes = archivo.resultados = archivo.en_cuarentena = 0
+    archivo.tamano = tamano
+    archivo.estado = 'PROCESANDO'
+    archivo.error = ''
+    archivo.save()
+    try:
+        with open(archivo.ruta, 'rb') as contenido:
+            pendientes, final, leidos = [], None, 0
+            for final, mensaje in mensajes(segmentos(contenido, archivo.desplazamiento)):
+                pendientes.extend(observaciones(mensaje))
+                leidos += 1
+                if len(pendientes) >= tamano_bloque:
+                    _confirmar(archivo, pendientes, final, leidos)
+                    pendientes, leidos = [], 0
+            if leidos:
+                _confirmar(archivo, pendientes, final, leidos)
+    except Exception as exc:
+        archivo.estado = 'ERROR'
+        archivo.error = f'{type(exc).__name__}: {exc}'
+        archivo.save(update_fields=['estado', 'error', 'fecha_actualizacion'])
+        raise
+    archivo.estado = 'COMPLETO'
+    archivo.save(update_fields=['estado', 'fecha_actualizacion'])
+    return archivo
+
+
+def archivos_listos(directorio, extensiones, estable):
+    """Rutas del directorio con extensión aceptada y sin modificar en ``estable`` segundos"""
+    limite = time.time() - estable
+    with os.scandir(directorio) as entradas:
+        for entrada in entradas:
+            if not entrada.is_file() or not entrada.name.lower().endswith(extensiones):
+                continue
+            estado = entrada.stat()
+            if estado.st_mtime <= limite:
+                yield os.path.abspath(entrada.path), estado.st_size
+
+
+def archivos_pendientes(directorio, extensiones, estable=2):
+    """ArchivoIngesta de los archivos nuevos, con datos añadidos o que quedaron a medias"""
+    listos = dict(archivos_listos(directorio, extensiones, estable))
+    conocidos = ArchivoIngesta.objects.in_bulk(list(listos), field_name='ruta')
+    for ruta, tamano in sorted(listos.items()):
+        archivo = conocidos.get(ruta)
+        if archivo is None:
+            yield ArchivoIngesta.objects.create(ruta=ruta, tamano=tamano)
+        elif archivo.estado != 'COMPLETO' or tamano != archivo.tamano:
+            yield archivo
+
+
+def reintentar_cuarentena(queryset):
+    """Vuelve a ingresar resultados en cuarentena (p. ej. tras añadir el LOINC a la plantilla).
+
+    Los que ahora se asignan se borran de la cuarentena; al resto se le
+    actualiza el motivo. Devuelve cuántos se guardaron.
+    """
+    registros = [r for r in queryset if r.orden.isdigit()]
+    items = [
+        {'analisis': int(r.orden), 'loinc': r.codigo, 'valor': r.valor, 'unidad': r.unidad or None}
+        for r in registros
+    ]
+    with transaction.atomic():
+        respuesta = ingestar(items)
+        fallidos = {}
+        for error in respuesta['errores']:
+            registro = registros[error['indice']]
+            registro.motivo = error['error'][:_CUARENTENA['motivo']]
+            fallidos[registro.pk] = registro
+        ResultadoCuarentena.objects.bulk_update(list(fallidos.values()), ['motivo'])
+        ResultadoCuarentena.objects.filter(pk__in=[r.pk for r in registros if r.pk not in fallidos]).delete()
+    return len(registros) - len(fallidos)
@@ -0,0 +1,139 @@
+# labApp/instrumentacion.py
+#
+# Registro de las consultas SQL de una petición o de un bloque de código:
+# cuántas, cuánto tiempo y qué "formas" se repiten (la misma consulta con
+# distintos parámetros, el síntoma típico de un N+1). Se engancha con
+# connection.execute_wrapper, así que funciona igual con DEBUG=False.
+#
+#   with registrar_consultas() as registro:
+#       ...
+#   registro.total, registro.tiempo_ms, registro.repetidas()
+#
+#   with presupuesto_consultas(8):   # en pruebas: falla si se pasa de 8
+#       ...
+#
+# ConsultasMiddleware hace lo mismo por petición cuando LAB_CONSULTAS_REGISTRAR
+# está activo (por defecto, igual que DEBUG): escribe un resumen en el logger
+# labApp.consultas, avisa de cada forma repetida LAB_CONSULTAS_N1_UMBRAL veces o
+# más con la línea de código que la dispara y añade la cabecera Server-Timing.
+
+import logging
+import os
+import re
+import time
+import traceback
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('labApp.consultas')
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS_IN = re.compile(r'\bIN \((?:\s*(?:\?|%s)\s*,?)+\)', re.IGNORECASE)
+
+
+def forma_sql(sql):
+    """La consulta sin valores: 'WHERE id = 5' y 'WHERE id = 7' comparten forma"""
+    sql = _LITERALES.sub('?', sql)
+    return _LISTAS_IN.sub('IN (...)', sql)
+
+
+def sitio_llamada():
+    """Primer marco de la pila que pertenece al proyecto (no a Django ni a este módulo)"""
+    for marco in reversed(traceback.extract_stack()[:-2]):
+        ruta = os.path.abspath(marco.filename)
+        if ruta.startswith(RAIZ_PROYECTO) and ruta != os.path.abspath(__file__) and 'site-packages' not in ruta:
+            return f'{os.path.relpath(ruta, RAIZ_PROYECTO)}:{marco.lineno} ({marco.name})'
+    return None
+
+
+class RegistroConsultas:
+    """Envoltorio para connection.execute_wrapper que acumula las consultas ejecutadas"""
+
+    def __init__(self):
+        self.total = 0
+        self.tiempo_ms = 0.0
+        self.formas = Counter()
+        self.sitios = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo_ms += (time.perf_counter() - inicio) * 1000
+            self.total += 1
+            forma = forma_sql(sql)
+            self.formas[forma] += 1
+            if self.formas[forma] == 2:
+                # Solo se busca el sitio cuando la forma se repite: recorrer la pila cuesta
+                self.sitios[forma] = sitio_llamada()
+
+    def repetidas(self, umbral=2):
+        """[(forma, veces, sitio)] de las consultas que se ejecutaron ``umbral`` veces o más"""
+        return [
+            (forma, veces, self.sitios.get(forma))
+            for forma, veces in self.formas.most_common() if veces >= umbral
+        ]
+
+
+@contextmanager
+def registrar_consultas(using=None):
+    """Registra las consultas de las conexiones indicadas (todas si ``using`` es None)"""
+    registro = RegistroConsultas()
+    alias = [using] if using else list(connections)
+    with ExitStack() as pila:
+        for nombre in alias:
+            pila.enter_context(connections[nombre].execute_wrapper(registro))
+        yield registro
+
+
+class PresupuestoExcedido(AssertionError):
+    pass
+
+
+@contextmanager
+def presupuesto_consultas(maximo, using=None):
+    """Falla con PresupuestoExcedido si el bloque ejecuta más de ``maximo`` consultas"""
+    with registrar_consultas(using) as registro:
+        yield registro
+    if registro.total > maximo:
+        detalle = '\n'.join(f'  {veces}x {sitio or "?"}: {forma}' for forma, veces, sitio in registro.repetidas())
+        raise PresupuestoExcedido(
+            f'{registro.total} consultas (presupuesto {maximo}, {registro.tiempo_ms:.1f} ms)'
+            + (f'\nRepetidas:\n{detalle}' if detalle else '')
+        )
+
+
+class ConsultasMiddleware:
+    # Admite ASGI para no obligar a Django a pasar las vistas async (API de
+    # ingesta) a un hilo síncrono. En ese modo no registra nada: las consultas
+    # corren en los hilos de sync_to_async, con otras conexiones.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.activo = getattr(settings, 'LAB_CONSULTAS_REGISTRAR', settings.DEBUG)
+        self.umbral = getattr(settings, 'LAB_CONSULTAS_N1_UMBRAL', 5)
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.get_response(request)
+        if not self.activo:
+            return self.get_response(request)
+        with registrar_consultas() as registro:
+            response = self.get_response(request)
+        logger.debug('%s %s: %d consultas, %.1f ms', request.method, request.path, registro.total, registro.tiempo_ms)
+        for forma, veces, sitio in registro.repetidas(self.umbral):
+            logger.warning('Posible N+1 en %s %s: %dx desde %s: %s', request.method, request.path, veces, sitio or '?', forma)
+        response.headers['Server-Timing'] = f'sql;dur={registro.tiempo_ms:.1f};desc="{registro.total} consultas"'
+        return response
@@ -0,0 +1,255 @@
+# labApp/intervalos.py
+#
+# Resolución de intervalos de referencia desde memoria. Cada intervalo es un
+# rango de edad continuo (días, meses o años) por sexo; al cargar la tabla se
+# convierte a días y se arma un índice ordenado por (propiedad, sexo) que se
+# consulta con búsqueda binaria.
+#
+# El índice se revisa contra Plantilla.version, que sube con cualquier cambio a
+# una plantilla, sus propiedades o sus intervalos (labApp/estructuras.py, la
+# única invalidación que hay que mantener): cada LAB_INTERVALOS_REVALIDAR
+# segundos se leen las versiones y la tabla solo se recarga si alguna cambió.
+# Cuando es este proceso el que sube una versión (señal version_plantilla) la
+# copia local se descarta en el acto. Una copia armada con cambios propios aún
+# sin confirmar no se da por buena hasta recargarla fuera de la transacción,
+# porque si se revierte las versiones vuelven atrás y podrían repetirse.
+#
+# Para miles de pares (paciente, propiedad) a la vez, resolver_lote() hace la
+# misma búsqueda vectorizada con numpy (searchsorted) si está instalado.
+#
+# Configuración (settings.py, opcional):
+#   LAB_INTERVALOS_CACHE       alias de CACHES compartido entre workers (p. ej.
+#                              Redis/Memcached). Si se define, el índice se
+#                              guarda ahí con clave de las versiones y un worker
+#                              que ve las mismas versiones lo toma sin leer la
+#                              tabla.
+#   LAB_INTERVALOS_REVALIDAR   segundos que la copia local se usa sin revisar
+#                              las versiones (por defecto 5).
+
+import hashlib
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import estructuras
+from .senales import contar_cache, version_plantilla
+from .models import IntervaloReferencia, PropiedadPlantilla
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CLAVE_MAPA = 'labApp:intervalos:indice:{}'
+
+DIAS_POR_ANIO = IntervaloReferencia.DIAS_POR_UNIDAD['ANIOS']
+CODIGOS_SEXO = {'AMBOS': 0, 'MASCULINO': 1, 'FEMENINO': 2}
+# Separación entre claves (propiedad, sexo) en el índice vectorizado: más días que cualquier edad
+ESCALA_DIAS = 2 ** 17
+
+
+def fecha_referencia(analisis):
+    """Fecha a la que se calcula la edad: la de la muestra o, si no hay, la del análisis"""
+    if analisis.fecha_muestra:
+        return analisis.fecha_muestra
+    if analisis.fecha_analisis:
+        return timezone.localdate(analisis.fecha_analisis)
+    return timezone.localdate()
+
+
+def dias_de_edad(paciente, fecha=None):
+    """Edad en días: exacta si hay fecha de nacimiento, si no a partir de los años cumplidos"""
+    if paciente.fecha_nacimiento:
+        return max(((fecha or timezone.localdate()) - paciente.fecha_nacimiento).days, 0)
+    return paciente.edad * DIAS_POR_ANIO
+
+
+def _ordenar_bandas(bandas):
+    """(desdes, hastas, valores) ordenados por inicio, sin traslapes.
+
+    Si dos rangos se traslapan (datos anteriores a la validación del modelo)
+    se queda el de menor id, como hacía el mapa por grupo de edad.
+    """
+    aceptadas = []
+    for desde, hasta, valores in bandas:
+        if all(hasta <= otro_desde or otro_hasta <= desde for otro_desde, otro_hasta, _ in aceptadas):
+            aceptadas.append((desde, hasta, valores))
+    aceptadas.sort(key=lambda banda: banda[0])
+    return (
+        [banda[0] for banda in aceptadas],
+        [banda[1] for banda in aceptadas],
+        [banda[2] for banda in aceptadas],
+    )
+
+
+def _buscar(bandas, dias):
+    desdes, hastas, valores = bandas
+    i = bisect_right(desdes, dias) - 1
+    if i >= 0 and dias < hastas[i]:
+        return valores[i]
+    return None
+
+
+def _huella(versiones):
+    """Clave corta del índice para un {plantilla_id: version}"""
+    return hashlib.sha1(repr(sorted(versiones.items())).encode()).hexdigest()
+
+
+class CacheIntervalos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos = None
+        self._version = None
+        self._revisado = 0.0
+        self._arreglos = None
+        self._sin_confirmar = False
+
+    def _cache_compartida(self):
+        alias = getattr(settings, 'LAB_INTERVALOS_CACHE', None)
+        return caches[alias] if alias else None
+
+    def _leer_bd(self):
+        crudos = defaultdict(list)
+        for propiedad_id, sexo, edad_min, edad_max, unidad, valor_min, valor_max in (
+            IntervaloReferencia.objects.order_by('id').values_list(
+                'propiedad_id', 'sexo', 'edad_min', 'edad_max', 'unidad_edad', 'valor_min', 'valor_max',
+            )
+        ):
+            intervalo = IntervaloReferencia(edad_min=edad_min, edad_max=edad_max, unidad_edad=unidad)
+            crudos[(propiedad_id, sexo)].append((*intervalo.rango_dias(), (valor_min, valor_max)))
+        indice = {clave: _ordenar_bandas(bandas) for clave, bandas in crudos.items()}
+        propiedades = {}
+        for plantilla_id, nombre, propiedad_id in (
+            PropiedadPlantilla.objects.order_by('id').values_list('plantilla_id', 'nombre_propiedad', 'id')
+        ):
+            propiedades.setdefault((plantilla_id, nombre), propiedad_id)
+        return indice, propiedades
+
+    def _obtener(self):
+        ahora = time.monotonic()
+        datos = self._datos
+        if datos is not None and ahora - self._revisado < getattr(settings, 'LAB_INTERVALOS_REVALIDAR', 5):
+            return datos
+        with self._lock:
+            versiones = estructuras.versiones()
+            # Se cuenta por revalidación, no por resolver(): acierto si no hizo falta leer la tabla
+            acierto = self._datos is not None and versiones == self._version
+            if not acierto:
+                if self._sin_confirmar and not transaction.get_connection().in_atomic_block:
+                    self._sin_confirmar = False
+                compartida = None if self._sin_confirmar else self._cache_compartida()
+                clave = CLAVE_MAPA.format(_huella(versiones))
+                datos = compartida.get(clave) if compartida is not None else None
+                acierto = datos is not None
+                if datos is None:
+                    datos = self._leer_bd()
+                    if compartida is not None:
+                        compartida.set(clave, datos, timeout=None)
+                self._datos = datos
+                self._version = None if self._sin_confirmar else versiones
+            contar_cache('intervalos', acierto)
+            self._revisado = ahora
+            return self._datos
+
+    def invalidar(self, sin_confirmar=False):
+        """Descarta la copia local. ``sin_confirmar``: la siguiente se arma con cambios propios aún sin confirmar"""
+        with self._lock:
+            self._datos = None
+            self._sin_confirmar = sin_confirmar
+
+    def resolver(self, propiedad_id, dias, sexo):
+        """(valor_min, valor_max) para la propiedad y una edad en días, o None. El sexo exacto gana a AMBOS."""
+        indice, _ = self._obtener()
+        for clave in ((propiedad_id, sexo), (propiedad_id, 'AMBOS')):
+            bandas = indice.get(clave)
+            if bandas:
+                valores = _buscar(bandas, dias)
+                if valores:
+                    return valores
+        return None
+
+    def _vectores(self, datos):
+        """Índice completo como arreglos numpy ordenados por (propiedad, sexo, inicio)"""
+        arreglos = self._arreglos
+        if arreglos is not None and arreglos[0] is datos:
+            return arreglos[1]
+        indice, _ = datos
+        claves, hastas, minimos, maximos = [], [], [], []
+        for (propiedad_id, sexo), (desdes_banda, hastas_banda, valores) in indice.items():
+            base = (propiedad_id * 4 + CODIGOS_SEXO[sexo]) * ESCALA_DIAS
+            claves += [base + min(desde, ESCALA_DIAS - 1) for desde in desdes_banda]
+            hastas += hastas_banda
+            minimos += [v[0] for v in valores]
+            maximos += [v[1] for v in valores]
+        orden = np.argsort(np.array(claves, dtype=np.float64), kind='stable')
+        vectores = tuple(np.array(lista, dtype=np.float64)[orden] for lista in (claves, hastas, minimos, maximos))
+        self._arreglos = (datos, vectores)
+        return vectores
+
+    def resolver_lote(self, propiedad_ids, dias, sexos):
+        """Resuelve muchos pares a la vez. Devuelve (minimos, maximos), con NaN donde no hay intervalo.
+
+        ``propiedad_ids``, ``dias`` y ``sexos`` son secuencias del mismo largo.
+        Con numpy se resuelve con dos searchsorted sobre todo el índice; sin
+        numpy se cae a la búsqueda binaria de resolver() por par.
+        """
+        datos = self._obtener()
+        if np is None:
+            minimos, maximos = [], []
+            for propiedad_id, dias_paciente, sexo in zip(propiedad_ids, dias, sexos):
+                valores = self.resolver(propiedad_id, dias_paciente, sexo) or (float('nan'), float('nan'))
+                minimos.append(valores[0])
+                maximos.append(valores[1])
+            return minimos, maximos
+
+        claves, hastas, minimos, maximos = self._vectores(datos)
+        propiedades = np.asarray(propiedad_ids, dtype=np.float64)
+        dias = np.asarray(dias, dtype=np.float64)
+        codigos = np.array([CODIGOS_SEXO.get(sexo, 0) for sexo in sexos], dtype=np.float64)
+        resultado_min = np.full(len(dias), np.nan)
+        resultado_max = np.full(len(dias), np.nan)
+        pendientes = np.ones(len(dias), dtype=bool)
+        # Primero el sexo del paciente, después AMBOS para los que no encontraron rango
+        for codigo in (codigos, np.zeros_like(codigos)):
+            base = (propiedades * 4 + codigo) * ESCALA_DIAS
+            buscado = base + np.minimum(dias, ESCALA_DIAS - 1)
+            posicion = np.searchsorted(claves, buscado, side='right') - 1
+            valida = posicion >= 0
+            posicion = np.where(valida, posicion, 0)
+            encontrado = (
+                pendientes & valida & (claves[posicion] >= base) & (dias < hastas[posicion])
+            ) if len(claves) else np.zeros(len(dias), dtype=bool)
+            resultado_min[encontrado] = minimos[posicion[encontrado]]
+            resultado_max[encontrado] = maximos[posicion[encontrado]]
+            pendientes &= ~encontrado
+        return resultado_min, resultado_max
+
+    def propiedad_id(self, plantilla_id, nombre_propiedad):
+        _, propiedades = self._obtener()
+        return propiedades.get((plantilla_id, nombre_propiedad))
+
+    def resolver_resultado(self, resultado):
+        """Intervalo de un ResultadoAnalisis (con analisis y paciente ya cargados)"""
+        analisis = resultado.analisis
+        propiedad_id = self.propiedad_id(analisis.plantilla_id, resultado.nombre_propiedad)
+        if propiedad_id is None:
+            return None
+        paciente = analisis.paciente
+        return self.resolver(propiedad_id, dias_de_edad(paciente, fecha_referencia(analisis)), paciente.sexo)
+
+
+intervalos = CacheIntervalos()
+
+
+@receiver(version_plantilla)
+def invalidar_intervalos(sender, **kwargs):
+    # Ya, para ver el cambio en esta misma transacción, y otra vez al confirmar
+    intervalos.invalidar(sin_confirmar=transaction.get_connection().in_atomic_block)
+    transaction.on_commit(intervalos.invalidar)
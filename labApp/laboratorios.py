@@ -0,0 +1,117 @@
+# labApp/laboratorios.py
+#
+# Separación por laboratorio. Cada usuario del admin ve solo los laboratorios a
+# los que pertenece su Usuario (mismo correo, relación Usuario.laboratorios);
+# el superusuario ve todos. Los ids se guardan en la sesión junto con una
+# versión de las membresías que vive en la caché: al cambiar cualquier
+# membresía sube la versión y cada sesión vuelve a leer las suyas, así que en
+# cada petición no se consulta la tabla intermedia.
+#
+# También mantiene la copia de ``laboratorio`` de Analisis, ResultadoAnalisis y
+# Reporte cuando un paciente cambia de laboratorio o un análisis de paciente.
+#
+# Configuración (settings.py, opcional):
+#   LAB_MEMBRESIAS_CACHE      alias de CACHES con la versión de las membresías
+#                             (por defecto 'default'; compartido entre workers
+#                             si es Redis/Memcached)
+#   LAB_MEMBRESIAS_SEGUNDOS   vigencia máxima de lo guardado en la sesión, para
+#                             cachés locales a cada proceso (por defecto 300)
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Analisis, Laboratorio, Paciente, Reporte, ResultadoAnalisis, Usuario
+
+CLAVE_SESION = '_lab_laboratorios'
+CLAVE_VERSION = 'labApp:membresias:version'
+
+
+def _cache():
+    return caches[getattr(settings, 'LAB_MEMBRESIAS_CACHE', 'default')]
+
+
+def version_membresias():
+    return _cache().get_or_set(CLAVE_VERSION, 1, timeout=None)
+
+
+def leer_membresias(usuario):
+    """Ids de los laboratorios del Usuario activo con el correo de ``usuario``"""
+    if not usuario.email:
+        return []
+    return sorted(Laboratorio.objects.filter(
+        usuarios__correo_electronico__iexact=usuario.email, usuarios__is_active=True,
+    ).values_list('id', flat=True).distinct())
+
+
+def laboratorios_de(request):
+    """Ids de los laboratorios visibles en esta petición, o None si no hay restricción"""
+    if hasattr(request, '_laboratorios'):
+        return request._laboratorios
+    usuario = request.user
+    if not usuario.is_authenticated:
+        ids = []
+    elif usuario.is_superuser:
+        ids = None
+    else:
+        version = version_membresias()
+        guardado = request.session.get(CLAVE_SESION)
+        if (
+            guardado and guardado['usuario'] == usuario.pk and guardado['version'] == version
+            and guardado['hasta'] > time.time()
+        ):
+            ids = guardado['ids']
+        else:
+            ids = leer_membresias(usuario)
+            request.session[CLAVE_SESION] = {
+                'usuario': usuario.pk, 'version': version, 'ids': ids,
+                'hasta': time.time() + getattr(settings, 'LAB_MEMBRESIAS_SEGUNDOS', 300),
+            }
+    request._laboratorios = ids
+    return ids
+
+
+def invalidar_membresias():
+    cache = _cache()
+    cache.get_or_set(CLAVE_VERSION, 1, timeout=None)
+    cache.incr(CLAVE_VERSION)
+
+
+@receiver(m2m_changed, sender=Usuario.laboratorios.through)
+def membresias_cambiadas(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidar_membresias()
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def usuario_cambiado(sender, raw=False, **kwargs):
+    # El correo o is_active deciden a qué Usuario corresponde cada cuenta del admin
+    if not raw:
+        invalidar_membresias()
+
+
+def _alinear(filtro, laboratorio_id):
+    for modelo in (ResultadoAnalisis, Reporte):
+        modelo.objects.filter(**filtro).exclude(laboratorio_id=laboratorio_id).update(laboratorio_id=laboratorio_id)
+
+
+@receiver(post_save, sender=Paciente)
+def paciente_movido(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    # Un UPDATE que no toca filas si el laboratorio no cambió
+    movidos = Analisis.objects.filter(paciente_id=instance.pk).exclude(laboratorio_id=instance.laboratorio_id)
+    if movidos.update(laboratorio_id=instance.laboratorio_id):
+        _alinear({'analisis__paciente_id': instance.pk}, instance.laboratorio_id)
+
+
+@receiver(post_save, sender=Analisis)
+def analisis_movido(sender, instance, created, raw=False, **kwargs):
+    # Analisis.save() marca _laboratorio_anterior solo si el laboratorio cambió
+    if not created and not raw and getattr(instance, '_laboratorio_anterior', None) is not None:
+        _alinear({'analisis_id': instance.pk}, instance.laboratorio_id)
+        del instance._laboratorio_anterior
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from labApp import benchmarks
+
+
+#Comando para correr los benchmarks de labApp/benchmarks sobre una base de datos de prueba
+class Command(BaseCommand):
+    help = 'Ejecuta benchmarks de rendimiento sobre una base de datos de prueba desechable'
+
+    def add_arguments(self, parser):
+        parser.add_argument('nombres', nargs='*', help='Benchmarks a ejecutar (por defecto todos)')
+        parser.add_argument('--escala', type=int, default=100000, help='Tamaño de los datos sintéticos')
+        parser.add_argument('--repeticiones', type=int, default=200, help='Mediciones por caso')
+        parser.add_argument('--listar', action='store_true', help='Solo lista los benchmarks disponibles')
+        parser.add_argument(
+            '--en-disco', action='store_true',
+            help='En SQLite, crea la base de prueba en un archivo temporal y no en memoria',
+        )
+        parser.add_argument(
+            '--linea-base', nargs='?', const=str(benchmarks.LINEA_BASE), default=None, metavar='RUTA',
+            help='Compara con la línea base guardada y falla si hay regresiones (por defecto labApp/benchmarks/linea_base.json)',
+        )
+        parser.add_argument(
+            '--guardar-linea-base', action='store_true',
+            help='Guarda los resultados como nueva línea base (en la ruta de --linea-base)',
+        )
+        parser.add_argument(
+            '--tolerancia', type=float, default=0.5,
+            help='Aumento relativo del p50 aceptado antes de contar una regresión',
+        )
+
+    def handle(self, *args, **options):
+        registro = benchmarks.cargar()
+        if options['listar']:
+            for nombre in sorted(registro):
+                self.stdout.write(nombre)
+            return
+
+        nombres = options['nombres'] or sorted(registro)
+        desconocidos = [n for n in nombres if n not in registro]
+        if desconocidos:
+            raise CommandError(f"Benchmarks desconocidos: {', '.join(desconocidos)}")
+
+        setup_test_environment()
+        nombre_original = connection.settings_dict['NAME']
+        temporal = None
+        if options['en_disco'] and connection.vendor == 'sqlite':
+            temporal = tempfile.mkdtemp(prefix='lab_benchmark_')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(temporal, 'benchmark.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        resultados = {}
+        try:
+            for nombre in nombres:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'== {nombre}'))
+                metricas = registro[nombre](options, self.stdout)
+                if metricas:
+                    resultados[nombre] = metricas
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            teardown_test_environment()
+            if temporal:
+                shutil.rmtree(temporal, ignore_errors=True)
+
+        ruta = options['linea_base'] or benchmarks.LINEA_BASE
+        if options['guardar_linea_base']:
+            benchmarks.guardar_linea_base(resultados, ruta)
+            self.stdout.write(self.style.SUCCESS(f'Línea base guardada en {ruta}'))
+        elif options['linea_base']:
+            self._comparar(resultados, benchmarks.leer_linea_base(ruta), options['tolerancia'])
+
+    def _comparar(self, resultados, base, tolerancia):
+        regresiones = []
+        for nombre, metricas in resultados.items():
+            if nombre not in base:
+                self.stdout.write(self.style.WARNING(f'{nombre}: sin línea base'))
+                continue
+            for caso, detalle, regresion in benchmarks.comparar(metricas, base[nombre], tolerancia):
+                linea = f'{nombre} / {caso}: {detalle}'
+                if regresion:
+                    regresiones.append(linea)
+                    self.stdout.write(self.style.ERROR(linea))
+                else:
+                    self.stdout.write(linea)
+        if regresiones:
+            raise CommandError(f'{len(regresiones)} regresiones frente a la línea base')
+        self.stdout.write(self.style.SUCCESS('Sin regresiones frente a la línea base'))
@@ -0,0 +1,47 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from labApp.duplicados import detectar
+from labApp.models import Paciente
+
+COLUMNAS = (
+    'paciente_a', 'paciente_b', 'laboratorio_a', 'laboratorio_b', 'nombre_a', 'nombre_b', 'similitud', 'motivo',
+)
+
+
+#Comando para listar posibles pacientes duplicados (no fusiona ni borra nada)
+class Command(BaseCommand):
+    help = 'Lista pares de pacientes posiblemente duplicados en CSV, comparando solo dentro de bloques'
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', nargs='?', default='-', help="Archivo CSV ('-' para la salida estándar)")
+        parser.add_argument('--laboratorio', type=int, nargs='*', help='Solo estos laboratorios (ids)')
+        parser.add_argument(
+            '--umbral', type=float, default=0.85,
+            help='Similitud mínima del nombre (0..1) para pares que solo comparten teléfono',
+        )
+        parser.add_argument('--tolerancia-edad', type=int, default=2, help='Años de diferencia aceptados sin fecha de nacimiento')
+        parser.add_argument('--entre-laboratorios', action='store_true', help='Comparar también pacientes de laboratorios distintos')
+
+    def handle(self, *args, **options):
+        queryset = Paciente.objects.all()
+        if options['laboratorio']:
+            queryset = queryset.filter(laboratorio_id__in=options['laboratorio'])
+        inicio = time.monotonic()
+        pares = detectar(
+            queryset, umbral=options['umbral'], tolerancia_edad=options['tolerancia_edad'],
+            entre_laboratorios=options['entre_laboratorios'],
+        )
+        salida = sys.stdout if options['salida'] == '-' else open(options['salida'], 'w', newline='', encoding='utf-8')
+        try:
+            escritor = csv.DictWriter(salida, fieldnames=COLUMNAS)
+            escritor.writeheader()
+            escritor.writerows(pares)
+        finally:
+            if salida is not sys.stdout:
+                salida.close()
+        self.stderr.write(self.style.SUCCESS(
+            f'{len(pares)} posibles duplicados en {time.monotonic() - inicio:.1f}s'
+        ))
@@ -0,0 +1,49 @@
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from labApp.exportacion import FORMATOS, exportar, marca_a_json, marca_desde_json
+
+
+#Comando para exportar análisis y resultados a CSV o JSON Lines, completo o incremental
+class Command(BaseCommand):
+    help = 'Exporta análisis y resultados en flujo (CSV o JSON Lines)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', help="Archivo de salida ('-' para la salida estándar)")
+        parser.add_argument('--formato', choices=FORMATOS, default='csv')
+        parser.add_argument(
+            '--marca',
+            help='Archivo JSON con la marca de la última exportación; solo se exportan los análisis '
+                 'posteriores y al terminar se actualiza (los resultados capturados después de '
+                 'exportar su análisis no vuelven a salir)',
+        )
+
+    def handle(self, *args, **options):
+        marca = None
+        if options['marca'] and os.path.exists(options['marca']):
+            try:
+                with open(options['marca'], encoding='utf-8') as archivo:
+                    marca = marca_desde_json(json.load(archivo))
+            except (ValueError, KeyError) as exc:
+                raise CommandError(f"Marca inválida en {options['marca']}: {exc}")
+
+        estado = {}
+        inicio = time.monotonic()
+        salida = sys.stdout if options['salida'] == '-' else open(options['salida'], 'w', newline='', encoding='utf-8')
+        try:
+            for bloque in exportar(options['formato'], marca=marca, estado=estado):
+                salida.write(bloque)
+        finally:
+            if salida is not sys.stdout:
+                salida.close()
+
+        # La marca solo avanza cuando el archivo quedó completo
+        if options['marca']:
+            with open(options['marca'], 'w', encoding='utf-8') as archivo:
+                json.dump(marca_a_json(estado['marca']), archivo)
+        self.stderr.write(self.style.SUCCESS(
+            f"{estado['filas']} filas exportadas en {time.monotonic() - inicio:.1f}s"
+        ))
@@ -0,0 +1,52 @@
+from datetime import datetime, time as dtime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from labApp.models import Analisis
+from labApp.reportes import reportes_zip
+
+
+#Comando para imprimir todos los reportes de un día (o de un filtro) de una sola vez en un ZIP
+class Command(BaseCommand):
+    help = 'Genera los PDF de varios análisis en paralelo y los guarda en un ZIP'
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', help='Ruta del archivo ZIP a crear')
+        parser.add_argument('--ids', type=int, nargs='*', help='Ids de análisis')
+        parser.add_argument('--desde', type=str, help='Fecha inicial de análisis (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=str, help='Fecha final de análisis, incluida (AAAA-MM-DD)')
+        parser.add_argument('--laboratorio', type=int, help='Id del laboratorio')
+        parser.add_argument('--plantilla', type=int, help='Id de la plantilla')
+        parser.add_argument('--procesos', type=int, help='Procesos para renderizar (por defecto, uno por CPU)')
+
+    def handle(self, *args, **options):
+        queryset = Analisis.objects.all()
+        if options['ids']:
+            queryset = queryset.filter(id__in=options['ids'])
+        if options['desde']:
+            queryset = queryset.filter(fecha_analisis__gte=self._fecha(options['desde'], dtime.min))
+        if options['hasta']:
+            queryset = queryset.filter(fecha_analisis__lte=self._fecha(options['hasta'], dtime.max))
+        if options['laboratorio']:
+            queryset = queryset.filter(laboratorio_id=options['laboratorio'])
+        if options['plantilla']:
+            queryset = queryset.filter(plantilla_id=options['plantilla'])
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+        if not ids:
+            raise CommandError('Ningún análisis coincide con el filtro')
+
+        estadisticas = {}
+        with open(options['salida'], 'wb') as salida:
+            for parte in reportes_zip(ids, procesos=options['procesos'], estadisticas=estadisticas):
+                salida.write(parte)
+        self.stdout.write(self.style.SUCCESS(
+            f"{estadisticas['total']} reportes en {estadisticas['segundos']:.1f}s "
+            f"({estadisticas['reportes_por_segundo']:.1f} reportes/s) -> {options['salida']}"
+        ))
+
+    def _fecha(self, texto, hora):
+        try:
+            fecha = datetime.strptime(texto, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Fecha inválida: {texto} (use AAAA-MM-DD)')
+        return timezone.make_aware(datetime.combine(fecha, hora))
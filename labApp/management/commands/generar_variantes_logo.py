@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from labApp.imagenes import actualizar_variantes
+from labApp.models import Laboratorio
+
+
+def kb(n):
+    return f'{n / 1024:,.1f} KB'
+
+
+#Comando para crear las variantes de los logos ya subidos (los nuevos las generan al guardarse)
+class Command(BaseCommand):
+    help = 'Genera la miniatura y demás variantes de los logos de laboratorio y compara tamaños'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forzar', action='store_true', help='Regenera aunque el logo no haya cambiado')
+        parser.add_argument('--laboratorio', type=int, nargs='*', help='Solo estos laboratorios (ids)')
+
+    def handle(self, *args, **options):
+        laboratorios = Laboratorio.objects.exclude(logo='').exclude(logo__isnull=True).order_by('id')
+        if options['laboratorio']:
+            laboratorios = laboratorios.filter(pk__in=options['laboratorio'])
+        total_original = total_variantes = procesados = 0
+        for laboratorio in laboratorios.iterator():
+            inicio = time.perf_counter()
+            datos = actualizar_variantes(laboratorio, forzar=options['forzar'])
+            milisegundos = (time.perf_counter() - inicio) * 1000
+            if not datos:
+                self.stdout.write(self.style.WARNING(f'{laboratorio}: no se pudo leer {laboratorio.logo.name}'))
+                continue
+            procesados += 1
+            origen = datos['origen']
+            detalle = ', '.join(
+                f"{nombre} {v['ancho']}x{v['alto']} {kb(v['bytes'])}" for nombre, v in datos['variantes'].items()
+            )
+            self.stdout.write(
+                f"{laboratorio.pk} {laboratorio.nombre_laboratorio}: original {origen['ancho']}x{origen['alto']} "
+                f"{kb(origen['bytes'])} -> {detalle} ({milisegundos:.0f} ms)"
+            )
+            total_original += origen['bytes']
+            total_variantes += datos['variantes'].get('miniatura', {}).get('bytes', 0)
+        if procesados:
+            # Lo que descarga la lista del admin antes y ahora
+            self.stdout.write(self.style.SUCCESS(
+                f'{procesados} logos. Lista de laboratorios: {kb(total_original)} con los originales, '
+                f'{kb(total_variantes)} con las miniaturas'
+            ))
+        else:
+            self.stdout.write('No hay logos que procesar')
@@ -1,30 +1,167 @@
 import csv
-from django.core.management.base import BaseCommand
+import hashlib
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from labApp.models import LoincCode
 
 
-#Aqui defino un comando donde busco el archivo CSV y lo importo a la base de datos, el archivo lo tengo en la carpeta loinc_documentos
-#Descargado desde la pagina de LOINC 
+# Columnas del CSV de LOINC -> campos del modelo LoincCode
+COLUMNAS = {
+    'shortname': 'SHORTNAME',
+    'component': 'COMPONENT',
+    'property': 'PROPERTY',
+    'system': 'SYSTEM',
+    'scale_typ': 'SCALE_TYP',
+}
+CAMPOS = list(COLUMNAS)
+
+
+def hash_fila(valores):
+    """Huella estable de los valores importados de una fila"""
+    contenido = '\x1f'.join(valores[campo] or '' for campo in CAMPOS)
+    return hashlib.md5(contenido.encode('utf-8')).hexdigest()
+
+
+def leer_filas(reader):
+    """Convierte cada fila del CSV en (loinc_num, valores) recortando al tamaño de cada campo"""
+    longitudes = {campo: LoincCode._meta.get_field(campo).max_length for campo in CAMPOS}
+    for row in reader:
+        loinc_num = (row.get('LOINC_NUM') or '').strip()
+        if not loinc_num:
+            continue
+        valores = {}
+        for campo, columna in COLUMNAS.items():
+            valor = row.get(columna) or ''
+            if longitudes[campo]:
+                valor = valor[:longitudes[campo]]
+            valores[campo] = valor
+        yield loinc_num, valores
+
+
+def en_lotes(iterable, tamano):
+    iterador = iter(iterable)
+    while lote := list(islice(iterador, tamano)):
+        yield lote
+
+
+#Aqui defino un comando que lee el CSV de LOINC (LoincTableCore.csv, descargado desde la pagina de LOINC)
+#en lotes y hace upsert por lote, saltando los códigos cuyo contenido no cambió
 class Command(BaseCommand):
     help = 'Importa los códigos LOINC desde un CSV'
 
-    def handle(self, *args, **kwargs):
-        with open('loinc_documentos/LoincTableCore/LoincTableCore.csv', newline='', encoding='utf-8') as csvfile:
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'ruta', nargs='?', default='loinc_documentos/LoincTableCore/LoincTableCore.csv',
+            help='Ruta al CSV LoincTableCore',
+        )
+        parser.add_argument('--lote', type=int, default=5000, help='Filas por lote/transacción')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='No escribe nada; muestra qué códigos son nuevos o cambiarían',
+        )
+        parser.add_argument(
+            '--max-diferencias', type=int, default=20,
+            help='Cuántos cambios detallar en modo --dry-run',
+        )
+
+    def handle(self, *args, **options):
+        ruta = options['ruta']
+        tamano_lote = options['lote']
+        dry_run = options['dry_run']
+        if tamano_lote < 1:
+            raise CommandError('--lote debe ser mayor que cero')
+
+        try:
+            csvfile = open(ruta, newline='', encoding='utf-8')
+        except OSError as exc:
+            raise CommandError(f'No se pudo abrir {ruta}: {exc}')
+
+        totales = {'leidos': 0, 'nuevos': 0, 'actualizados': 0, 'sin_cambios': 0}
+        diferencias = []
+        inicio = time.monotonic()
+        with csvfile:
             reader = csv.DictReader(csvfile)
-            count = 0
-            for row in reader:
-                LoincCode.objects.update_or_create(
-                    loinc_num=row['LOINC_NUM'],
-                    defaults={
-                        'component': row.get('COMPONENT', ''),
-                        'property': row.get('PROPERTY', ''),
-                        'time_aspct': row.get('TIME_ASPCT', ''),
-                        'system': row.get('SYSTEM', ''),
-                        'scale_typ': row.get('SCALE_TYP', ''),
-                        'method_typ': row.get('METHOD_TYP', ''),
-                        'shortname': row.get('SHORTNAME', ''),
-                        'long_common_name': row.get('LONG_COMMON_NAME', ''),
-                    }
+            for lote in en_lotes(leer_filas(reader), tamano_lote):
+                # Un lote puede repetir un código; se queda la última aparición
+                filas = dict(lote)
+                if dry_run:
+                    self._comparar_lote(filas, totales, diferencias, options['max_diferencias'])
+                else:
+                    self._guardar_lote(filas, totales)
+                totales['leidos'] += len(lote)
+                transcurrido = time.monotonic() - inicio
+                self.stdout.write(
+                    f"{totales['leidos']} filas leídas "
+                    f"({totales['leidos'] / transcurrido if transcurrido else 0:.0f} filas/s)"
+                )
+
+        transcurrido = time.monotonic() - inicio
+        if dry_run:
+            for loinc_num, cambios in diferencias:
+                self.stdout.write(f'~ {loinc_num}')
+                for campo, (antes, despues) in cambios.items():
+                    self.stdout.write(f'    {campo}: {antes!r} -> {despues!r}')
+        resumen = (
+            f"{'[dry-run] ' if dry_run else ''}"
+            f"{totales['nuevos']} nuevos, {totales['actualizados']} actualizados, "
+            f"{totales['sin_cambios']} sin cambios en {transcurrido:.1f}s"
+        )
+        self.stdout.write(self.style.SUCCESS(resumen))
+
+    def _hashes_existentes(self, loinc_nums):
+        """{loinc_num: (huella, guardada)}; a los códigos importados antes de hash_contenido
+        se les calcula la huella con sus valores para no contarlos todos como actualizados"""
+        existentes = {}
+        for codigo in LoincCode.objects.filter(loinc_num__in=loinc_nums).values('loinc_num', 'hash_contenido', *CAMPOS):
+            if codigo['hash_contenido']:
+                existentes[codigo['loinc_num']] = (codigo['hash_contenido'], True)
+            else:
+                existentes[codigo['loinc_num']] = (hash_fila(codigo), False)
+        return existentes
+
+    def _guardar_lote(self, filas, totales):
+        with transaction.atomic():
+            existentes = self._hashes_existentes(list(filas))
+            pendientes = []
+            for loinc_num, valores in filas.items():
+                huella = hash_fila(valores)
+                anterior, guardada = existentes.get(loinc_num, (None, False))
+                if anterior == huella:
+                    totales['sin_cambios'] += 1
+                    if guardada:
+                        continue
+                    # Sin cambios pero sin huella guardada: se reescribe para guardarla
+                else:
+                    totales['actualizados' if anterior is not None else 'nuevos'] += 1
+                pendientes.append(LoincCode(loinc_num=loinc_num, hash_contenido=huella, **valores))
+            if pendientes:
+                LoincCode.objects.bulk_create(
+                    pendientes,
+                    update_conflicts=True,
+                    unique_fields=['loinc_num'],
+                    update_fields=CAMPOS + ['hash_contenido'],
                 )
-                count += 1
-        self.stdout.write(self.style.SUCCESS(f'Importados {count} códigos LOINC'))
+
+    def _comparar_lote(self, filas, totales, diferencias, max_diferencias):
+        existentes = {
+            codigo['loinc_num']: codigo
+            for codigo in LoincCode.objects.filter(loinc_num__in=list(filas)).values('loinc_num', *CAMPOS)
+        }
+        for loinc_num, valores in filas.items():
+            actual = existentes.get(loinc_num)
+            if actual is None:
+                totales['nuevos'] += 1
+                continue
+            cambios = {
+                campo: (actual[campo], valores[campo])
+                for campo in CAMPOS if (actual[campo] or '') != valores[campo]
+            }
+            if not cambios:
+                totales['sin_cambios'] += 1
+                continue
+            totales['actualizados'] += 1
+            if len(diferencias) < max_diferencias:
+                diferencias.append((loinc_num, cambios))
@@ -0,0 +1,56 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from labApp.ingesta_archivos import TAMANO_BLOQUE, archivos_pendientes, procesar_archivo
+
+
+#Comando para cargar los archivos HL7/ASTM que dejan los analizadores en un directorio (una vez o vigilándolo)
+class Command(BaseCommand):
+    help = 'Ingresa los resultados de archivos HL7 v2 (ORU^R01) y ASTM E1394 de un directorio'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directorio', help='Directorio donde los analizadores dejan los archivos')
+        parser.add_argument(
+            '--extensiones', default='.hl7,.oru,.astm,.txt',
+            help='Extensiones aceptadas, separadas por comas',
+        )
+        parser.add_argument('--bloque', type=int, default=TAMANO_BLOQUE, help='Resultados por transacción')
+        parser.add_argument(
+            '--estable', type=float, default=2,
+            help='Segundos sin modificarse antes de leer un archivo (para no leerlo a medio escribir)',
+        )
+        parser.add_argument('--vigilar', action='store_true', help='No termina: revisa el directorio cada --intervalo')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos entre revisiones con --vigilar')
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(options['directorio']):
+            raise CommandError(f"No existe el directorio {options['directorio']}")
+        extensiones = tuple(e.strip().lower() for e in options['extensiones'].split(',') if e.strip())
+        while True:
+            self._revisar(options['directorio'], extensiones, options)
+            if not options['vigilar']:
+                break
+            time.sleep(options['intervalo'])
+            # Como un worker de larga vida: no conservar conexiones caídas o vencidas
+            close_old_connections()
+
+    def _revisar(self, directorio, extensiones, options):
+        for archivo in archivos_pendientes(directorio, extensiones, options['estable']):
+            inicio = time.monotonic()
+            resultados, cuarentena = archivo.resultados, archivo.en_cuarentena
+            try:
+                procesar_archivo(archivo, tamano_bloque=options['bloque'])
+            except Exception as exc:
+                # El archivo queda en ERROR y se reintenta en la siguiente revisión
+                self.stderr.write(f'{archivo.ruta}: {exc}')
+                if not options['vigilar']:
+                    raise
+                continue
+            segundos = time.monotonic() - inicio
+            nuevos = archivo.resultados - resultados
+            self.stdout.write(self.style.SUCCESS(
+                f'{archivo.ruta}: {nuevos} resultados, {archivo.en_cuarentena - cuarentena} en cuarentena '
+                f'en {segundos:.1f}s ({nuevos / max(segundos, 1e-6) * 60:.0f} resultados/min)'
+            ))
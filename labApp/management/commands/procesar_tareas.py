@@ -0,0 +1,48 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from labApp import tareas, tareas_trabajador
+
+
+#Comando que atiende la cola de tareas en segundo plano (labApp/tareas.py)
+class Command(BaseCommand):
+    help = 'Ejecuta las tareas encoladas con un pool de hilos y, opcionalmente, de procesos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=2, help='Hilos por proceso')
+        parser.add_argument(
+            '--procesos', type=int, default=1,
+            help='Procesos trabajadores (para tareas que usan CPU, como renderizar PDF)',
+        )
+        parser.add_argument('--espera', type=float, default=1.0, help='Segundos entre revisiones con la cola vacía')
+        parser.add_argument('--vaciar', action='store_true', help='Termina cuando no quedan tareas disponibles')
+
+    def handle(self, *args, **options):
+        hilos, espera, vaciar = max(1, options['hilos']), options['espera'], options['vaciar']
+        procesos = max(1, options['procesos'])
+        self.stdout.write(f'Atendiendo la cola con {procesos} proceso(s) x {hilos} hilo(s)')
+        if procesos == 1:
+            parar = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *_: parar.set())
+            signal.signal(signal.SIGINT, lambda *_: parar.set())
+            tareas.trabajar(hilos, espera, parar=parar, vaciar=vaciar)
+            return
+
+        contexto = multiprocessing.get_context('spawn')
+        hijos = [
+            contexto.Process(target=tareas_trabajador.correr, args=(hilos, espera, vaciar), name=f'tareas-{n}')
+            for n in range(procesos)
+        ]
+        for hijo in hijos:
+            hijo.start()
+        # Al recibir SIGTERM se reenvía a los hijos, que terminan la tarea en curso y salen
+        signal.signal(signal.SIGTERM, lambda *_: [hijo.terminate() for hijo in hijos])
+        try:
+            for hijo in hijos:
+                hijo.join()
+        except KeyboardInterrupt:
+            # Ctrl+C ya llegó a todo el grupo de procesos; solo queda esperarlos
+            for hijo in hijos:
+                hijo.join()
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from labApp.ingesta import purgar_claves
+
+
+#Comando para borrar las claves de idempotencia vencidas de la API de ingesta (para cron, p. ej. una vez al día)
+class Command(BaseCommand):
+    help = 'Borra las claves de idempotencia de la API de ingesta más viejas que su vigencia'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas', type=float,
+            help='Vigencia en horas (por defecto LAB_INGESTA_IDEMPOTENCIA_HORAS, 24)',
+        )
+
+    def handle(self, *args, **options):
+        borradas = purgar_claves(options['horas'])
+        self.stdout.write(self.style.SUCCESS(f'{borradas} claves de idempotencia vencidas borradas'))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from labApp.models import ResultadoAnalisis
+from labApp.resultados import recalcular_resultados
+
+
+#Comando para llenar (o corregir) valor_numerico, ref_min, ref_max y bandera de los resultados existentes
+class Command(BaseCommand):
+    help = 'Recalcula el valor numérico, el rango de referencia y la bandera de los resultados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000, help='Filas por lote')
+        parser.add_argument('--analisis', type=int, nargs='*', help='Solo estos análisis (ids)')
+
+    def handle(self, *args, **options):
+        queryset = ResultadoAnalisis.objects.all()
+        if options['analisis']:
+            queryset = queryset.filter(analisis_id__in=options['analisis'])
+        inicio = time.monotonic()
+        actualizados = recalcular_resultados(queryset, batch_size=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{actualizados} resultados actualizados en {time.monotonic() - inicio:.1f}s'
+        ))
@@ -0,0 +1,43 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from labApp import calidad
+
+
+def fecha(texto):
+    try:
+        return datetime.date.fromisoformat(texto)
+    except ValueError:
+        raise CommandError(f'Fecha inválida {texto!r}; use AAAA-MM-DD')
+
+
+#Comando para actualizar los resúmenes diarios de control de calidad (labApp/calidad.py)
+class Command(BaseCommand):
+    help = 'Calcula media, DE, CV y reglas de Westgard por día, laboratorio y propiedad'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde', type=fecha,
+            help='Primer día (AAAA-MM-DD); por defecto el último ya resumido, para actualizar solo lo nuevo',
+        )
+        parser.add_argument('--hasta', type=fecha, help='Último día incluido (por defecto hoy)')
+        parser.add_argument('--dias', type=int, default=7, help='Días por ventana (una consulta por ventana)')
+        parser.add_argument('--lote', type=int, default=5000, help='Filas por lectura del cursor')
+
+    def handle(self, *args, **options):
+        desde = options['desde'] or calidad.desde_pendiente()
+        if desde is None:
+            self.stdout.write('No hay análisis que resumir')
+            return
+        hasta = (options['hasta'] or timezone.localdate()) + datetime.timedelta(days=1)
+        inicio = time.monotonic()
+        total = 0
+        for inicio_ventana, fin_ventana in calidad.ventanas(desde, hasta, max(1, options['dias'])):
+            escritos = calidad.resumir_ventana(inicio_ventana, fin_ventana, options['lote'])
+            total += escritos
+            self.stdout.write(f'{inicio_ventana} a {fin_ventana - datetime.timedelta(days=1)}: {escritos} resúmenes')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} resúmenes diarios escritos en {time.monotonic() - inicio:.1f}s'
+        ))
@@ -0,0 +1,70 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from labApp import datos_sinteticos
+from labApp.models import Analisis
+
+
+#Comando para llenar la base con datos sintéticos deterministas (pruebas de carga y benchmarks)
+class Command(BaseCommand):
+    help = 'Crea laboratorios, pacientes, análisis y resultados sintéticos con bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--perfil', choices=sorted(datos_sinteticos.PERFILES), default='pequeno',
+            help='Tamaño predefinido (grande: 50 laboratorios, 200k pacientes, 1M análisis, ~20M resultados)',
+        )
+        parser.add_argument('--laboratorios', type=int, help='Sustituye el valor del perfil')
+        parser.add_argument('--pacientes', type=int, help='Sustituye el valor del perfil')
+        parser.add_argument('--analisis', type=int, help='Sustituye el valor del perfil')
+        parser.add_argument('--loinc', type=int, default=0, help='Códigos LOINC sintéticos adicionales')
+        parser.add_argument('--semilla', type=int, default=1, help='Misma semilla, mismos datos')
+        parser.add_argument(
+            '--hasta', type=datetime.date.fromisoformat, default=datetime.date(2025, 12, 31),
+            help='Fecha del análisis más reciente (AAAA-MM-DD)',
+        )
+        parser.add_argument('--dias', type=int, default=365, help='Días hacia atrás en que se reparten los análisis')
+        parser.add_argument('--lote', type=int, default=2000, help='Análisis por transacción')
+        parser.add_argument(
+            '--agregar', action='store_true', help='Agrega aunque la base ya tenga análisis (por defecto se niega)',
+        )
+
+    def handle(self, *args, **options):
+        tamanos = {**datos_sinteticos.PERFILES[options['perfil']]}
+        for campo in tamanos:
+            if options[campo] is not None:
+                tamanos[campo] = options[campo]
+        if min(tamanos.values()) < 1 or options['lote'] < 1 or options['dias'] < 1:
+            raise CommandError('Los tamaños, --lote y --dias deben ser mayores que cero')
+        if not options['agregar'] and Analisis.objects.exists():
+            raise CommandError(
+                f"La base {connection.settings_dict['NAME']} ya tiene análisis; use --agregar para sumar datos sintéticos"
+            )
+
+        self.stdout.write(
+            f"Sembrando {tamanos['laboratorios']} laboratorios, {tamanos['pacientes']} pacientes y "
+            f"{tamanos['analisis']} análisis en {connection.settings_dict['NAME']}"
+        )
+        inicio = time.monotonic()
+        paso = max(options['lote'], tamanos['analisis'] // 20)
+
+        def progreso(analisis, resultados):
+            if analisis % paso < options['lote'] or analisis == tamanos['analisis']:
+                transcurrido = time.monotonic() - inicio
+                self.stdout.write(
+                    f'  {analisis} análisis, {resultados} resultados ({transcurrido:.0f}s, '
+                    f'{resultados / max(transcurrido, 1e-9):,.0f} resultados/s)'
+                )
+
+        if options['loinc']:
+            datos_sinteticos.crear_codigos_loinc(options['loinc'], semilla=options['semilla'], inicio=100_000)
+        totales = datos_sinteticos.sembrar(
+            **tamanos, semilla=options['semilla'], hasta=options['hasta'], dias=options['dias'],
+            lote=options['lote'], progreso=progreso,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{cantidad} {modelo}' for modelo, cantidad in totales.items())
+            + f' en {time.monotonic() - inicio:.1f}s'
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0002_reporte'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loinccode',
+            name='hash_contenido',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
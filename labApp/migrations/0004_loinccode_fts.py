@@ -0,0 +1,58 @@
+# Índice FTS5 para la búsqueda de códigos LOINC (solo SQLite)
+
+from django.db import migrations
+
+SQL_CREAR = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS labApp_loinccode_fts USING fts5(
+        shortname, component, property, system,
+        content='labApp_loinccode', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS labApp_loinccode_fts_ai AFTER INSERT ON labApp_loinccode BEGIN
+        INSERT INTO labApp_loinccode_fts(rowid, shortname, component, property, system)
+        VALUES (new.id, new.shortname, new.component, new.property, new.system);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS labApp_loinccode_fts_ad AFTER DELETE ON labApp_loinccode BEGIN
+        INSERT INTO labApp_loinccode_fts(labApp_loinccode_fts, rowid, shortname, component, property, system)
+        VALUES ('delete', old.id, old.shortname, old.component, old.property, old.system);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS labApp_loinccode_fts_au AFTER UPDATE ON labApp_loinccode BEGIN
+        INSERT INTO labApp_loinccode_fts(labApp_loinccode_fts, rowid, shortname, component, property, system)
+        VALUES ('delete', old.id, old.shortname, old.component, old.property, old.system);
+        INSERT INTO labApp_loinccode_fts(rowid, shortname, component, property, system)
+        VALUES (new.id, new.shortname, new.component, new.property, new.system);
+    END""",
+    "INSERT INTO labApp_loinccode_fts(labApp_loinccode_fts) VALUES ('rebuild')",
+]
+
+SQL_BORRAR = [
+    'DROP TRIGGER IF EXISTS labApp_loinccode_fts_ai',
+    'DROP TRIGGER IF EXISTS labApp_loinccode_fts_ad',
+    'DROP TRIGGER IF EXISTS labApp_loinccode_fts_au',
+    'DROP TABLE IF EXISTS labApp_loinccode_fts',
+]
+
+
+def crear_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SQL_CREAR:
+        schema_editor.execute(sql)
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SQL_BORRAR:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0003_loinccode_hash_contenido'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:40
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def quitar_duplicados(apps, schema_editor):
+    # Conserva por (analisis, nombre_propiedad) la fila con valor capturado o,
+    # si ninguna lo tiene, la más antigua. Solo se borran filas vacías o con el
+    # mismo valor que la conservada; si hay valores distintos la migración se
+    # detiene sin tocar nada (no se puede elegir cuál es el bueno).
+    ResultadoAnalisis = apps.get_model('labApp', 'ResultadoAnalisis')
+    duplicados = list(
+        ResultadoAnalisis.objects.values('analisis_id', 'nombre_propiedad')
+        .annotate(total=Count('id'), primero=Min('id'))
+        .filter(total__gt=1)
+    )
+    conflictos = [
+        grupo for grupo in duplicados
+        if ResultadoAnalisis.objects.filter(
+            analisis_id=grupo['analisis_id'], nombre_propiedad=grupo['nombre_propiedad'],
+        ).exclude(valor='').values('valor').distinct().count() > 1
+    ]
+    if conflictos:
+        detalle = ', '.join(f"análisis {g['analisis_id']} / {g['nombre_propiedad']}" for g in conflictos[:20])
+        raise RuntimeError(
+            f'Hay resultados repetidos con valores distintos ({detalle}). '
+            'Deje un solo resultado por propiedad antes de aplicar esta migración.'
+        )
+    for grupo in duplicados:
+        filas = ResultadoAnalisis.objects.filter(
+            analisis_id=grupo['analisis_id'], nombre_propiedad=grupo['nombre_propiedad'],
+        )
+        conservar = filas.exclude(valor='').order_by('id').values_list('id', flat=True).first() or grupo['primero']
+        filas.exclude(id=conservar).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0004_loinccode_fts'),
+    ]
+
+    operations = [
+        migrations.RunPython(quitar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='resultadoanalisis',
+            constraint=models.UniqueConstraint(fields=('analisis', 'nombre_propiedad'), name='resultado_unico_por_propiedad'),
+        ),
+    ]
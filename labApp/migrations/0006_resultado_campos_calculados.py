@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0005_resultado_unico_por_propiedad'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultadoanalisis',
+            name='bandera',
+            field=models.CharField(blank=True, choices=[('H', 'Alto'), ('L', 'Bajo'), ('N', 'Normal'), ('X', 'No numérico')], db_index=True, default='', editable=False, max_length=1),
+        ),
+        migrations.AddField(
+            model_name='resultadoanalisis',
+            name='ref_max',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='resultadoanalisis',
+            name='ref_min',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='resultadoanalisis',
+            name='valor_numerico',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
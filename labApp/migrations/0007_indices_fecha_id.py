@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0006_resultado_campos_calculados'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='analisis',
+            index=models.Index(fields=['fecha_analisis', 'id'], name='analisis_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reporte',
+            index=models.Index(fields=['fecha_generacion', 'id'], name='reporte_fecha_id_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:53
+
+from django.db import migrations, models
+
+# Grupos fijos anteriores (edad <= 18, <= 59, el resto) como rangos en años
+RANGOS_GRUPO = {
+    'NINO': (0, 18),
+    'ADULTO': (19, 59),
+    'ADULTO_MAYOR': (60, None),
+}
+
+
+def grupos_a_rangos(apps, schema_editor):
+    IntervaloReferencia = apps.get_model('labApp', 'IntervaloReferencia')
+    for grupo, (edad_min, edad_max) in RANGOS_GRUPO.items():
+        IntervaloReferencia.objects.filter(grupo_edad=grupo).update(
+            edad_min=edad_min, edad_max=edad_max, unidad_edad='ANIOS',
+        )
+
+
+def rangos_a_grupos(apps, schema_editor):
+    IntervaloReferencia = apps.get_model('labApp', 'IntervaloReferencia')
+    for intervalo in IntervaloReferencia.objects.all():
+        anios = intervalo.edad_min if intervalo.unidad_edad == 'ANIOS' else 0
+        intervalo.grupo_edad = 'NINO' if anios <= 18 else 'ADULTO' if anios <= 59 else 'ADULTO_MAYOR'
+        intervalo.save(update_fields=['grupo_edad'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0007_indices_fecha_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='intervaloreferencia',
+            name='edad_max',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='intervaloreferencia',
+            name='edad_min',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='intervaloreferencia',
+            name='unidad_edad',
+            field=models.CharField(choices=[('DIAS', 'Días'), ('MESES', 'Meses'), ('ANIOS', 'Años')], default='ANIOS', max_length=5),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='fecha_nacimiento',
+            field=models.DateField(blank=True, null=True),
+        ),
+        # Con default para poder revertir RemoveField sobre filas existentes
+        migrations.AlterField(
+            model_name='intervaloreferencia',
+            name='grupo_edad',
+            field=models.CharField(max_length=20, default='ADULTO'),
+        ),
+        migrations.RunPython(grupos_a_rangos, rangos_a_grupos),
+        migrations.RemoveField(
+            model_name='intervaloreferencia',
+            name='grupo_edad',
+        ),
+    ]
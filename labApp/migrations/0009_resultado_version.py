@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0008_intervalos_por_rango_de_edad'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultadoanalisis',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0009_resultado_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=100, unique=True)),
+                ('huella', models.CharField(max_length=64)),
+                ('respuesta', models.JSONField()),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
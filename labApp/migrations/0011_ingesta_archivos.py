@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0010_clave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoIngesta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ruta', models.CharField(max_length=500, unique=True)),
+                ('tamano', models.PositiveBigIntegerField(default=0)),
+                ('desplazamiento', models.PositiveBigIntegerField(default=0)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('COMPLETO', 'Completo'), ('ERROR', 'Error')], db_index=True, default='PENDIENTE', max_length=10)),
+                ('mensajes', models.PositiveIntegerField(default=0)),
+                ('resultados', models.PositiveIntegerField(default=0)),
+                ('en_cuarentena', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResultadoCuarentena',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orden', models.CharField(blank=True, max_length=100)),
+                ('codigo', models.CharField(blank=True, max_length=100)),
+                ('valor', models.CharField(blank=True, max_length=100)),
+                ('unidad', models.CharField(blank=True, max_length=20)),
+                ('motivo', models.CharField(max_length=255)),
+                ('segmento', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('archivo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cuarentena', to='labApp.archivoingesta')),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0011_ingesta_archivos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(db_index=True, max_length=100)),
+                ('argumentos', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_CURSO', 'En curso'), ('COMPLETA', 'Completa'), ('FALLIDA', 'Fallida')], default='PENDIENTE', max_length=10)),
+                ('prioridad', models.SmallIntegerField(default=0)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('max_intentos', models.PositiveSmallIntegerField(default=5)),
+                ('disponible_desde', models.DateTimeField(default=django.utils.timezone.now)),
+                ('trabajador', models.CharField(blank=True, max_length=100)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(models.OrderBy(models.F('prioridad'), descending=True), models.F('disponible_desde'), models.F('id'), condition=models.Q(('estado', 'PENDIENTE')), name='tarea_pendiente_idx'), models.Index(fields=['estado', 'fecha_inicio'], name='tarea_estado_inicio_idx')],
+            },
+        ),
+    ]
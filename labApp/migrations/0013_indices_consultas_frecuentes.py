@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:07
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def revisar_propiedades_duplicadas(apps, schema_editor):
+    """Falla con un mensaje claro en lugar del IntegrityError de la restricción"""
+    PropiedadPlantilla = apps.get_model('labApp', 'PropiedadPlantilla')
+    duplicadas = list(
+        PropiedadPlantilla.objects.values('plantilla__titulo', 'nombre_propiedad')
+        .annotate(n=Count('id')).filter(n__gt=1)[:20]
+    )
+    if duplicadas:
+        detalle = ', '.join(f"{d['plantilla__titulo']} / {d['nombre_propiedad']}" for d in duplicadas)
+        raise RuntimeError(
+            f'Hay propiedades repetidas dentro de una plantilla ({detalle}). '
+            'Renómbrelas o elimínelas antes de aplicar esta migración.'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0012_tareas'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='tarea',
+            name='tarea_pendiente_idx',
+        ),
+        migrations.AddIndex(
+            model_name='analisis',
+            index=models.Index(fields=['plantilla', 'fecha_analisis', 'id'], name='analisis_plantilla_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='analisis',
+            index=models.Index(fields=['paciente', 'fecha_analisis'], name='analisis_paciente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='intervaloreferencia',
+            index=models.Index(fields=['propiedad', 'sexo', 'edad_min'], name='intervalo_prop_sexo_edad_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['usuario', 'estado', 'fecha_vencimiento'], name='pago_usuario_estado_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['estado', 'fecha_vencimiento'], name='pago_estado_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tarea',
+            index=models.Index(models.F('estado'), models.OrderBy(models.F('prioridad'), descending=True), models.F('disponible_desde'), models.F('id'), name='tarea_cola_idx'),
+        ),
+        migrations.RunPython(revisar_propiedades_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='propiedadplantilla',
+            constraint=models.UniqueConstraint(fields=('plantilla', 'nombre_propiedad'), name='propiedad_unica_por_plantilla'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0013_indices_consultas_frecuentes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analisis',
+            name='es_control',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='analisis',
+            name='nivel_control',
+            field=models.CharField(blank=True, help_text='Ej: Nivel 1, Normal, Patológico', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ResumenControlDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('es_control', models.BooleanField(default=False)),
+                ('nivel', models.CharField(blank=True, max_length=20)),
+                ('n', models.PositiveIntegerField()),
+                ('suma', models.FloatField()),
+                ('suma_cuadrados', models.FloatField()),
+                ('media', models.FloatField()),
+                ('de', models.FloatField(blank=True, null=True)),
+                ('cv', models.FloatField(blank=True, null=True)),
+                ('minimo', models.FloatField()),
+                ('maximo', models.FloatField()),
+                ('media_objetivo', models.FloatField(blank=True, null=True)),
+                ('de_objetivo', models.FloatField(blank=True, null=True)),
+                ('violaciones', models.JSONField(blank=True, default=list)),
+                ('rechazo', models.BooleanField(default=False)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('laboratorio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_control', to='labApp.laboratorio')),
+                ('propiedad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_control', to='labApp.propiedadplantilla')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fecha', 'es_control'], name='resumen_control_fecha_idx')],
+                'constraints': [models.UniqueConstraint(fields=('laboratorio', 'propiedad', 'nivel', 'fecha', 'es_control'), name='resumen_control_unico')],
+            },
+        ),
+    ]
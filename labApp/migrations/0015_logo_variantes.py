@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0014_control_calidad'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='laboratorio',
+            name='logo_variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
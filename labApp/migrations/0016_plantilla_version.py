@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0015_logo_variantes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plantilla',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copiar_laboratorio(apps, schema_editor):
+    Paciente = apps.get_model('labApp', 'Paciente')
+    Analisis = apps.get_model('labApp', 'Analisis')
+    ResultadoAnalisis = apps.get_model('labApp', 'ResultadoAnalisis')
+    Reporte = apps.get_model('labApp', 'Reporte')
+    # Un UPDATE por tabla: primero los análisis, de los que copian resultados y reportes
+    Analisis.objects.update(laboratorio_id=Subquery(
+        Paciente.objects.filter(pk=OuterRef('paciente_id')).values('laboratorio_id')[:1]
+    ))
+    del_analisis = Subquery(Analisis.objects.filter(pk=OuterRef('analisis_id')).values('laboratorio_id')[:1])
+    ResultadoAnalisis.objects.update(laboratorio_id=del_analisis)
+    Reporte.objects.update(laboratorio_id=del_analisis)
+
+
+def campo(null):
+    return models.ForeignKey(
+        db_index=False, editable=False, null=null, on_delete=django.db.models.deletion.CASCADE,
+        related_name='+', to='labApp.laboratorio',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0016_plantilla_version'),
+    ]
+
+    operations = [
+        migrations.AddField(model_name='analisis', name='laboratorio', field=campo(null=True)),
+        migrations.AddField(model_name='resultadoanalisis', name='laboratorio', field=campo(null=True)),
+        migrations.AddField(model_name='reporte', name='laboratorio', field=campo(null=True)),
+        migrations.RunPython(copiar_laboratorio, migrations.RunPython.noop),
+        migrations.AlterField(model_name='analisis', name='laboratorio', field=campo(null=False)),
+        migrations.AlterField(model_name='resultadoanalisis', name='laboratorio', field=campo(null=False)),
+        migrations.AlterField(model_name='reporte', name='laboratorio', field=campo(null=False)),
+        migrations.AddIndex(
+            model_name='analisis',
+            index=models.Index(fields=['laboratorio', 'fecha_analisis', 'id'], name='analisis_lab_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resultadoanalisis',
+            index=models.Index(fields=['laboratorio', 'id'], name='resultado_lab_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reporte',
+            index=models.Index(fields=['laboratorio', 'fecha_generacion', 'id'], name='reporte_lab_fecha_idx'),
+        ),
+    ]
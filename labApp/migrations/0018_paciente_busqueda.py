@@ -0,0 +1,151 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:42
+#
+# Claves normalizada y fonética del nombre del paciente y un índice FTS5 con
+# el tokenizador trigram sobre ambas (solo SQLite) para la búsqueda del admin.
+#
+# Las claves se calculan con una copia de labApp/nombres.py tal como estaba al
+# escribir la migración, para que cambiar las reglas después no cambie lo que
+# hace. El trigram necesita SQLite 3.34 con FTS5; sin eso no se crea el índice
+# y labApp/busqueda.py busca sobre nombre_clave.
+
+import re
+import sqlite3
+import unicodedata
+
+from django.db import migrations, models
+
+PARTICULAS = frozenset({'de', 'del', 'la', 'las', 'los', 'y', 'e', 'da', 'van', 'von'})
+
+REGLAS_FONETICAS = [
+    (re.compile(r'gu(?=[ei])'), 'G'),
+    (re.compile(r'g(?=[ei])'), 'j'),
+    (re.compile(r'qu(?=[ei])'), 'k'),
+    (re.compile(r'c(?=[ei])'), 's'),
+    (re.compile(r'ch'), 'C'),
+    (re.compile(r'[cq]'), 'k'),
+    (re.compile(r'z'), 's'),
+    (re.compile(r'v'), 'b'),
+    (re.compile(r'w'), 'u'),
+    (re.compile(r'll'), 'y'),
+    (re.compile(r'y$'), 'i'),
+    (re.compile(r'h'), ''),
+    (re.compile(r'(.)\1+'), r'\1'),
+]
+
+SQL_CREAR = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS labApp_paciente_fts USING fts5(
+        nombre_clave, nombre_fonetico,
+        content='labApp_paciente', content_rowid='id',
+        tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS labApp_paciente_fts_ai AFTER INSERT ON labApp_paciente BEGIN
+        INSERT INTO labApp_paciente_fts(rowid, nombre_clave, nombre_fonetico)
+        VALUES (new.id, new.nombre_clave, new.nombre_fonetico);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS labApp_paciente_fts_ad AFTER DELETE ON labApp_paciente BEGIN
+        INSERT INTO labApp_paciente_fts(labApp_paciente_fts, rowid, nombre_clave, nombre_fonetico)
+        VALUES ('delete', old.id, old.nombre_clave, old.nombre_fonetico);
+    END""",
+    # Solo cuando cambia el nombre: mover pacientes de laboratorio no toca el índice
+    """CREATE TRIGGER IF NOT EXISTS labApp_paciente_fts_au
+        AFTER UPDATE OF nombre_clave, nombre_fonetico ON labApp_paciente BEGIN
+        INSERT INTO labApp_paciente_fts(labApp_paciente_fts, rowid, nombre_clave, nombre_fonetico)
+        VALUES ('delete', old.id, old.nombre_clave, old.nombre_fonetico);
+        INSERT INTO labApp_paciente_fts(rowid, nombre_clave, nombre_fonetico)
+        VALUES (new.id, new.nombre_clave, new.nombre_fonetico);
+    END""",
+    "INSERT INTO labApp_paciente_fts(labApp_paciente_fts) VALUES ('rebuild')",
+]
+
+SQL_BORRAR = [
+    'DROP TRIGGER IF EXISTS labApp_paciente_fts_ai',
+    'DROP TRIGGER IF EXISTS labApp_paciente_fts_ad',
+    'DROP TRIGGER IF EXISTS labApp_paciente_fts_au',
+    'DROP TABLE IF EXISTS labApp_paciente_fts',
+]
+
+
+def tokens(texto):
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return re.findall(r'[a-z0-9]+', sin_acentos.lower())
+
+
+def fonetica(token):
+    for patron, reemplazo in REGLAS_FONETICAS:
+        token = patron.sub(reemplazo, token)
+    return token.replace('G', 'g').replace('C', 'ch')
+
+
+def clave_nombre(texto):
+    return ' '.join(sorted(tokens(texto)))
+
+
+def clave_fonetica(texto):
+    return ' '.join(sorted(fonetica(t) for t in tokens(texto) if t not in PARTICULAS))
+
+
+def fts5_trigram(conexion):
+    """True si el SQLite de la conexión tiene FTS5 y el tokenizador trigram (3.34+)"""
+    if sqlite3.sqlite_version_info < (3, 34):
+        return False
+    with conexion.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def llenar_claves(apps, schema_editor):
+    Paciente = apps.get_model('labApp', 'Paciente')
+    lote = []
+    for paciente in Paciente.objects.only('id', 'nombre').iterator(chunk_size=5000):
+        paciente.nombre_clave = clave_nombre(paciente.nombre)
+        paciente.nombre_fonetico = clave_fonetica(paciente.nombre)
+        lote.append(paciente)
+        if len(lote) == 5000:
+            Paciente.objects.bulk_update(lote, ['nombre_clave', 'nombre_fonetico'])
+            lote = []
+    Paciente.objects.bulk_update(lote, ['nombre_clave', 'nombre_fonetico'])
+
+
+def crear_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite' or not fts5_trigram(schema_editor.connection):
+        return
+    for sql in SQL_CREAR:
+        schema_editor.execute(sql)
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SQL_BORRAR:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0017_laboratorio_denormalizado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='nombre_clave',
+            field=models.CharField(blank=True, default='', editable=False, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='nombre_fonetico',
+            field=models.CharField(blank=True, default='', editable=False, max_length=150),
+        ),
+        migrations.RunPython(llenar_claves, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['laboratorio', 'nombre_fonetico'], name='paciente_lab_fonetico_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['laboratorio', 'nombre_clave'], name='paciente_lab_clave_idx'),
+        ),
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
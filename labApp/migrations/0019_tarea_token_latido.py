@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:02
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def latido_inicial(apps, schema_editor):
+    # Las tareas en curso conservan el plazo que tenían: el último latido es su inicio
+    Tarea = apps.get_model('labApp', 'Tarea')
+    Tarea.objects.filter(estado='EN_CURSO').update(latido=F('fecha_inicio'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labApp', '0018_paciente_busqueda'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='tarea',
+            name='tarea_estado_inicio_idx',
+        ),
+        migrations.AddField(
+            model_name='tarea',
+            name='latido',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='tarea',
+            name='token',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.RunPython(latido_inicial, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='tarea',
+            index=models.Index(fields=['estado', 'latido'], name='tarea_estado_latido_idx'),
+        ),
+    ]
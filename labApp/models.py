@@ -1,9 +1,54 @@
 # labApp/models.py
 
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.hashers import make_password, check_password, is_password_usable
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
+
+from .nombres import clave_fonetica, clave_nombre
+
+#------------------------ Consultas por laboratorio ------------------------------
+# Analisis, ResultadoAnalisis y Reporte guardan una copia del laboratorio de su
+# paciente para listar y filtrar por laboratorio sin joins (labApp/laboratorios.py).
+class PorLaboratorioQuerySet(models.QuerySet):
+    def de_laboratorios(self, laboratorios):
+        """Filas de esos laboratorios (ids); None = sin restricción (superusuario)"""
+        if laboratorios is None:
+            return self
+        return self.filter(laboratorio_id__in=laboratorios)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        completar_laboratorio(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+def completar_laboratorio(objs):
+    """Copia el laboratorio de ORIGEN_LABORATORIO a las filas que no lo tengan (una consulta como máximo)"""
+    pendientes = [obj for obj in objs if obj.laboratorio_id is None]
+    origen = getattr(type(pendientes[0]), 'ORIGEN_LABORATORIO', None) if pendientes else None
+    if origen is None:
+        return
+    campo = type(pendientes[0])._meta.get_field(origen)
+    sin_cargar = {getattr(obj, campo.attname) for obj in pendientes if not campo.is_cached(obj)}
+    laboratorios = dict(
+        campo.related_model._base_manager.filter(pk__in=sin_cargar).values_list('pk', 'laboratorio_id')
+    ) if sin_cargar else {}
+    for obj in pendientes:
+        if campo.is_cached(obj):
+            obj.laboratorio_id = getattr(obj, origen).laboratorio_id
+        else:
+            obj.laboratorio_id = laboratorios.get(getattr(obj, campo.attname))
+
+class PacienteQuerySet(PorLaboratorioQuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.completar_claves()
+        return super().bulk_create(objs, *args, **kwargs)
 
 #------------------------------ Tabla Laboratorio ----------------------------
 class Laboratorio(models.Model):
@@ -13,9 +58,19 @@ class Laboratorio(models.Model):
     codigo_postal = models.CharField(max_length=20)
     pais = models.CharField(max_length=100)
     logo = models.ImageField(upload_to='logos_laboratorios/', null=True, blank=True)
+    # Miniatura, encabezado de PDF... del logo actual (labApp/imagenes.py)
+    logo_variantes = models.JSONField(default=dict, blank=True, editable=False)
     def __str__(self):
         return f"{self.nombre_laboratorio} - {self.ciudad}, {self.estado}"
 
+# Al subir o cambiar el logo se generan sus variantes redimensionadas
+@receiver(post_save, sender=Laboratorio)
+def generar_variantes_logo(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .imagenes import actualizar_variantes
+    actualizar_variantes(instance)
+
 #------------------------------ Tabla Usuario ----------------------------
 class Usuario(models.Model):
     nombre = models.CharField(max_length=150)
@@ -44,12 +99,38 @@ class Paciente(models.Model):
     laboratorio = models.ForeignKey(Laboratorio, on_delete=models.CASCADE, related_name="pacientes")
     nombre = models.CharField(max_length=150)
     edad = models.PositiveIntegerField()
+    # Opcional: con ella los intervalos por días/meses (neonatos, lactantes) usan la edad exacta
+    fecha_nacimiento = models.DateField(null=True, blank=True)
     sexo = models.CharField(max_length=10, choices=SEXO_CHOICES)
     telefono = models.CharField(max_length=20)
     correo_electronico = models.EmailField(blank=True, null=True)
+    # Claves del nombre para la búsqueda y la detección de duplicados (labApp/nombres.py)
+    nombre_clave = models.CharField(max_length=150, blank=True, default='', editable=False)
+    nombre_fonetico = models.CharField(max_length=150, blank=True, default='', editable=False)
+
+    objects = PacienteQuerySet.as_manager()
+
+    def completar_claves(self):
+        self.nombre_clave = clave_nombre(self.nombre)
+        self.nombre_fonetico = clave_fonetica(self.nombre)
+
+    def save(self, *args, **kwargs):
+        self.completar_claves()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'nombre' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'nombre_clave', 'nombre_fonetico'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.nombre} ({self.laboratorio.nombre_laboratorio})"
 
+    class Meta:
+        indexes = [
+            # Posibles duplicados al registrar y bloques de detectar_duplicados
+            models.Index(fields=['laboratorio', 'nombre_fonetico'], name='paciente_lab_fonetico_idx'),
+            models.Index(fields=['laboratorio', 'nombre_clave'], name='paciente_lab_clave_idx'),
+        ]
+
 #--------------------------- Tabla Pagos ----------------------------
 class Pago(models.Model):
     ESTADOS = [("PAGADO", "Pagado"), ("VENCIDO", "Vencido"), ("PENDIENTE", "Pendiente")]
@@ -59,6 +140,12 @@ class Pago(models.Model):
     estado = models.CharField(max_length=10, choices=ESTADOS)
     def __str__(self):
         return f"Pago {self.estado} - {self.usuario.nombre} ({self.fecha_pago})"
+    class Meta:
+        indexes = [
+            # Pagos pendientes/vencidos de un usuario y, en general, por vencer
+            models.Index(fields=['usuario', 'estado', 'fecha_vencimiento'], name='pago_usuario_estado_venc_idx'),
+            models.Index(fields=['estado', 'fecha_vencimiento'], name='pago_estado_venc_idx'),
+        ]
 
 #------------------------ Tabla LOINC ------------------------------
 class LoincCode(models.Model):
@@ -68,6 +155,8 @@ class LoincCode(models.Model):
     property = models.CharField(max_length=50, null=True, blank=True)
     system = models.CharField(max_length=100, null=True, blank=True)
     scale_typ = models.CharField(max_length=20, null=True, blank=True)
+    # Huella de los campos importados; permite al importador saltar filas sin cambios
+    hash_contenido = models.CharField(max_length=32, blank=True, default='', editable=False)
     def __str__(self):
         return f"{self.loinc_num} - {self.shortname}"
 
@@ -88,6 +177,8 @@ class Plantilla(models.Model):
         blank=True, null=True,
         help_text="Usado solo si el formato es 'Receta Justificada'"
     )
+    # Sube con cualquier cambio a la plantilla o a sus propiedades/intervalos (labApp/estructuras.py)
+    version = models.PositiveIntegerField(default=1, editable=False)
 
     def __str__(self):
         return self.titulo
@@ -107,19 +198,50 @@ class PropiedadPlantilla(models.Model):
     class Meta:
         verbose_name = "Propiedad de Plantilla"
         verbose_name_plural = "2. Propiedades de Plantillas (Añadir Intervalos aquí)"
+        constraints = [
+            # Los resultados se identifican por (análisis, nombre_propiedad): dos propiedades
+            # con el mismo nombre en una plantilla compartirían resultado
+            models.UniqueConstraint(fields=['plantilla', 'nombre_propiedad'], name='propiedad_unica_por_plantilla'),
+        ]
 
 # 3. Los Intervalos: Se asocian a cada Hoja/Propiedad.
+# Rango de edad continuo [edad_min, edad_max] en la unidad elegida (edad_max vacío = sin límite).
 class IntervaloReferencia(models.Model):
     propiedad = models.ForeignKey(PropiedadPlantilla, on_delete=models.CASCADE, related_name="intervalos")
-    EDADES = [("NINO", "Niño"), ("ADULTO", "Adulto"), ("ADULTO_MAYOR", "Adulto Mayor")]
+    UNIDADES_EDAD = [("DIAS", "Días"), ("MESES", "Meses"), ("ANIOS", "Años")]
+    DIAS_POR_UNIDAD = {"DIAS": 1, "MESES": 30.4375, "ANIOS": 365.25}
     SEXOS = [("MASCULINO", "Masculino"), ("FEMENINO", "Femenino"), ("AMBOS", "Ambos")]
-    grupo_edad = models.CharField(max_length=20, choices=EDADES)
+    edad_min = models.PositiveIntegerField(default=0)
+    edad_max = models.PositiveIntegerField(null=True, blank=True)
+    unidad_edad = models.CharField(max_length=5, choices=UNIDADES_EDAD, default="ANIOS")
     sexo = models.CharField(max_length=10, choices=SEXOS, default="AMBOS")
     valor_min = models.FloatField()
     valor_max = models.FloatField()
 
+    def rango_dias(self):
+        """[desde, hasta) en días; edad_max es inclusivo en su unidad (18 años llega hasta un día antes de los 19)"""
+        factor = self.DIAS_POR_UNIDAD[self.unidad_edad]
+        hasta = float('inf') if self.edad_max is None else (self.edad_max + 1) * factor
+        return self.edad_min * factor, hasta
+
+    def clean(self):
+        if self.edad_max is not None and self.edad_max < self.edad_min:
+            raise ValidationError({'edad_max': 'La edad máxima no puede ser menor que la mínima.'})
+        if not self.propiedad_id:
+            return
+        desde, hasta = self.rango_dias()
+        otros = IntervaloReferencia.objects.filter(propiedad_id=self.propiedad_id, sexo=self.sexo).exclude(pk=self.pk)
+        for otro in otros:
+            otro_desde, otro_hasta = otro.rango_dias()
+            if desde < otro_hasta and otro_desde < hasta:
+                raise ValidationError(f'El rango de edad se traslapa con {otro}.')
+
     def __str__(self):
-        return f"{self.propiedad.nombre_propiedad} ({self.grupo_edad}, {self.sexo})"
+        hasta = self.edad_max if self.edad_max is not None else '∞'
+        return f"{self.propiedad.nombre_propiedad} ({self.edad_min}-{hasta} {self.get_unidad_edad_display().lower()}, {self.sexo})"
+    class Meta:
+        # Validación de traslapes (clean) y bandas de una propiedad por sexo
+        indexes = [models.Index(fields=['propiedad', 'sexo', 'edad_min'], name='intervalo_prop_sexo_edad_idx')]
 
 #=============================================================================
 # SECCIÓN DE ANÁLISIS DEL PACIENTE
@@ -128,51 +250,259 @@ class IntervaloReferencia(models.Model):
 # 4. El Análisis: Se vincula a la Plantilla maestra.
 class Analisis(models.Model):
     paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE)
+    # Copia de paciente.laboratorio; la mantienen save(), bulk_create y la señal de Paciente
+    laboratorio = models.ForeignKey(
+        Laboratorio, on_delete=models.CASCADE, related_name='+', editable=False, db_index=False,
+    )
     plantilla = models.ForeignKey(Plantilla, on_delete=models.PROTECT, related_name='analisis', null=True, blank=True)
     fecha_analisis = models.DateTimeField(auto_now_add=True)
     fecha_muestra = models.DateField(null=True, blank=True)
     hora_toma = models.TimeField(null=True, blank=True)
     hora_impresion = models.TimeField(null=True, blank=True)
+    # Muestras de control de calidad (labApp/calidad.py): no son resultados de un paciente
+    es_control = models.BooleanField(default=False)
+    nivel_control = models.CharField(max_length=20, blank=True, help_text="Ej: Nivel 1, Normal, Patológico")
+
+    ORIGEN_LABORATORIO = 'paciente'
+    objects = PorLaboratorioQuerySet.as_manager()
 
+    def save(self, *args, **kwargs):
+        # Sigue al paciente; solo consulta si el paciente no viene cargado
+        anterior = self.laboratorio_id
+        self.laboratorio_id = self.paciente.laboratorio_id
+        if not self._state.adding and anterior is not None and anterior != self.laboratorio_id:
+            # La señal de labApp/laboratorios.py mueve sus resultados y reportes
+            self._laboratorio_anterior = anterior
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'paciente' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'laboratorio'}
+        super().save(*args, **kwargs)
     def __str__(self):
         return f"{self.plantilla.titulo} - {self.paciente.nombre}" if self.plantilla else "Análisis sin plantilla"
+    class Meta:
+        indexes = [
+            # Changelist del admin limitado a los laboratorios del usuario
+            models.Index(fields=['laboratorio', 'fecha_analisis', 'id'], name='analisis_lab_fecha_idx'),
+            # Orden y cursor del changelist del admin (labApp/paginacion.py), también filtrado por plantilla
+            models.Index(fields=['fecha_analisis', 'id'], name='analisis_fecha_id_idx'),
+            models.Index(fields=['plantilla', 'fecha_analisis', 'id'], name='analisis_plantilla_fecha_idx'),
+            # Historial de un paciente, del más reciente al más antiguo
+            models.Index(fields=['paciente', 'fecha_analisis'], name='analisis_paciente_fecha_idx'),
+        ]
 
 # 5. Los Resultados: Se generan a partir del Análisis.
 class ResultadoAnalisis(models.Model):
+    BANDERAS = [("H", "Alto"), ("L", "Bajo"), ("N", "Normal"), ("X", "No numérico")]
     analisis = models.ForeignKey(Analisis, on_delete=models.CASCADE, related_name='resultados')
+    # Copia de analisis.laboratorio
+    laboratorio = models.ForeignKey(
+        Laboratorio, on_delete=models.CASCADE, related_name='+', editable=False, db_index=False,
+    )
     loinc_code = models.ForeignKey(LoincCode, on_delete=models.PROTECT, null=True, blank=True)
     nombre_propiedad = models.CharField(max_length=100)
     valor = models.CharField(max_length=100, blank=True)
     unidad = models.CharField(max_length=20, null=True, blank=True)
+    # Calculados al guardar (labApp/resultados.py); no se editan a mano
+    valor_numerico = models.FloatField(null=True, blank=True, editable=False)
+    ref_min = models.FloatField(null=True, blank=True, editable=False)
+    ref_max = models.FloatField(null=True, blank=True, editable=False)
+    bandera = models.CharField(max_length=1, choices=BANDERAS, blank=True, default='', editable=False, db_index=True)
+    # Control de concurrencia optimista: cambia en cada guardado (ver resultados.guardar_en_lote)
+    version = models.PositiveIntegerField(default=0)
+
+    ORIGEN_LABORATORIO = 'analisis'
+    objects = PorLaboratorioQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        from .resultados import refrescar_resultado
+        refrescar_resultado(self)
+        if self.laboratorio_id is None:
+            self.laboratorio_id = self.analisis.laboratorio_id
+        if not self._state.adding:
+            self.version += 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(CAMPOS_CALCULADOS_RESULTADO) | {'version'}
+        super().save(*args, **kwargs)
     def __str__(self):
         return f"{self.nombre_propiedad}: {self.valor} {self.unidad or ''}"
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['analisis', 'nombre_propiedad'], name='resultado_unico_por_propiedad'),
+        ]
+        indexes = [models.Index(fields=['laboratorio', 'id'], name='resultado_lab_id_idx')]
 
-# 6. El Disparador: Se actualiza para usar la nueva estructura.
+CAMPOS_CALCULADOS_RESULTADO = ('valor_numerico', 'ref_min', 'ref_max', 'bandera')
+
+# 6. El Disparador: delega en el servicio de generación en lote
+# (o en la cola de tareas con LAB_TAREAS_RESULTADOS, ver labApp/tareas.py).
 @receiver(post_save, sender=Analisis)
 def crear_resultados_predeterminados(sender, instance, created, **kwargs):
-    if created and instance.plantilla and instance.plantilla.tipo_formato != 'RECETA_JUSTIFICADA':
-        paciente = instance.paciente
-        sexo_paciente = paciente.sexo
-        if paciente.edad <= 18: grupo_edad = "NINO"
-        elif paciente.edad <= 59: grupo_edad = "ADULTO"
-        else: grupo_edad = "ADULTO_MAYOR"
-
-        for propiedad in instance.plantilla.propiedades.all():
-            intervalo = propiedad.intervalos.filter(grupo_edad=grupo_edad).filter(models.Q(sexo=sexo_paciente) | models.Q(sexo="AMBOS")).first()
-            if intervalo:
-                ResultadoAnalisis.objects.create(
-                    analisis=instance,
-                    loinc_code=propiedad.loinc_code,
-                    nombre_propiedad=propiedad.nombre_propiedad,
-                    valor='',
-                    unidad=propiedad.unidad
-                )
+    if created:
+        if getattr(settings, 'LAB_TAREAS_RESULTADOS', False):
+            from .tareas import encolar
+            encolar('resultados.generar', prioridad=10, analisis_ids=[instance.pk])
+            return
+        from .resultados import generar_resultados
+        generar_resultados(instance)
 
 #------------------------ Tabla Reporte ------------------------------
 class Reporte(models.Model):
     analisis = models.ForeignKey(Analisis, on_delete=models.CASCADE, related_name="reportes")
+    # Copia de analisis.laboratorio
+    laboratorio = models.ForeignKey(
+        Laboratorio, on_delete=models.CASCADE, related_name='+', editable=False, db_index=False,
+    )
     generado_por = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True)
     fecha_generacion = models.DateTimeField(auto_now_add=True)
 
+    ORIGEN_LABORATORIO = 'analisis'
+    objects = PorLaboratorioQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if self.laboratorio_id is None:
+            self.laboratorio_id = self.analisis.laboratorio_id
+        super().save(*args, **kwargs)
     def __str__(self):
         return f"Reporte: {self.analisis.paciente.nombre} - {self.analisis.plantilla.titulo} ({self.fecha_generacion:%d-%m-%Y})"
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha_generacion', 'id'], name='reporte_fecha_id_idx'),
+            models.Index(fields=['laboratorio', 'fecha_generacion', 'id'], name='reporte_lab_fecha_idx'),
+        ]
+
+#------------------------ Tabla ClaveIdempotencia ------------------------------
+# Lotes ya procesados por la API de ingesta (labApp/ingesta.py): reenviar la misma
+# clave devuelve la respuesta guardada en lugar de volver a escribir.
+class ClaveIdempotencia(models.Model):
+    clave = models.CharField(max_length=100, unique=True)
+    huella = models.CharField(max_length=64)
+    respuesta = models.JSONField()
+    fecha_creacion = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.clave
+
+#------------------------ Tabla ArchivoIngesta ------------------------------
+# Archivos HL7/ASTM dejados por los analizadores (labApp/ingesta_archivos.py).
+# ``desplazamiento`` es el byte donde termina el último mensaje confirmado: tras
+# una caída se retoma desde ahí, a mitad de archivo.
+class ArchivoIngesta(models.Model):
+    ESTADOS = [
+        ("PENDIENTE", "Pendiente"),
+        ("PROCESANDO", "Procesando"),
+        ("COMPLETO", "Completo"),
+        ("ERROR", "Error"),
+    ]
+    ruta = models.CharField(max_length=500, unique=True)
+    tamano = models.PositiveBigIntegerField(default=0)
+    desplazamiento = models.PositiveBigIntegerField(default=0)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default="PENDIENTE", db_index=True)
+    mensajes = models.PositiveIntegerField(default=0)
+    resultados = models.PositiveIntegerField(default=0)
+    en_cuarentena = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.ruta
+
+#------------------------ Tabla ResultadoCuarentena ------------------------------
+# Observaciones que no se pudieron asignar a un resultado (análisis inexistente,
+# código LOINC que no está en la plantilla...). Se guardan tal cual para revisarlas.
+class ResultadoCuarentena(models.Model):
+    archivo = models.ForeignKey(ArchivoIngesta, on_delete=models.CASCADE, related_name="cuarentena", null=True, blank=True)
+    orden = models.CharField(max_length=100, blank=True)
+    codigo = models.CharField(max_length=100, blank=True)
+    valor = models.CharField(max_length=100, blank=True)
+    unidad = models.CharField(max_length=20, blank=True)
+    motivo = models.CharField(max_length=255)
+    segmento = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.orden} {self.codigo}: {self.motivo}"
+
+#------------------------ Tabla Tarea ------------------------------
+# Cola de trabajos en segundo plano (labApp/tareas.py), atendida por
+# ``manage.py procesar_tareas``. Mayor ``prioridad`` se atiende antes.
+class Tarea(models.Model):
+    ESTADOS = [
+        ("PENDIENTE", "Pendiente"),
+        ("EN_CURSO", "En curso"),
+        ("COMPLETA", "Completa"),
+        ("FALLIDA", "Fallida"),
+    ]
+    nombre = models.CharField(max_length=100, db_index=True)
+    argumentos = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default="PENDIENTE")
+    prioridad = models.SmallIntegerField(default=0)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=5)
+    # Con reintentos, la tarea no se vuelve a tomar antes de esta fecha
+    disponible_desde = models.DateTimeField(default=timezone.now)
+    trabajador = models.CharField(max_length=100, blank=True)
+    # Cambia en cada reclamo: solo quien tiene el token vigente puede guardar el resultado
+    token = models.CharField(max_length=32, blank=True, editable=False)
+    # Lo renueva el trabajador mientras ejecuta; sin latido reciente la tarea se da por abandonada
+    latido = models.DateTimeField(null=True, blank=True, editable=False)
+    resultado = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.nombre} #{self.pk} ({self.get_estado_display()})"
+    class Meta:
+        indexes = [
+            # El orden exacto en que los trabajadores toman las tareas. No es un índice parcial
+            # (WHERE estado = 'PENDIENTE'): con el estado como parámetro SQLite no puede usarlo
+            models.Index(
+                'estado', models.F('prioridad').desc(), 'disponible_desde', 'id', name='tarea_cola_idx',
+            ),
+            models.Index(fields=['estado', 'latido'], name='tarea_estado_latido_idx'),
+        ]
+
+#------------------------ Tabla ResumenControlDiario ------------------------------
+# Estadísticas diarias por laboratorio y propiedad (labApp/calidad.py), de los
+# resultados de pacientes y de cada nivel de control, con las reglas de Westgard
+# violadas ese día. Las escribe ``manage.py resumir_control_calidad``; los
+# tableros leen estas filas en lugar de recorrer los resultados.
+class ResumenControlDiario(models.Model):
+    laboratorio = models.ForeignKey(Laboratorio, on_delete=models.CASCADE, related_name="resumenes_control")
+    propiedad = models.ForeignKey(PropiedadPlantilla, on_delete=models.CASCADE, related_name="resumenes_control")
+    fecha = models.DateField()
+    es_control = models.BooleanField(default=False)
+    nivel = models.CharField(max_length=20, blank=True)
+    n = models.PositiveIntegerField()
+    # Sumas para combinar días (media y DE de un periodo) sin volver a los resultados
+    suma = models.FloatField()
+    suma_cuadrados = models.FloatField()
+    media = models.FloatField()
+    de = models.FloatField(null=True, blank=True)
+    cv = models.FloatField(null=True, blank=True)
+    minimo = models.FloatField()
+    maximo = models.FloatField()
+    # Media y DE contra las que se evaluaron las reglas (gráfica de Levey-Jennings)
+    media_objetivo = models.FloatField(null=True, blank=True)
+    de_objetivo = models.FloatField(null=True, blank=True)
+    violaciones = models.JSONField(default=list, blank=True)
+    rechazo = models.BooleanField(default=False)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.propiedad.nombre_propiedad} {self.fecha:%d-%m-%Y} ({self.nivel or 'pacientes'})"
+    class Meta:
+        constraints = [
+            # Serie de Levey-Jennings: (laboratorio, propiedad, nivel) en orden de fecha. es_control va
+            # al final: Django filtra los booleanos como "WHERE es_control", sin igualdad que use el índice
+            models.UniqueConstraint(
+                fields=['laboratorio', 'propiedad', 'nivel', 'fecha', 'es_control'], name='resumen_control_unico',
+            ),
+        ]
+        indexes = [
+            # Reemplazo de una ventana de días y objetivos de los días anteriores
+            models.Index(fields=['fecha', 'es_control'], name='resumen_control_fecha_idx'),
+        ]
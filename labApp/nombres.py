@@ -0,0 +1,66 @@
+# labApp/nombres.py
+#
+# Claves de búsqueda de nombres de pacientes. Sin dependencias de los modelos:
+# las usan Paciente.save(), la búsqueda del admin (labApp/busqueda.py) y el
+# comando detectar_duplicados. La migración 0018 tiene su propia copia.
+#
+#   normalizar('José  María López')  -> 'jose maria lopez'
+#   clave_nombre('López, José María') -> 'jose lopez maria'  (tokens ordenados)
+#   clave_fonetica('Josué Velázquez') -> 'belaskes josue'     (español, aproximada)
+
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+# Partículas que no distinguen a nadie ("María de la Luz" = "María Luz")
+PARTICULAS = frozenset({'de', 'del', 'la', 'las', 'los', 'y', 'e', 'da', 'van', 'von'})
+
+# Reglas en orden sobre cada token ya normalizado; las mayúsculas son marcas temporales
+_REGLAS_FONETICAS = [
+    (re.compile(r'gu(?=[ei])'), 'G'),  # guerrero: g dura
+    (re.compile(r'g(?=[ei])'), 'j'),   # gerardo = jerardo
+    (re.compile(r'qu(?=[ei])'), 'k'),
+    (re.compile(r'c(?=[ei])'), 's'),   # cecilia = sesilia
+    (re.compile(r'ch'), 'C'),
+    (re.compile(r'[cq]'), 'k'),
+    (re.compile(r'z'), 's'),
+    (re.compile(r'v'), 'b'),
+    (re.compile(r'w'), 'u'),
+    (re.compile(r'll'), 'y'),
+    (re.compile(r'y$'), 'i'),          # godoy = godoi
+    (re.compile(r'h'), ''),            # h muda
+    (re.compile(r'(.)\1+'), r'\1'),    # letras dobles
+]
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos ni signos y con un solo espacio entre palabras"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'[a-z0-9]+', sin_acentos.lower()))
+
+
+def tokens(texto):
+    return normalizar(texto).split()
+
+
+def clave_nombre(texto):
+    """Nombre normalizado con las palabras en orden alfabético: el orden de nombres y apellidos no importa"""
+    return ' '.join(sorted(tokens(texto)))
+
+
+def fonetica(token):
+    """Código fonético de una palabra ya normalizada"""
+    for patron, reemplazo in _REGLAS_FONETICAS:
+        token = patron.sub(reemplazo, token)
+    return token.replace('G', 'g').replace('C', 'ch')
+
+
+def clave_fonetica(texto):
+    """Códigos fonéticos de las palabras (sin partículas) en orden alfabético"""
+    return ' '.join(sorted(fonetica(t) for t in tokens(texto) if t not in PARTICULAS))
+
+
+def similitud(clave_a, clave_b):
+    """0..1 entre dos claves de nombre (ya ordenadas, así que compara palabra por palabra)"""
+    return SequenceMatcher(None, clave_a, clave_b).ratio()
@@ -0,0 +1,151 @@
+# labApp/paginacion.py
+#
+# Paginación para los changelists grandes del admin (Analisis,
+# ResultadoAnalisis, Reporte):
+#   - Paginación por cursor (keyset) sobre el orden por defecto, p. ej.
+#     (-fecha_analisis, -id): cada página es un rango sobre el índice en lugar
+#     de un OFFSET que recorre todas las filas anteriores.
+#   - Conteos estimados o en caché: por encima de LAB_ADMIN_CONTEO_UMBRAL filas
+#     el total de la tabla sin filtros se estima (pg_class.reltuples en
+#     PostgreSQL, MAX(id) en SQLite) y los conteos con filtros se guardan
+#     LAB_ADMIN_CONTEO_TTL segundos en la caché de Django.
+
+import hashlib
+
+from django.conf import settings
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+CURSOR_VAR = 'c'
+
+
+def estimar_filas(modelo, using='default'):
+    """Número aproximado de filas de la tabla, sin recorrerla (None si no se puede estimar)"""
+    conexion = connections[using]
+    if conexion.vendor == 'postgresql':
+        with conexion.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [modelo._meta.db_table])
+            fila = cursor.fetchone()
+        return int(fila[0]) if fila and fila[0] >= 0 else None
+    if conexion.vendor == 'sqlite':
+        # Con ids autoincrementales y pocos borrados, MAX(id) es una buena cota y sale del índice
+        return modelo._default_manager.using(using).aggregate(maximo=Max('pk'))['maximo'] or 0
+    return None
+
+
+def conteo(queryset):
+    """COUNT(*) del queryset: estimado para tablas grandes sin filtro, en caché para lo demás"""
+    umbral = getattr(settings, 'LAB_ADMIN_CONTEO_UMBRAL', 100000)
+    if not queryset.query.where:
+        estimado = estimar_filas(queryset.model, queryset.db)
+        if estimado is not None and estimado > umbral:
+            return estimado, True
+    sql, parametros = queryset.query.sql_with_params()
+    clave = 'labApp:conteo:' + hashlib.md5(f'{sql}{parametros!r}'.encode('utf-8')).hexdigest()
+    total = cache.get(clave)
+    if total is None:
+        total = queryset.count()
+        if total > umbral:
+            cache.set(clave, total, getattr(settings, 'LAB_ADMIN_CONTEO_TTL', 60))
+    return total, False
+
+
+class PaginadorConteoEstimado(Paginator):
+    @cached_property
+    def count(self):
+        total, self.estimado = conteo(self.object_list)
+        return total
+
+
+class ChangeListKeyset(ChangeList):
+    """ChangeList que, con el orden por defecto, pagina por cursor en lugar de OFFSET"""
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.keyset_activo = False
+        self.cursor_siguiente = None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        parametros = super().get_filters_params(params)
+        parametros.pop(CURSOR_VAR, None)
+        return parametros
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Cambiar de orden o de filtro regresa a la primera página
+        new_params = new_params or {}
+        if CURSOR_VAR not in new_params:
+            remove = list(remove or []) + [CURSOR_VAR]
+        return super().get_query_string(new_params, remove)
+
+    def get_results(self, request):
+        if ORDER_VAR in self.params or self.show_all:
+            return super().get_results(request)
+
+        campos = self.model_admin.keyset_campos
+        queryset = self.queryset.order_by(*[f'-{campo}' for campo in campos])
+        if self.cursor:
+            queryset = queryset.filter(self._condicion_cursor(campos))
+        filas = list(queryset[:self.list_per_page + 1])
+        hay_siguiente = len(filas) > self.list_per_page
+        filas = filas[:self.list_per_page]
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = paginator.count
+        self.conteo_estimado = getattr(paginator, 'estimado', False)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = filas
+        self.can_show_all = False
+        self.multi_page = hay_siguiente or bool(self.cursor)
+        self.paginator = paginator
+        self.keyset_activo = True
+        if hay_siguiente:
+            ultimo = filas[-1]
+            self.cursor_siguiente = self.get_query_string({
+                CURSOR_VAR: '_'.join(self._codificar(getattr(ultimo, campo)) for campo in campos),
+            })
+        self.url_primera_pagina = self.get_query_string(remove=[CURSOR_VAR])
+
+    def _codificar(self, valor):
+        return valor.isoformat() if hasattr(valor, 'isoformat') else str(valor)
+
+    def _condicion_cursor(self, campos):
+        """(a, b) < (cursor_a, cursor_b) en orden descendente, como OR de rangos sobre el índice"""
+        partes = self.cursor.rsplit('_', len(campos) - 1)
+        if len(partes) != len(campos):
+            raise IncorrectLookupParameters
+        valores = []
+        for campo, parte in zip(campos, partes):
+            try:
+                valor = self.lookup_opts.get_field(campo).to_python(parte)
+            except ValidationError:
+                raise IncorrectLookupParameters
+            if valor is None:
+                raise IncorrectLookupParameters
+            valores.append(valor)
+        condicion = Q()
+        for i, campo in enumerate(campos):
+            iguales = {campos[j]: valores[j] for j in range(i)}
+            condicion |= Q(**iguales, **{f'{campo}__lt': valores[i]})
+        return condicion
+
+
+class PaginacionKeysetMixin:
+    """Mixin de ModelAdmin: cursor sobre ``keyset_campos`` (descendente) y conteos estimados"""
+    keyset_campos = ('id',)
+    paginator = PaginadorConteoEstimado
+    show_full_result_count = False
+
+    def get_ordering(self, request):
+        return self.ordering or [f'-{campo}' for campo in self.keyset_campos]
+
+    def get_changelist(self, request, **kwargs):
+        return ChangeListKeyset
@@ -0,0 +1,411 @@
+# labApp/reportes.py
+#
+# Generación de los PDF de un Analisis (los que se ven/reimprimen desde
+# Reporte). El PDF se guarda en disco con el hash de su contenido como nombre:
+# mientras no cambien el análisis, sus resultados, rangos o la marca del
+# laboratorio, volver a verlo o reimprimirlo es solo enviar el archivo.
+#
+# Configuración (settings.py, opcional):
+#   LAB_PDF_RENDERIZADOR   ruta a la clase renderizadora
+#                          (por defecto ReportLabRenderizador)
+#   LAB_PDF_CACHE_DIR      carpeta de la caché (por defecto MEDIA_ROOT/reportes_cache)
+#   LAB_PDF_PROCESOS       procesos para generar lotes (por defecto os.cpu_count())
+
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.utils.text import slugify
+
+from . import estructuras, imagenes, reportes_trabajador
+from .models import Analisis, LoincCode, Reporte, ResultadoAnalisis
+
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_JUSTIFY
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+except ImportError:
+    SimpleDocTemplate = None
+
+logger = logging.getLogger(__name__)
+
+# Se incrementa cuando cambia el diseño de los PDF para no servir versiones viejas
+VERSION_FORMATO = 1
+
+ETIQUETAS_BANDERA = {'H': 'Alto', 'L': 'Bajo'}
+
+
+# -------------------------------
+# Contexto: datos planos del análisis
+# -------------------------------
+def construir_contexto(analisis):
+    """Todo lo que aparece en el PDF, como datos planos (serializables y picklables)"""
+    paciente = analisis.paciente
+    laboratorio = paciente.laboratorio
+    plantilla = analisis.plantilla
+    logo = None
+    if laboratorio.logo:
+        # La variante "reporte" (labApp/imagenes.py) en lugar del original de varios MB
+        reducido = imagenes.variante(laboratorio, 'reporte')
+        try:
+            if reducido:
+                almacen = laboratorio.logo.storage
+                logo = {'ruta': almacen.path(reducido['ruta']), 'nombre': reducido['ruta'], 'tamano': reducido['bytes']}
+            else:
+                logo = {'ruta': laboratorio.logo.path, 'nombre': laboratorio.logo.name, 'tamano': laboratorio.logo.size}
+        except (OSError, NotImplementedError):
+            logo = None  # El archivo ya no existe o el storage no es local
+    # Encabezado y códigos LOINC desde la estructura en caché de la plantilla (labApp/estructuras.py)
+    estructura = estructuras.obtener(plantilla) if plantilla else None
+    loinc = {p['loinc_id']: p['loinc_num'] for p in estructura['propiedades']} if estructura else {}
+    resultados = list(analisis.resultados.all())
+    faltantes = {r.loinc_code_id for r in resultados if r.loinc_code_id and r.loinc_code_id not in loinc}
+    if faltantes:
+        # Resultados con un LOINC que ya no está en la plantilla
+        loinc.update(LoincCode.objects.filter(pk__in=faltantes).values_list('id', 'loinc_num'))
+    return {
+        'laboratorio': {
+            'nombre': laboratorio.nombre_laboratorio,
+            'ciudad': laboratorio.ciudad,
+            'estado': laboratorio.estado,
+            'pais': laboratorio.pais,
+            'codigo_postal': laboratorio.codigo_postal,
+            'logo': logo,
+        },
+        'paciente': {'nombre': paciente.nombre, 'edad': paciente.edad, 'sexo': paciente.get_sexo_display()},
+        'analisis': {
+            'id': analisis.id,
+            'fecha_analisis': timezone.localtime(analisis.fecha_analisis),
+            'fecha_muestra': analisis.fecha_muestra,
+            'hora_toma': analisis.hora_toma,
+            'hora_impresion': analisis.hora_impresion,
+        },
+        'plantilla': {
+            'titulo': estructura['titulo'] if estructura else 'Análisis',
+            'tipo_formato': estructura['tipo_formato'] if estructura else 'RESULTADOS',
+            'texto': estructura['texto'] if estructura else '',
+        },
+        'resultados': [
+            {
+                'nombre': r.nombre_propiedad,
+                'valor': r.valor,
+                'unidad': r.unidad or '',
+                'ref_min': r.ref_min,
+                'ref_max': r.ref_max,
+                'bandera': r.bandera,
+                'loinc': loinc.get(r.loinc_code_id, ''),
+            }
+            for r in resultados
+        ],
+    }
+
+
+def analisis_para_reporte(analisis_ids):
+    """Análisis con todo lo necesario para construir_contexto() en dos consultas (más la estructura de cada plantilla)"""
+    return (
+        Analisis.objects.filter(pk__in=analisis_ids)
+        .select_related('paciente__laboratorio', 'plantilla')
+        .prefetch_related(Prefetch('resultados', queryset=ResultadoAnalisis.objects.order_by('id')))
+    )
+
+
+def huella(contexto, renderizador):
+    contenido = json.dumps(
+        [VERSION_FORMATO, renderizador.nombre, contexto], sort_keys=True, default=str, ensure_ascii=False,
+    )
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+# -------------------------------
+# Renderizadores
+# -------------------------------
+class Renderizador:
+    """Convierte un contexto de construir_contexto() en los bytes de un PDF"""
+    nombre = 'base'
+
+    def renderizar(self, contexto):
+        raise NotImplementedError
+
+
+class ReportLabRenderizador(Renderizador):
+    nombre = 'reportlab'
+
+    def __init__(self):
+        if SimpleDocTemplate is None:
+            raise ImproperlyConfigured(
+                'ReportLabRenderizador necesita reportlab (pip install reportlab) '
+                'o define LAB_PDF_RENDERIZADOR con otro renderizador.'
+            )
+
+    def renderizar(self, contexto):
+        estilos = getSampleStyleSheet()
+        buffer = io.BytesIO()
+        documento = SimpleDocTemplate(
+            buffer, pagesize=letter, title=contexto['plantilla']['titulo'],
+            leftMargin=2 * cm, rightMargin=2 * cm, topMargin=1.5 * cm, bottomMargin=1.5 * cm,
+        )
+        elementos = self._encabezado(contexto, estilos)
+        elementos.append(Spacer(1, 0.5 * cm))
+        elementos.append(Paragraph(escape(contexto['plantilla']['titulo']), estilos['Heading2']))
+
+        formato = contexto['plantilla']['tipo_formato']
+        if formato == 'RECETA_JUSTIFICADA':
+            justificado = ParagraphStyle('justificado', parent=estilos['BodyText'], alignment=TA_JUSTIFY, leading=16)
+            for parrafo in contexto['plantilla']['texto'].split('\n\n'):
+                if parrafo.strip():
+                    elementos.append(Paragraph(escape(parrafo.strip()).replace('\n', '<br/>'), justificado))
+                    elementos.append(Spacer(1, 0.3 * cm))
+        else:
+            elementos.append(self._tabla_resultados(contexto, estilos))
+            if formato == 'IMAGENES_RESULTADOS':
+                # Aún no hay imágenes por análisis en el modelo; se reserva su espacio en la hoja
+                elementos.append(Spacer(1, 0.5 * cm))
+                elementos.append(Paragraph('Imágenes', estilos['Heading3']))
+                elementos.append(Spacer(1, 6 * cm))
+
+        documento.build(elementos)
+        return buffer.getvalue()
+
+    def _encabezado(self, contexto, estilos):
+        laboratorio = {k: escape(v) if isinstance(v, str) else v for k, v in contexto['laboratorio'].items()}
+        paciente = {k: escape(v) if isinstance(v, str) else v for k, v in contexto['paciente'].items()}
+        analisis = contexto['analisis']
+        datos_lab = Paragraph(
+            f"<b>{laboratorio['nombre']}</b><br/>{laboratorio['ciudad']}, {laboratorio['estado']}, "
+            f"{laboratorio['pais']} {laboratorio['codigo_postal']}",
+            estilos['Normal'],
+        )
+        logo = ''
+        if laboratorio['logo']:
+            try:
+                logo = Image(laboratorio['logo']['ruta'], width=3 * cm, height=3 * cm, kind='proportional')
+            except OSError:
+                logo = ''
+        fecha = analisis['fecha_muestra'] or analisis['fecha_analisis']
+        datos_paciente = Paragraph(
+            f"<b>Paciente:</b> {paciente['nombre']}<br/>"
+            f"<b>Edad:</b> {paciente['edad']} años &nbsp; <b>Sexo:</b> {paciente['sexo']}<br/>"
+            f"<b>Fecha:</b> {fecha:%d-%m-%Y}"
+            + (f" &nbsp; <b>Hora de toma:</b> {analisis['hora_toma']:%H:%M}" if analisis['hora_toma'] else '')
+            + f"<br/><b>Folio:</b> {analisis['id']}",
+            estilos['Normal'],
+        )
+        tabla = Table([[logo, datos_lab], ['', datos_paciente]], colWidths=[3.5 * cm, None])
+        tabla.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'TOP'), ('SPAN', (0, 0), (0, 1))]))
+        return [tabla]
+
+    def _tabla_resultados(self, contexto, estilos):
+        filas = [['Propiedad', 'Resultado', 'Unidad', 'Rango de referencia']]
+        resaltadas = []
+        for i, resultado in enumerate(contexto['resultados'], start=1):
+            rango = ''
+            if resultado['ref_min'] is not None and resultado['ref_max'] is not None:
+                rango = f"{resultado['ref_min']:g} - {resultado['ref_max']:g}"
+            valor = resultado['valor']
+            if resultado['bandera'] in ETIQUETAS_BANDERA:
+                valor = f"{valor} ({ETIQUETAS_BANDERA[resultado['bandera']]})"
+                resaltadas.append(i)
+            filas.append([Paragraph(escape(resultado['nombre']), estilos['Normal']), valor, resultado['unidad'], rango])
+        tabla = Table(filas, colWidths=[7 * cm, 3.5 * cm, 2.5 * cm, 4 * cm], repeatRows=1)
+        estilo = [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0d64ba')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('LINEBELOW', (0, 1), (-1, -1), 0.25, colors.lightgrey),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]
+        for fila in resaltadas:
+            estilo += [('TEXTCOLOR', (1, fila), (1, fila), colors.red), ('FONTNAME', (1, fila), (1, fila), 'Helvetica-Bold')]
+        tabla.setStyle(TableStyle(estilo))
+        return tabla
+
+
+_renderizador = None
+_renderizador_lock = threading.Lock()
+
+
+def obtener_renderizador():
+    global _renderizador
+    ruta = getattr(settings, 'LAB_PDF_RENDERIZADOR', 'labApp.reportes.ReportLabRenderizador')
+    if _renderizador is None or _renderizador[0] != ruta:
+        with _renderizador_lock:
+            _renderizador = (ruta, import_string(ruta)())
+    return _renderizador[1]
+
+
+# -------------------------------
+# Caché en disco
+# -------------------------------
+class CachePDF:
+    """PDFs en disco con nombre = hash del contenido; también lleva la cuenta de aciertos y fallos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.estadisticas = {'aciertos': 0, 'fallos': 0, 'ms_aciertos': 0.0, 'ms_fallos': 0.0}
+
+    @property
+    def directorio(self):
+        return Path(getattr(settings, 'LAB_PDF_CACHE_DIR', None) or Path(settings.MEDIA_ROOT) / 'reportes_cache')
+
+    def ruta(self, clave):
+        return self.directorio / clave[:2] / f'{clave}.pdf'
+
+    def guardar(self, clave, contenido):
+        ruta = self.ruta(clave)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        # Escritura atómica: otro proceso nunca ve un PDF a medias
+        descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as archivo:
+            archivo.write(contenido)
+        os.replace(temporal, ruta)
+        return ruta
+
+    def registrar(self, acierto, milisegundos):
+        with self._lock:
+            self.estadisticas['aciertos' if acierto else 'fallos'] += 1
+            self.estadisticas['ms_aciertos' if acierto else 'ms_fallos'] += milisegundos
+
+
+cache_pdf = CachePDF()
+
+
+def obtener_pdf(analisis, renderizador=None):
+    """Ruta al PDF del análisis (renderizándolo solo si no está en caché) y su hash.
+
+    ``analisis`` debe venir de analisis_para_reporte() para no hacer consultas extra.
+    """
+    inicio = time.perf_counter()
+    renderizador = renderizador or obtener_renderizador()
+    contexto = construir_contexto(analisis)
+    clave = huella(contexto, renderizador)
+    ruta = cache_pdf.ruta(clave)
+    acierto = ruta.exists()
+    if not acierto:
+        ruta = cache_pdf.guardar(clave, renderizador.renderizar(contexto))
+    milisegundos = (time.perf_counter() - inicio) * 1000
+    cache_pdf.registrar(acierto, milisegundos)
+    logger.info(
+        'PDF análisis %s: %s en %.1f ms', analisis.pk, 'caché' if acierto else 'renderizado', milisegundos,
+    )
+    return ruta, clave
+
+
+# -------------------------------
+# Generación en lote
+# -------------------------------
+def nombre_archivo(analisis):
+    titulo = analisis.plantilla.titulo if analisis.plantilla else 'analisis'
+    return f'{analisis.id}_{slugify(analisis.paciente.nombre)}_{slugify(titulo)}.pdf'
+
+
+def generar_lote(analisis_ids, procesos=None, tamano_bloque=200, mp_contexto='spawn'):
+    """Genera los PDF de muchos análisis repartiendo el renderizado en un pool de procesos.
+
+    Es un generador de (analisis, nombre_archivo, ruta) que entrega cada PDF en
+    cuanto está listo: primero los que ya estaban en caché y luego los demás
+    según terminan. Procesa ``tamano_bloque`` análisis a la vez para que la
+    memoria no crezca con el tamaño del lote.
+    """
+    renderizador = obtener_renderizador()
+    analisis_ids = list(analisis_ids)
+    procesos = procesos or getattr(settings, 'LAB_PDF_PROCESOS', None) or os.cpu_count() or 1
+    pool = None
+    try:
+        for inicio in range(0, len(analisis_ids), tamano_bloque):
+            pendientes = {}
+            for analisis in analisis_para_reporte(analisis_ids[inicio:inicio + tamano_bloque]).order_by('id'):
+                contexto = construir_contexto(analisis)
+                clave = huella(contexto, renderizador)
+                ruta = cache_pdf.ruta(clave)
+                if ruta.exists():
+                    cache_pdf.registrar(True, 0.0)
+                    yield analisis, nombre_archivo(analisis), ruta
+                elif procesos <= 1:
+                    yield analisis, nombre_archivo(analisis), cache_pdf.guardar(clave, renderizador.renderizar(contexto))
+                else:
+                    if pool is None:
+                        pool = ProcessPoolExecutor(
+                            max_workers=procesos, mp_context=multiprocessing.get_context(mp_contexto),
+                            initializer=reportes_trabajador.iniciar,
+                        )
+                    pendientes[pool.submit(reportes_trabajador.renderizar, contexto, clave)] = analisis
+            for futuro in as_completed(pendientes):
+                analisis = pendientes[futuro]
+                cache_pdf.registrar(False, 0.0)
+                yield analisis, nombre_archivo(analisis), Path(futuro.result())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+class _SalidaZip:
+    """Destino de escritura para ZipFile que acumula lo escrito hasta que se vacía"""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+def zip_en_flujo(archivos):
+    """Genera los bytes de un ZIP a partir de (nombre, ruta) sin armarlo completo en memoria"""
+    salida = _SalidaZip()
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_DEFLATED) as archivo_zip:
+        for nombre, ruta in archivos:
+            archivo_zip.write(ruta, arcname=nombre)
+            yield salida.vaciar()
+    yield salida.vaciar()
+
+
+def reportes_zip(analisis_ids, generado_por=None, procesos=None, estadisticas=None):
+    """Bytes de un ZIP con los PDF de ``analisis_ids``; al terminar crea sus Reporte en bloque.
+
+    ``estadisticas`` (dict opcional) recibe total, segundos y reportes_por_segundo.
+    """
+    generados = []
+    inicio = time.perf_counter()
+
+    def archivos():
+        for analisis, nombre, ruta in generar_lote(analisis_ids, procesos=procesos):
+            generados.append(analisis.id)
+            yield nombre, ruta
+
+    yield from zip_en_flujo(archivos())
+
+    Reporte.objects.bulk_create([Reporte(analisis_id=pk, generado_por=generado_por) for pk in generados])
+    segundos = time.perf_counter() - inicio
+    resumen = {
+        'total': len(generados), 'segundos': segundos,
+        'reportes_por_segundo': len(generados) / segundos if segundos else 0.0,
+    }
+    if estadisticas is not None:
+        estadisticas.update(resumen)
+    logger.info('Lote de %(total)s reportes en %(segundos).1f s (%(reportes_por_segundo).1f reportes/s)', resumen)
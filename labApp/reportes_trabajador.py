@@ -0,0 +1,18 @@
+# labApp/reportes_trabajador.py
+#
+# Funciones que corren dentro de los procesos del pool de generar_lote().
+# Este módulo no importa modelos al cargarse: con el contexto 'spawn' el
+# proceso hijo lo importa antes de que Django esté configurado.
+
+import os
+
+
+def iniciar():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LabConriquezConfig.settings')
+    import django
+    django.setup()
+
+
+def renderizar(contexto, clave):
+    from .reportes import cache_pdf, obtener_renderizador
+    return str(cache_pdf.guardar(clave, obtener_renderizador().renderizar(contexto)))
@@ -0,0 +1,274 @@
+# labApp/resultados.py
+#
+# Generación de los ResultadoAnalisis vacíos de un análisis a partir de las
+# propiedades de su plantilla. Es el único camino para crearlos: lo usan la
+# señal post_save de Analisis y la captura de órdenes en lote.
+#
+# También calcula los campos denormalizados de cada resultado (valor numérico,
+# rango de referencia y bandera H/L/N/X) para que el admin y los reportes
+# filtren y cuenten anormales en SQL.
+#
+# Configuración (settings.py, opcional):
+#   LAB_TAREAS_RESULTADOS   True para que el recálculo al cambiar un intervalo
+#                           se encole (labApp/tareas.py) en vez de correr al
+#                           confirmar la transacción (por defecto False)
+
+import math
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import estructuras
+from .intervalos import dias_de_edad, fecha_referencia, intervalos
+from .models import (
+    Analisis, IntervaloReferencia, Paciente, PropiedadPlantilla, ResultadoAnalisis,
+    CAMPOS_CALCULADOS_RESULTADO,
+)
+
+
+def generar_resultados(analisis, batch_size=1000):
+    """Crea los resultados de uno o varios análisis con un solo bulk_create.
+
+    Acepta un Analisis o una lista (p. ej. la devuelta por
+    ``Analisis.objects.bulk_create``). Es idempotente: la restricción única
+    (analisis, nombre_propiedad) hace que las filas ya existentes se ignoren.
+    Solo se crean propiedades con intervalo para la edad y el sexo del
+    paciente, igual que antes.
+    """
+    if isinstance(analisis, Analisis):
+        analisis = [analisis]
+    analisis = [a for a in analisis if a.plantilla_id]
+    if not analisis:
+        return []
+
+    # Estructura de cada plantilla desde la caché versionada; sin consulta de
+    # versiones para las plantillas que ya vienen cargadas (formulario del admin)
+    plantillas = estructuras.obtener_varias(
+        {a.plantilla_id for a in analisis},
+        {a.plantilla_id: a.plantilla.version for a in analisis if Analisis.plantilla.is_cached(a)},
+    )
+
+    # Pacientes que no vengan ya cargados en el análisis, en una sola consulta
+    faltantes = {a.paciente_id for a in analisis if not Analisis.paciente.is_cached(a)}
+    pacientes = Paciente.objects.only('edad', 'fecha_nacimiento', 'sexo').in_bulk(faltantes) if faltantes else {}
+
+    # Todos los pares (análisis, propiedad) se resuelven en una sola llamada al índice
+    pares = []
+    for a in analisis:
+        plantilla = plantillas.get(a.plantilla_id)
+        if plantilla is None or plantilla['tipo_formato'] == 'RECETA_JUSTIFICADA':
+            continue
+        paciente = a.paciente if Analisis.paciente.is_cached(a) else pacientes[a.paciente_id]
+        dias = dias_de_edad(paciente, fecha_referencia(a))
+        pares += [(a, propiedad, dias, paciente.sexo) for propiedad in plantilla['propiedades']]
+    minimos, maximos = intervalos.resolver_lote(
+        [propiedad['id'] for _, propiedad, _, _ in pares],
+        [dias for _, _, dias, _ in pares],
+        [sexo for _, _, _, sexo in pares],
+    )
+
+    nuevos = []
+    for (a, propiedad, _, _), ref_min, ref_max in zip(pares, minimos, maximos):
+        if not math.isnan(ref_min):
+            nuevos.append(ResultadoAnalisis(
+                analisis=a,
+                loinc_code_id=propiedad['loinc_id'],
+                nombre_propiedad=propiedad['nombre'],
+                valor='',
+                unidad=propiedad['unidad'],
+                ref_min=float(ref_min),
+                ref_max=float(ref_max),
+            ))
+    return ResultadoAnalisis.objects.bulk_create(nuevos, batch_size=batch_size, ignore_conflicts=True)
+
+
+def parsear_valor(valor):
+    """Valor numérico de un resultado capturado como texto ('5.2', '5,2'), o None"""
+    try:
+        numero = float((valor or '').strip().replace(',', '.'))
+    except ValueError:
+        return None
+    return numero if math.isfinite(numero) else None
+
+
+def calcular_campos(valor, intervalo):
+    """(valor_numerico, ref_min, ref_max, bandera) para un valor y su intervalo (o None)"""
+    ref_min, ref_max = intervalo if intervalo else (None, None)
+    numero = parsear_valor(valor)
+    if not (valor or '').strip():
+        bandera = ''
+    elif numero is None:
+        bandera = 'X'
+    elif intervalo is None:
+        bandera = ''
+    elif numero < ref_min:
+        bandera = 'L'
+    elif numero > ref_max:
+        bandera = 'H'
+    else:
+        bandera = 'N'
+    return numero, ref_min, ref_max, bandera
+
+
+def asignar_campos(resultado, intervalo):
+    """Actualiza en memoria los campos calculados; True si alguno cambió"""
+    nuevos = calcular_campos(resultado.valor, intervalo)
+    actuales = tuple(getattr(resultado, campo) for campo in CAMPOS_CALCULADOS_RESULTADO)
+    if nuevos == actuales:
+        return False
+    for campo, valor in zip(CAMPOS_CALCULADOS_RESULTADO, nuevos):
+        setattr(resultado, campo, valor)
+    return True
+
+
+def refrescar_resultado(resultado):
+    """Recalcula los campos de un resultado antes de guardarlo (ResultadoAnalisis.save)"""
+    return asignar_campos(resultado, intervalos.resolver_resultado(resultado))
+
+
+def recalcular_resultados(queryset, batch_size=2000):
+    """Recalcula en lote los campos de ``queryset`` y guarda solo las filas que cambian.
+
+    Devuelve el número de filas actualizadas.
+    """
+    actualizados = 0
+    lote = []
+    filas = queryset.select_related('analisis__paciente').only(
+        'valor', 'nombre_propiedad', *CAMPOS_CALCULADOS_RESULTADO,
+        'analisis__plantilla_id', 'analisis__fecha_analisis', 'analisis__fecha_muestra',
+        'analisis__paciente__edad', 'analisis__paciente__fecha_nacimiento', 'analisis__paciente__sexo',
+    ).order_by('id')
+    for resultado in filas.iterator(chunk_size=batch_size):
+        lote.append(resultado)
+        if len(lote) >= batch_size:
+            actualizados += _recalcular_lote(lote)
+            lote = []
+    if lote:
+        actualizados += _recalcular_lote(lote)
+    return actualizados
+
+
+def rangos_en_lote(resultados):
+    """{id(resultado): (ref_min, ref_max) o None} resolviendo todos los resultados con una llamada al índice"""
+    propiedad_ids, dias, sexos, con_propiedad = [], [], [], []
+    for resultado in resultados:
+        analisis = resultado.analisis
+        propiedad_id = intervalos.propiedad_id(analisis.plantilla_id, resultado.nombre_propiedad)
+        if propiedad_id is None:
+            continue
+        con_propiedad.append(resultado)
+        propiedad_ids.append(propiedad_id)
+        dias.append(dias_de_edad(analisis.paciente, fecha_referencia(analisis)))
+        sexos.append(analisis.paciente.sexo)
+    minimos, maximos = intervalos.resolver_lote(propiedad_ids, dias, sexos)
+    return {
+        id(resultado): None if math.isnan(ref_min) else (float(ref_min), float(ref_max))
+        for resultado, ref_min, ref_max in zip(con_propiedad, minimos, maximos)
+    }
+
+
+def _recalcular_lote(resultados):
+    rangos = rangos_en_lote(resultados)
+    cambiados = [r for r in resultados if asignar_campos(r, rangos.get(id(r)))]
+    if not cambiados:
+        return 0
+    return _guardar_calculados(cambiados)
+
+
+def _guardar_calculados(resultados):
+    with transaction.atomic():
+        ResultadoAnalisis.objects.bulk_update(resultados, CAMPOS_CALCULADOS_RESULTADO)
+    return len(resultados)
+
+
+class ConflictoVersion(Exception):
+    """Otro usuario guardó alguno de los resultados después de que se leyeron"""
+
+    def __init__(self, resultados):
+        self.resultados = resultados
+        nombres = ', '.join(r.nombre_propiedad for r in resultados)
+        super().__init__(f'Resultados modificados por otro usuario: {nombres}')
+
+
+def guardar_en_lote(resultados, campos=('valor',)):
+    """Guarda resultados editados con un solo bulk_update en una transacción.
+
+    Cada resultado debe traer en ``version`` la versión con la que se leyó;
+    si en la base ya es otra (otro técnico guardó antes) no se guarda nada y se
+    lanza ConflictoVersion. Los campos calculados se recalculan en lote.
+    Los resultados necesitan ``analisis`` y su paciente cargados.
+    """
+    if not resultados:
+        return []
+    with transaction.atomic():
+        actuales = dict(
+            ResultadoAnalisis.objects.select_for_update()
+            .filter(pk__in=[r.pk for r in resultados]).values_list('pk', 'version')
+        )
+        conflictos = [r for r in resultados if actuales.get(r.pk) != r.version]
+        if conflictos:
+            raise ConflictoVersion(conflictos)
+        rangos = rangos_en_lote(resultados)
+        for resultado in resultados:
+            asignar_campos(resultado, rangos.get(id(resultado)))
+            resultado.version += 1
+        ResultadoAnalisis.objects.bulk_update(
+            resultados, [*campos, *CAMPOS_CALCULADOS_RESULTADO, 'version'],
+        )
+    return resultados
+
+
+def recalcular_propiedades(propiedad_ids):
+    """Recalcula los resultados de las propiedades cuyos intervalos cambiaron"""
+    filtro = Q()
+    for plantilla_id, nombre in PropiedadPlantilla.objects.filter(pk__in=propiedad_ids).values_list(
+        'plantilla_id', 'nombre_propiedad',
+    ):
+        filtro |= Q(analisis__plantilla_id=plantilla_id, nombre_propiedad=nombre)
+    if not filtro:
+        return 0  # Propiedades borradas junto con sus intervalos
+    return recalcular_resultados(ResultadoAnalisis.objects.filter(filtro))
+
+
+# Propiedades con intervalos cambiados pendientes de recalcular, por hilo y alias de conexión
+_pendientes = threading.local()
+
+
+def _propiedades_pendientes(alias):
+    if not hasattr(_pendientes, 'por_alias'):
+        _pendientes.por_alias = {}
+    return _pendientes.por_alias.setdefault(alias, set())
+
+
+def _recalcular_pendientes(alias):
+    propiedad_ids = _propiedades_pendientes(alias)
+    if not propiedad_ids:
+        return  # Ya las recalculó otra llamada de esta misma transacción
+    propiedad_ids = sorted(propiedad_ids)
+    _propiedades_pendientes(alias).clear()
+    if getattr(settings, 'LAB_TAREAS_RESULTADOS', False):
+        from .tareas import encolar
+        encolar('resultados.recalcular_propiedades', propiedad_ids=propiedad_ids)
+        return
+    recalcular_propiedades(propiedad_ids)
+
+
+@receiver(post_save, sender=IntervaloReferencia)
+@receiver(post_delete, sender=IntervaloReferencia)
+def refrescar_rangos(sender, instance, raw=False, using='default', **kwargs):
+    """Al cambiar un intervalo se actualiza el rango guardado en los resultados de esa propiedad.
+
+    Se recalcula al confirmar la transacción, una sola vez con todas las
+    propiedades tocadas (un formset que edita N intervalos no recalcula N
+    veces). Con LAB_TAREAS_RESULTADOS va a la cola de tareas.
+    """
+    if raw:
+        return
+    _propiedades_pendientes(using).add(instance.propiedad_id)
+    # La primera llamada que corre al confirmar vacía el conjunto y las demás no hacen nada;
+    # registrar una por señal evita perder el recálculo si un savepoint se revierte
+    transaction.on_commit(lambda: _recalcular_pendientes(using), using=using)
@@ -0,0 +1,20 @@
+# labApp/senales.py
+#
+# Señales que emite labApp para quien quiera medirlas, sin que la app dependa
+# de ese código: el proyecto (LabConriquezConfig/metricas.py) escucha
+# cache_consultada y la publica en /metrics. version_plantilla avisa al
+# índice de intervalos (labApp/intervalos.py) sin que estructuras.py lo importe.
+
+from django.dispatch import Signal
+
+# Una lectura de una caché propia de la app. Argumentos: nombre ('intervalos',
+# 'plantillas'...) y acierto (True si no hizo falta ir a la base de datos)
+cache_consultada = Signal()
+
+
+def contar_cache(nombre, acierto):
+    cache_consultada.send(sender=None, nombre=nombre, acierto=acierto)
+
+
+# Este proceso subió Plantilla.version de una o más plantillas (labApp/estructuras.py)
+version_plantilla = Signal()
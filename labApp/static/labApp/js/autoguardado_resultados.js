@@ -0,0 +1,54 @@
+// Autoguardado de valores en el inline de resultados del análisis.
+// Al cambiar un valor se envía solo ese resultado a
+// <analisis>/resultados/<id>/valor/ y se actualiza la versión oculta del
+// formulario, para que el "Guardar" final no lo marque como conflicto.
+'use strict';
+{
+    const PATRON_VALOR = /^resultados-(\d+)-valor$/;
+
+    function campo(indice, nombre) {
+        return document.querySelector(`[name="resultados-${indice}-${nombre}"]`);
+    }
+
+    function marcar(input, color, titulo) {
+        input.style.outline = color ? `2px solid ${color}` : '';
+        input.title = titulo || '';
+    }
+
+    async function guardar(input, indice) {
+        const id = campo(indice, 'id');
+        const version = campo(indice, 'version');
+        if (!id || !id.value || !version) {
+            return;
+        }
+        const token = document.querySelector('[name=csrfmiddlewaretoken]').value;
+        let respuesta;
+        try {
+            respuesta = await fetch(`../resultados/${id.value}/valor/`, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json', 'X-CSRFToken': token},
+                body: JSON.stringify({valor: input.value, version: Number(version.value)}),
+                credentials: 'same-origin',
+            });
+        } catch (error) {
+            marcar(input, 'orange', 'No se pudo autoguardar; se guardará con el formulario.');
+            return;
+        }
+        const datos = await respuesta.json();
+        if (respuesta.ok) {
+            version.value = datos.version;
+            marcar(input, datos.bandera === 'H' || datos.bandera === 'L' ? 'red' : 'green', 'Guardado');
+        } else if (respuesta.status === 409) {
+            marcar(input, 'red', `Otro usuario guardó "${datos.valor}". Recarga la página.`);
+        } else {
+            marcar(input, 'orange', datos.error || 'No se pudo autoguardar.');
+        }
+    }
+
+    document.addEventListener('change', function(evento) {
+        const coincidencia = PATRON_VALOR.exec(evento.target.name || '');
+        if (coincidencia) {
+            guardar(evento.target, coincidencia[1]);
+        }
+    });
+}
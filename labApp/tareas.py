@@ -0,0 +1,291 @@
+# labApp/tareas.py
+#
+# Cola de tareas en segundo plano sobre la propia base de datos (tabla Tarea),
+# sin broker externo. Desde el admin o cualquier vista:
+#
+#   tareas.encolar('reportes.pdf', analisis_ids=[1, 2, 3], prioridad=5)
+#
+# y ``manage.py procesar_tareas`` las ejecuta con un pool de hilos o procesos.
+# Las funciones se registran con @tarea('nombre') y reciben los argumentos
+# guardados (JSON) como palabras clave.
+#
+# Cada trabajador reclama tareas con SELECT ... FOR UPDATE SKIP LOCKED cuando
+# la base lo admite (PostgreSQL, MySQL 8); en SQLite, que bloquea la base
+# entera al escribir, con un UPDATE condicionado al estado (compare-and-set).
+# Una tarea que falla se reintenta con espera exponencial hasta max_intentos.
+#
+# Cada reclamo entrega un token nuevo y el trabajador renueva el latido de la
+# tarea mientras la ejecuta. Una tarea sin latido reciente (trabajador caído)
+# vuelve a la cola, y ese reclamo cuenta como intento: la que tumba a su
+# trabajador una y otra vez termina FALLIDA. El resultado solo se guarda si
+# el token sigue siendo el del trabajador; si la tarea se rescató y otro la
+# tomó, el primero descarta lo suyo.
+#
+# Configuración (settings.py, opcional):
+#   LAB_TAREAS_MAX_INTENTOS    intentos por tarea (por defecto 5)
+#   LAB_TAREAS_ESPERA_BASE     segundos antes del primer reintento; se duplica
+#                              en cada uno (por defecto 10, tope 1 hora)
+#   LAB_TAREAS_LATIDO          segundos entre latidos de una tarea en curso
+#                              (por defecto 30)
+#   LAB_TAREAS_TIEMPO_MAXIMO   segundos sin latido tras los que una tarea
+#                              EN_CURSO se da por abandonada (trabajador caído)
+#                              y vuelve a la cola (por defecto 900)
+#   LAB_TAREAS_RESULTADOS      True para que los resultados de un análisis
+#                              nuevo se generen en la cola y no en la petición
+#                              del admin, y el recálculo de rangos al cambiar
+#                              un intervalo se encole (por defecto False)
+
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, Min
+from django.utils import timezone
+
+from . import reportes, resultados
+from .models import Analisis, ResultadoAnalisis, Tarea
+
+logger = logging.getLogger(__name__)
+
+ESPERA_MAXIMA = 3600
+
+REGISTRO = {}
+
+
+def tarea(nombre):
+    """Registra ``funcion(**argumentos)`` como tarea ``nombre``"""
+    def decorador(funcion):
+        REGISTRO[nombre] = funcion
+        return funcion
+    return decorador
+
+
+def encolar(nombre, prioridad=0, demora=0, max_intentos=None, **argumentos):
+    """Crea la Tarea. Si se llama dentro de una transacción, los trabajadores no la ven hasta el commit"""
+    if nombre not in REGISTRO:
+        raise ValueError(f'Tarea desconocida: {nombre}')
+    return Tarea.objects.create(
+        nombre=nombre,
+        argumentos=argumentos,
+        prioridad=prioridad,
+        max_intentos=max_intentos or getattr(settings, 'LAB_TAREAS_MAX_INTENTOS', 5),
+        disponible_desde=timezone.now() + timedelta(seconds=demora),
+    )
+
+
+def nombre_trabajador():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'[:100]
+
+
+def _disponibles(ahora):
+    return Tarea.objects.filter(estado='PENDIENTE', disponible_desde__lte=ahora).order_by('-prioridad', 'disponible_desde', 'id')
+
+
+def _reclamo(trabajador, ahora):
+    return {
+        'estado': 'EN_CURSO', 'trabajador': trabajador, 'token': uuid.uuid4().hex, 'fecha_inicio': ahora,
+        'latido': ahora, 'intentos': F('intentos') + 1,
+    }
+
+
+def reclamar(trabajador, limite=1):
+    """Marca hasta ``limite`` tareas disponibles como EN_CURSO para ``trabajador`` y las devuelve"""
+    ahora = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(_disponibles(ahora).select_for_update(skip_locked=True).values_list('id', flat=True)[:limite])
+            Tarea.objects.filter(id__in=ids).update(**_reclamo(trabajador, ahora))
+    else:
+        # Sin SKIP LOCKED: varios trabajadores pueden leer los mismos candidatos,
+        # pero solo uno consigue el UPDATE ... WHERE estado = 'PENDIENTE'
+        ids = []
+        for pk in _disponibles(ahora).values_list('id', flat=True)[:limite * 4]:
+            if Tarea.objects.filter(id=pk, estado='PENDIENTE').update(**_reclamo(trabajador, ahora)):
+                ids.append(pk)
+                if len(ids) == limite:
+                    break
+    if not ids:
+        return []
+    return list(Tarea.objects.filter(id__in=ids).order_by('-prioridad', 'disponible_desde', 'id'))
+
+
+def espera_reintento(intentos):
+    """Segundos antes del siguiente intento: base * 2^(intentos-1), con ±20 % para no sincronizar reintentos"""
+    base = getattr(settings, 'LAB_TAREAS_ESPERA_BASE', 10)
+    return min(ESPERA_MAXIMA, base * 2 ** (intentos - 1)) * random.uniform(0.8, 1.2)
+
+
+class Latido(threading.Thread):
+    """Renueva ``latido`` de la tarea cada LAB_TAREAS_LATIDO segundos hasta detener()"""
+
+    def __init__(self, tarea):
+        super().__init__(name=f'latido-{tarea.pk}', daemon=True)
+        self.tarea = tarea
+        self.parar = threading.Event()
+
+    def run(self):
+        intervalo = getattr(settings, 'LAB_TAREAS_LATIDO', 30)
+        try:
+            while not self.parar.wait(intervalo):
+                try:
+                    _propia(self.tarea).update(latido=timezone.now())
+                except Exception:
+                    logger.exception('No se pudo renovar el latido de la tarea #%s', self.tarea.pk)
+        finally:
+            connection.close()
+
+    def detener(self):
+        self.parar.set()
+        self.join()
+
+
+def _propia(tarea):
+    """La fila de la tarea mientras siga reclamada con el token de este trabajador"""
+    return Tarea.objects.filter(pk=tarea.pk, token=tarea.token, estado='EN_CURSO')
+
+
+def ejecutar(tarea):
+    """Ejecuta una tarea ya reclamada y guarda su resultado o programa el reintento.
+
+    False si falló o si, mientras corría, se dio por abandonada y pasó a otro
+    trabajador (entonces no se guarda nada).
+    """
+    latido = Latido(tarea)
+    latido.start()
+    try:
+        funcion = REGISTRO[tarea.nombre]
+        resultado = funcion(**tarea.argumentos)
+    except Exception:
+        latido.detener()
+        error = traceback.format_exc()
+        if tarea.intentos < tarea.max_intentos and tarea.nombre in REGISTRO:
+            cambios = {
+                'estado': 'PENDIENTE', 'token': '',
+                'disponible_desde': timezone.now() + timedelta(seconds=espera_reintento(tarea.intentos)),
+            }
+            logger.warning('Tarea %s #%s falló (intento %s), se reintenta', tarea.nombre, tarea.pk, tarea.intentos)
+        else:
+            cambios = {'estado': 'FALLIDA', 'fecha_fin': timezone.now()}
+            logger.error('Tarea %s #%s falló definitivamente', tarea.nombre, tarea.pk)
+        _guardar(tarea, error=error, **cambios)
+        return False
+    latido.detener()
+    return _guardar(tarea, estado='COMPLETA', resultado=resultado, fecha_fin=timezone.now())
+
+
+def _guardar(tarea, **cambios):
+    if not _propia(tarea).update(**cambios):
+        logger.warning('Tarea %s #%s ya no es de este trabajador; se descarta su resultado', tarea.nombre, tarea.pk)
+        return False
+    for campo, valor in cambios.items():
+        setattr(tarea, campo, valor)
+    return cambios.get('estado') == 'COMPLETA'
+
+
+def rescatar_abandonadas():
+    """Devuelve a la cola las tareas EN_CURSO sin latido reciente; las que agotaron sus intentos quedan FALLIDA"""
+    ahora = timezone.now()
+    limite = ahora - timedelta(seconds=getattr(settings, 'LAB_TAREAS_TIEMPO_MAXIMO', 900))
+    abandonadas = Tarea.objects.filter(estado='EN_CURSO', latido__lt=limite)
+    mensaje = 'Trabajador sin respuesta'
+    fallidas = abandonadas.filter(intentos__gte=F('max_intentos')).update(
+        estado='FALLIDA', token='', fecha_fin=ahora, error=f'{mensaje}; sin intentos restantes.',
+    )
+    devueltas = abandonadas.update(
+        estado='PENDIENTE', token='', disponible_desde=ahora, error=f'{mensaje}; tarea devuelta a la cola.',
+    )
+    return fallidas + devueltas
+
+
+def bucle(parar, espera=1.0, trabajador=None, vaciar=False):
+    """Reclama y ejecuta tareas hasta que se active el threading.Event ``parar``.
+
+    Con ``vaciar`` termina en cuanto no quedan tareas disponibles.
+    """
+    trabajador = trabajador or nombre_trabajador()
+    try:
+        while not parar.is_set():
+            try:
+                close_old_connections()
+                reclamadas = reclamar(trabajador)
+                if not reclamadas:
+                    if rescatar_abandonadas():
+                        continue
+                    if vaciar:
+                        break
+                    parar.wait(espera)
+                    continue
+                for t in reclamadas:
+                    ejecutar(t)
+            except Exception:
+                # Base bloqueada o conexión caída: el hilo sigue; lo que quedó EN_CURSO lo rescata el latido
+                logger.exception('Error en el bucle del trabajador %s', trabajador)
+                close_old_connections()
+                parar.wait(espera)
+    finally:
+        connection.close()
+
+
+def trabajar(hilos=1, espera=1.0, parar=None, vaciar=False):
+    """Corre ``hilos`` bucles en paralelo (cada hilo con su conexión) hasta que terminen"""
+    parar = parar or threading.Event()
+    corriendo = [
+        threading.Thread(target=bucle, args=(parar, espera), kwargs={'vaciar': vaciar}, name=f'tareas-{n}')
+        for n in range(hilos)
+    ]
+    for hilo in corriendo:
+        hilo.start()
+    for hilo in corriendo:
+        hilo.join()
+
+
+def resumen():
+    """Profundidad de la cola y latencias para el admin"""
+    ahora = timezone.now()
+    por_estado = dict(Tarea.objects.values_list('estado').annotate(n=Count('id')).order_by())
+    pendientes = Tarea.objects.filter(estado='PENDIENTE', disponible_desde__lte=ahora).aggregate(
+        mas_antigua=Min('disponible_desde'),
+    )
+    espera = ExpressionWrapper(F('fecha_inicio') - F('fecha_creacion'), output_field=DurationField())
+    duracion = ExpressionWrapper(F('fecha_fin') - F('fecha_inicio'), output_field=DurationField())
+    ultima_hora = Tarea.objects.filter(estado='COMPLETA', fecha_fin__gte=ahora - timedelta(hours=1)).aggregate(
+        completas=Count('id'), espera_media=Avg(espera), espera_maxima=Max(espera), duracion_media=Avg(duracion),
+    )
+    return {
+        'por_estado': [(etiqueta, por_estado.get(clave, 0)) for clave, etiqueta in Tarea.ESTADOS],
+        'antiguedad': ahora - pendientes['mas_antigua'] if pendientes['mas_antigua'] else None,
+        **ultima_hora,
+    }
+
+
+# -------------------------------
+# Tareas del laboratorio
+# -------------------------------
+@tarea('resultados.generar')
+def generar_resultados(analisis_ids):
+    analisis = list(Analisis.objects.select_related('paciente').filter(id__in=analisis_ids))
+    return len(resultados.generar_resultados(analisis))
+
+
+@tarea('resultados.recalcular')
+def recalcular_resultados(analisis_ids):
+    return resultados.recalcular_resultados(ResultadoAnalisis.objects.filter(analisis_id__in=analisis_ids))
+
+
+@tarea('resultados.recalcular_propiedades')
+def recalcular_propiedades(propiedad_ids):
+    """Resultados de propiedades cuyos intervalos cambiaron (señal de labApp/resultados.py)"""
+    return resultados.recalcular_propiedades(propiedad_ids)
+
+
+@tarea('reportes.pdf')
+def generar_pdfs(analisis_ids):
+    """Deja los PDF en la caché para que verlos o imprimirlos después sea inmediato"""
+    return sum(1 for _ in reportes.generar_lote(analisis_ids))
@@ -0,0 +1,19 @@
+# labApp/tareas_trabajador.py
+#
+# Punto de entrada de cada proceso de ``procesar_tareas --procesos N``.
+# Como reportes_trabajador, no importa modelos al cargarse: con el contexto
+# 'spawn' el proceso hijo lo importa antes de que Django esté configurado.
+
+import signal
+import threading
+
+from .reportes_trabajador import iniciar
+
+
+def correr(hilos, espera, vaciar):
+    iniciar()
+    from .tareas import trabajar
+    parar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+    signal.signal(signal.SIGINT, lambda *_: parar.set())
+    trabajar(hilos, espera, parar=parar, vaciar=vaciar)
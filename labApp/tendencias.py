@@ -0,0 +1,138 @@
+# labApp/tendencias.py
+#
+# Historial de resultados de un paciente por código LOINC: serie cronológica
+# de valores numéricos y sus estadísticas (mínimo, máximo, pendiente por día,
+# cambio porcentual) más el "delta check" contra el resultado anterior.
+#
+# Todos los resultados numéricos del paciente salen de una sola consulta
+# (índice analisis_paciente_fecha_idx y el único (analisis, nombre_propiedad)),
+# ya parseados en valor_numerico. Las estadísticas se calculan con numpy si
+# está instalado; si no, con el mismo cálculo en Python.
+#
+# Configuración (settings.py, opcional):
+#   LAB_DELTA_CHECK_PCT    cambio porcentual contra el resultado anterior a
+#                          partir del cual se marca (por defecto 25)
+#   LAB_DELTA_CHECK        {loinc_num: porcentaje} para analitos con otro umbral
+
+import math
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import ResultadoAnalisis
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SEGUNDOS_POR_DIA = 86400
+
+
+def umbral_delta(loinc_num):
+    return getattr(settings, 'LAB_DELTA_CHECK', {}).get(loinc_num, getattr(settings, 'LAB_DELTA_CHECK_PCT', 25))
+
+
+def series_paciente(paciente_id, loinc_num=None):
+    """{loinc_num: {"nombre", "puntos": [...]}} en orden cronológico, con una consulta"""
+    consulta = ResultadoAnalisis.objects.filter(
+        analisis__paciente_id=paciente_id, valor_numerico__isnull=False, loinc_code__isnull=False,
+    )
+    if loinc_num:
+        consulta = consulta.filter(loinc_code__loinc_num=loinc_num)
+    filas = consulta.order_by('loinc_code__loinc_num', 'analisis__fecha_analisis', 'analisis_id').values_list(
+        'loinc_code__loinc_num', 'loinc_code__shortname', 'analisis_id', 'analisis__fecha_analisis',
+        'valor', 'valor_numerico', 'unidad', 'ref_min', 'ref_max', 'bandera',
+    )
+    series = OrderedDict()
+    for loinc, nombre, analisis_id, fecha, valor, numerico, unidad, ref_min, ref_max, bandera in filas:
+        serie = series.setdefault(loinc, {'loinc': loinc, 'nombre': nombre, 'puntos': []})
+        serie['puntos'].append({
+            'analisis': analisis_id, 'fecha': fecha, 'valor': valor, 'valor_numerico': numerico,
+            'unidad': unidad, 'ref_min': ref_min, 'ref_max': ref_max, 'bandera': bandera,
+        })
+    return series
+
+
+def _numero(x):
+    """float de numpy/Python o None si no es finito (para JSON)"""
+    x = float(x)
+    return x if math.isfinite(x) else None
+
+
+def _estadisticas_numpy(dias, valores, umbral):
+    t = np.asarray(dias, dtype=np.float64)
+    v = np.asarray(valores, dtype=np.float64)
+    pendiente = np.nan
+    if len(v) > 1 and np.ptp(t) > 0:
+        tc = t - t.mean()
+        pendiente = np.dot(tc, v - v.mean()) / np.dot(tc, tc)
+    deltas = np.diff(v)
+    anteriores = np.abs(v[:-1])
+    delta_pct = np.divide(deltas * 100, anteriores, out=np.full(len(deltas), np.nan), where=anteriores != 0)
+    alertas = np.abs(np.nan_to_num(delta_pct, nan=0.0)) >= umbral
+    return {
+        'n': len(v),
+        'minimo': _numero(v.min()),
+        'maximo': _numero(v.max()),
+        'media': _numero(v.mean()),
+        'primero': _numero(v[0]),
+        'ultimo': _numero(v[-1]),
+        'cambio_pct': _numero((v[-1] - v[0]) * 100 / abs(v[0])) if v[0] != 0 else None,
+        'pendiente_por_dia': _numero(pendiente),
+    }, [None, *map(_numero, deltas)], [None, *map(_numero, delta_pct)], [False, *alertas.tolist()]
+
+
+def _estadisticas_python(dias, valores, umbral):
+    n = len(valores)
+    media = sum(valores) / n
+    pendiente = None
+    if n > 1 and max(dias) > min(dias):
+        media_t = sum(dias) / n
+        covarianza = sum((t - media_t) * (v - media) for t, v in zip(dias, valores))
+        pendiente = covarianza / sum((t - media_t) ** 2 for t in dias)
+    deltas = [b - a for a, b in zip(valores, valores[1:])]
+    delta_pct = [d * 100 / abs(a) if a else None for d, a in zip(deltas, valores)]
+    alertas = [p is not None and abs(p) >= umbral for p in delta_pct]
+    return {
+        'n': n,
+        'minimo': min(valores),
+        'maximo': max(valores),
+        'media': media,
+        'primero': valores[0],
+        'ultimo': valores[-1],
+        'cambio_pct': (valores[-1] - valores[0]) * 100 / abs(valores[0]) if valores[0] else None,
+        'pendiente_por_dia': pendiente,
+    }, [None, *deltas], [None, *delta_pct], [False, *alertas]
+
+
+def estadisticas(serie):
+    """Añade delta/delta_pct/alerta_delta a cada punto y devuelve las estadísticas de la serie"""
+    puntos = serie['puntos']
+    if not puntos:
+        return {'n': 0}
+    origen = puntos[0]['fecha']
+    dias = [(p['fecha'] - origen).total_seconds() / SEGUNDOS_POR_DIA for p in puntos]
+    valores = [p['valor_numerico'] for p in puntos]
+    calcular = _estadisticas_numpy if np is not None else _estadisticas_python
+    resumen, deltas, delta_pct, alertas = calcular(dias, valores, umbral_delta(serie['loinc']))
+    for punto, delta, pct, alerta in zip(puntos, deltas, delta_pct, alertas):
+        punto.update(delta=delta, delta_pct=pct, alerta_delta=bool(alerta))
+    resumen['alertas_delta'] = sum(alertas)
+    resumen['umbral_delta_pct'] = umbral_delta(serie['loinc'])
+    return resumen
+
+
+def tendencias_paciente(paciente_id, loinc_num=None):
+    """Series del paciente (o solo ``loinc_num``) con sus estadísticas en serie["estadisticas"]"""
+    series = series_paciente(paciente_id, loinc_num)
+    for serie in series.values():
+        serie['estadisticas'] = estadisticas(serie)
+    return series
+
+
+def a_json(serie):
+    return {
+        **serie,
+        'puntos': [{**p, 'fecha': p['fecha'].isoformat()} for p in serie['puntos']],
+    }
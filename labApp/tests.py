@@ -1,3 +1,1538 @@
-from django.test import TestCase
+import csv
+import datetime
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import F
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.migrations.executor import MigrationExecutor
+from django.db.utils import ConnectionHandler, OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from LabConriquezConfig import basedatos, metricas
+
+from . import (
+    busqueda, calidad, datos_sinteticos, duplicados, estructuras, exportacion, imagenes, ingesta_archivos, laboratorios,
+    nombres, reportes, resultados, senales, tareas, tendencias, views,
+)
+from .benchmarks import comparar
+from .intervalos import intervalos
+from .instrumentacion import PresupuestoExcedido, forma_sql, presupuesto_consultas, registrar_consultas
+from .models import (
+    Analisis, ArchivoIngesta, ClaveIdempotencia, IntervaloReferencia, Laboratorio, LoincCode, Paciente, Pago, Plantilla,
+    PropiedadPlantilla, Reporte, ResultadoAnalisis, ResultadoCuarentena, ResumenControlDiario, Tarea, Usuario,
+)
+
+
+class InstrumentacionTests(TestCase):
+    def test_forma_sql_ignora_valores(self):
+        self.assertEqual(
+            forma_sql("SELECT * FROM t WHERE id = 5 AND nombre = 'a''b'"),
+            forma_sql("SELECT * FROM t WHERE id = 7 AND nombre = 'c'"),
+        )
+        self.assertEqual(forma_sql('WHERE id IN (%s, %s, %s)'), forma_sql('WHERE id IN (%s)'))
+
+    def test_detecta_consultas_repetidas(self):
+        Laboratorio.objects.create(nombre_laboratorio='L', ciudad='c', estado='e', codigo_postal='1', pais='MX')
+        with registrar_consultas() as registro:
+            for _ in range(3):
+                list(Laboratorio.objects.filter(pk=1))
+        self.assertEqual(registro.total, 3)
+        [(forma, veces, sitio)] = registro.repetidas()
+        self.assertEqual(veces, 3)
+        self.assertIn('labApp/tests.py', sitio)
+
+    def test_presupuesto_excedido(self):
+        with self.assertRaises(PresupuestoExcedido):
+            with presupuesto_consultas(1):
+                Laboratorio.objects.count()
+                Laboratorio.objects.count()
+
+
+# Consultas por página del admin con la sesión ya iniciada. Si una cifra cambia,
+# revisar el mensaje del fallo: lista las consultas repetidas y la línea que las
+# dispara. Ninguna debe crecer con el número de filas (test_no_crece_con_los_datos).
+PRESUPUESTOS = {
+    ('plantilla', 'changelist'): 5,
+    ('plantilla', 'change'): 5,
+    ('propiedadplantilla', 'changelist'): 6,
+    ('propiedadplantilla', 'change'): 9,
+    ('analisis', 'changelist'): 6,
+    ('analisis', 'change'): 10,
+    ('usuario', 'changelist'): 5,
+    ('usuario', 'change'): 6,
+    ('laboratorio', 'changelist'): 5,
+    ('laboratorio', 'change'): 4,
+    ('paciente', 'changelist'): 6,
+    ('paciente', 'change'): 6,
+    ('pago', 'changelist'): 5,
+    ('pago', 'change'): 6,
+    ('resultadoanalisis', 'changelist'): 5,
+    ('resultadoanalisis', 'change'): 8,
+    ('loinccode', 'changelist'): 7,
+    ('loinccode', 'change'): 4,
+    ('reporte', 'changelist'): 6,
+    ('reporte', 'change'): 9,
+    ('archivoingesta', 'changelist'): 5,
+    ('archivoingesta', 'change'): 4,
+    ('resultadocuarentena', 'changelist'): 5,
+    ('resultadocuarentena', 'change'): 5,
+    ('tarea', 'changelist'): 9,
+    ('tarea', 'change'): 4,
+    ('resumencontroldiario', 'changelist'): 6,
+    ('resumencontroldiario', 'change'): 7,
+}
+
+
+class ConsultasAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        cls.crear_datos(3)
+
+    @classmethod
+    def crear_datos(cls, cantidad):
+        n = Laboratorio.objects.count()
+        laboratorio = Laboratorio.objects.create(
+            nombre_laboratorio=f'Lab {n}', ciudad='Culiacán', estado='Sinaloa', codigo_postal='80000', pais='México',
+        )
+        usuario = Usuario.objects.create(nombre=f'Usuario {n}', correo_electronico=f'u{n}@example.com', num_telefono='1')
+        usuario.laboratorios.add(laboratorio)
+        plantilla = Plantilla.objects.create(titulo=f'Química {n}')
+        codigos = {}
+        for i in range(cantidad):
+            loinc = codigos[f'Prop {i}'] = LoincCode.objects.create(loinc_num=f'{n}{i}-1', shortname=f'Prueba {i}')
+            propiedad = PropiedadPlantilla.objects.create(
+                plantilla=plantilla, nombre_propiedad=f'Prop {i}', unidad='mg/dL', loinc_code=loinc,
+            )
+            IntervaloReferencia.objects.create(
+                propiedad=propiedad, edad_min=19, edad_max=59, sexo='AMBOS', valor_min=70, valor_max=100,
+            )
+        for i in range(cantidad):
+            Pago.objects.create(
+                usuario=usuario, fecha_pago=datetime.date(2025, 1, 1),
+                fecha_vencimiento=datetime.date(2025, 2, 1), estado='PAGADO',
+            )
+            paciente = Paciente.objects.create(
+                laboratorio=laboratorio, nombre=f'Paciente {i}', edad=40, sexo='FEMENINO', telefono='1',
+            )
+            analisis = Analisis.objects.create(paciente=paciente, plantilla=plantilla)
+            Reporte.objects.create(analisis=analisis, generado_por=usuario)
+        for resultado in ResultadoAnalisis.objects.filter(analisis__plantilla=plantilla).select_related('analisis'):
+            resultado.loinc_code = codigos[resultado.nombre_propiedad]
+            resultado.valor = '85'
+            resultado.save()
+        archivo = ArchivoIngesta.objects.create(ruta=f'/entrada/{n}.hl7', tamano=100, desplazamiento=100, estado='COMPLETO')
+        for i in range(cantidad):
+            ResultadoCuarentena.objects.create(archivo=archivo, orden=str(i), codigo='0000-0', valor='1', motivo='Sin LOINC')
+            Tarea.objects.create(nombre='reportes.pdf', argumentos={'analisis_ids': [analisis.id]})
+        for i, propiedad in enumerate(plantilla.propiedades.all()):
+            ResumenControlDiario.objects.create(
+                laboratorio=laboratorio, propiedad=propiedad, fecha=datetime.date(2025, 1, 1 + i), es_control=True,
+                nivel='1', n=2, suma=170, suma_cuadrados=14450, media=85, de=0, minimo=85, maximo=85,
+                violaciones=['1_2s'],
+            )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        ContentType.objects.clear_cache()
+
+    def url(self, modelo, vista):
+        if vista == 'changelist':
+            return reverse(f'admin:labApp_{modelo}_changelist')
+        objeto = self.modelo(modelo).objects.order_by('-pk').first()
+        return reverse(f'admin:labApp_{modelo}_change', args=[objeto.pk])
+
+    def modelo(self, nombre):
+        return next(m for m in admin.site._registry if m._meta.app_label == 'labApp' and m._meta.model_name == nombre)
+
+    def contar(self, url):
+        with registrar_consultas(connection.alias) as registro:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200, url)
+        return registro
+
+    def test_todos_los_admins_tienen_presupuesto(self):
+        registrados = {m._meta.model_name for m in admin.site._registry if m._meta.app_label == 'labApp'}
+        self.assertEqual(registrados, {modelo for modelo, _ in PRESUPUESTOS})
+
+    def test_presupuestos(self):
+        for (modelo, vista), esperado in PRESUPUESTOS.items():
+            with self.subTest(modelo=modelo, vista=vista):
+                ContentType.objects.clear_cache()
+                registro = self.contar(self.url(modelo, vista))
+                repetidas = '\n'.join(f'{veces}x {sitio}: {forma}' for forma, veces, sitio in registro.repetidas())
+                self.assertEqual(registro.total, esperado, repetidas)
+
+    def test_no_crece_con_los_datos(self):
+        antes = {}
+        for clave in PRESUPUESTOS:
+            ContentType.objects.clear_cache()
+            antes[clave] = self.contar(self.url(*clave)).total
+        self.crear_datos(12)
+        for clave in PRESUPUESTOS:
+            with self.subTest(modelo=clave[0], vista=clave[1]):
+                ContentType.objects.clear_cache()
+                registro = self.contar(self.url(*clave))
+                self.assertEqual(registro.total, antes[clave], registro.repetidas())
+
+
+# Consultas frecuentes de modelos, admin, ingesta y cola de tareas. Cada una debe
+# resolverse con un índice: si alguna vuelve a recorrer la tabla completa (un
+# índice borrado o una consulta que dejó de poder usarlo) el test lo señala con
+# el plan de SQLite. Las marcadas con ordenada=True tampoco deben ordenar en memoria.
+CONSULTAS_INDEXADAS = {
+    'intervalos de una propiedad y sexo (clean)': (
+        lambda: IntervaloReferencia.objects.filter(propiedad_id=1, sexo='AMBOS').order_by('edad_min'), True,
+    ),
+    'resultados de un análisis': (lambda: ResultadoAnalisis.objects.filter(analisis_id=1), False),
+    'resultado por análisis y propiedad (ingesta)': (
+        lambda: ResultadoAnalisis.objects.filter(analisis_id__in=[1, 2], nombre_propiedad__in=['A', 'B']), False,
+    ),
+    'resultados anormales': (lambda: ResultadoAnalisis.objects.filter(bandera='H'), False),
+    'propiedades de una plantilla (inline)': (lambda: PropiedadPlantilla.objects.filter(plantilla_id=1), False),
+    'propiedad por nombre': (
+        lambda: PropiedadPlantilla.objects.filter(plantilla_id=1, nombre_propiedad='Glucosa'), False,
+    ),
+    'serie de un analito del paciente (tendencias)': (
+        lambda: ResultadoAnalisis.objects.filter(
+            analisis__paciente_id=1, loinc_code__loinc_num='2345-7', valor_numerico__isnull=False,
+        ).order_by('analisis__fecha_analisis'), False,
+    ),
+    'análisis: primera página del admin': (
+        lambda: Analisis.objects.order_by('-fecha_analisis', '-id')[:100], True,
+    ),
+    'análisis: página con cursor y plantilla': (
+        lambda: Analisis.objects.filter(
+            plantilla_id=1, fecha_analisis__lt=datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc),
+        ).order_by('-fecha_analisis', '-id')[:100], True,
+    ),
+    'análisis de un laboratorio (admin)': (
+        lambda: Analisis.objects.filter(laboratorio_id__in=[1]).order_by('-fecha_analisis', '-id')[:100], True,
+    ),
+    'resultados de un laboratorio (admin)': (
+        lambda: ResultadoAnalisis.objects.filter(laboratorio_id__in=[1]).order_by('-id')[:100], True,
+    ),
+    'reportes de un laboratorio (admin)': (
+        lambda: Reporte.objects.filter(laboratorio_id__in=[1]).order_by('-fecha_generacion', '-id')[:100], True,
+    ),
+    'historial de un paciente': (
+        lambda: Analisis.objects.filter(paciente_id=1).order_by('-fecha_analisis'), True,
+    ),
+    'búsqueda de pacientes por nombre (admin)': (
+        lambda: Paciente.objects.filter(busqueda.filtro_pacientes('lopez maria')), False,
+    ),
+    'posibles duplicados de un paciente': (
+        lambda: Paciente.objects.filter(laboratorio_id=1, nombre_fonetico='lopes maria'), False,
+    ),
+    'pagos vencidos de un usuario': (
+        lambda: Pago.objects.filter(usuario_id=1, estado='PENDIENTE', fecha_vencimiento__lt=datetime.date(2026, 1, 1)),
+        False,
+    ),
+    'pagos por vencer': (
+        lambda: Pago.objects.filter(estado='PENDIENTE', fecha_vencimiento__lte=datetime.date(2026, 1, 1)), False,
+    ),
+    'reportes: primera página del admin': (
+        lambda: Reporte.objects.order_by('-fecha_generacion', '-id')[:100], True,
+    ),
+    'reportes de un análisis': (lambda: Reporte.objects.filter(analisis_id=1), False),
+    'códigos LOINC por número (ingesta)': (lambda: LoincCode.objects.filter(loinc_num__in=['2345-7', '718-7']), False),
+    'archivos de ingesta por ruta': (lambda: ArchivoIngesta.objects.filter(ruta__in=['/a.hl7', '/b.hl7']), False),
+    'resúmenes de control de una ventana': (
+        lambda: ResumenControlDiario.objects.filter(
+            fecha__gte=datetime.date(2025, 1, 1), fecha__lt=datetime.date(2025, 1, 8),
+        ), False,
+    ),
+    'serie de Levey-Jennings': (
+        lambda: ResumenControlDiario.objects.filter(
+            laboratorio_id=1, propiedad_id=1, es_control=True, nivel='1',
+        ).order_by('fecha'), True,
+    ),
+    'siguiente tarea de la cola': (
+        lambda: Tarea.objects.filter(
+            estado='PENDIENTE', disponible_desde__lte=datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc),
+        ).order_by('-prioridad', 'disponible_desde', 'id')[:1], True,
+    ),
+    'tareas sin latido (rescate)': (
+        lambda: Tarea.objects.filter(
+            estado='EN_CURSO', latido__lt=datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc),
+        ), False,
+    ),
+}
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Los planes se comprueban con EXPLAIN QUERY PLAN de SQLite')
+class PlanesConsultaTests(TestCase):
+    def plan(self, queryset):
+        sql, params = queryset.query.get_compiler(connection=connection).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [fila[-1] for fila in cursor.fetchall()]
+
+    def test_consultas_frecuentes_usan_indices(self):
+        for nombre, (consulta, ordenada) in CONSULTAS_INDEXADAS.items():
+            with self.subTest(nombre):
+                plan = self.plan(consulta())
+                detalle = '\n'.join(plan)
+                # "SCAN tabla" a secas es un recorrido completo; "SCAN tabla USING INDEX" recorre
+                # el índice en orden y se detiene en el LIMIT
+                completos = [paso for paso in plan if re.fullmatch(r'SCAN \S+', paso)]
+                self.assertEqual(completos, [], detalle)
+                if ordenada:
+                    self.assertNotIn('TEMP B-TREE', detalle, detalle)
+
+
+class ControlCalidadTests(TestCase):
+    # Puntuaciones z de una serie de controles y las reglas que debe marcar cada valor
+    SERIE = [0.5, 2.5, 2.2, -0.5, 3.5, 1.2, 1.5, 1.1, 1.3, -2.5, 2.5, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+    ESPERADAS = {
+        1: {'1_2s'}, 2: {'1_2s', '2_2s'}, 4: {'1_2s', '1_3s'}, 7: {'4_1s'}, 8: {'4_1s'},
+        9: {'1_2s'}, 10: {'1_2s', 'R_4s'}, 19: {'10_x'}, 20: {'10_x'},
+    }
+
+    def test_reglas_de_westgard(self):
+        marcas = calidad._reglas_python(self.SERIE)
+        self.assertEqual({i: m for i, m in enumerate(marcas) if m}, self.ESPERADAS)
+
+    @skipUnless(calidad.np is not None, 'numpy no está instalado')
+    def test_numpy_coincide_con_python(self):
+        z = calidad.np.array(self.SERIE)
+        reglas = calidad._reglas_numpy(z, calidad.np.arange(len(z)))
+        marcas = [{regla for regla, bandera in reglas.items() if bandera[i]} for i in range(len(z))]
+        self.assertEqual(marcas, calidad._reglas_python(self.SERIE))
+
+
+@skipUnless(imagenes.Image is not None, 'Pillow no está instalado')
+class VariantesLogoTests(TestCase):
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        configuracion = override_settings(MEDIA_ROOT=directorio)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+
+    def crear(self, lado=800):
+        buffer = io.BytesIO()
+        imagenes.Image.new('RGBA', (lado, lado // 2), (200, 30, 30, 255)).save(buffer, 'PNG')
+        return Laboratorio.objects.create(
+            nombre_laboratorio='Lab', ciudad='c', estado='e', codigo_postal='0', pais='MX',
+            logo=SimpleUploadedFile('logo.png', buffer.getvalue()),
+        )
+
+    def test_genera_variantes_al_subir(self):
+        laboratorio = Laboratorio.objects.get(pk=self.crear().pk)
+        miniatura = imagenes.variante(laboratorio, 'miniatura')
+        self.assertEqual((miniatura['ancho'], miniatura['alto']), (100, 50))
+        self.assertLess(miniatura['bytes'], laboratorio.logo.size)
+        self.assertEqual(set(laboratorio.logo_variantes['variantes']), set(imagenes.VARIANTES))
+
+    def test_sirve_con_cache_larga(self):
+        url = imagenes.url_variante(self.crear(), 'miniatura')
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('immutable', respuesta['Cache-Control'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+        self.assertEqual(self.client.get('/logos/miniatura-0000000000000000.webp').status_code, 404)
+
+
+class DatosSinteticosTests(TestCase):
+    def valores(self):
+        return list(ResultadoAnalisis.objects.order_by('id').values_list('nombre_propiedad', 'valor', 'bandera'))
+
+    def test_misma_semilla_mismos_datos(self):
+        totales = datos_sinteticos.sembrar(laboratorios=1, pacientes=5, analisis=8, semilla=7)
+        self.assertEqual(totales['resultados'], ResultadoAnalisis.objects.count())
+        self.assertGreater(totales['resultados'], 0)
+        primera = self.valores()
+        ResultadoAnalisis.objects.all().delete()
+        Analisis.objects.all().delete()
+        Paciente.objects.all().delete()
+        Laboratorio.objects.all().delete()
+        datos_sinteticos.sembrar(laboratorios=1, pacientes=5, analisis=8, semilla=7)
+        self.assertEqual(self.valores(), primera)
+
+    def test_comparar_con_linea_base(self):
+        base = {'caso': {'p50': 10.0, 'consultas': 4}}
+        self.assertFalse(comparar({'caso': {'p50': 12.0, 'consultas': 4}}, base)[0][2])
+        self.assertTrue(comparar({'caso': {'p50': 20.0, 'consultas': 4}}, base)[0][2])
+        self.assertTrue(comparar({'caso': {'p50': 10.0, 'consultas': 5}}, base)[0][2])
+        self.assertFalse(comparar({'nuevo': {'p50': 1.0, 'consultas': 1}}, base)[0][2])
+
+
+class MetricasTests(TestCase):
+    def setUp(self):
+        metricas.registro.reiniciar()
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def test_expone_latencia_sql_y_plantillas_por_vista(self):
+        self.client.get(reverse('admin:labApp_analisis_changelist'))
+        texto = self.client.get('/metrics').content.decode()
+        vista = 'vista="admin:labApp_analisis_changelist"'
+        self.assertRegex(texto, rf'lab_peticion_segundos_count\{{proceso="\d+",{vista},metodo="GET"\}} 1')
+        self.assertRegex(texto, rf'lab_sql_consultas_total\{{proceso="\d+",{vista}\}} [1-9]')
+        self.assertRegex(texto, rf'lab_plantilla_segundos_total\{{proceso="\d+",{vista}\}} 0\.\d*[1-9]')
+
+    def test_cuenta_cache_de_labapp_sin_parchear_plantillas(self):
+        from django.template.backends.django import Template
+        self.assertNotIn('metricas', Template.render.__module__)
+        senales.contar_cache('intervalos', True)
+        senales.contar_cache('intervalos', False)
+        texto = self.client.get('/metrics').content.decode()
+        self.assertRegex(texto, r'lab_cache_aciertos_total\{proceso="\d+",cache="intervalos"\} 1')
+        self.assertRegex(texto, r'lab_cache_fallos_total\{proceso="\d+",cache="intervalos"\} 1')
+
+    @override_settings(LAB_METRICAS_TOKEN='secreto')
+    def test_exige_token_si_esta_configurado(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secreto').status_code, 200)
+
+    def test_guarda_perfil_de_peticiones_lentas(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        with override_settings(
+            LAB_METRICAS_PERFIL_UMBRAL_MS=0, LAB_METRICAS_PERFIL_MUESTREO=1.0, LAB_METRICAS_PERFIL_DIRECTORIO=directorio,
+        ):
+            self.client.get(reverse('admin:labApp_paciente_changelist'))
+        self.assertTrue(any(nombre.endswith('.prof') and 'paciente_changelist' in nombre for nombre in os.listdir(directorio)))
+
+
+# Sin caché compartida: lo confirmado con captureOnCommitCallbacks se revierte al terminar cada prueba
+@override_settings(LAB_PLANTILLAS_CACHE=None)
+class EstructurasPlantillaTests(TestCase):
+    def setUp(self):
+        estructuras.lru.limpiar()
+        self.addCleanup(estructuras.lru.limpiar)
+        self.plantilla = Plantilla.objects.create(titulo='Perfil lipídico')
+        self.loinc = LoincCode.objects.create(loinc_num='2093-3', shortname='Cholest SerPl-mCnc')
+
+    def agregar(self, nombre):
+        propiedad = PropiedadPlantilla.objects.create(
+            plantilla=self.plantilla, nombre_propiedad=nombre, unidad='mg/dL', loinc_code=self.loinc,
+        )
+        IntervaloReferencia.objects.create(propiedad=propiedad, valor_min=0, valor_max=200)
+        return propiedad
+
+    def test_version_sube_con_cualquier_cambio(self):
+        propiedad = self.agregar('Colesterol')
+        self.plantilla.refresh_from_db()
+        self.assertEqual(self.plantilla.version, 3)
+        self.plantilla.titulo = 'Perfil de lípidos'
+        self.plantilla.save()
+        self.assertEqual(self.plantilla.version, 4)
+        propiedad.delete()
+        self.assertEqual(Plantilla.objects.get(pk=self.plantilla.pk).version, 6)
+
+    def test_estructura_en_cache_por_version(self):
+        self.agregar('Colesterol')
+        self.plantilla.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            estructura = estructuras.obtener(self.plantilla)
+        self.assertEqual(
+            [(p['nombre'], p['loinc_num'], p['intervalos']) for p in estructura['propiedades']],
+            [('Colesterol', '2093-3', (('AMBOS', 0, None, 'ANIOS', 0.0, 200.0),))],
+        )
+        with self.assertNumQueries(0):
+            self.assertIs(estructuras.obtener(self.plantilla), estructura)
+        self.agregar('HDL')
+        with self.captureOnCommitCallbacks(execute=True):
+            nombres = [p['nombre'] for p in estructuras.obtener(self.plantilla.pk)['propiedades']]
+        self.assertEqual(nombres, ['Colesterol', 'HDL'])
+
+    def test_no_guarda_lo_leido_en_una_transaccion_sin_confirmar(self):
+        estructuras.obtener(self.plantilla.pk)
+        self.assertIsNone(estructuras.lru.obtener(estructuras.CLAVE.format(self.plantilla.pk, self.plantilla.version)))
+
+
+class LaboratoriosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.labs = [
+            Laboratorio.objects.create(
+                nombre_laboratorio=f'Lab {i}', ciudad='Culiacán', estado='Sinaloa', codigo_postal='80000', pais='México',
+            )
+            for i in range(2)
+        ]
+        cls.plantilla = Plantilla.objects.create(titulo='Química')
+        propiedad = PropiedadPlantilla.objects.create(plantilla=cls.plantilla, nombre_propiedad='Glucosa', unidad='mg/dL')
+        IntervaloReferencia.objects.create(propiedad=propiedad, valor_min=70, valor_max=100)
+        cls.pacientes = [
+            Paciente.objects.create(laboratorio=lab, nombre=f'Paciente {i}', edad=40, sexo='FEMENINO', telefono='1')
+            for i, lab in enumerate(cls.labs)
+        ]
+        cls.analisis = [Analisis.objects.create(paciente=p, plantilla=cls.plantilla) for p in cls.pacientes]
+        usuario = Usuario.objects.create(nombre='Química', correo_electronico='quimica@example.com', num_telefono='1')
+        usuario.laboratorios.add(cls.labs[0])
+        cls.staff = get_user_model().objects.create_user('quimica', 'Quimica@example.com', 'x', is_staff=True)
+        cls.staff.user_permissions.add(*Permission.objects.filter(content_type__app_label='labApp'))
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def test_copia_el_laboratorio_del_paciente(self):
+        analisis = self.analisis[0]
+        self.assertEqual(analisis.laboratorio_id, self.labs[0].pk)
+        self.assertEqual(
+            set(ResultadoAnalisis.objects.filter(analisis=analisis).values_list('laboratorio_id', flat=True)),
+            {self.labs[0].pk},
+        )
+        [reporte] = Reporte.objects.bulk_create([Reporte(analisis=analisis)])
+        self.assertEqual(reporte.laboratorio_id, self.labs[0].pk)
+
+    def test_mover_paciente_mueve_sus_filas(self):
+        paciente = self.pacientes[0]
+        Reporte.objects.create(analisis=self.analisis[0])
+        paciente.laboratorio = self.labs[1]
+        paciente.save()
+        for modelo in (Analisis, ResultadoAnalisis, Reporte):
+            with self.subTest(modelo._meta.model_name):
+                self.assertFalse(modelo.objects.filter(laboratorio=self.labs[0]).exists())
+
+    def test_reasignar_analisis_mueve_resultados_y_reportes(self):
+        analisis = self.analisis[0]
+        Reporte.objects.create(analisis=analisis)
+        otro_analisis = self.analisis[1]
+        analisis.paciente = self.pacientes[1]
+        analisis.save(update_fields=['paciente'])
+        self.assertEqual(Analisis.objects.get(pk=analisis.pk).laboratorio_id, self.labs[1].pk)
+        for modelo in (ResultadoAnalisis, Reporte):
+            with self.subTest(modelo._meta.model_name):
+                self.assertEqual(
+                    set(modelo.objects.filter(analisis=analisis).values_list('laboratorio_id', flat=True)), {self.labs[1].pk},
+                )
+        # Guardar sin cambiar de paciente no vuelve a alinear nada
+        with self.assertNumQueries(1):
+            otro_analisis.save(update_fields=['fecha_muestra'])
+
+    def test_admin_filtra_por_la_copia_del_laboratorio(self):
+        for analisis in self.analisis:
+            Reporte.objects.create(analisis=analisis)
+        for nombre, modelo in (('resultadoanalisis', ResultadoAnalisis), ('reporte', Reporte)):
+            with self.subTest(nombre), registrar_consultas(connection.alias) as registro:
+                respuesta = self.client.get(reverse(f'admin:labApp_{nombre}_changelist'))
+                self.assertEqual(
+                    {fila.pk for fila in respuesta.context['cl'].result_list},
+                    set(modelo.objects.filter(analisis=self.analisis[0]).values_list('pk', flat=True)),
+                )
+                # El filtro va sobre la copia de la propia tabla, no a través de Paciente
+                tabla = modelo._meta.db_table
+                self.assertTrue(any(f'WHERE "{tabla}"."laboratorio_id" IN' in forma for forma in registro.formas))
+        ajeno = Reporte.objects.get(analisis=self.analisis[1])
+        self.assertRedirects(
+            self.client.get(reverse('admin:labApp_reporte_change', args=[ajeno.pk])), reverse('admin:index'),
+        )
+
+    def test_admin_solo_muestra_su_laboratorio(self):
+        respuesta = self.client.get(reverse('admin:labApp_analisis_changelist'))
+        self.assertEqual(
+            [a.pk for a in respuesta.context['cl'].result_list], [self.analisis[0].pk],
+        )
+        ajeno = reverse('admin:labApp_analisis_change', args=[self.analisis[1].pk])
+        self.assertRedirects(self.client.get(ajeno), reverse('admin:index'))
+
+    def test_membresias_en_sesion(self):
+        url = reverse('admin:labApp_paciente_changelist')
+        self.client.get(url)
+        with registrar_consultas(connection.alias) as registro:
+            self.client.get(url)
+        self.assertFalse([forma for forma in registro.formas if 'labApp_usuario_laboratorios' in forma])
+        Usuario.objects.get(correo_electronico='quimica@example.com').laboratorios.add(self.labs[1])
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.context['cl'].result_count, 2)
+
+
+class BusquedaPacientesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.laboratorio = Laboratorio.objects.create(
+            nombre_laboratorio='Lab', ciudad='Culiacán', estado='Sinaloa', codigo_postal='80000', pais='México',
+        )
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def crear(self, nombre, edad=40, sexo='FEMENINO', telefono='6671234567'):
+        return Paciente.objects.create(laboratorio=self.laboratorio, nombre=nombre, edad=edad, sexo=sexo, telefono=telefono)
+
+    def buscar(self, termino):
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse('admin:labApp_paciente_changelist'), {'q': termino})
+        return sorted(p.nombre for p in respuesta.context['cl'].result_list)
+
+    def test_claves(self):
+        self.assertEqual(nombres.clave_nombre('López, José  María'), 'jose lopez maria')
+        self.assertEqual(nombres.clave_fonetica('María de la Luz Vázquez'), nombres.clave_fonetica('Maria Luz Basques'))
+        self.assertNotEqual(nombres.clave_fonetica('Guerrero'), nombres.clave_fonetica('Gerrero'))
+
+    def test_claves_al_guardar_y_en_bulk_create(self):
+        paciente = self.crear('Núñez Godoy')
+        self.assertEqual((paciente.nombre_clave, paciente.nombre_fonetico), ('godoy nunez', 'godoi nunes'))
+        paciente.nombre = 'Ana Núñez'
+        paciente.save(update_fields=['nombre'])
+        self.assertEqual(Paciente.objects.get(pk=paciente.pk).nombre_clave, 'ana nunez')
+        Paciente.objects.bulk_create([Paciente(laboratorio=self.laboratorio, nombre='Óscar Ruiz', edad=1, sexo='MASCULINO')])
+        self.assertTrue(Paciente.objects.filter(nombre_clave='oscar ruiz').exists())
+
+    def test_busqueda_sin_acentos_ni_orden(self):
+        for nombre in ('José María López', 'Jose Lopes Ruiz', 'Ana Pérez'):
+            self.crear(nombre)
+        self.assertEqual(self.buscar('lopez jose'), ['Jose Lopes Ruiz', 'José María López'])
+        self.assertEqual(self.buscar('PEREZ'), ['Ana Pérez'])
+        self.assertEqual(self.buscar('ana pe'), ['Ana Pérez'])
+        self.crear('Perla Ríos')
+        self.assertEqual(self.buscar('ri'), ['José María López', 'Perla Ríos'])
+
+    def test_busqueda_por_laboratorio(self):
+        self.crear('Ana Pérez')
+        otro = Laboratorio.objects.create(
+            nombre_laboratorio='Clínica Norte', ciudad='Culiacán', estado='Sinaloa', codigo_postal='80000', pais='México',
+        )
+        Paciente.objects.create(laboratorio=otro, nombre='Luis Soto', edad=30, sexo='MASCULINO', telefono='1')
+        self.assertEqual(self.buscar('clínica nor'), ['Luis Soto'])
+        self.assertEqual(self.buscar('ana'), ['Ana Pérez'])
+
+    def test_migracion_sin_trigram_no_crea_indice(self):
+        migracion = importlib.import_module('labApp.migrations.0018_paciente_busqueda')
+        editor = mock.Mock(connection=connection)
+        with mock.patch.object(migracion.sqlite3, 'sqlite_version_info', (3, 31, 1)):
+            migracion.crear_indice(None, editor)
+        editor.execute.assert_not_called()
+        migracion.crear_indice(None, editor)
+        self.assertTrue(editor.execute.called)
+
+    def test_detecta_duplicados_por_bloques(self):
+        original = self.crear('María López Pérez')
+        mismo = self.crear('Perez Lopes, Maria', edad=41)
+        self.crear('María López Pérez', sexo='MASCULINO')
+        self.crear('María López Pérez', edad=70)
+        telefono = self.crear('Ma. López Pérez', edad=40, telefono='667-123-4567')
+        self.crear('Juan López Pérez', telefono='6671234567')
+        pares = {(p['paciente_a'], p['paciente_b']): p['motivo'] for p in duplicados.detectar()}
+        self.assertEqual(pares, {
+            (original.pk, mismo.pk): 'nombre',
+            (original.pk, telefono.pk): 'telefono',
+        })
+
+    def test_aviso_de_duplicado_al_registrar(self):
+        existente = self.crear('José López')
+        self.client.force_login(self.admin)
+        respuesta = self.client.post(reverse('admin:labApp_paciente_add'), {
+            'laboratorio': self.laboratorio.pk, 'nombre': 'Lopes Jose', 'edad': 40, 'sexo': 'MASCULINO', 'telefono': '1',
+        }, follow=True)
+        [mensaje] = [m for m in respuesta.context['messages'] if 'duplicado' in str(m)]
+        self.assertIn(reverse('admin:labApp_paciente_change', args=[existente.pk]), str(mensaje))
+
+
+def datos_formulario(respuesta):
+    """Datos POST equivalentes a enviar sin cambios el formulario del admin de la respuesta"""
+    datos, formularios = {}, [respuesta.context['adminform'].form]
+    for inline in respuesta.context['inline_admin_formsets']:
+        gestion = inline.formset.management_form
+        datos.update({f'{gestion.prefix}-{campo}': valor for campo, valor in gestion.initial.items()})
+        formularios += inline.formset.forms
+    for form in formularios:
+        for campo in form:
+            valor = campo.value()
+            if valor is None or valor is False:
+                continue
+            datos[campo.html_name] = 'on' if valor is True else valor
+    return datos
+
+
+class ResultadosConcurrenciaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        laboratorio = Laboratorio.objects.create(
+            nombre_laboratorio='Lab', ciudad='Culiacán', estado='Sinaloa', codigo_postal='80000', pais='México',
+        )
+        paciente = Paciente.objects.create(laboratorio=laboratorio, nombre='Ana', edad=40, sexo='FEMENINO', telefono='1')
+        plantilla = Plantilla.objects.create(titulo='Química')
+        for nombre in ('Glucosa', 'Urea'):
+            propiedad = PropiedadPlantilla.objects.create(plantilla=plantilla, nombre_propiedad=nombre, unidad='mg/dL')
+            IntervaloReferencia.objects.create(propiedad=propiedad, valor_min=70, valor_max=100)
+        cls.analisis = Analisis.objects.create(paciente=paciente, plantilla=plantilla)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:labApp_analisis_change', args=[self.analisis.pk])
+
+    def resultado(self, nombre):
+        return ResultadoAnalisis.objects.get(analisis=self.analisis, nombre_propiedad=nombre)
+
+    def formulario(self, **valores):
+        """POST del formulario leído ahora, con ``valores`` {propiedad: valor} capturados en el inline"""
+        respuesta = self.client.get(self.url)
+        datos = datos_formulario(respuesta)
+        for form in respuesta.context['inline_admin_formsets'][0].formset.forms:
+            if form.instance.nombre_propiedad in valores:
+                datos[f'{form.prefix}-valor'] = valores[form.instance.nombre_propiedad]
+        return datos
+
+    def test_guarda_en_lote(self):
+        datos = self.formulario(Glucosa='120', Urea='30')
+        respuesta = self.client.post(self.url, datos)
+        self.assertEqual(respuesta.status_code, 302)
+        glucosa, urea = self.resultado('Glucosa'), self.resultado('Urea')
+        self.assertEqual((glucosa.valor, glucosa.bandera, glucosa.version), ('120', 'H', 1))
+        self.assertEqual((urea.valor, urea.bandera), ('30', 'L'))
+
+    def test_version_vieja_regresa_el_formulario_con_error(self):
+        datos = self.formulario(Glucosa='120')
+        otro = self.resultado('Glucosa')
+        otro.valor = '85'
+        otro.save()
+        respuesta = self.client.post(self.url, datos)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'Otro usuario guardó este resultado', count=1)
+        self.assertEqual(self.resultado('Glucosa').valor, '85')
+
+    def test_conflicto_al_guardar_revierte_todo(self):
+        # La carrera entre la validación y el guardado (SQLite no bloquea al leer)
+        datos = self.formulario(Glucosa='120')
+        datos['nivel_control'] = 'Nivel 1'
+        conflicto = resultados.ConflictoVersion([self.resultado('Glucosa')])
+        with mock.patch.object(resultados, 'guardar_en_lote', side_effect=conflicto):
+            respuesta = self.client.post(self.url, datos)
+        # Se vuelve a mostrar el formulario con lo capturado y el error solo en la fila en conflicto
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'Otro usuario guardó este resultado', count=1)
+        [formset] = [inline.formset for inline in respuesta.context['inline_admin_formsets']]
+        errores = {form.instance.nombre_propiedad: form.non_field_errors() for form in formset.forms}
+        self.assertEqual((len(errores['Glucosa']), len(errores['Urea'])), (1, 0))
+        self.assertEqual(respuesta.context['adminform'].form['nivel_control'].value(), 'Nivel 1')
+        self.assertEqual({form.instance.nombre_propiedad: form['valor'].value() for form in formset.forms}, {'Glucosa': '120', 'Urea': ''})
+        self.analisis.refresh_from_db()
+        self.assertEqual(self.analisis.nivel_control, '')
+        self.assertEqual(self.resultado('Glucosa').valor, '')
+
+    def test_autoguardado(self):
+        glucosa = self.resultado('Glucosa')
+        url = reverse('admin:labApp_analisis_autoguardar_valor', args=[self.analisis.pk, glucosa.pk])
+        respuesta = self.client.post(url, {'valor': '65', 'version': glucosa.version}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['bandera'], 'L')
+        respuesta = self.client.post(url, {'valor': '90', 'version': glucosa.version}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['valor'], '65')
+        respuesta = self.client.post(url, {'valor': '90'}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class MigracionResultadosDuplicadosTests(TransactionTestCase):
+    antes = [('labApp', '0004_loinccode_fts')]
+    despues = [('labApp', '0005_resultado_unico_por_propiedad')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.antes)
+        apps = self.executor.loader.project_state(self.antes).apps
+        self.addCleanup(self.migrar_al_final)
+        self.ResultadoAnalisis = apps.get_model('labApp', 'ResultadoAnalisis')
+        laboratorio = apps.get_model('labApp', 'Laboratorio').objects.create(
+            nombre_laboratorio='Lab', ciudad='c', estado='e', codigo_postal='1', pais='MX',
+        )
+        paciente = apps.get_model('labApp', 'Paciente').objects.create(
+            laboratorio=laboratorio, nombre='Ana', edad=40, sexo='FEMENINO', telefono='1',
+        )
+        self.analisis = apps.get_model('labApp', 'Analisis').objects.create(paciente=paciente)
+
+    def migrar_al_final(self):
+        self.ResultadoAnalisis.objects.all().delete()
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def crear(self, *valores):
+        return [
+            self.ResultadoAnalisis.objects.create(analisis=self.analisis, nombre_propiedad='Glucosa', valor=valor).pk
+            for valor in valores
+        ]
+
+    def test_quita_repetidos_vacios_o_iguales(self):
+        vacio, capturado, igual, _ = self.crear('', '85', '85', '')
+        MigrationExecutor(connection).migrate(self.despues)
+        self.assertEqual(list(self.ResultadoAnalisis.objects.values_list('pk', 'valor')), [(capturado, '85')])
+
+    def test_valores_distintos_detienen_la_migracion(self):
+        self.crear('85', '', '90')
+        with self.assertRaisesMessage(RuntimeError, 'valores distintos'):
+            MigrationExecutor(connection).migrate(self.despues)
+        self.assertEqual(self.ResultadoAnalisis.objects.count(), 3)
+
+
+class CamposCalculadosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        laboratorio = Laboratorio.objects.create(
+            nombre_laboratorio='Lab', ciudad='Culiacán', estado='Sinaloa', codigo_postal='80000', pais='México',
+        )
+        paciente = Paciente.objects.create(laboratorio=laboratorio, nombre='Ana', edad=40, sexo='FEMENINO', telefono='1')
+        plantilla = Plantilla.objects.create(titulo='Química')
+        cls.propiedades = [
+            PropiedadPlantilla.objects.create(plantilla=plantilla, nombre_propiedad=nombre, unidad='mg/dL')
+            for nombre in ('Glucosa', 'Urea')
+        ]
+        cls.intervalos = [
+            IntervaloReferencia.objects.create(propiedad=propiedad, valor_min=70, valor_max=100)
+            for propiedad in cls.propiedades
+        ]
+        cls.analisis = Analisis.objects.create(paciente=paciente, plantilla=plantilla)
+
+    def setUp(self):
+        # El índice en memoria no se entera de que cada prueba se revierte
+        intervalos.invalidar()
+        self.addCleanup(intervalos.invalidar)
+
+    def test_banderas(self):
+        casos = {
+            '120': (120.0, 'H'), '65': (65.0, 'L'), '85,5': (85.5, 'N'), '100': (100.0, 'N'),
+            'positivo': (None, 'X'), '': (None, ''), 'inf': (None, 'X'),
+        }
+        for valor, (numero, bandera) in casos.items():
+            with self.subTest(valor):
+                self.assertEqual(resultados.calcular_campos(valor, (70, 100)), (numero, 70, 100, bandera))
+        self.assertEqual(resultados.calcular_campos('85', None), (85.0, None, None, ''))
+
+    def test_recalcular_banderas_llena_los_existentes(self):
+        ResultadoAnalisis.objects.filter(analisis=self.analisis).update(valor='150')
+        ResultadoAnalisis.objects.update(valor_numerico=None, ref_min=None, ref_max=None, bandera='')
+        call_command('recalcular_banderas', stdout=io.StringIO())
+        self.assertEqual(
+            set(ResultadoAnalisis.objects.values_list('valor_numerico', 'ref_min', 'ref_max', 'bandera')),
+            {(150.0, 70.0, 100.0, 'H')},
+        )
+
+    def test_editar_intervalos_recalcula_una_vez_al_confirmar(self):
+        with mock.patch.object(resultados, 'recalcular_propiedades', wraps=resultados.recalcular_propiedades) as recalculo:
+            with self.captureOnCommitCallbacks(execute=True):
+                for intervalo in self.intervalos:
+                    intervalo.valor_max = 200
+                    intervalo.save()
+                self.assertEqual(set(ResultadoAnalisis.objects.values_list('ref_max', flat=True)), {100.0})
+        recalculo.assert_called_once_with(sorted(p.pk for p in self.propiedades))
+        self.assertFalse(Tarea.objects.exists())
+        self.assertEqual(set(ResultadoAnalisis.objects.values_list('ref_max', flat=True)), {200.0})
+
+    def test_intervalo_revertido_no_deja_pendientes(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.intervalos[0].delete()
+            raise RuntimeError
+        with self.captureOnCommitCallbacks(execute=True):
+            self.intervalos[1].valor_max = 200
+            self.intervalos[1].save()
+        # La propiedad del intervalo revertido se recalcula de más, con su rango sin cambios
+        self.assertEqual(
+            dict(ResultadoAnalisis.objects.values_list('nombre_propiedad', 'ref_max')), {'Glucosa': 100.0, 'Urea': 200.0},
+        )
+        self.assertEqual(resultados._propiedades_pendientes('default'), set())
+
+    @override_settings(LAB_TAREAS_RESULTADOS=True)
+    def test_editar_intervalos_encola_un_solo_recalculo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for intervalo in self.intervalos:
+                intervalo.valor_max = 200
+                intervalo.save()
+        [tarea] = Tarea.objects.filter(nombre='resultados.recalcular_propiedades')
+        self.assertEqual(tarea.argumentos, {'propiedad_ids': sorted(p.pk for p in self.propiedades)})
+        self.assertEqual(set(ResultadoAnalisis.objects.values_list('ref_max', flat=True)), {100.0})
+        [reclamada] = tareas.reclamar('prueba')
+        self.assertTrue(tareas.ejecutar(reclamada))
+        self.assertEqual(set(ResultadoAnalisis.objects.values_list('ref_max', flat=True)), {200.0})
+
+
+@override_settings(LAB_TAREAS_ESPERA_BASE=10, LAB_TAREAS_TIEMPO_MAXIMO=900)
+class TareasTests(TestCase):
+    def setUp(self):
+        self.llamadas = []
+        tareas.tarea('prueba.eco')(lambda **argumentos: self.llamadas.append(argumentos) or argumentos)
+        tareas.tarea('prueba.falla')(lambda: 1 / 0)
+        self.addCleanup(tareas.REGISTRO.pop, 'prueba.eco')
+        self.addCleanup(tareas.REGISTRO.pop, 'prueba.falla')
+
+    def test_encolar_y_reclamar_en_orden(self):
+        with self.assertRaises(ValueError):
+            tareas.encolar('no.existe')
+        baja = tareas.encolar('prueba.eco', n=1)
+        alta = tareas.encolar('prueba.eco', prioridad=5, n=2)
+        tareas.encolar('prueba.eco', demora=60, n=3)
+        reclamadas = tareas.reclamar('w1', limite=5)
+        self.assertEqual([t.pk for t in reclamadas], [alta.pk, baja.pk])
+        self.assertEqual({(t.estado, t.intentos, t.trabajador) for t in reclamadas}, {('EN_CURSO', 1, 'w1')})
+        self.assertTrue(all(t.token for t in reclamadas))
+        self.assertEqual(tareas.reclamar('w2'), [])
+        self.assertTrue(tareas.ejecutar(reclamadas[0]))
+        alta.refresh_from_db()
+        self.assertEqual((alta.estado, alta.resultado), ('COMPLETA', {'n': 2}))
+
+    def test_reintento_con_espera_exponencial(self):
+        tarea = tareas.encolar('prueba.falla', max_intentos=2)
+        antes = timezone.now()
+        with self.assertLogs('labApp.tareas', 'WARNING'):
+            self.assertFalse(tareas.ejecutar(tareas.reclamar('w1')[0]))
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'PENDIENTE')
+        self.assertIn('ZeroDivisionError', tarea.error)
+        self.assertTrue(
+            antes + datetime.timedelta(seconds=8) <= tarea.disponible_desde <= timezone.now() + datetime.timedelta(seconds=12)
+        )
+        self.assertAlmostEqual(tareas.espera_reintento(3), 40, delta=8)
+        Tarea.objects.filter(pk=tarea.pk).update(disponible_desde=timezone.now())
+        with self.assertLogs('labApp.tareas', 'ERROR'):
+            self.assertFalse(tareas.ejecutar(tareas.reclamar('w1')[0]))
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos), ('FALLIDA', 2))
+
+    def test_rescate_cuenta_como_intento(self):
+        viva, caida, agotada = (tareas.encolar('prueba.eco', max_intentos=2) for _ in range(3))
+        tareas.reclamar('w1', limite=3)
+        Tarea.objects.filter(pk=agotada.pk).update(intentos=2)
+        Tarea.objects.exclude(pk=viva.pk).update(latido=timezone.now() - datetime.timedelta(seconds=901))
+        self.assertEqual(tareas.rescatar_abandonadas(), 2)
+        estados = dict(Tarea.objects.values_list('pk', 'estado'))
+        self.assertEqual(
+            (estados[viva.pk], estados[caida.pk], estados[agotada.pk]), ('EN_CURSO', 'PENDIENTE', 'FALLIDA'),
+        )
+
+    def test_trabajador_que_perdio_la_tarea_no_guarda(self):
+        tareas.encolar('prueba.eco', n=1)
+        [primera] = tareas.reclamar('w1')
+        # Se dio por abandonada y otro trabajador la tomó
+        Tarea.objects.filter(pk=primera.pk).update(estado='PENDIENTE')
+        [segunda] = tareas.reclamar('w2')
+        with self.assertLogs('labApp.tareas', 'WARNING'):
+            self.assertFalse(tareas.ejecutar(primera))
+        self.assertEqual(Tarea.objects.get(pk=primera.pk).estado, 'EN_CURSO')
+        self.assertTrue(tareas.ejecutar(segunda))
+        self.assertEqual(Tarea.objects.get(pk=primera.pk).trabajador, 'w2')
+        self.assertEqual(len(self.llamadas), 2)
+
+    def test_error_de_base_no_termina_el_bucle(self):
+        fallas = [OperationalError('database is locked'), []]
+        with mock.patch.object(tareas, 'reclamar', side_effect=fallas) as reclamar, \
+                mock.patch.object(tareas, 'close_old_connections'), mock.patch.object(tareas, 'connection'), \
+                self.assertLogs('labApp.tareas', 'ERROR') as registro:
+            tareas.bucle(threading.Event(), espera=0, trabajador='w1', vaciar=True)
+        self.assertEqual(reclamar.call_count, 2)
+        self.assertIn('database is locked', registro.output[0])
+
+
+class ImportarLoincTests(TestCase):
+    ENCABEZADO = 'LOINC_NUM,COMPONENT,PROPERTY,SYSTEM,SCALE_TYP,SHORTNAME\n'
+
+    def importar(self, filas, *opciones):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        ruta = os.path.join(directorio, 'LoincTableCore.csv')
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            archivo.write(self.ENCABEZADO + ''.join(f'{fila}\n' for fila in filas))
+        salida = io.StringIO()
+        call_command('importar_loinc', ruta, '--lote', '2', *opciones, stdout=salida)
+        return salida.getvalue()
+
+    def test_cuenta_nuevos_actualizados_y_sin_cambios(self):
+        # Importados antes de que existiera hash_contenido
+        LoincCode.objects.create(
+            loinc_num='2345-7', component='Glucose', property='MCnc', system='Ser/Plas', scale_typ='Qn', shortname='Glucose',
+        )
+        LoincCode.objects.create(loinc_num='2160-0', component='Creatinine', shortname='Creat')
+        filas = [
+            '2345-7,Glucose,MCnc,Ser/Plas,Qn,Glucose',
+            '2160-0,Creatinine,MCnc,Ser/Plas,Qn,Creat SerPl-mCnc',
+            '718-7,Hemoglobin,MCnc,Bld,Qn,Hgb Bld-mCnc',
+        ]
+        self.assertIn('1 nuevos, 1 actualizados, 1 sin cambios', self.importar(filas))
+        self.assertTrue(all(LoincCode.objects.values_list('hash_contenido', flat=True)))
+        self.assertEqual(LoincCode.objects.get(loinc_num='2160-0').system, 'Ser/Plas')
+        self.assertIn('0 nuevos, 0 actualizados, 3 sin cambios', self.importar(filas))
+
+    def test_dry_run_no_escribe(self):
+        LoincCode.objects.create(loinc_num='2345-7', component='Glucose', shortname='Glucose')
+        salida = self.importar(['2345-7,Glucose,MCnc,Ser/Plas,Qn,Glucose', '718-7,Hemoglobin,MCnc,Bld,Qn,Hgb'], '--dry-run')
+        self.assertIn('[dry-run] 1 nuevos, 1 actualizados, 0 sin cambios', salida)
+        self.assertIn("system: None -> 'Ser/Plas'", salida)
+        self.assertEqual(LoincCode.objects.count(), 1)
+        self.assertIsNone(LoincCode.objects.get().system)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'El índice FTS5 solo existe en SQLite')
+class BusquedaLoincTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def buscar(self, termino):
+        respuesta = self.client.get(reverse('admin:labApp_loinccode_changelist'), {'q': termino})
+        return sorted(c.loinc_num for c in respuesta.context['cl'].result_list)
+
+    def autocompletar(self, termino):
+        respuesta = self.client.get(reverse('admin:autocomplete'), {
+            'term': termino, 'app_label': 'labApp', 'model_name': 'propiedadplantilla', 'field_name': 'loinc_code',
+        })
+        return [int(r['id']) for r in respuesta.json()['results']]
+
+    def test_indice_sigue_altas_cambios_y_bajas(self):
+        codigo = LoincCode.objects.create(loinc_num='2345-7', shortname='Glucose SerPl-mCnc', component='Glucosa')
+        self.assertEqual(self.buscar('GLUCOSA'), ['2345-7'])
+        self.assertEqual(self.autocompletar('gluc'), [codigo.pk])
+        codigo.component = 'Creatinina'
+        codigo.shortname = 'Creat SerPl-mCnc'
+        codigo.save()
+        self.assertEqual(self.buscar('glucosa'), [])
+        self.assertEqual(self.autocompletar('creat'), [codigo.pk])
+        LoincCode.objects.filter(pk=codigo.pk).update(system='Orina')
+        self.assertEqual(self.buscar('orina'), ['2345-7'])
+        codigo.delete()
+        self.assertEqual(self.buscar('creat'), [])
+        self.assertEqual(self.autocompletar('creat'), [])
+
+    def test_autocompletado_por_codigo_y_relevancia(self):
+        en_componente = LoincCode.objects.create(loinc_num='1558-6', shortname='Fasting gluc', component='Glucose p fast')
+        en_nombre = LoincCode.objects.create(loinc_num='2339-0', shortname='Glucose Bld-mCnc', component='Glucose')
+        LoincCode.objects.create(loinc_num='718-7', shortname='Hgb Bld-mCnc', component='Hemoglobin')
+        exacto = LoincCode.objects.create(loinc_num='2339', shortname='Otro', component='Otro')
+        # bm25 pondera más el shortname que el component
+        self.assertEqual(busqueda.buscar_loinc_ids('glucose'), [en_nombre.pk, en_componente.pk])
+        self.assertEqual(self.autocompletar('glucose'), [en_nombre.pk, en_componente.pk])
+        # Un código exacto va antes que los que solo empiezan igual
+        self.assertEqual(self.autocompletar('2339')[:2], [exacto.pk, en_nombre.pk])
+
+
+class IntervalosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        plantilla = Plantilla.objects.create(titulo='Química')
+        cls.glucosa = PropiedadPlantilla.objects.create(plantilla=plantilla, nombre_propiedad='Glucosa')
+        cls.bilirrubina = PropiedadPlantilla.objects.create(plantilla=plantilla, nombre_propiedad='Bilirrubina')
+        cls.sin_intervalos = PropiedadPlantilla.objects.create(plantilla=plantilla, nombre_propiedad='Nota')
+        for sexo, edad_min, edad_max, valores in (
+            ('AMBOS', 0, 17, (60, 100)), ('AMBOS', 18, None, (70, 110)), ('MASCULINO', 18, None, (75, 115)),
+        ):
+            IntervaloReferencia.objects.create(
+                propiedad=cls.glucosa, sexo=sexo, edad_min=edad_min, edad_max=edad_max,
+                valor_min=valores[0], valor_max=valores[1],
+            )
+        for unidad, edad_min, edad_max, valores in (
+            ('DIAS', 0, 29, (1, 12)), ('MESES', 1, 11, (0.2, 1)), ('ANIOS', 1, None, (0.1, 1.2)),
+        ):
+            IntervaloReferencia.objects.create(
+                propiedad=cls.bilirrubina, unidad_edad=unidad, edad_min=edad_min, edad_max=edad_max,
+                valor_min=valores[0], valor_max=valores[1],
+            )
+
+    def setUp(self):
+        intervalos.invalidar()
+        self.addCleanup(intervalos.invalidar)
+
+    # (propiedad, días de edad, sexo) -> intervalo esperado
+    def casos(self):
+        glucosa, bilirrubina = self.glucosa.pk, self.bilirrubina.pk
+        return [
+            ((glucosa, 0, 'FEMENINO'), (60, 100)),
+            ((glucosa, 6573, 'MASCULINO'), (60, 100)),       # un día antes de los 18 años
+            ((glucosa, 6575, 'MASCULINO'), (75, 115)),       # el sexo exacto gana a AMBOS
+            ((glucosa, 6575, 'FEMENINO'), (70, 110)),
+            ((glucosa, 100 * 365, 'FEMENINO'), (70, 110)),   # sin edad máxima
+            ((bilirrubina, 29, 'FEMENINO'), (1, 12)),
+            ((bilirrubina, 31, 'FEMENINO'), (0.2, 1)),
+            ((bilirrubina, 365, 'MASCULINO'), (0.2, 1)),     # 11 meses llega hasta los 365.25 días
+            ((bilirrubina, 366, 'MASCULINO'), (0.1, 1.2)),
+            ((self.sin_intervalos.pk, 100, 'AMBOS'), None),
+        ]
+
+    def test_resolver_bordes_de_edad_sexo_y_unidades(self):
+        for argumentos, esperado in self.casos():
+            with self.subTest(argumentos=argumentos):
+                self.assertEqual(intervalos.resolver(*argumentos), esperado)
+
+    def test_resolver_lote_coincide_con_resolver(self):
+        argumentos, esperados = zip(*self.casos())
+        esperados = [valores or (None, None) for valores in esperados]
+
+        def resolver_lote():
+            minimos, maximos = intervalos.resolver_lote(*zip(*argumentos))
+            # NaN (sin intervalo) es distinto de sí mismo
+            return [(None, None) if minimo != minimo else (minimo, maximo) for minimo, maximo in zip(minimos, maximos)]
+
+        self.assertEqual(resolver_lote(), esperados)
+        with mock.patch('labApp.intervalos.np', None):
+            self.assertEqual(resolver_lote(), esperados)
+
+    @override_settings(LAB_INTERVALOS_CACHE=None, LAB_INTERVALOS_REVALIDAR=0)
+    def test_sin_cache_compartida_solo_recarga_si_cambia_la_version(self):
+        intervalos.resolver(self.glucosa.pk, 0, 'AMBOS')
+        with self.assertNumQueries(1):
+            self.assertEqual(intervalos.resolver(self.glucosa.pk, 0, 'AMBOS'), (60, 100))
+        # Otro worker edita el intervalo: aquí no llega la señal, solo la versión nueva
+        IntervaloReferencia.objects.filter(propiedad=self.glucosa, edad_min=0).update(valor_max=99)
+        self.otro_worker_sube_la_version()
+        self.assertEqual(intervalos.resolver(self.glucosa.pk, 0, 'AMBOS'), (60, 99))
+
+    def otro_worker_sube_la_version(self):
+        Plantilla.objects.filter(propiedades=self.glucosa).update(version=F('version') + 1)
+
+    @override_settings(LAB_INTERVALOS_CACHE=None, LAB_INTERVALOS_REVALIDAR=0)
+    def test_copia_con_cambios_revertidos_no_se_reusa(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            intervalo = IntervaloReferencia.objects.get(propiedad=self.glucosa, edad_min=0)
+            intervalo.valor_max = 99
+            intervalo.save()
+            self.assertEqual(intervalos.resolver(self.glucosa.pk, 0, 'AMBOS'), (60, 99))
+            raise RuntimeError
+        # Otro cambio confirmado deja la plantilla en la misma versión que tenía la copia revertida
+        IntervaloReferencia.objects.filter(propiedad=self.glucosa, edad_min=0).update(valor_max=98)
+        self.otro_worker_sube_la_version()
+        self.assertEqual(intervalos.resolver(self.glucosa.pk, 0, 'AMBOS'), (60, 98))
+
+
+class ReportesPDFTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        laboratorio = Laboratorio.objects.create(
+            nombre_laboratorio='Lab', ciudad='Culiacán', estado='Sinaloa', codigo_postal='80000', pais='México',
+        )
+        plantilla = Plantilla.objects.create(titulo='Química')
+        propiedad = PropiedadPlantilla.objects.create(plantilla=plantilla, nombre_propiedad='Glucosa', unidad='mg/dL')
+        IntervaloReferencia.objects.create(propiedad=propiedad, valor_min=70, valor_max=100)
+        cls.analisis = [
+            Analisis.objects.create(
+                paciente=Paciente.objects.create(
+                    laboratorio=laboratorio, nombre=f'Paciente {i}', edad=40, sexo='FEMENINO', telefono='1',
+                ),
+                plantilla=plantilla,
+            )
+            for i in range(3)
+        ]
+        ResultadoAnalisis.objects.filter(analisis__in=cls.analisis).update(valor='85')
+        cls.reporte = Reporte.objects.create(analisis=cls.analisis[0])
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        ajustes = override_settings(LAB_PDF_CACHE_DIR=directorio, LAB_PDF_PROCESOS=1)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.directorio = directorio
+        self.client.force_login(self.admin)
+
+    def pdf(self, **cabeceras):
+        respuesta = self.client.get(reverse('admin:labApp_reporte_pdf', args=[self.reporte.pk]), headers=cabeceras)
+        contenido = b''.join(respuesta.streaming_content) if respuesta.streaming else respuesta.content
+        respuesta.close()
+        return respuesta, contenido
+
+    def test_pdf_en_cache_con_etag(self):
+        aciertos = reportes.cache_pdf.estadisticas['aciertos']
+        respuesta, contenido = self.pdf()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(contenido.startswith(b'%PDF'))
+        etag = respuesta.headers['ETag']
+        respuesta, contenido = self.pdf(if_none_match=etag)
+        self.assertEqual((respuesta.status_code, contenido), (304, b''))
+        self.assertEqual(reportes.cache_pdf.estadisticas['aciertos'], aciertos + 1)
+        # Otro valor es otro PDF
+        resultado = ResultadoAnalisis.objects.get(analisis=self.reporte.analisis)
+        resultado.valor = '150'
+        resultado.save()
+        respuesta, contenido = self.pdf(if_none_match=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta.headers['ETag'], etag)
+        self.assertEqual(sum(1 for _ in Path(self.directorio).rglob('*.pdf')), 2)
+
+    @skipUnless('fork' in multiprocessing.get_all_start_methods(), 'Los hijos heredan los ajustes de la prueba con fork')
+    def test_lote_en_pool_de_procesos(self):
+        ids = [analisis.pk for analisis in self.analisis]
+        generados = list(reportes.generar_lote(ids, procesos=2, mp_contexto='fork'))
+        self.assertEqual(sorted(analisis.pk for analisis, _, _ in generados), ids)
+        for analisis, nombre, ruta in generados:
+            self.assertTrue(nombre.startswith(f'{analisis.pk}_paciente-'))
+            self.assertTrue(ruta.is_file() and ruta.is_relative_to(self.directorio))
+        # La segunda vez todo sale de la caché, sin levantar el pool
+        with mock.patch.object(reportes, 'ProcessPoolExecutor') as pool:
+            self.assertEqual(
+                sorted(ruta for _, _, ruta in reportes.generar_lote(ids, procesos=2)), sorted(r for _, _, r in generados),
+            )
+        pool.assert_not_called()
+
+    def test_zip_en_flujo_desde_el_admin(self):
+        respuesta = self.client.post(reverse('admin:labApp_analisis_changelist'), {
+            'action': 'descargar_reportes_zip', '_selected_action': [analisis.pk for analisis in self.analisis],
+        })
+        self.assertTrue(respuesta.streaming)
+        partes = list(respuesta.streaming_content)
+        self.assertGreater(len(partes), len(self.analisis))
+        with zipfile.ZipFile(io.BytesIO(b''.join(partes))) as archivo_zip:
+            nombres = archivo_zip.namelist()
+            self.assertTrue(all(archivo_zip.read(nombre).startswith(b'%PDF') for nombre in nombres))
+        self.assertEqual(sorted(int(nombre.split('_')[0]) for nombre in nombres), [a.pk for a in self.analisis])
+        self.assertEqual(Reporte.objects.count(), 1 + len(self.analisis))
+
+
+class PaginacionKeysetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        laboratorio = Laboratorio.objects.create(
+            nombre_laboratorio='Lab', ciudad='Culiacán', estado='Sinaloa', codigo_postal='80000', pais='México',
+        )
+        paciente = Paciente.objects.create(laboratorio=laboratorio, nombre='Ana', edad=40, sexo='FEMENINO', telefono='1')
+        cls.analisis = [Analisis.objects.create(paciente=paciente) for _ in range(5)]
+        # Tres con la misma fecha: el id desempata
+        fecha = timezone.now()
+        Analisis.objects.filter(pk__in=[a.pk for a in cls.analisis[:3]]).update(fecha_analisis=fecha)
+        Analisis.objects.filter(pk__in=[a.pk for a in cls.analisis[3:]]).update(
+            fecha_analisis=fecha - datetime.timedelta(days=1),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.enterContext(mock.patch.object(admin.site._registry[Analisis], 'list_per_page', 2))
+
+    def test_recorre_todas_las_paginas_por_cursor(self):
+        url, vistos = reverse('admin:labApp_analisis_changelist'), []
+        siguiente = ''
+        while siguiente is not None:
+            cl = self.client.get(url + siguiente).context['cl']
+            self.assertTrue(cl.keyset_activo)
+            vistos += [analisis.pk for analisis in cl.result_list]
+            siguiente = cl.cursor_siguiente
+        pks = [a.pk for a in self.analisis]
+        self.assertEqual(vistos, pks[2::-1] + pks[:2:-1])
+
+    def test_conteo_estimado_y_cursor_invalido(self):
+        url = reverse('admin:labApp_analisis_changelist')
+        with override_settings(LAB_ADMIN_CONTEO_UMBRAL=2):
+            respuesta = self.client.get(url)
+        self.assertTrue(respuesta.context['cl'].conteo_estimado)
+        self.assertContains(respuesta, f'≈ {self.analisis[-1].pk}')
+        self.assertRedirects(self.client.get(url, {'c': 'no-es-fecha_1'}), url + '?e=1', fetch_redirect_response=False)
+        # Con otro orden vuelve la paginación normal
+        self.assertFalse(self.client.get(url, {'o': '1'}).context['cl'].keyset_activo)
+
+
+class PerfilesBaseDatosTests(TestCase):
+    def test_perfiles_desde_el_entorno(self):
+        configuracion = basedatos.base_de_datos(Path('/srv/lab'), {})
+        self.assertEqual(configuracion['NAME'], Path('/srv/lab/db.sqlite3'))
+        self.assertEqual(configuracion['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('PRAGMA journal_mode=WAL', configuracion['OPTIONS']['init_command'])
+        configuracion = basedatos.base_de_datos(Path('/srv/lab'), {'LAB_DB_PERFIL': 'postgres', 'LAB_DB_POOL': '2,20'})
+        self.assertEqual(configuracion['CONN_MAX_AGE'], 0)
+        self.assertEqual(configuracion['OPTIONS']['pool'], {'min_size': 2, 'max_size': 20, 'timeout': 10})
+        for entorno in ({'LAB_DB_PERFIL': 'mysql'}, {'LAB_DB_ESPERA': 'mucho'}, {'LAB_DB_PERFIL': 'postgres', 'LAB_DB_POOL': '20'}):
+            with self.subTest(entorno=entorno), self.assertRaises(ValueError):
+                basedatos.base_de_datos(Path('/srv/lab'), entorno)
+
+    def test_escrituras_concurrentes_esperan_en_lugar_de_fallar(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        conexiones = ConnectionHandler({
+            'default': basedatos.sqlite({'LAB_DB_NOMBRE': os.path.join(directorio, 'lab.sqlite3'), 'LAB_DB_ESPERA': '5'}, None),
+        })
+        with conexiones['default'].cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone(), ('wal',))
+            cursor.execute('CREATE TABLE contador (n INTEGER)')
+            cursor.execute('INSERT INTO contador VALUES (0)')
+        conexiones['default'].close()
+        errores, listos = [], threading.Barrier(2)
+
+        def sumar():
+            # Leer y después escribir en la misma transacción: con DEFERRED una de las dos fallaría al instante
+            try:
+                listos.wait(timeout=5)
+                with transaction.atomic(using='default'), conexiones['default'].cursor() as cursor:
+                    [(n,)] = cursor.execute('SELECT n FROM contador').fetchall()
+                    time.sleep(0.1)
+                    cursor.execute('UPDATE contador SET n = %s', [n + 1])
+            except Exception as exc:
+                errores.append(exc)
+            finally:
+                conexiones['default'].close()
+
+        hilos = [threading.Thread(target=sumar) for _ in range(2)]
+        # transaction.atomic() con las conexiones de la prueba
+        with mock.patch('django.db.transaction.get_connection', lambda using: conexiones[using]):
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        self.assertEqual(errores, [])
+        with conexiones['default'].cursor() as cursor:
+            self.assertEqual(cursor.execute('SELECT n FROM contador').fetchone(), (2,))
+        conexiones['default'].close()
+
+
+class ExportacionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        laboratorio = Laboratorio.objects.create(
+            nombre_laboratorio='Lab', ciudad='Culiacán', estado='Sinaloa', codigo_postal='80000', pais='México',
+        )
+        cls.paciente = Paciente.objects.create(laboratorio=laboratorio, nombre='Ana', edad=40, sexo='FEMENINO', telefono='1')
+        cls.plantilla = Plantilla.objects.create(titulo='Química')
+        for nombre in ('Glucosa', 'Urea'):
+            propiedad = PropiedadPlantilla.objects.create(plantilla=cls.plantilla, nombre_propiedad=nombre, unidad='mg/dL')
+            IntervaloReferencia.objects.create(propiedad=propiedad, valor_min=70, valor_max=100)
+
+    def setUp(self):
+        intervalos.invalidar()
+        self.addCleanup(intervalos.invalidar)
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        self.salida = os.path.join(directorio, 'resultados.csv')
+        self.marca = os.path.join(directorio, 'marca.json')
+
+    def exportar(self, *opciones):
+        call_command('exportar_resultados', self.salida, *opciones, stderr=io.StringIO())
+        with open(self.salida, newline='', encoding='utf-8') as archivo:
+            return list(csv.DictReader(archivo))
+
+    def test_exportacion_completa_e_incremental(self):
+        primero = Analisis.objects.create(paciente=self.paciente, plantilla=self.plantilla)
+        ResultadoAnalisis.objects.filter(analisis=primero, nombre_propiedad='Glucosa').update(valor='85')
+        filas = self.exportar('--marca', self.marca)
+        self.assertEqual([(f['analisis_id'], f['propiedad'], f['valor']) for f in filas], [
+            (str(primero.pk), 'Glucosa', '85'), (str(primero.pk), 'Urea', ''),
+        ])
+        self.assertEqual(filas[0]['paciente'], 'Ana')
+        self.assertEqual(self.exportar('--marca', self.marca), [])
+        segundo = Analisis.objects.create(paciente=self.paciente, plantilla=self.plantilla)
+        self.assertEqual({f['analisis_id'] for f in self.exportar('--marca', self.marca)}, {str(segundo.pk)})
+        # JSON Lines con las mismas columnas
+        call_command('exportar_resultados', self.salida, '--formato', 'jsonl', stderr=io.StringIO())
+        with open(self.salida, encoding='utf-8') as archivo:
+            lineas = [json.loads(linea) for linea in archivo]
+        self.assertEqual(len(lineas), 4)
+        self.assertEqual(list(lineas[0]), exportacion.ENCABEZADOS)
+
+
+class IngestaArchivosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        laboratorio = Laboratorio.objects.create(
+            nombre_laboratorio='Lab', ciudad='Culiacán', estado='Sinaloa', codigo_postal='80000', pais='México',
+        )
+        paciente = Paciente.objects.create(laboratorio=laboratorio, nombre='Ana', edad=40, sexo='FEMENINO', telefono='1')
+        plantilla = Plantilla.objects.create(titulo='Química')
+        for nombre, loinc_num in (('Glucosa', '2345-7'), ('Urea', '3094-0')):
+            propiedad = PropiedadPlantilla.objects.create(
+                plantilla=plantilla, nombre_propiedad=nombre, unidad='mg/dL',
+                loinc_code=LoincCode.objects.create(loinc_num=loinc_num, shortname=nombre),
+            )
+            IntervaloReferencia.objects.create(propiedad=propiedad, valor_min=70, valor_max=100)
+        cls.analisis = Analisis.objects.create(paciente=paciente, plantilla=plantilla)
+
+    def setUp(self):
+        intervalos.invalidar()
+        self.addCleanup(intervalos.invalidar)
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        self.ruta = os.path.join(directorio, 'equipo.hl7')
+
+    def hl7(self, glucosa, orden=None, urea='30'):
+        orden = self.analisis.pk if orden is None else orden
+        return (
+            '\x0bMSH|^~\\&|EQUIPO|LAB|LIS|LAB|20260101120000||ORU^R01|1|P|2.5\r'
+            'PID|1||123\r'
+            f'OBR|1|{orden}||QUIMICA\r'
+            f'OBX|1|NM|2345-7^Glucose^LN||{glucosa}|mg/dL|70-100|N|||F\r'
+            # Código local con el LOINC como alternativo
+            f'OBX|2|NM|U01^Urea^L^3094-0^Urea^LN||{urea}|mg/dL||||F\r'
+            'OBX|3|NM|2345-7^Glucose^LN||||||||X\r\x1c\r'
+        ).encode('latin-1')
+
+    def escribir(self, contenido, modo='wb'):
+        with open(self.ruta, modo) as archivo:
+            archivo.write(contenido)
+
+    def valores(self):
+        return dict(ResultadoAnalisis.objects.filter(analisis=self.analisis).values_list('nombre_propiedad', 'valor'))
+
+    def test_lee_hl7_y_astm(self):
+        astm = (
+            '1H|\\^&|||Equipo\r\n2P|1\r\n'
+            f'3O|1|{self.analisis.pk}||^^^2345-7\r\n'
+            '4R|1|^^^2345-7|88|mg/dL||N||F\r\n5R|2|^^^3094-0||mg/dL||||X\r\n6L|1|N\r\n'
+        ).encode('latin-1')
+        leidas = [
+            list(ingesta_archivos.observaciones(mensaje))
+            for _, mensaje in ingesta_archivos.mensajes(ingesta_archivos.segmentos(io.BytesIO(self.hl7('95') + astm)))
+        ]
+        self.assertEqual(
+            [[(o['orden'], o['loinc'], o['valor'], o['unidad']) for o in mensaje] for mensaje in leidas],
+            [
+                [(str(self.analisis.pk), '2345-7', '95', 'mg/dL'), (str(self.analisis.pk), '3094-0', '30', 'mg/dL')],
+                [(str(self.analisis.pk), '2345-7', '88', 'mg/dL')],
+            ],
+        )
+
+    def test_cuarentena_de_lo_que_no_se_asigna(self):
+        desconocido = self.hl7('99', urea='1').replace(b'2345-7', b'9999-9')
+        self.escribir(self.hl7('95') + self.hl7('120', orden='SIN-ORDEN') + desconocido)
+        archivo = ingesta_archivos.procesar_archivo(ArchivoIngesta.objects.create(ruta=self.ruta))
+        # La Urea del tercer mensaje reemplaza a la del primero dentro del mismo bloque
+        self.assertEqual((archivo.estado, archivo.mensajes, archivo.resultados, archivo.en_cuarentena), ('COMPLETO', 3, 2, 3))
+        self.assertEqual(self.valores(), {'Glucosa': '95', 'Urea': '1'})
+        self.assertEqual(
+            sorted((r.codigo, r.motivo) for r in archivo.cuarentena.all()),
+            [
+                ('2345-7', 'Sin número de análisis válido.'),
+                ('3094-0', 'Sin número de análisis válido.'),
+                ('9999-9', f'La plantilla del análisis {self.analisis.pk} no tiene el LOINC 9999-9.'),
+            ],
+        )
+
+    def test_reanuda_desde_el_desplazamiento_guardado(self):
+        primero = self.hl7('95')
+        self.escribir(primero + self.hl7('96'))
+        archivo = ArchivoIngesta.objects.create(ruta=self.ruta)
+        confirmar = ingesta_archivos._confirmar
+        llamadas = []
+
+        def confirmar_y_caer(*argumentos):
+            llamadas.append(argumentos)
+            if len(llamadas) > 1:
+                raise OSError('disco lleno')
+            confirmar(*argumentos)
+
+        # Se cae al confirmar el segundo mensaje: el primero ya quedó guardado con su desplazamiento
+        with mock.patch.object(ingesta_archivos, '_confirmar', confirmar_y_caer), self.assertRaises(OSError):
+            ingesta_archivos.procesar_archivo(archivo, tamano_bloque=1)
+        archivo.refresh_from_db()
+        # El cierre del marco MLLP no es un segmento: se relee (y se descarta) al reanudar
+        marco = len(b'\x1c\r')
+        self.assertEqual(
+            (archivo.estado, archivo.mensajes, archivo.resultados, archivo.desplazamiento),
+            ('ERROR', 1, 2, len(primero) - marco),
+        )
+        self.assertEqual(self.valores()['Glucosa'], '95')
+        # Al reanudar no se vuelve a leer el primer mensaje
+        archivo = ingesta_archivos.procesar_archivo(archivo, tamano_bloque=1)
+        self.assertEqual((archivo.estado, archivo.mensajes, archivo.resultados), ('COMPLETO', 2, 4))
+        self.assertEqual(self.valores()['Glucosa'], '96')
+        # El equipo añade otro mensaje al mismo archivo
+        self.escribir(self.hl7('97'), 'ab')
+        [pendiente] = ingesta_archivos.archivos_pendientes(os.path.dirname(self.ruta), ('.hl7',), estable=0)
+        archivo = ingesta_archivos.procesar_archivo(pendiente)
+        self.assertEqual(
+            (archivo.mensajes, archivo.resultados, archivo.desplazamiento), (3, 6, os.path.getsize(self.ruta) - marco),
+        )
+        self.assertEqual(self.valores()['Glucosa'], '97')
+
+
+@override_settings(LAB_INGESTA_TOKENS=['secreto'])
+class IngestaAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        laboratorio = Laboratorio.objects.create(
+            nombre_laboratorio='Lab', ciudad='Culiacán', estado='Sinaloa', codigo_postal='80000', pais='México',
+        )
+        paciente = Paciente.objects.create(laboratorio=laboratorio, nombre='Ana', edad=40, sexo='FEMENINO', telefono='1')
+        plantilla = Plantilla.objects.create(titulo='Química')
+        propiedad = PropiedadPlantilla.objects.create(
+            plantilla=plantilla, nombre_propiedad='Glucosa', unidad='mg/dL',
+            loinc_code=LoincCode.objects.create(loinc_num='2345-7', shortname='Glucosa'),
+        )
+        IntervaloReferencia.objects.create(propiedad=propiedad, valor_min=70, valor_max=100)
+        cls.analisis = Analisis.objects.create(paciente=paciente, plantilla=plantilla)
+
+    def setUp(self):
+        intervalos.invalidar()
+        self.addCleanup(intervalos.invalidar)
+        self.url = reverse('ingesta_resultados')
+
+    def enviar(self, valor, token='secreto', **cabeceras):
+        cuerpo = json.dumps({'resultados': [{'analisis': self.analisis.pk, 'loinc': '2345-7', 'valor': valor}]})
+        return self.client.post(
+            self.url, cuerpo, content_type='application/json', headers={'Authorization': f'Bearer {token}', **cabeceras},
+        )
+
+    def glucosa(self):
+        return ResultadoAnalisis.objects.get(analisis=self.analisis, nombre_propiedad='Glucosa')
+
+    def test_token_y_limite_de_lotes(self):
+        self.assertEqual(self.enviar('90', token='otro').status_code, 403)
+        self.assertEqual(self.client.post(self.url, '{}', content_type='application/json').status_code, 403)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        with override_settings(LAB_INGESTA_CONCURRENCIA=1), mock.patch.object(views.lotes_en_curso, 'activos', 1):
+            respuesta = self.enviar('90')
+        self.assertEqual((respuesta.status_code, respuesta.headers['Retry-After']), (429, '1'))
+        respuesta = self.enviar('90')
+        self.assertEqual((respuesta.status_code, respuesta.json()['guardados']), (200, 1))
+        self.assertEqual((self.glucosa().valor, self.glucosa().bandera), ('90', 'N'))
+        self.assertEqual(views.lotes_en_curso.activos, 0)
+
+    def test_clave_de_idempotencia(self):
+        self.assertEqual(self.enviar('90', idempotency_key='lote-1').json(), {'recibidos': 1, 'guardados': 1, 'errores': []})
+        ResultadoAnalisis.objects.filter(pk=self.glucosa().pk).update(valor='editado')
+        # El reenvío devuelve la respuesta guardada sin volver a escribir
+        self.assertTrue(self.enviar('90', idempotency_key='lote-1').json()['repetido'])
+        self.assertEqual(self.glucosa().valor, 'editado')
+        self.assertEqual(self.enviar('95', idempotency_key='lote-1').status_code, 422)
+        # Vencida, la clave vale como nueva y la purga la borra
+        hace_dos_dias = timezone.now() - datetime.timedelta(days=2)
+        ClaveIdempotencia.objects.filter(clave='lote-1').update(fecha_creacion=hace_dos_dias)
+        self.assertNotIn('repetido', self.enviar('95', idempotency_key='lote-1').json())
+        self.assertEqual(self.glucosa().valor, '95')
+        ClaveIdempotencia.objects.create(clave='lote-0', huella='x', respuesta={})
+        ClaveIdempotencia.objects.filter(clave='lote-0').update(fecha_creacion=hace_dos_dias)
+        call_command('purgar_idempotencia', stdout=io.StringIO())
+        self.assertEqual(list(ClaveIdempotencia.objects.values_list('clave', flat=True)), ['lote-1'])
+
+
+class TendenciasTests(TestCase):
+    def serie(self, valores, dias=None):
+        inicio = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        dias = range(0, 10 * len(valores), 10) if dias is None else dias
+        return {'loinc': '2345-7', 'puntos': [
+            {'fecha': inicio + datetime.timedelta(days=d), 'valor_numerico': v} for d, v in zip(dias, valores)
+        ]}
+
+    def assertIguales(self, a, b):
+        if isinstance(a, dict):
+            self.assertEqual(a.keys(), b.keys())
+            for clave in a:
+                with self.subTest(clave=clave):
+                    self.assertIguales(a[clave], b[clave])
+        elif isinstance(a, float) and b is not None:
+            self.assertAlmostEqual(a, b, places=9)
+        else:
+            self.assertEqual(a, b)
+
+    def test_numpy_y_python_dan_la_misma_serie(self):
+        for valores, dias in (
+            ([95, 110, 0, 80, 150.5], None),  # un cero: sin delta porcentual para el siguiente
+            ([-4, 2, 2], None),
+            ([100], None),
+            ([90, 120], [0, 0]),  # misma fecha: sin pendiente
+        ):
+            with self.subTest(valores=valores):
+                con_numpy = self.serie(valores, dias)
+                resumen = tendencias.estadisticas(con_numpy)
+                sin_numpy = self.serie(valores, dias)
+                with mock.patch.object(tendencias, 'np', None):
+                    self.assertIguales(resumen, tendencias.estadisticas(sin_numpy))
+                for punto, esperado in zip(con_numpy['puntos'], sin_numpy['puntos']):
+                    self.assertIguales(punto, esperado)
+        # Último caso: de 90 a 120 es +33 %, sobre el umbral por defecto de 25 %
+        self.assertEqual(resumen['alertas_delta'], 1)
+        self.assertAlmostEqual(con_numpy['puntos'][1]['delta_pct'], 100 / 3)
@@ -1,7 +1,98 @@
+import hmac
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, JsonResponse
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+from django.views.decorators.csrf import csrf_exempt
+
+from . import imagenes, ingesta
 
 # Create your views here.
 from django.shortcuts import render
 
 def inicio(request):
     return render(request, "inicio.html")
+
+
+# -------------------------------
+# Variantes del logo (labApp/imagenes.py)
+# -------------------------------
+@require_safe
+def logo_variante(request, nombre):
+    """Sirve una variante con caché de un año: el nombre lleva el hash del contenido"""
+    if not imagenes.NOMBRE_VALIDO.fullmatch(nombre):
+        raise Http404
+    ruta = f'{imagenes.CARPETA}/{nombre}'
+    if not default_storage.exists(ruta):
+        raise Http404
+    etag = f'"{nombre.split("-")[-1].split(".")[0]}"'
+    respuesta = get_conditional_response(request, etag=etag)
+    if respuesta is None:
+        respuesta = FileResponse(
+            default_storage.open(ruta, 'rb'), content_type=imagenes.TIPOS[nombre.rsplit('.', 1)[-1]],
+        )
+    respuesta.headers['ETag'] = etag
+    patch_cache_control(respuesta, public=True, max_age=365 * 24 * 3600, immutable=True)
+    return respuesta
+
+
+# -------------------------------
+# API de ingesta de resultados (equipos analizadores)
+# -------------------------------
+class _LotesEnCurso:
+    """Contador de lotes en proceso compartido por los hilos/event loops del proceso"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.activos = 0
+
+    def entrar(self, limite):
+        with self._lock:
+            if self.activos >= limite:
+                return False
+            self.activos += 1
+            return True
+
+    def salir(self):
+        with self._lock:
+            self.activos -= 1
+
+
+lotes_en_curso = _LotesEnCurso()
+
+
+def _token_valido(request):
+    encabezado = request.headers.get('Authorization', '')
+    if not encabezado.startswith('Bearer '):
+        return False
+    token = encabezado[len('Bearer '):].strip().encode()
+    return any(hmac.compare_digest(token, valido.encode()) for valido in getattr(settings, 'LAB_INGESTA_TOKENS', ()))
+
+
+@csrf_exempt
+async def ingestar_resultados(request):
+    """POST de un lote de resultados en JSON (ver labApp/ingesta.py)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Solo POST.'}, status=405, headers={'Allow': 'POST'})
+    if not _token_valido(request):
+        return JsonResponse({'error': 'Token inválido.'}, status=403)
+    # Sin cola: si ya hay demasiados lotes escribiendo, el equipo reintenta más tarde
+    if not lotes_en_curso.entrar(getattr(settings, 'LAB_INGESTA_CONCURRENCIA', 4)):
+        return JsonResponse({'error': 'Demasiados lotes en proceso.'}, status=429, headers={'Retry-After': '1'})
+    try:
+        try:
+            items = ingesta.leer_lote(request.body, getattr(settings, 'LAB_INGESTA_MAX_ITEMS', 5000))
+        except ingesta.LoteInvalido as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        clave = request.headers.get('Idempotency-Key', '')[:100]
+        estado, respuesta = await sync_to_async(ingesta.ingestar_idempotente)(
+            items, clave, ingesta.huella_cuerpo(request.body),
+        )
+        return JsonResponse(respuesta, status=estado)
+    finally:
+        lotes_en_curso.salir()